@@ -258,6 +258,35 @@ def main():
             if 'user_level' not in st.session_state:
                 st.session_state.user_level = UserLevel.PUBLIC if hasattr(UserLevel, 'PUBLIC') else "public"
         
+        # メトリクスエンドポイント（RURI_METRICS_PORT 指定時・プロセスで一度だけ起動）
+        if os.getenv("RURI_METRICS_PORT"):
+            from src.metrics import get_metrics
+            get_metrics().start_http_server()
+        
+        # Ollamaモデルの事前ロード（初回メッセージでのモデルロード待ちを避ける・プロセスで一度だけ）
+        try:
+            from ai_providers.ollama_lifecycle import preload_configured_models
+            preload_configured_models()
+        except Exception as e:
+            if not CLOUD_MODE:
+                print(f"⚠️ Ollamaモデルの事前ロードに失敗: {e}")
+
+        # プロバイダー接続先への先行接続（共有HTTP接続プール・プロセスで一度だけ）
+        try:
+            from ai_providers.http_pool import prewarm_configured_endpoints
+            prewarm_configured_endpoints()
+        except Exception as e:
+            if not CLOUD_MODE:
+                print(f"⚠️ 先行接続に失敗: {e}")
+
+        # 優先プロバイダーのバックグラウンド生成（初回メッセージで初期化を待たない・プロセスで一度だけ）
+        try:
+            from ai_providers.registry import preload_configured_providers
+            preload_configured_providers()
+        except Exception as e:
+            if not CLOUD_MODE:
+                print(f"⚠️ プロバイダーの事前生成に失敗: {e}")
+
         # アプリケーション初期化ログ（一度だけ表示）
         if 'app_initialized' not in st.session_state:
             st.session_state.app_initialized = True
@@ -927,6 +956,9 @@ def setup_responsive_sidebar(user_level: Any, features: Dict[str, bool], ui_conf
                     st.session_state.authenticated = False
                     # 初期化フラグもリセット
                     st.session_state.initialization_complete = False
+                # 署名つきトークンも破棄する
+                st.session_state.pop("auth_token", None)
+                st.session_state.pop("owner_authenticated", None)
                 # ログアウト時のみrerunが必要
                 st.rerun()
 
@@ -1315,7 +1347,135 @@ def show_settings_page(user_level: Any, features: Dict[str, bool]):
 def show_analytics_page(user_level: Any, features: Dict[str, bool]):
     """分析ページ"""
     st.title("📊 分析")
-    st.info("🚧 実装中...")
+
+    try:
+        import pandas as pd
+        from src.emotion_timeseries import get_timeseries_store
+    except ImportError as e:
+        st.error(f"分析モジュールの読み込みに失敗しました: {e}")
+        return
+
+    # EmotionSystemと同じ保存先（emotion_data.json → emotion_data_timeseries.npz）
+    store = get_timeseries_store("emotion_data_timeseries.npz")
+    summary = store.get_summary()
+
+    st.subheader("🎨 感情学習の推移")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("学習イベント総数", f"{summary['total_events']:,}")
+    with col2:
+        st.metric("学習済み感情数", len(summary['per_emotion']))
+
+    if summary['total_events'] == 0:
+        st.info("💬 まだ感情学習の記録がありません。ルリと会話してみてください！")
+    else:
+        _show_emotion_charts(store, summary, pd)
+
+    # 管理者（所有者）向け: リクエスト単位のレイテンシ内訳
+    is_owner = (hasattr(UserLevel, 'OWNER') and user_level == UserLevel.OWNER) or user_level == "owner"
+    if is_owner:
+        _show_tracing_admin_view(pd)
+        _show_rerun_timing_admin_view(pd)
+
+def _show_emotion_charts(store, summary: Dict[str, Any], pd):
+    """感情学習の推移グラフ"""
+    window_labels = {"minute": "分単位", "hour": "時間単位", "day": "日単位"}
+    window = st.radio(
+        "集計単位",
+        options=list(window_labels.keys()),
+        format_func=lambda w: window_labels[w],
+        horizontal=True,
+        key="analytics_window"
+    )
+
+    # 事前集計バケットから描画（生イベントは走査しない）
+    charts = store.get_chart_buckets(window, max_points=500)
+    frames = {
+        emotion: pd.Series(values, index=pd.to_datetime(buckets, unit="s"))
+        for emotion, (buckets, values) in charts.items()
+        if len(buckets)
+    }
+    if frames:
+        st.line_chart(pd.DataFrame(frames))
+
+    with st.expander("📈 感情別の移動平均"):
+        emotion = st.selectbox("感情", options=sorted(summary['per_emotion'].keys()), key="analytics_emotion")
+        window_events = st.slider("移動平均の件数", min_value=5, max_value=200, value=20, key="analytics_rolling")
+        # 表示用に直近の範囲へ絞る（分単位: 1時間 / 時間単位: 1日 / 日単位: 1週間）
+        recent_seconds = {"minute": 3600, "hour": 86400, "day": 7 * 86400}[window]
+        span = store.time_span()
+        timestamps, means = store.rolling_mean(emotion, window_events, start=span[1] - recent_seconds)
+        if len(timestamps):
+            st.line_chart(pd.DataFrame({emotion: means}, index=pd.to_datetime(timestamps, unit="s")))
+
+    st.caption(f"感情別イベント数: {summary['per_emotion']}")
+
+def _show_tracing_admin_view(pd):
+    """チャットパイプラインのステージ別レイテンシ（トレース）"""
+    from src.tracing import get_tracer
+
+    tracer = get_tracer()
+    st.subheader("⏱️ レイテンシ内訳（トレース）")
+
+    enabled = st.toggle("トレースを有効化", value=tracer.enabled, key="analytics_tracing_enabled")
+    if enabled and not tracer.enabled:
+        tracer.enable()
+    elif not enabled and tracer.enabled:
+        tracer.disable()
+    if tracer.jsonl is not None:
+        st.caption(f"JSONL出力先: {tracer.jsonl.path}")
+
+    breakdown = tracer.get_stage_breakdown("chat.turn")
+    if not breakdown:
+        st.info("📭 まだトレースがありません。トレースを有効にしてルリと会話してみてください。")
+        return
+
+    st.dataframe(pd.DataFrame(breakdown).set_index("stage"), use_container_width=True)
+
+    with st.expander("🧵 直近のトレース"):
+        for trace in reversed(tracer.get_recent_traces(limit=10)):
+            st.markdown(f"**{trace['name']}** `{trace['trace_id']}` — {trace['duration_ms']:.1f} ms")
+            st.dataframe(
+                pd.DataFrame([
+                    {"stage": span["name"], "duration_ms": span["duration_ms"], "error": span["error"]}
+                    for span in trace["spans"]
+                ]),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+    if st.button("🧹 トレースをクリア", key="analytics_tracing_clear"):
+        tracer.clear()
+        st.rerun()
+
+def _show_rerun_timing_admin_view(pd):
+    """チャット送信時の再実行方式（アプリ全体 / チャット領域のみ）の処理時間比較"""
+    from src.ui_components import RerunTimer, FRAGMENTS_AVAILABLE
+
+    timer = RerunTimer()
+    st.subheader("🔁 再実行方式の比較")
+    if not FRAGMENTS_AVAILABLE:
+        st.caption("このStreamlitは st.fragment に未対応のため、常にアプリ全体が再実行されます")
+
+    mode_labels = {"fragment": "チャット領域のみ（fragment）", "full": "アプリ全体（full）"}
+    mode = st.radio(
+        "送信時の再実行方式",
+        options=list(RerunTimer.MODES),
+        index=RerunTimer.MODES.index(timer.mode),
+        format_func=lambda m: mode_labels[m],
+        horizontal=True,
+        key="analytics_rerun_mode",
+        disabled=not FRAGMENTS_AVAILABLE,
+    )
+    if FRAGMENTS_AVAILABLE and mode != timer.mode:
+        timer.set_mode(mode)
+
+    summary = timer.get_summary()
+    if not summary:
+        st.info("📭 まだ計測結果がありません。方式を切り替えてルリと会話してみてください。")
+        return
+    st.dataframe(pd.DataFrame(summary).set_index("mode"), use_container_width=True)
+    st.caption("overhead は応答の生成・表示を除いた時間（再実行そのもののコスト）")
 
 def show_auth_page():
     """所有者認証ページ（メインエリア表示）"""
@@ -1352,12 +1512,22 @@ def show_auth_page():
                 try:
                     auth_handler = UnifiedAuth()
                     # 実際に存在するメソッドを使用（パスワードのみで認証）
-                    new_level = auth_handler.authenticate_user(password)
+                    throttled = False
+                    try:
+                        new_level = auth_handler.authenticate_user(password)
+                    except getattr(auth_handler, 'ThrottledError', ()):
+                        # 検証が混み合っているだけ（パスワードの誤りではない）
+                        new_level, throttled = None, True
                     
-                    if new_level and (new_level == UserLevel.OWNER if hasattr(UserLevel, 'OWNER') else new_level == "owner"):
+                    if throttled:
+                        st.warning(auth_handler.THROTTLED_MESSAGE)
+                    elif new_level and (new_level == UserLevel.OWNER if hasattr(UserLevel, 'OWNER') else new_level == "owner"):
                         st.session_state.user_level = new_level
                         st.session_state.authenticated = True
                         st.session_state.authenticated_username = username  # 将来的な利用のため保存
+                        if hasattr(auth_handler, 'set_authentication_level'):
+                            # 以降の再実行は署名つきトークンで確認する（パスワードを再検証しない）
+                            auth_handler.set_authentication_level(new_level)
                         st.success("✅ 認証に成功しました！")
                         st.session_state.show_auth = False
                         st.session_state.current_page = 'home'
@@ -1426,4 +1596,17 @@ if __name__ == "__main__":
     if 'app_initialized_stable' not in st.session_state:
         st.session_state.app_initialized_stable = True
     
-    main()
\ No newline at end of file
+    # 再実行方式の計測（full 方式ではアプリ全体の実行時間をメッセージ単位で記録）
+    try:
+        from src.ui_components import RerunTimer
+        rerun_timer = RerunTimer()
+    except ImportError:
+        rerun_timer = None
+    
+    if rerun_timer:
+        rerun_timer.script_started()
+    try:
+        main()
+    finally:
+        if rerun_timer:
+            rerun_timer.script_finished()
\ No newline at end of file
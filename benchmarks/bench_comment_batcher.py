@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+コメントのマイクロバッチのスループット計測
+
+疑似LLMサーバーに対し、一定レートで届くコメントを
+1件ずつ返答する場合とマイクロバッチで返答する場合を比較する。
+
+    python benchmarks/bench_comment_batcher.py --rate 20 --duration 5 --output batcher.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from comment_batcher import CommentMicroBatcher
+from fake_llm_server import FakeLLMServer, FakeLLMConfig
+
+COMMENTS = [
+    "こんにちは！", "ルリちゃんかわいい", "今日の配信も楽しみにしてました", "888888",
+    "好きな色は何ですか？", "初見です", "wwwww", "その服似合ってる", "今日は何するの？",
+    "感情ってどうやって覚えるの？", "お疲れさま！", "虹色になってきたね",
+]
+
+
+def run_scenario(base_url: str, rate: float, duration: float, batching: bool) -> dict:
+    """rate件/秒でduration秒コメントを投入し、全返答までの統計を返す"""
+    session = requests.Session()
+
+    def generate(prompt: str) -> str:
+        response = session.post(f"{base_url}/chat/completions", json={
+            "model": "fake", "messages": [{"role": "user", "content": prompt}]
+        }, timeout=60)
+        return response.json()["choices"][0]["message"]["content"]
+
+    options = {} if batching else {"max_batch": 1, "window_ms": 0.0, "adaptive": False}
+    batcher = CommentMicroBatcher(generate, **options)
+
+    futures = []
+    start = time.monotonic()
+    index = 0
+    while time.monotonic() - start < duration:
+        futures.append(batcher.submit(COMMENTS[index % len(COMMENTS)] + f" #{index}"))
+        index += 1
+        time.sleep(1.0 / rate)
+
+    results = [future.result(timeout=300) for future in futures]
+    elapsed = time.monotonic() - start
+    batcher.stop()
+
+    stats = batcher.get_stats()
+    stats["wall_seconds"] = round(elapsed, 3)
+    stats["answered_per_second"] = round(sum(1 for r in results if r["answered"]) / elapsed, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コメントマイクロバッチのスループット計測")
+    parser.add_argument("--rate", type=float, default=20.0, help="秒あたりのコメント数")
+    parser.add_argument("--duration", type=float, default=5.0, help="コメントを投入する秒数")
+    parser.add_argument("--latency", type=float, default=0.3, help="疑似LLMの基本レイテンシ（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="疑似LLMのトークンレート")
+    parser.add_argument("--output", help="結果JSONの出力先")
+    args = parser.parse_args()
+
+    report = {}
+    with FakeLLMServer(config=FakeLLMConfig(args.latency, args.token_rate)) as server:
+        for label, batching in (("per_comment", False), ("micro_batch", True)):
+            print(f"⏱️  {label} を計測中...")
+            report[label] = run_scenario(server.base_url, args.rate, args.duration, batching)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
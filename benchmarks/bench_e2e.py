@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+エンドツーエンドのレイテンシ・スループット計測
+
+ローカルの疑似LLMサーバー（OpenAI互換 / Ollama互換）を起動し、
+RuriCharacter の generate_response / generate_response_async / generate_stream_response を
+プロバイダーごとに同時セッション数を上げながら実行する。
+
+計測項目（シナリオ = プロバイダー × モード × 同時セッション数）:
+- 初回トークン時間（TTFT）の p50/p95
+- レイテンシの p50/p95/p99
+- トークン/秒（1文字=1トークン、壁時計あたりの合計）
+- セッションあたりのメモリ（tracemalloc のピーク / 同時セッション数）
+
+結果はJSONに保存し、--baseline を渡すと前回結果と比較して劣化を検出する（劣化時は終了コード1）。
+
+    python benchmarks/bench_e2e.py --output bench_e2e.json
+    python benchmarks/bench_e2e.py --baseline bench_e2e.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from fake_llm_server import FakeLLMServer, FakeLLMConfig
+
+MODES = ("sync", "async", "stream")
+MESSAGES = ["こんにちは！", "今日はどんな色が見えますか？", "最近嬉しかったことを教えて", "配信お疲れさま！"]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000, 1)
+
+
+# ------------------------------------------------------------
+# プロバイダーの準備
+# ------------------------------------------------------------
+def provider_configs(server: FakeLLMServer) -> Dict[str, Dict[str, Any]]:
+    """疑似サーバーへ向けたプロバイダー設定"""
+    return {
+        "openai": {"model": "fake", "api_key": "bench-dummy-key", "base_url": server.base_url},
+        "ollama": {"model": "fake:latest", "host": server.host, "port": server.port},
+    }
+
+
+def prepare_provider(name: str) -> Optional[str]:
+    """プロバイダーを登録し、利用できなければ理由を返す"""
+    from ai_providers import registry
+
+    if name == "openai":
+        # 疑似サーバー用のダミーキー（実キーが設定されていてもローカルにしか送られない）
+        os.environ.setdefault("OPENAI_API_KEY", "bench-dummy-key")
+        from settings import reload_settings
+        reload_settings()
+    if name == "ollama" and name not in registry.list_providers():
+        try:
+            import ollama  # noqa: F401
+        except ImportError:
+            return "ollama library not installed"
+        from ai_providers.ollama_provider import OllamaAIProvider
+        registry.register("ollama", OllamaAIProvider)
+    if name not in registry.list_providers():
+        return "not registered"
+    return None
+
+
+def make_character(name: str, config: Dict[str, Any]):
+    from character_ai import RuriCharacter
+
+    # フォールバック応答の擬似ストリーミングは遅延なし（計測にペース配分の待ちを含めない）
+    character = RuriCharacter(ai_provider=name, provider_config=config, stream_chars_per_second=0)
+    if character.provider_key != name:
+        return None
+    return character
+
+
+# ------------------------------------------------------------
+# 1リクエスト
+# ------------------------------------------------------------
+def _sync_request(character, message: str) -> Tuple[float, float, str]:
+    start = time.perf_counter()
+    text = character.generate_response(message)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, text
+
+
+async def _async_request(character, message: str) -> Tuple[float, float, str]:
+    start = time.perf_counter()
+    text = await character.generate_response_async(message)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, text
+
+
+async def _stream_request(character, message: str) -> Tuple[float, float, str]:
+    start = time.perf_counter()
+    first = None
+    chunks = []
+    async for chunk in character.generate_stream_response(message):
+        if first is None:
+            first = time.perf_counter() - start
+        chunks.append(chunk if isinstance(chunk, str) else getattr(chunk, "text", str(chunk)))
+    elapsed = time.perf_counter() - start
+    return (first if first is not None else elapsed), elapsed, "".join(chunks)
+
+
+# ------------------------------------------------------------
+# シナリオ
+# ------------------------------------------------------------
+def run_scenario(name: str, config: Dict[str, Any], mode: str, concurrency: int,
+                 requests_per_session: int, expected_reply: str, measure_memory: bool) -> Dict[str, Any]:
+    """同時セッション concurrency 件で requests_per_session 回ずつ応答を生成"""
+    from ai_providers import registry, router
+
+    # シナリオ間でプロバイダーインスタンス・ブレーカー状態を持ち越さない
+    registry.clear_cache()
+    router.reset()
+    sessions = [make_character(name, config) for _ in range(concurrency)]
+    if any(session is None for session in sessions):
+        return {"skipped": "provider unavailable"}
+
+    def message_for(session_index: int, request_index: int) -> str:
+        # 同一メッセージの集約（single-flight）が効かないようセッションごとに変える
+        return f"{MESSAGES[request_index % len(MESSAGES)]} (s{session_index}-r{request_index})"
+
+    if measure_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+
+    if mode == "sync":
+        def session_run(index: int):
+            return [_sync_request(sessions[index], message_for(index, i)) for i in range(requests_per_session)]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = [sample for result in pool.map(session_run, range(concurrency)) for sample in result]
+    else:
+        request = _async_request if mode == "async" else _stream_request
+
+        async def session_run(index: int):
+            return [await request(sessions[index], message_for(index, i)) for i in range(requests_per_session)]
+
+        async def run_all():
+            results = await asyncio.gather(*[session_run(index) for index in range(concurrency)])
+            return [sample for result in results for sample in result]
+
+        samples = asyncio.run(run_all())
+
+    wall = time.perf_counter() - wall_start
+    peak = None
+    if measure_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    ok = [(ttft, latency, text) for ttft, latency, text in samples if text == expected_reply]
+    ttfts = [ttft for ttft, _, _ in ok]
+    latencies = [latency for _, latency, _ in ok]
+    tokens = sum(len(text) for _, _, text in ok)
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "ttft_p50_ms": _ms(percentile(ttfts, 50)),
+        "ttft_p95_ms": _ms(percentile(ttfts, 95)),
+        "latency_p50_ms": _ms(percentile(latencies, 50)),
+        "latency_p95_ms": _ms(percentile(latencies, 95)),
+        "latency_p99_ms": _ms(percentile(latencies, 99)),
+        "tokens_per_second": round(tokens / wall, 1) if wall > 0 else None,
+        "memory_per_session_kb": round(peak / concurrency / 1024, 1) if peak is not None else None,
+    }
+
+
+def run_suite(args) -> Dict[str, Any]:
+    server_config = FakeLLMConfig(args.latency, args.token_rate, jitter=args.jitter, seed=args.seed)
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "settings": {
+            "latency": args.latency, "token_rate": args.token_rate, "jitter": args.jitter,
+            "concurrency": args.concurrency, "requests_per_session": args.requests,
+        },
+        "scenarios": {},
+    }
+
+    with FakeLLMServer(config=server_config) as server:
+        configs = provider_configs(server)
+        for name in args.providers:
+            reason = prepare_provider(name)
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    key = f"{name}/{mode}/c{concurrency}"
+                    if reason:
+                        result = {"skipped": reason}
+                    else:
+                        print(f"⏱️  {key} を計測中...")
+                        result = run_scenario(name, configs[name], mode, concurrency, args.requests,
+                                              server_config.reply_text, not args.no_memory)
+                    report["scenarios"][key] = result
+    return report
+
+
+# ------------------------------------------------------------
+# ベースライン比較
+# ------------------------------------------------------------
+LOWER_IS_BETTER = ("ttft_p95_ms", "latency_p95_ms", "latency_p99_ms", "memory_per_session_kb")
+HIGHER_IS_BETTER = ("tokens_per_second",)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """劣化した指標の一覧（tolerance=0.2 なら20%超の悪化を劣化とみなす）"""
+    regressions = []
+    for key, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(key)
+        if not previous or "skipped" in current or "skipped" in previous:
+            continue
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{key}: errors {previous.get('errors', 0)} -> {current['errors']}")
+        for metric in LOWER_IS_BETTER:
+            before, after = previous.get(metric), current.get(metric)
+            if before and after is not None and after > before * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {before} -> {after}")
+        for metric in HIGHER_IS_BETTER:
+            before, after = previous.get(metric), current.get(metric)
+            if before and after is not None and after < before * (1 - tolerance):
+                regressions.append(f"{key}: {metric} {before} -> {after}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RuriCharacter のエンドツーエンドベンチマーク")
+    parser.add_argument("--providers", nargs="+", default=["openai", "ollama"])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=5, help="セッションあたりのリクエスト数")
+    parser.add_argument("--latency", type=float, default=0.2, help="疑似LLMの初回トークン時間（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="疑似LLMのトークンレート")
+    parser.add_argument("--jitter", type=float, default=0.1, help="疑似LLMの遅延の揺らぎ（割合）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="tracemallocによるメモリ計測を省略")
+    parser.add_argument("--output", help="結果JSONの出力先")
+    parser.add_argument("--baseline", help="比較するベースラインJSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="劣化とみなす悪化率")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    print(json.dumps(report["scenarios"], ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 結果を保存しました: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("❌ ベースラインからの劣化を検出しました:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ ベースラインからの劣化はありません")
+
+
+if __name__ == "__main__":
+    main()
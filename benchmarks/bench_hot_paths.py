@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+メッセージごとに実行されるPythonのホットパスのマイクロベンチマーク
+
+対象:
+- EmotionSystem.detect_emotion_from_text / learn_emotion（ディスク書き込み込み）/ get_bubble_color_for_emotion
+- EmotionColorEngine.compute
+- SimpleAIProvider._determine_response_category
+- BaseAIProvider.get_emotion_analysis
+- RuriImageAnalyzer.analyze_colors（cv2 が無い環境ではスキップ）
+
+長さの異なる日本語コメントのコーパスで ops/sec と1回あたりのメモリ割り当て
+（tracemalloc のピーク増分と残留量）を計測し、比較可能なJSONを出力する。
+ネットワークは使わない。
+
+    python benchmarks/bench_hot_paths.py --output hot_paths.json
+    python benchmarks/bench_hot_paths.py --baseline hot_paths.json --tolerance 0.25
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+# ------------------------------------------------------------
+# コーパス（配信コメントを想定）
+# ------------------------------------------------------------
+SHORT_COMMENTS = [
+    "こんにちは", "8888", "wwww", "かわいい", "初見です", "草", "えっ", "好き",
+    "おつかれ！", "わくわく", "こわい", "ありがとう", "まさか", "やった！", "むぅ", "きた！",
+]
+
+MEDIUM_COMMENTS = [
+    "今日の配信も楽しみにしてました！",
+    "ルリちゃんの好きな色は何ですか？",
+    "仕事で疲れたけど配信見て元気出た、ありがとう",
+    "その話ちょっと切ないね…寂しい気持ちわかる",
+    "びっくりした！まさかそんな展開になるとは",
+    "最近イライラすることが多くて許せない気分",
+    "次の配信がもう待ち遠しい、期待してます",
+    "ホラーゲームは怖いから苦手なんだよね、不安になる",
+    "虹色の衣装すごい素敵、幸せな気持ちになった",
+    "感情ってどうやって学習しているの？教えてほしい",
+]
+
+LONG_COMMENTS = [
+    "今日は朝から雨で少し悲しい気分だったけど、ルリちゃんの配信を見ていたら楽しい気持ちになってきました。"
+    "特にさっきの色の話がとても素晴らしくて、モノクロの世界から少しずつ色が見えてくる感覚がわかる気がします。"
+    "次回も期待しています、ありがとう！",
+    "初めてコメントします。友達に勧められて見始めたのですが、正直最初は不安でした。"
+    "でも話を聞いているうちに大切なことを思い出させてもらえて、なんだか切ないけど幸せな気持ちになりました。"
+    "これからも応援しています、大好きです。",
+    "ちょっと相談なんですが、最近仕事でイライラすることが多くて、上司の言い方が許せないと感じてしまいます。"
+    "こういう時ってどう気持ちを整理したらいいんでしょうか？ルリちゃんならどう感じるのか教えてほしいです。"
+    "怖い話じゃなくて、前向きになれる話が聞きたいな。",
+    "まさかの展開にびっくりしました！えっ、本当にそんなことがあるの？って思わず声が出ちゃいました。"
+    "驚きと期待が入り混じってわくわくが止まらないです。次の配信が待ち遠しい、楽しみにしてます！",
+]
+
+CORPORA = {"short": SHORT_COMMENTS, "medium": MEDIUM_COMMENTS, "long": LONG_COMMENTS}
+
+
+# ------------------------------------------------------------
+# 計測
+# ------------------------------------------------------------
+def measure(fn: Callable[[Any], Any], inputs: List[Any], min_time: float, alloc_samples: int) -> Dict[str, Any]:
+    """ops/sec（min_time秒以上回す）と1回あたりの割り当てを計測"""
+    count = len(inputs)
+
+    # ウォームアップ
+    for item in inputs:
+        fn(item)
+
+    # 実行時間（tracemalloc無効状態）
+    gc.collect()
+    ops = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for item in inputs:
+            fn(item)
+        ops += count
+        elapsed = time.perf_counter() - start
+
+    # 割り当て（1回ごとのピーク増分と、まとめて実行した後の残留量）
+    samples = [inputs[i % count] for i in range(alloc_samples)]
+    gc.collect()
+    tracemalloc.start()
+    peaks = []
+    for item in samples:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(item)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    retained_start, _ = tracemalloc.get_traced_memory()
+    for item in samples:
+        fn(item)
+    gc.collect()
+    retained_end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(ops / elapsed, 1),
+        "mean_us": round(elapsed / ops * 1e6, 3),
+        "peak_alloc_bytes_per_call": round(sum(peaks) / len(peaks), 1),
+        "retained_bytes_per_call": round((retained_end - retained_start) / len(samples), 1),
+    }
+
+
+# ------------------------------------------------------------
+# ベンチマーク定義
+# ------------------------------------------------------------
+def build_benchmarks(workdir: str) -> Dict[str, Any]:
+    """名前 -> (関数, 入力) または スキップ理由"""
+    from emotion_system import EmotionSystem, EmotionType
+    from ai_providers.simple_provider import SimpleAIProvider
+
+    benchmarks: Dict[str, Any] = {}
+
+    system = EmotionSystem(save_path=os.path.join(workdir, "emotion_data.json"))
+    provider = SimpleAIProvider()
+    emotions = list(EmotionType)
+
+    for size, corpus in CORPORA.items():
+        benchmarks[f"emotion.detect_emotion_from_text/{size}"] = (system.detect_emotion_from_text, corpus)
+        benchmarks[f"simple.determine_response_category/{size}"] = (provider._determine_response_category, corpus)
+        benchmarks[f"base.get_emotion_analysis/{size}"] = (provider.get_emotion_analysis, corpus)
+
+    # 学習（毎回JSONを書き込む）
+    benchmarks["emotion.learn_emotion"] = (lambda emotion: system.learn_emotion(emotion, 0.01), emotions)
+
+    # 吹き出し色（モノクロ段階 / フルカラー段階）
+    monochrome = EmotionSystem(save_path=os.path.join(workdir, "monochrome.json"))
+    full_color = EmotionSystem(save_path=os.path.join(workdir, "full_color.json"))
+    for emotion in emotions:
+        full_color.emotion_levels[emotion] = 1.0
+    full_color._update_color_stage()
+    benchmarks["emotion.get_bubble_color_for_emotion/monochrome"] = (monochrome.get_bubble_color_for_emotion, emotions)
+    benchmarks["emotion.get_bubble_color_for_emotion/full_color"] = (full_color.get_bubble_color_for_emotion, emotions)
+
+    # 感情ベクトル -> 色（吹き出し・Live2D・OBS共通。丸めた入力ごとのキャッシュ込み）
+    from emotion_color import get_color_engine
+    color_engine = get_color_engine()
+    detected = [system.detect_emotion_vector(text) for text in CORPORA["short"]]
+    benchmarks["emotion_color.compute"] = (color_engine.compute, detected)
+
+    # 画像解析
+    imageboard = os.path.join(project_root, "assets", "ruri_imageboard.png")
+    try:
+        from image_analyzer import RuriImageAnalyzer
+        analyzer = RuriImageAnalyzer(imageboard)
+        benchmarks["image.analyze_colors"] = (lambda _: analyzer.analyze_colors(), [None])
+    except ImportError as e:
+        benchmarks["image.analyze_colors"] = f"skipped: {e}"
+
+    return benchmarks
+
+
+def run(args) -> Dict[str, Any]:
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"min_time": args.min_time, "alloc_samples": args.alloc_samples},
+        "results": {},
+    }
+
+    # 元のカレントディレクトリの設定ファイル（assets/ruri_config.json）を読むため移動
+    cwd = os.getcwd()
+    os.chdir(project_root)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, bench in build_benchmarks(workdir).items():
+                if args.filter and args.filter not in name:
+                    continue
+                if isinstance(bench, str):
+                    report["results"][name] = {"skipped": bench}
+                    print(f"⏭️  {name:<52} {bench}")
+                    continue
+                fn, inputs = bench
+                report["results"][name] = measure(fn, inputs, args.min_time, args.alloc_samples)
+                result = report["results"][name]
+                print(f"⏱️  {name:<52} {result['ops_per_sec']:>12,.0f} ops/s  "
+                      f"{result['peak_alloc_bytes_per_call']:>9,.0f} B/call")
+    finally:
+        os.chdir(cwd)
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """ops/sec の低下・割り当ての増加が tolerance を超えたものを列挙"""
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "skipped" in current or "skipped" in previous:
+            continue
+        if current["ops_per_sec"] < previous["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: ops/sec {previous['ops_per_sec']} -> {current['ops_per_sec']}")
+        before = previous["peak_alloc_bytes_per_call"]
+        after = current["peak_alloc_bytes_per_call"]
+        if after > max(before, 64) * (1 + tolerance):
+            regressions.append(f"{name}: peak alloc {before} -> {after} B/call")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="感情・パレット・色のホットパスのマイクロベンチマーク")
+    parser.add_argument("--min-time", type=float, default=0.5, help="ベンチマークごとの最小計測秒数")
+    parser.add_argument("--alloc-samples", type=int, default=200, help="割り当て計測の呼び出し回数")
+    parser.add_argument("--filter", help="名前にこの文字列を含むベンチマークのみ実行")
+    parser.add_argument("--output", help="結果JSONの出力先")
+    parser.add_argument("--baseline", help="比較するベースラインJSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="劣化とみなす悪化率")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 結果を保存しました: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("❌ ベースラインからの劣化を検出しました:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ ベースラインからの劣化はありません")
+
+
+if __name__ == "__main__":
+    main()
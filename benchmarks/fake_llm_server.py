@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用のローカル疑似LLMサーバー
+
+以下のプロトコルを提供する。
+- OpenAI chat-completions 互換: POST /v1/chat/completions（"stream": true でSSE）
+- Ollama 互換: POST /api/chat（既定でNDJSONストリーミング）、GET /api/tags
+
+最初のトークンまでの時間（latency）とトークンレート（token_rate）、
+その揺らぎ（jitter）を設定できる。1文字を1トークンとして扱う。
+コメントのバッチ返答プロンプト（"[番号] コメント" の行を含む）には
+コメントごとのJSON Linesで返答する。
+
+    python benchmarks/fake_llm_server.py --port 8765 --latency 0.3 --token-rate 50 --jitter 0.2
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Iterator, List, Optional
+
+_COMMENT_LINE = re.compile(r"^\[(\d+)\]\s*(.+)$", re.MULTILINE)
+_REPLY_TEXT = "コメントありがとうございます！とても嬉しいです。"
+
+
+class FakeLLMConfig:
+    """疑似LLMの振る舞い"""
+
+    def __init__(self, latency: float = 0.3, token_rate: float = 50.0, reply_text: str = _REPLY_TEXT,
+                 jitter: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            latency: 最初のトークンまでの秒数
+            token_rate: 秒あたりの生成トークン数（1文字=1トークンとみなす）
+            reply_text: 通常プロンプトへの返答
+            jitter: 遅延の揺らぎ（0.2なら各遅延を ±20% の一様乱数で揺らす）
+            seed: 揺らぎの乱数シード
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_text = reply_text
+        self.jitter = jitter
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _jittered(self, seconds: float) -> float:
+        if not self.jitter:
+            return seconds
+        with self.lock:
+            factor = self._random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+        return max(0.0, seconds * factor)
+
+    def first_token_delay(self) -> float:
+        return self._jittered(self.latency)
+
+    def token_delay(self) -> float:
+        return self._jittered(1.0 / self.token_rate)
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+
+def build_reply(prompt: str, config: FakeLLMConfig) -> str:
+    """プロンプトへの返答（バッチプロンプトならコメントごとのJSON Lines）"""
+    comments = _COMMENT_LINE.findall(prompt)
+    if not comments:
+        return config.reply_text
+    return "\n".join(
+        json.dumps({"id": int(comment_id), "reply": f"「{text[:10]}」ありがとう！", "emotion": "joy"},
+                   ensure_ascii=False)
+        for comment_id, text in comments
+    )
+
+
+def _paced_tokens(reply: str, config: FakeLLMConfig) -> Iterator[str]:
+    """設定した遅延でトークン（1文字）を順に返す"""
+    time.sleep(config.first_token_delay())
+    for index, token in enumerate(reply):
+        if index:
+            time.sleep(config.token_delay())
+        yield token
+
+
+def _make_handler(config: FakeLLMConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        # --------------------------------------------------------
+        # 共通
+        # --------------------------------------------------------
+        def _read_json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _send_json(self, payload: Dict[str, Any], status: int = 200):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _start_chunked(self, content_type: str):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+        def _write_chunk(self, data: str):
+            payload = data.encode("utf-8")
+            self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+
+        def _end_chunked(self):
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        @staticmethod
+        def _last_user_prompt(messages: List[Dict[str, str]]) -> str:
+            return messages[-1].get("content", "") if messages else ""
+
+        # --------------------------------------------------------
+        # ルーティング
+        # --------------------------------------------------------
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "/api/tags":
+                self._send_json({"models": [{"name": "fake:latest", "model": "fake:latest", "size": 0}]})
+            elif path == "/v1/models":
+                self._send_json({"object": "list", "data": [{"id": "fake", "object": "model"}]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            if path == "/v1/chat/completions":
+                self._openai_chat(self._read_json())
+            elif path == "/api/chat":
+                self._ollama_chat(self._read_json())
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        # --------------------------------------------------------
+        # OpenAI
+        # --------------------------------------------------------
+        def _openai_chat(self, request: Dict[str, Any]):
+            prompt = self._last_user_prompt(request.get("messages", []))
+            reply = build_reply(prompt, config)
+            model = request.get("model", "fake")
+            config.count_request()
+
+            if not request.get("stream"):
+                time.sleep(config.first_token_delay() + sum(config.token_delay() for _ in reply[1:]))
+                self._send_json({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(reply),
+                              "total_tokens": len(prompt) + len(reply)},
+                })
+                return
+
+            self._start_chunked("text/event-stream")
+            for token in _paced_tokens(reply, config):
+                event = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+            final = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self._end_chunked()
+
+        # --------------------------------------------------------
+        # Ollama
+        # --------------------------------------------------------
+        def _ollama_chat(self, request: Dict[str, Any]):
+            prompt = self._last_user_prompt(request.get("messages", []))
+            reply = build_reply(prompt, config)
+            model = request.get("model", "fake:latest")
+            config.count_request()
+
+            def message(content: str, done: bool) -> Dict[str, Any]:
+                item = {
+                    "model": model,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "message": {"role": "assistant", "content": content},
+                    "done": done,
+                }
+                if done:
+                    item.update({"done_reason": "stop", "prompt_eval_count": len(prompt), "eval_count": len(reply)})
+                return item
+
+            if request.get("stream", True) is False:
+                time.sleep(config.first_token_delay() + sum(config.token_delay() for _ in reply[1:]))
+                self._send_json(message(reply, True))
+                return
+
+            self._start_chunked("application/x-ndjson")
+            for token in _paced_tokens(reply, config):
+                self._write_chunk(json.dumps(message(token, False), ensure_ascii=False) + "\n")
+            self._write_chunk(json.dumps(message("", True)) + "\n")
+            self._end_chunked()
+
+    return Handler
+
+
+class FakeLLMServer:
+    """バックグラウンドスレッドで動く疑似LLMサーバー"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.config))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        """OpenAI互換APIのベースURL"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def ollama_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の疑似LLMサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="最初のトークンまでの秒数")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="秒あたりの生成トークン数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延の揺らぎ（割合）")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port,
+                           FakeLLMConfig(args.latency, args.token_rate, jitter=args.jitter))
+    print(f"🧪 疑似LLMサーバー起動: OpenAI={server.base_url} / Ollama={server.ollama_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+ルリ アプリ本体のパッケージ
+
+src/ 内のモジュールどうしは相対import（失敗時はモジュール名）で参照する:
+
+    try:
+        from .metrics import get_metrics
+    except ImportError:
+        from metrics import get_metrics
+
+テスト・ベンチマークのように src/ を import パスに加えて実行すると、同じファイルが
+"metrics" と "src.metrics" の2つのモジュールとして読み込まれ、メトリクス・設定・
+トレーサー等のプロセス共有オブジェクトが分かれてしまう。src/ がパス上にあるときは
+"src.<name>" を "<name>" と同じモジュールとして返す（モジュール側の対処は不要）。
+"""
+import importlib
+import importlib.abc
+import importlib.util
+import os
+import sys
+
+_SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _src_on_path() -> bool:
+    return any(os.path.abspath(entry or os.curdir) == _SRC_DIR for entry in sys.path)
+
+
+class _SharedModuleLoader(importlib.abc.Loader):
+    """"src.<name>" の読み込みを "<name>" の import に置き換える"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        # import 機構は読み込み後の sys.modules の値を返す
+        sys.modules[module.__name__] = importlib.import_module(self.name)
+
+
+class _SharedModuleFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path=None, target=None):
+        if not fullname.startswith(__name__ + ".") or not _src_on_path():
+            return None
+        name = fullname[len(__name__) + 1:]
+        if importlib.util.find_spec(name.partition(".")[0]) is None:
+            return None
+        return importlib.util.spec_from_loader(fullname, _SharedModuleLoader(name))
+
+
+if not any(isinstance(finder, _SharedModuleFinder) for finder in sys.meta_path):
+    sys.meta_path.insert(0, _SharedModuleFinder())
@@ -5,6 +5,9 @@ from .base_provider import BaseAIProvider
 from .registry import AIProviderRegistry
 from .simple_provider import SimpleAIProvider
 from .config_manager import AIProviderConfigManager, config_manager
+from .router import ProviderRouter, CircuitBreaker
+from .hedging import HedgedRequestExecutor
+from .single_flight import SingleFlight
 
 # 動的インポート用
 __all__ = [
@@ -12,7 +15,11 @@ __all__ = [
     'AIProviderRegistry', 
     'SimpleAIProvider',
     'AIProviderConfigManager',
-    'config_manager'
+    'config_manager',
+    'ProviderRouter',
+    'CircuitBreaker',
+    'HedgedRequestExecutor',
+    'SingleFlight'
 ]
 
 # グローバルレジストリインスタンス（設定管理統合）
@@ -46,6 +53,12 @@ try:
 except ImportError:
     pass
 
+# フェイルオーバールーター（ブレーカー状態・レイテンシ統計はプロセス全体で共有）
+router = ProviderRouter(registry, config_manager)
+
+# 同一プロンプトのリクエスト集約（実行中の呼び出しはプロセス全体で共有）
+single_flight = SingleFlight()
+
 # 設定管理との統合
 def get_configured_provider(force_reload: bool = False):
     """設定ファイルに基づいて最適なプロバイダーを取得"""
@@ -3,6 +3,34 @@ from typing import Dict, List, Any, Optional, Union, AsyncGenerator
 from dataclasses import dataclass
 from enum import Enum
 
+import numpy as np
+
+from .context_window import ContextWindowManager, PromptBuild
+
+try:
+    from ..metrics import get_metrics
+    from ..tracing import get_tracer
+    from ..emotion_vector import EMOTION_COUNT, EmotionVector, KeywordScorer, emotion_index
+except ImportError:
+    from metrics import get_metrics
+    from tracing import get_tracer
+    from emotion_vector import EMOTION_COUNT, EmotionVector, KeywordScorer, emotion_index
+
+_prompt_tokens = get_metrics().histogram(
+    "ruri_prompt_tokens", "リクエストごとのプロンプトトークン数", ("provider",),
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+_input_tokens_total = get_metrics().counter(
+    "ruri_prompt_input_tokens_total", "プロバイダーが報告した入力トークン数", ("provider",))
+_cached_tokens_total = get_metrics().counter(
+    "ruri_prompt_cached_tokens_total", "プロバイダー側でキャッシュから読まれた入力トークン数", ("provider",))
+_evaluated_tokens_total = get_metrics().counter(
+    "ruri_prompt_evaluated_tokens_total", "プロバイダーが実際に評価した入力トークン数（KVキャッシュで省いた分を除く）", ("provider",))
+
+# プロンプトの並び
+# - "stable_prefix": キャラクター設定を固定の先頭部分にし、変化する状態は末尾近くに置く（キャッシュ向き）
+# - "legacy": 状態をシステムプロンプト内に埋め込む従来の並び
+PROMPT_LAYOUTS = ("stable_prefix", "legacy")
+
 class EmotionType(Enum):
     """感情タイプ"""
     JOY = "joy"           # 喜び
@@ -14,6 +42,21 @@ class EmotionType(Enum):
     DISGUST = "disgust"   # 嫌悪
     ANTICIPATION = "anticipation"  # 期待
 
+_EMOTIONS = tuple(EmotionType)  # EmotionVector の添字 -> EmotionType
+
+# 感情分析のキーワード
+BASE_EMOTION_KEYWORDS = {
+    EmotionType.JOY: ["嬉しい", "楽しい", "幸せ", "良い", "素晴らしい"],
+    EmotionType.ANGER: ["怒り", "腹立たしい", "むかつく", "嫌い"],
+    EmotionType.SADNESS: ["悲しい", "辛い", "寂しい", "落ち込む"],
+    EmotionType.LOVE: ["愛", "好き", "大切", "愛している"],
+    EmotionType.SURPRISE: ["驚き", "びっくり", "まさか", "信じられない"],
+    EmotionType.FEAR: ["怖い", "恐れ", "不安", "心配"],
+    EmotionType.DISGUST: ["気持ち悪い", "嫌", "うんざり"],
+    EmotionType.ANTICIPATION: ["期待", "楽しみ", "待ち遠しい"]
+}
+_KEYWORD_SCORER = KeywordScorer(BASE_EMOTION_KEYWORDS, weight=0.3)
+
 class ColorStage(Enum):
     """色彩学習段階"""
     MONOCHROME = "monochrome"           # モノクロ段階
@@ -29,6 +72,36 @@ class EmotionState:
     color_hue: Optional[float] = None  # HSV色相値
     learned: bool = False
 
+class EmotionStateView:
+    """プロバイダーの感情配列の1要素を EmotionState と同じ属性で読み書きする"""
+    
+    __slots__ = ("emotion", "color_hue", "_provider", "_index")
+    
+    def __init__(self, provider: "BaseAIProvider", emotion: EmotionType, color_hue: Optional[float] = None):
+        self.emotion = emotion
+        self.color_hue = color_hue  # HSV色相値
+        self._provider = provider
+        self._index = emotion_index(emotion)
+    
+    @property
+    def intensity(self) -> float:
+        return float(self._provider.emotion_vector.values[self._index])
+    
+    @intensity.setter
+    def intensity(self, value: float):
+        self._provider.emotion_vector.values[self._index] = value
+    
+    @property
+    def learned(self) -> bool:
+        return bool(self._provider.emotion_learned[self._index])
+    
+    @learned.setter
+    def learned(self, value: bool):
+        self._provider.emotion_learned[self._index] = value
+    
+    def __repr__(self) -> str:
+        return f"EmotionStateView({self.emotion.value}, intensity={self.intensity:.2f}, learned={self.learned})"
+
 @dataclass
 class CharacterResponse:
     """キャラクター応答"""
@@ -45,6 +118,10 @@ class BaseAIProvider(ABC):
     統一インターフェースで利用可能にする
     """
     
+    # generate_response_async がイベントループを塞がない実装か
+    # （False のプロバイダーはルーターが同期版をスレッドプールへ退避して呼ぶ）
+    native_async = False
+    
     def __init__(self, config: Dict[str, Any] = None):
         """
         Args:
@@ -53,20 +130,25 @@ class BaseAIProvider(ABC):
         self.config = config or {}
         self.character_context = ""
         self.conversation_history: List[Dict[str, str]] = []
-        self.emotion_states: Dict[EmotionType, EmotionState] = {}
+        # 感情の強度と学習済みフラグ（EmotionType の定義順の配列。emotion_states はその参照用）
+        self.emotion_vector = EmotionVector()
+        self.emotion_learned = np.zeros(EMOTION_COUNT, dtype=bool)
+        self.emotion_states: Dict[EmotionType, EmotionStateView] = {}
         self.current_color_stage = ColorStage.MONOCHROME
+        # プロンプトのトークン予算と古い履歴の要約
+        self.context_window = ContextWindowManager.from_config(self.config)
+        self.prompt_layout = self.config.get("prompt_layout", "stable_prefix")
+        if self.prompt_layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"未対応のプロンプト配置: {self.prompt_layout}")
         
         # 初期感情状態設定
         self._initialize_emotions()
     
     def _initialize_emotions(self):
         """感情状態の初期化"""
-        for emotion in EmotionType:
-            self.emotion_states[emotion] = EmotionState(
-                emotion=emotion,
-                intensity=0.0,
-                learned=False
-            )
+        self.emotion_vector.values.fill(0.0)
+        self.emotion_learned.fill(False)
+        self.emotion_states = {emotion: EmotionStateView(self, emotion) for emotion in EmotionType}
     
     @abstractmethod
     def is_available(self) -> bool:
@@ -94,10 +176,70 @@ class BaseAIProvider(ABC):
         """ストリーミング応答生成"""
         pass
     
+    def close(self):
+        """接続などの資源を解放（レジストリが置き換え・破棄したインスタンスに対して呼ぶ）
+        
+        既定では何もしない。共有の接続プールの接続は閉じないこと。
+        """
+        pass
+    
+    async def aclose(self):
+        """close の非同期版"""
+        self.close()
+    
     def set_character_context(self, context: str):
         """キャラクター設定の読み込み"""
         self.character_context = context
     
+    def build_prompt(self, system_prompt: str, message: str, context: Dict[str, Any] = None,
+                     state_prompt: str = None) -> PromptBuild:
+        """トークン予算内のメッセージ列を組み立てる
+        
+        コンテキストに会話履歴があればそれを優先（フェイルオーバー時の履歴引き継ぎ）
+        state_prompt は "stable_prefix" 配置で今回の発言の直前に置く状態ブロック
+        """
+        context = context or {}
+        history = context.get('conversation_history')
+        if history is None:
+            history = []
+            for conv in self.conversation_history:
+                history.append({"role": "user", "content": conv["user"]})
+                history.append({"role": "assistant", "content": conv["assistant"]})
+        
+        build = self.context_window.build_messages(
+            system_prompt, history, message, context.get('conversation_id', 'default'), state_prompt
+        )
+        _prompt_tokens.observe(build.prompt_tokens, provider=self.__class__.__name__)
+        span = get_tracer().current_span()
+        if span is not None:
+            span.set_attribute("prompt_tokens", build.prompt_tokens)
+        return build
+    
+    def record_prompt_cache(self, input_tokens: Optional[int], cached_tokens: Optional[int]) -> Dict[str, Any]:
+        """プロバイダーが報告した入力トークン・キャッシュ済みトークンを記録（メタデータ用の辞書を返す）"""
+        if not input_tokens:
+            return {}
+        cached_tokens = max(0, min(cached_tokens or 0, input_tokens))
+        provider = self.__class__.__name__
+        _input_tokens_total.inc(input_tokens, provider=provider)
+        _cached_tokens_total.inc(cached_tokens, provider=provider)
+        return {
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "cache_hit_ratio": round(cached_tokens / input_tokens, 3),
+            "prompt_layout": self.prompt_layout,
+        }
+    
+    def record_prompt_eval(self, evaluated_tokens: Optional[int]) -> Dict[str, Any]:
+        """入力トークン総数・キャッシュ済み数を返さないプロバイダー（Ollama）の評価トークン数を記録
+        
+        手元の推定トークン数とは数え方が違うため、差を取ってキャッシュ率にはしない。
+        """
+        if evaluated_tokens is None:
+            return {}
+        _evaluated_tokens_total.inc(evaluated_tokens, provider=self.__class__.__name__)
+        return {"prompt_eval_count": evaluated_tokens, "prompt_layout": self.prompt_layout}
+    
     def add_conversation(self, user_message: str, assistant_message: str):
         """会話履歴の追加"""
         self.conversation_history.append({
@@ -111,16 +253,16 @@ class BaseAIProvider(ABC):
     
     def update_emotion_state(self, emotion: EmotionType, intensity: float):
         """感情状態の更新"""
-        if emotion in self.emotion_states:
-            self.emotion_states[emotion].intensity = max(0.0, min(1.0, intensity))
-            self.emotion_states[emotion].learned = True
-            
-            # 色彩段階の更新
-            self._update_color_stage()
+        index = emotion_index(emotion)
+        self.emotion_vector.values[index] = max(0.0, min(1.0, intensity))
+        self.emotion_learned[index] = True
+        
+        # 色彩段階の更新
+        self._update_color_stage()
     
     def _update_color_stage(self):
         """色彩段階の自動更新"""
-        learned_count = sum(1 for state in self.emotion_states.values() if state.learned)
+        learned_count = int(np.count_nonzero(self.emotion_learned))
         
         if learned_count == 0:
             self.current_color_stage = ColorStage.MONOCHROME
@@ -131,26 +273,17 @@ class BaseAIProvider(ABC):
         else:
             self.current_color_stage = ColorStage.FULL_COLOR
     
+    def analyze_emotions(self, text: str) -> EmotionVector:
+        """テキストの感情分析（キーワード1件につき0.3、最大1.0）"""
+        return _KEYWORD_SCORER.score(text)
+    
     def get_emotion_analysis(self, text: str) -> Dict[EmotionType, float]:
         """テキストの感情分析（基本実装）"""
-        # 基本的なキーワードベース分析
-        emotion_keywords = {
-            EmotionType.JOY: ["嬉しい", "楽しい", "幸せ", "良い", "素晴らしい"],
-            EmotionType.ANGER: ["怒り", "腹立たしい", "むかつく", "嫌い"],
-            EmotionType.SADNESS: ["悲しい", "辛い", "寂しい", "落ち込む"],
-            EmotionType.LOVE: ["愛", "好き", "大切", "愛している"],
-            EmotionType.SURPRISE: ["驚き", "びっくり", "まさか", "信じられない"],
-            EmotionType.FEAR: ["怖い", "恐れ", "不安", "心配"],
-            EmotionType.DISGUST: ["気持ち悪い", "嫌", "うんざり"],
-            EmotionType.ANTICIPATION: ["期待", "楽しみ", "待ち遠しい"]
-        }
-        
-        results = {}
-        for emotion, keywords in emotion_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in text)
-            results[emotion] = min(1.0, score * 0.3)
-        
-        return results
+        return self.analyze_emotions(text).to_dict(EmotionType)
+    
+    def get_learned_emotions(self) -> List[str]:
+        """学習済みの感情名（定義順）"""
+        return [_EMOTIONS[index].value for index in np.flatnonzero(self.emotion_learned)]
     
     def get_status_info(self) -> Dict[str, Any]:
         """プロバイダーの状態情報"""
@@ -158,26 +291,19 @@ class BaseAIProvider(ABC):
             "provider_name": self.__class__.__name__,
             "available": self.is_available(),
             "color_stage": self.current_color_stage.value,
-            "learned_emotions": [
-                emotion.value for emotion, state in self.emotion_states.items() 
-                if state.learned
-            ],
+            "learned_emotions": self.get_learned_emotions(),
             "conversation_count": len(self.conversation_history),
             "config": self.config
         }
     
     def get_color_info(self) -> Dict[str, Any]:
         """現在の色彩情報"""
-        dominant_emotion = max(
-            self.emotion_states.items(),
-            key=lambda x: x[1].intensity,
-            default=(EmotionType.JOY, EmotionState(EmotionType.JOY, 0.0))
-        )
+        dominant_emotion, dominant_intensity = self.emotion_vector.dominant(EmotionType)
         
         return {
             "stage": self.current_color_stage.value,
-            "dominant_emotion": dominant_emotion[0].value,
-            "dominant_intensity": dominant_emotion[1].intensity,
+            "dominant_emotion": dominant_emotion.value,
+            "dominant_intensity": dominant_intensity,
             "emotion_colors": {
                 emotion.value: state.color_hue 
                 for emotion, state in self.emotion_states.items()
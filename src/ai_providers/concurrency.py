@@ -0,0 +1,351 @@
+"""
+非同期実行の基盤（スレッドへの退避・同時実行数の制限・同期呼び出し用の共有ループ）
+
+- 同期APIしかないプロバイダー呼び出しは、サイズを決めた共有スレッドプールへ退避して
+  イベントループを塞がない
+- ConcurrencyLimit はイベントループ・スレッドをまたいで共有できる同時実行数の上限
+  （Streamlitのセッションごとのスレッドと配信用のループが同じ上限を使う）
+- run_sync は共有のバックグラウンドループでコルーチンを実行する同期ファサード用。
+  全セッションの呼び出しが1つのループに集まるため、相乗り（SingleFlight）や
+  非同期の接続プールもセッション間で共有される
+- iterate_in_thread / iterate_sync は同期・非同期のストリーミングをつなぐ
+
+環境変数:
+    RURI_PROVIDER_THREADS       退避用スレッドプールのサイズ（既定: 16）
+    RURI_PROVIDER_CONCURRENCY   プロバイダーごとの同時リクエスト数の既定値（既定: 8）
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Iterable, Iterator, Optional
+
+try:
+    from ..metrics import get_metrics
+except ImportError:
+    from metrics import get_metrics
+
+_wait_seconds = get_metrics().histogram(
+    "ruri_concurrency_wait_seconds", "同時実行数の上限による待ち時間（秒）", ("limit",))
+_active = get_metrics().gauge("ruri_concurrency_active", "上限つき区間で実行中の数", ("limit",))
+
+
+class ConcurrencyLimit:
+    """ループ・スレッドをまたいで共有できる同時実行数の上限
+
+    非同期では `async with limit:`、スレッドからは `with limit:` で使う。
+    待っている呼び出しには到着順に枠を渡す。
+    """
+
+    def __init__(self, limit: int, name: str = "default"):
+        if limit < 1:
+            raise ValueError("limit は1以上を指定してください")
+        self.limit = limit
+        self.name = name
+        self._lock = threading.Lock()
+        self._active = 0
+        self._max_waiting = 0
+        self._waiters: deque = deque()  # (loop, future) または (None, threading.Event)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _try_acquire(self) -> bool:
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return True
+        return False
+
+    def _enqueue(self, waiter):
+        self._waiters.append(waiter)
+        self._max_waiting = max(self._max_waiting, len(self._waiters))
+
+    async def acquire(self):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                self._acquired(start)
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._enqueue(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # 枠を受け取った直後にキャンセルされた場合は次へ渡す
+            if future.done() and not future.cancelled():
+                self._pass_on()
+            raise
+        self._acquired(start)
+
+    def acquire_blocking(self, timeout: float = None) -> bool:
+        start = time.perf_counter()
+        with self._lock:
+            if self._try_acquire():
+                self._acquired(start)
+                return True
+            event = threading.Event()
+            waiter = (None, event)
+            self._enqueue(waiter)
+        if event.wait(timeout):
+            self._acquired(start)
+            return True
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return False
+        # タイムアウトと同時に枠を受け取った
+        self._pass_on()
+        return False
+
+    def _acquired(self, start: float):
+        _wait_seconds.observe(time.perf_counter() - start, limit=self.name)
+        _active.inc(limit=self.name)
+
+    def _pass_on(self):
+        """受け取ったが使わない枠を次の待ち手へ渡す"""
+        _active.inc(limit=self.name)
+        self.release()
+
+    def release(self):
+        _active.dec(limit=self.name)
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop is None:
+                    waiter.set()
+                    return
+                if waiter.cancelled():
+                    continue
+                try:
+                    loop.call_soon_threadsafe(self._grant, waiter)
+                    return
+                except RuntimeError:
+                    continue  # 待っていたループが既に閉じている
+            self._active -= 1
+
+    def _grant(self, future: asyncio.Future):
+        # 枠は解放側から引き継ぐ（_active は変えない）
+        if future.done():
+            self._pass_on()
+        else:
+            future.set_result(True)
+
+    async def __aenter__(self) -> "ConcurrencyLimit":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def __enter__(self) -> "ConcurrencyLimit":
+        self.acquire_blocking()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "max_waiting": self._max_waiting,
+        }
+
+
+class ProviderLimits:
+    """プロバイダーごとの同時リクエスト数の上限（設定の "max_concurrency" を使う）"""
+
+    def __init__(self, config_manager=None, default_limit: int = None):
+        self.config_manager = config_manager
+        self.default_limit = default_limit or int(os.getenv("RURI_PROVIDER_CONCURRENCY", "8"))
+        self._limits: Dict[str, ConcurrencyLimit] = {}
+        self._lock = threading.Lock()
+
+    def _configured_limit(self, name: str) -> int:
+        if self.config_manager is not None:
+            try:
+                config = self.config_manager.get_provider_config(name) or {}
+                if config.get("max_concurrency"):
+                    return int(config["max_concurrency"])
+            except Exception:
+                pass
+        return self.default_limit
+
+    def get(self, name: str) -> ConcurrencyLimit:
+        with self._lock:
+            if name not in self._limits:
+                self._limits[name] = ConcurrencyLimit(self._configured_limit(name), name=f"provider:{name}")
+            return self._limits[name]
+
+    def set_limit(self, name: str, limit: int):
+        """上限を変更（実行中・待機中の呼び出しは古い上限のまま完了する）"""
+        with self._lock:
+            self._limits[name] = ConcurrencyLimit(limit, name=f"provider:{name}")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: limit.get_status() for name, limit in self._limits.items()}
+
+
+# ------------------------------------------------------------
+# スレッドへの退避
+# ------------------------------------------------------------
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """同期プロバイダー呼び出し用の共有スレッドプール"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("RURI_PROVIDER_THREADS", "16")),
+                thread_name_prefix="ruri-provider",
+            )
+        return _executor
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """同期関数を共有スレッドプールで実行（トレースのスパン等のコンテキストも引き継ぐ）"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, fn, *args, **kwargs))
+
+
+_END = object()
+
+
+async def iterate_in_thread(factory: Callable[[], Iterable[Any]]) -> AsyncIterator[Any]:
+    """同期イテレーター（同期SDKのストリーミング応答等）を共有スレッドプールで回し、要素を非同期に受け取る
+
+    受け取り側が途中でやめた場合は、次の要素の時点でイテレーターを閉じる
+    （with 文で確保した枠などはワーカースレッド側で解放される）。
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def post(item: Any, error: BaseException = None):
+        try:
+            loop.call_soon_threadsafe(items.put_nowait, (item, error))
+        except RuntimeError:
+            stop.set()  # ループが既に閉じている
+
+    def pump():
+        iterator = iter(factory())
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                post(item)
+        except BaseException as e:
+            post(_END, e)
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        post(_END)
+
+    context = contextvars.copy_context()
+    loop.run_in_executor(get_executor(), context.run, pump)
+    try:
+        while True:
+            item, error = await items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+# ------------------------------------------------------------
+# 同期ファサード用の共有ループ
+# ------------------------------------------------------------
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_async_loop() -> asyncio.AbstractEventLoop:
+    """同期呼び出しを受け付けるバックグラウンドのイベントループ（プロセスで1つ）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=run, name="ruri-async-loop", daemon=True).start()
+            ready.wait()
+            _loop = loop
+        return _loop
+
+
+def run_sync(coro: Coroutine, timeout: float = None) -> Any:
+    """コルーチンを共有ループで実行して結果を待つ（イベントループ外のスレッドから呼ぶ）
+
+    呼び出し元のコンテキスト（トレースの親スパン等）はそのまま引き継がれる。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("イベントループ内からは run_sync ではなく await で呼び出してください")
+    return asyncio.run_coroutine_threadsafe(coro, get_async_loop()).result(timeout)
+
+
+def iterate_sync(agen: AsyncIterator[Any]) -> Iterator[Any]:
+    """非同期イテレーターを共有ループで回し、同期的に要素を受け取る（Streamlit等から使う）
+
+    受け取り側が途中でやめるとループ上の処理はキャンセルされる。
+    """
+    items: queue.SimpleQueue = queue.SimpleQueue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((_END, e))
+            return
+        items.put((_END, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_async_loop())
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None and not isinstance(error, asyncio.CancelledError):
+                    raise error
+                return
+            yield item
+    finally:
+        future.cancel()
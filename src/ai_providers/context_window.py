@@ -0,0 +1,280 @@
+"""
+会話コンテキストのウィンドウ管理
+
+プロバイダーへ渡すプロンプトをトークン予算内に収める。
+- トークン数は tiktoken があればそれで、無ければ文字種ベースの推定で数える
+- 新しい発言から予算いっぱいまで履歴を詰め、入りきらない古い発言は要約にまとめる
+- 要約の更新はバックグラウンドスレッドで行い、リクエストは手元の最新要約を使う
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+try:
+    from ..log_config import get_logger
+except ImportError:
+    from log_config import get_logger
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _ENCODING = None
+    TIKTOKEN_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+# メッセージごとの役割・区切りのオーバーヘッド（OpenAIのchat形式の目安）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """テキストのトークン数"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return estimate_tokens(text)
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の推定（日本語は概ね1文字1トークン、英数字は4文字で1トークン）"""
+    wide = 0
+    narrow = 0
+    for char in text:
+        if ord(char) > 0x2E7F:
+            wide += 1
+        elif not char.isspace():
+            narrow += 1
+    return wide + (narrow + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def extractive_summary(previous: str, entries: List[Dict[str, str]], max_tokens: int) -> str:
+    """LLMを使わない要約（前回の要約に、各発言の冒頭を追記して予算で切る）"""
+    lines = [previous] if previous else []
+    for entry in entries:
+        content = " ".join(entry.get("content", "").split())
+        if not content:
+            continue
+        speaker = "ユーザー" if entry.get("role") == "user" else "ルリ"
+        head = content.split("。")[0][:60]
+        lines.append(f"{speaker}: {head}")
+
+    # 予算を超えたら古い行から落とす
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+@dataclass
+class PromptBuild:
+    """組み立てたプロンプトとトークン内訳"""
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    history_used: int
+    history_dropped: int
+    summary_tokens: int = 0
+    budget: int = 0
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "history_used": self.history_used,
+            "history_dropped": self.history_dropped,
+            "summary_tokens": self.summary_tokens,
+            "prompt_budget": self.budget,
+        }
+
+
+@dataclass
+class _SummaryState:
+    text: str = ""
+    last_covered: Optional[str] = None  # 要約済みの最後の発言の指紋
+    pending: Optional[Future] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def _fingerprint(entry: Dict[str, str]) -> str:
+    raw = f"{entry.get('role')}\x1f{entry.get('content', '')}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ContextWindowManager:
+    """トークン予算つきのプロンプト組み立てと要約の管理"""
+
+    def __init__(self,
+                 max_prompt_tokens: int = 3000,
+                 summary_tokens: int = 300,
+                 min_recent_messages: int = 2,
+                 summarizer: Callable[[str, List[Dict[str, str]], int], str] = None,
+                 max_conversations: int = 256):
+        """
+        Args:
+            max_prompt_tokens: プロンプト全体（システム・要約・履歴・今回の発言）の上限
+            summary_tokens: 要約に割り当てる上限
+            min_recent_messages: 予算を超えても残す直近の発言数
+            summarizer: (前回の要約, 新たに要約する発言, 上限トークン) -> 要約
+            max_conversations: 要約を保持する会話数の上限（古いものから破棄）
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summary_tokens = summary_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summarizer = summarizer or extractive_summary
+        self.max_conversations = max_conversations
+        self._summaries: "OrderedDict[str, _SummaryState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] = None) -> "ContextWindowManager":
+        """プロバイダー設定の "context_window" から生成"""
+        options = (config or {}).get("context_window", {})
+        return cls(**{key: value for key, value in options.items()
+                      if key in ("max_prompt_tokens", "summary_tokens", "min_recent_messages")})
+
+    # ------------------------------------------------------------
+    # 組み立て
+    # ------------------------------------------------------------
+    def build_messages(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                       conversation_id: str = "default", state_prompt: str = None) -> PromptBuild:
+        """OpenAI/Ollama形式のメッセージ列を予算内で組み立てる
+
+        並びは [システム, 要約, 履歴..., 状態, 今回の発言]。
+        頻繁に変わる状態（state_prompt）を末尾近くに置くことで、
+        システムプロンプトから履歴までの先頭部分がリクエスト間で同一に保たれ、
+        プロバイダー側のプロンプトキャッシュが効く。
+        """
+        history = [entry for entry in (history or []) if entry.get("role") in ("user", "assistant")]
+        system = {"role": "system", "content": system_prompt}
+        current = {"role": "user", "content": message}
+        state = {"role": "system", "content": state_prompt} if state_prompt else None
+        fixed = message_tokens(system) + message_tokens(current) + (message_tokens(state) if state else 0)
+
+        kept, dropped, summary = self.fit_history(history, fixed, conversation_id)
+
+        messages = [system]
+        summary_tokens = 0
+        if summary:
+            summary_message = {"role": "system", "content": f"これまでの会話の要約:\n{summary}"}
+            summary_tokens = message_tokens(summary_message)
+            messages.append(summary_message)
+        messages.extend({"role": entry["role"], "content": entry["content"]} for entry in kept)
+        if state:
+            messages.append(state)
+        messages.append(current)
+
+        return PromptBuild(
+            messages=messages,
+            prompt_tokens=fixed + summary_tokens + sum(message_tokens(entry) for entry in kept),
+            history_used=len(kept),
+            history_dropped=dropped,
+            summary_tokens=summary_tokens,
+            budget=self.max_prompt_tokens,
+        )
+
+    def fit_history(self, history: List[Dict[str, str]], fixed_tokens: int,
+                    conversation_id: str = "default") -> Tuple[List[Dict[str, str]], int, str]:
+        """予算に収まる直近の履歴・溢れた件数・使う要約
+
+        溢れた発言があれば要約の更新をバックグラウンドで予約する。
+        """
+        state = self._state(conversation_id)
+        summary = state.text
+        available = self.max_prompt_tokens - fixed_tokens
+        if summary:
+            available -= count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+
+        kept_count = 0
+        used = 0
+        for entry in reversed(history):
+            cost = message_tokens(entry)
+            if used + cost > available and kept_count >= self.min_recent_messages:
+                break
+            used += cost
+            kept_count += 1
+
+        split = len(history) - kept_count
+        older, kept = history[:split], history[split:]
+        if older:
+            self._schedule_summary(conversation_id, state, older, kept)
+        return kept, len(older), summary
+
+    # ------------------------------------------------------------
+    # 要約
+    # ------------------------------------------------------------
+    def _state(self, conversation_id: str) -> _SummaryState:
+        with self._lock:
+            state = self._summaries.get(conversation_id)
+            if state is None:
+                state = self._summaries[conversation_id] = _SummaryState()
+                while len(self._summaries) > self.max_conversations:
+                    self._summaries.popitem(last=False)
+            else:
+                self._summaries.move_to_end(conversation_id)
+            return state
+
+    @staticmethod
+    def _unsummarized(state: _SummaryState, older: List[Dict[str, str]],
+                      kept: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """溢れた発言のうち、まだ要約に入っていないもの"""
+        if state.last_covered is None:
+            return older
+        fingerprints = [_fingerprint(entry) for entry in older]
+        if state.last_covered in fingerprints:
+            return older[fingerprints.index(state.last_covered) + 1:]
+        if any(_fingerprint(entry) == state.last_covered for entry in kept):
+            return []
+        # 要約済みの発言は履歴の上限で既に切り捨てられている
+        return older
+
+    def _schedule_summary(self, conversation_id: str, state: _SummaryState,
+                          older: List[Dict[str, str]], kept: List[Dict[str, str]]):
+        with state.lock:
+            if state.pending is not None and not state.pending.done():
+                return
+            entries = self._unsummarized(state, older, kept)
+            if not entries:
+                return
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ruri-summary")
+            state.pending = self._executor.submit(self._refresh_summary, state, list(entries))
+
+    def _refresh_summary(self, state: _SummaryState, entries: List[Dict[str, str]]):
+        try:
+            text = self.summarizer(state.text, entries, self.summary_tokens)
+        except Exception as e:
+            logger.warning("⚠️ 会話要約の更新に失敗: %s", e)
+            return
+        with state.lock:
+            state.text = text
+            state.last_covered = _fingerprint(entries[-1])
+
+    def get_summary(self, conversation_id: str = "default") -> str:
+        return self._state(conversation_id).text
+
+    def wait_for_summaries(self, timeout: float = None):
+        """予約済みの要約更新の完了を待つ（テスト・終了処理用）"""
+        with self._lock:
+            states = list(self._summaries.values())
+        for state in states:
+            pending = state.pending
+            if pending is not None:
+                pending.result(timeout)
+
+    def reset(self, conversation_id: str = None):
+        with self._lock:
+            if conversation_id is None:
+                self._summaries.clear()
+            else:
+                self._summaries.pop(conversation_id, None)
@@ -0,0 +1,286 @@
+"""
+プロバイダー横断のヘッジリクエスト（テールレイテンシ対策）
+
+第一候補のプロバイダーが一定時間内に最初のトークンを返さない場合、
+別プロバイダー（または別モデル）へ二本目のリクエストを出し、先に完了した方を採用する。
+負けた側はキャンセルする。ヘッジ遅延は第一候補の初回トークン時間の分位点から決める。
+"""
+import asyncio
+import contextlib
+import inspect
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, Tuple
+
+from .base_provider import BaseAIProvider, CharacterResponse
+from .router import LatencyTracker
+
+
+class HedgeLegError(Exception):
+    """ヘッジの片側が失敗（例外またはエラー応答）"""
+
+
+@dataclass
+class LegResult:
+    """片側（primary / secondary）の実行結果"""
+    text: str
+    response: Optional[CharacterResponse]
+    first_token_latency: float
+    total_latency: float
+
+
+@dataclass
+class HedgedResult:
+    """ヘッジ実行の結果（どちらが勝ったかを記録してヘッジ遅延の調整に使う）"""
+    text: str
+    response: Optional[CharacterResponse]
+    winner: str                      # "primary" / "secondary"
+    winner_provider: str
+    hedged: bool                     # 二本目を出したか
+    hedge_delay: float               # 使用したヘッジ遅延（秒）
+    first_token_latency: float       # 勝者の初回トークン時間（リクエスト開始から）
+    total_latency: float
+    cancelled: Optional[str] = None  # キャンセルした側
+
+    def to_metadata(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("text")
+        data.pop("response")
+        return data
+
+
+class HedgedRequestExecutor:
+    """ヘッジリクエストの実行と統計"""
+
+    def __init__(self,
+                 router=None,
+                 percentile: float = 95.0,
+                 default_delay: float = 0.5,
+                 min_delay: float = 0.05,
+                 max_delay: float = 3.0,
+                 min_samples: int = 10,
+                 history_size: int = 200):
+        """
+        Args:
+            router: ProviderRouter（結果をブレーカー・レイテンシ統計に反映）
+            percentile: ヘッジ遅延に使う初回トークン時間の分位点
+            default_delay: サンプル不足時のヘッジ遅延（秒）
+            min_delay / max_delay: ヘッジ遅延の下限・上限（秒）
+            min_samples: 分位点を採用する最小サンプル数
+            history_size: 保持する実行結果の件数
+        """
+        self.router = router
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+
+        self._first_token: Dict[str, LatencyTracker] = {}
+        self._history: deque = deque(maxlen=history_size)
+        self._stats = {
+            "requests": 0,
+            "hedged": 0,
+            "wins": {"primary": 0, "secondary": 0},
+        }
+
+    # ------------------------------------------------------------
+    # ヘッジ遅延
+    # ------------------------------------------------------------
+    def _tracker(self, name: str) -> LatencyTracker:
+        if name not in self._first_token:
+            self._first_token[name] = LatencyTracker()
+        return self._first_token[name]
+
+    def get_hedge_delay(self, provider_name: str) -> float:
+        """第一候補の初回トークン時間の分位点（サンプル不足時は既定値）"""
+        tracker = self._tracker(provider_name)
+        delay = self.default_delay
+        if len(tracker) >= self.min_samples:
+            delay = tracker.percentile(self.percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    # ------------------------------------------------------------
+    # 実行
+    # ------------------------------------------------------------
+    async def _run_leg(self,
+                       provider: BaseAIProvider,
+                       message: str,
+                       context: Dict[str, Any],
+                       first_token: asyncio.Event,
+                       started: float,
+                       limit=None) -> LegResult:
+        """片側を実行。ストリーミング対応なら最初のチャンク到着でfirst_tokenを立てる
+
+        limit（ConcurrencyLimit）があれば、枠を確保してから呼び出し、終わるまで保持する。
+        """
+        async with limit if limit is not None else contextlib.AsyncExitStack():
+            return await self._call_leg(provider, message, context, first_token, started)
+
+    async def _call_leg(self,
+                        provider: BaseAIProvider,
+                        message: str,
+                        context: Dict[str, Any],
+                        first_token: asyncio.Event,
+                        started: float) -> LegResult:
+        loop = asyncio.get_running_loop()
+        try:
+            if inspect.isasyncgenfunction(provider.generate_stream_response):
+                chunks = []
+                first_at = None
+                async for chunk in provider.generate_stream_response(message, context):
+                    if first_at is None:
+                        first_at = loop.time()
+                        first_token.set()
+                    chunks.append(chunk)
+                text = "".join(chunks)
+                response = None
+            else:
+                response = await provider.generate_response_async(message, context)
+                first_at = loop.time()
+                first_token.set()
+                text = response.text if response else ""
+                if response and (response.metadata or {}).get("error"):
+                    raise HedgeLegError(str(response.metadata["error"]))
+        except (asyncio.CancelledError, HedgeLegError):
+            raise
+        except Exception as e:
+            raise HedgeLegError(f"{e.__class__.__name__}: {e}") from e
+
+        if not text:
+            raise HedgeLegError("empty_response")
+
+        finished = loop.time()
+        return LegResult(
+            text=text,
+            response=response,
+            first_token_latency=(first_at or finished) - started,
+            total_latency=finished - started,
+        )
+
+    async def execute(self,
+                      primary: Tuple[str, BaseAIProvider],
+                      secondary: Optional[Tuple[str, BaseAIProvider]],
+                      message: str,
+                      context: Dict[str, Any] = None,
+                      limits=None) -> HedgedResult:
+        """ヘッジ付きで応答生成
+
+        Args:
+            primary: (プロバイダー名, インスタンス)
+            secondary: ヘッジ先 (プロバイダー名, インスタンス)。Noneならヘッジしない
+            limits: ProviderLimits（両側ともプロバイダーごとの同時実行数の上限に従う）
+        Raises:
+            HedgeLegError: 両側とも失敗した場合
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        delay = self.get_hedge_delay(primary[0])
+
+        legs = {"primary": primary}
+        events = {"primary": asyncio.Event()}
+        tasks: Dict[asyncio.Task, str] = {}
+
+        def start_leg(leg: str):
+            if leg == "secondary":
+                legs[leg] = secondary
+                events[leg] = asyncio.Event()
+            task = asyncio.create_task(
+                self._run_leg(legs[leg][1], message, context, events[leg], started,
+                              limits.get(legs[leg][0]) if limits is not None else None)
+            )
+            tasks[task] = leg
+
+        start_leg("primary")
+        primary_task = next(iter(tasks))
+
+        # ヘッジ遅延まで第一候補の最初のトークン（または完了）を待つ
+        first_wait = asyncio.create_task(events["primary"].wait())
+        await asyncio.wait({primary_task, first_wait}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        first_wait.cancel()
+
+        hedged = False
+        primary_ok = primary_task.done() and not primary_task.cancelled() and primary_task.exception() is None
+        if secondary is not None and not events["primary"].is_set() and not primary_ok:
+            start_leg("secondary")
+            hedged = True
+
+        winner_task = None
+        errors: Dict[str, str] = {}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                leg = tasks[task]
+                if task.exception() is None:
+                    winner_task = winner_task or task
+                else:
+                    errors[leg] = str(task.exception())
+                    self._record_provider(legs[leg][0], success=False)
+            if winner_task is not None:
+                break
+            # 第一候補が最初のトークン後に失敗した場合もセカンダリで救済
+            if not pending and secondary is not None and "secondary" not in legs:
+                start_leg("secondary")
+                hedged = True
+                pending = {task for task, leg in tasks.items() if leg == "secondary"}
+
+        # 敗者のキャンセル
+        cancelled = None
+        for task in pending:
+            task.cancel()
+            cancelled = tasks[task]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        self._stats["requests"] += 1
+        if hedged:
+            self._stats["hedged"] += 1
+
+        if winner_task is None:
+            raise HedgeLegError(f"全てのレッグが失敗しました: {errors}")
+
+        winner = tasks[winner_task]
+        leg_result: LegResult = winner_task.result()
+        winner_name = legs[winner][0]
+        self._stats["wins"][winner] += 1
+        self._tracker(winner_name).record(leg_result.first_token_latency)
+        self._record_provider(winner_name, success=True, latency=leg_result.total_latency)
+
+        result = HedgedResult(
+            text=leg_result.text,
+            response=leg_result.response,
+            winner=winner,
+            winner_provider=winner_name,
+            hedged=hedged,
+            hedge_delay=delay,
+            first_token_latency=leg_result.first_token_latency,
+            total_latency=leg_result.total_latency,
+            cancelled=cancelled,
+        )
+        self._history.append(result.to_metadata())
+        return result
+
+    def _record_provider(self, name: str, success: bool, latency: float = None):
+        if self.router is not None:
+            self.router.record_result(name, success, latency)
+
+    # ------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------
+    def get_stats(self) -> Dict[str, Any]:
+        """ヘッジ率・勝敗・初回トークン分位点（ヘッジ遅延の調整用）"""
+        requests = self._stats["requests"]
+        hedged = self._stats["hedged"]
+        hedged_history = [item for item in self._history if item["hedged"]]
+        return {
+            "requests": requests,
+            "hedged": hedged,
+            "hedge_rate": round(hedged / requests, 3) if requests else 0.0,
+            "wins": dict(self._stats["wins"]),
+            "secondary_win_rate_when_hedged": round(
+                sum(1 for item in hedged_history if item["winner"] == "secondary") / len(hedged_history), 3
+            ) if hedged_history else None,
+            "first_token": {name: tracker.get_status() for name, tracker in self._first_token.items()},
+            "recent": list(self._history)[-10:],
+        }
@@ -0,0 +1,345 @@
+"""
+プロバイダー共通のHTTP接続プール
+
+OpenAI・Ollama・GPT-OSS がそれぞれクライアントを作るとTCP/TLSハンドシェイクが
+インスタンスごとに繰り返され、接続も共有されない。ここでプロセス全体で1つの
+keep-alive 接続プールを持ち、各プロバイダーのクライアントに注入する。
+
+- 接続先（scheme://host:port）ごとにトランスポートを1つ持ち、接続数の上限はホスト単位
+- h2 パッケージがあれば HTTP/2 を有効化（HTTPSの接続先で多重化される）
+- SDKによって依存するhttpx実装が異なる（openai は httpx2 の場合がある）ため、
+  トランスポートはライブラリごとに分けて持つ
+- 利用状況（接続数・処理中リクエスト・所要時間）はメトリクスとして公開
+- 起動時に接続先へ先行接続（prewarm）して、初回リクエストのハンドシェイクを省く
+"""
+import importlib
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    from ..metrics import get_metrics
+    from ..log_config import get_logger
+    from ..settings import get_settings
+except ImportError:
+    from metrics import get_metrics
+    from log_config import get_logger
+    from settings import get_settings
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    try:
+        import httpx2 as httpx
+        HTTPX_AVAILABLE = True
+    except ImportError:
+        httpx = None
+        HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+_requests_total = get_metrics().counter(
+    "ruri_http_pool_requests_total", "共有HTTP接続プール経由のリクエスト", ("host", "result"))
+_request_seconds = get_metrics().histogram(
+    "ruri_http_pool_request_seconds", "レスポンスヘッダー受信までの時間（秒）", ("host",))
+_in_flight = get_metrics().gauge(
+    "ruri_http_pool_in_flight", "処理中のリクエスト数", ("host",))
+_connections = get_metrics().gauge(
+    "ruri_http_pool_connections", "プール内の接続数", ("host", "state"))
+_prewarm_total = get_metrics().counter(
+    "ruri_http_pool_prewarm_total", "起動時の先行接続", ("host", "result"))
+
+
+def origin_of(url: str) -> str:
+    """URLの接続先（scheme://host:port）"""
+    parts = urlsplit(url if "://" in url else f"http://{url}")
+    scheme = parts.scheme or "http"
+    port = parts.port or (443 if scheme == "https" else 80)
+    return f"{scheme}://{parts.hostname}:{port}"
+
+
+def _library_of(client_class: type) -> Any:
+    """httpx.Client 系のクラスが属するhttpx実装（httpx / httpx2）のモジュール"""
+    for cls in client_class.__mro__:
+        name = cls.__module__.split(".")[0]
+        if name.startswith("httpx"):
+            return importlib.import_module(name)
+    return httpx
+
+
+def _connection_counts(transport: Any) -> Optional[Tuple[int, int]]:
+    """トランスポートの接続数（総数, アイドル数）
+
+    httpx は接続プールを公開していないため、内部の httpcore.ConnectionPool を参照する。
+    httpx/httpcore の版で構造が違って読めないときは None（統計・メトリクスから省く）。
+    """
+    try:
+        connections = list(transport._pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+    except Exception:
+        return None
+    return len(connections), idle
+
+
+def _metered_transport_class(lib: Any) -> type:
+    """利用状況を記録するトランスポートのクラス（httpx実装ごとに作る）"""
+
+    class MeteredTransport(lib.BaseTransport):
+        """共有トランスポートへの委譲（close はプール側でのみ行う）"""
+
+        def __init__(self, inner: Any, pool: "HTTPConnectionPool", origin: str):
+            self.inner = inner
+            self.pool = pool
+            self.origin = origin
+
+        def handle_request(self, request):
+            start = self.pool._begin(self.origin)
+            result = "error"
+            try:
+                response = self.inner.handle_request(request)
+                result = "ok"
+                return response
+            finally:
+                self.pool._end(self.origin, start, result, self.inner)
+
+        def close(self):
+            pass
+
+    return MeteredTransport
+
+
+class HTTPConnectionPool:
+    """プロセス全体で共有する keep-alive 接続プール"""
+
+    def __init__(self,
+                 max_connections: int = 20,
+                 max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 120.0,
+                 http2: bool = None,
+                 host_limits: Dict[str, int] = None):
+        """
+        Args:
+            max_connections: 接続先ごとの最大接続数
+            max_keepalive_connections: 接続先ごとに保持するアイドル接続数
+            keepalive_expiry: アイドル接続を保持する秒数
+            http2: HTTP/2を使うか（既定: h2 パッケージがあれば有効）
+            host_limits: 接続先（URL）ごとの最大接続数の上書き
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = HTTP2_AVAILABLE if http2 is None else (http2 and HTTP2_AVAILABLE)
+        self.host_limits = {origin_of(url): limit for url, limit in (host_limits or {}).items()}
+        self._lock = threading.Lock()
+        self._transports: Dict[Tuple[str, str], Any] = {}
+        self._transport_classes: Dict[str, type] = {}
+        self._ollama_clients: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._prewarmed = False
+
+    def _limits(self, lib: Any, origin: str) -> Any:
+        max_connections = self.host_limits.get(origin, self.max_connections)
+        return lib.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(self.max_keepalive_connections, max_connections),
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _wrap(self, lib: Any, inner: Any, origin: str) -> Any:
+        if lib.__name__ not in self._transport_classes:
+            self._transport_classes[lib.__name__] = _metered_transport_class(lib)
+        return self._transport_classes[lib.__name__](inner, self, origin)
+
+    # ------------------------------------------------------------
+    # トランスポート
+    # ------------------------------------------------------------
+    def transport_for(self, url: str, lib: Any = None) -> Any:
+        """接続先ごとに共有する同期トランスポート"""
+        lib = lib or httpx
+        origin = origin_of(url)
+        key = (lib.__name__, origin)
+        with self._lock:
+            if key not in self._transports:
+                inner = lib.HTTPTransport(http2=self.http2, limits=self._limits(lib, origin))
+                self._transports[key] = self._wrap(lib, inner, origin)
+                logger.debug("🔌 HTTP接続プールを作成: %s (%s)", origin, lib.__name__)
+            return self._transports[key]
+
+    # ------------------------------------------------------------
+    # SDKクライアント
+    # ------------------------------------------------------------
+    def openai_http_client(self, base_url: str = None) -> Any:
+        """openai.OpenAI(http_client=...) に渡す共有接続のクライアント"""
+        import openai
+        base_url = base_url or "https://api.openai.com/v1"
+        lib = _library_of(openai.DefaultHttpxClient)
+        return openai.DefaultHttpxClient(transport=self.transport_for(base_url, lib))
+
+    def ollama_client(self, base_url: str) -> Any:
+        """接続先ごとに共有する ollama.Client"""
+        import ollama
+        origin = origin_of(base_url)
+        with self._lock:
+            client = self._ollama_clients.get(origin)
+        if client is None:
+            lib = _ollama_library()
+            client = ollama.Client(host=base_url, transport=self.transport_for(base_url, lib))
+            with self._lock:
+                client = self._ollama_clients.setdefault(origin, client)
+        return client
+
+    # ------------------------------------------------------------
+    # 利用状況
+    # ------------------------------------------------------------
+    def _begin(self, origin: str) -> float:
+        with self._lock:
+            stats = self._stats.setdefault(origin, {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0})
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        _in_flight.inc(host=origin)
+        return time.perf_counter()
+
+    def _end(self, origin: str, start: float, result: str, inner: Any):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats = self._stats[origin]
+            stats["in_flight"] -= 1
+            if result != "ok":
+                stats["errors"] += 1
+        _in_flight.dec(host=origin)
+        _requests_total.inc(host=origin, result=result)
+        _request_seconds.observe(elapsed, host=origin)
+        counts = _connection_counts(inner)
+        if counts is not None:
+            total, idle = counts
+            _connections.set(total - idle, host=origin, state="active")
+            _connections.set(idle, host=origin, state="idle")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """接続先ごとの接続数・リクエスト数"""
+        with self._lock:
+            transports = list(self._transports.items())
+            stats = {origin: dict(values) for origin, values in self._stats.items()}
+        hosts: Dict[str, Dict[str, Any]] = {}
+        for (library, origin), transport in transports:
+            entry = hosts.setdefault(origin, {"connections": 0, "idle": 0, "libraries": []})
+            entry["libraries"].append(library)
+            counts = _connection_counts(transport.inner)
+            if counts is None:
+                entry["connections"] = entry["idle"] = None
+            elif entry["connections"] is not None:
+                entry["connections"] += counts[0]
+                entry["idle"] += counts[1]
+        for origin, values in stats.items():
+            hosts.setdefault(origin, {"connections": 0, "idle": 0, "libraries": []}).update(values)
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "hosts": hosts,
+        }
+
+    # ------------------------------------------------------------
+    # 先行接続・終了
+    # ------------------------------------------------------------
+    def prewarm(self, urls: Iterable[Any], timeout: float = 3.0) -> List[str]:
+        """接続先へ軽いリクエストを送り、接続をプールに確保しておく（接続できたURLを返す）
+
+        urls には URL か (URL, httpxモジュール) を渡す。ステータスコードは問わない。
+        """
+        warmed = []
+        for item in urls:
+            url, lib = item if isinstance(item, tuple) else (item, None)
+            lib = lib or httpx
+            origin = origin_of(url)
+            client = lib.Client(transport=self.transport_for(url, lib), timeout=timeout)
+            try:
+                client.get(url)
+            except Exception as e:
+                _prewarm_total.inc(host=origin, result="error")
+                logger.debug("⚠️ 先行接続に失敗: %s (%s)", origin, e)
+                continue
+            _prewarm_total.inc(host=origin, result="ok")
+            warmed.append(url)
+        return warmed
+
+    def prewarm_async(self, urls: Iterable[Any], timeout: float = 3.0) -> threading.Thread:
+        """バックグラウンドで先行接続"""
+        urls = list(urls)
+        thread = threading.Thread(target=self.prewarm, args=(urls, timeout),
+                                  name="ruri-http-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        """全接続を閉じる（以降のリクエストでは新たに接続する）"""
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+            self._ollama_clients.clear()
+        for transport in transports:
+            try:
+                transport.inner.close()
+            except Exception:
+                pass
+
+
+def _ollama_library() -> Any:
+    """ollama パッケージが使っているhttpx実装"""
+    from ollama import _client
+    return getattr(_client, "httpx", httpx)
+
+
+_pool: Optional[HTTPConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HTTPConnectionPool:
+    """共有接続プールを取得（シングルトン）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HTTPConnectionPool()
+        return _pool
+
+
+def prewarm_configured_endpoints(config_manager=None) -> List[str]:
+    """有効なプロバイダーの接続先へバックグラウンドで先行接続（プロセスで一度だけ）"""
+    pool = get_http_pool()
+    with _pool_lock:
+        if pool._prewarmed or not HTTPX_AVAILABLE:
+            return []
+        pool._prewarmed = True
+    if config_manager is None:
+        from .config_manager import config_manager
+
+    targets = []
+    for name, provider in config_manager.providers.items():
+        if not provider.enabled:
+            continue
+        config = provider.config or {}
+        if name == "openai":
+            try:
+                import openai
+            except ImportError:
+                continue
+            base_url = config.get("base_url") or get_settings().openai_base_url or "https://api.openai.com/v1"
+            targets.append((base_url, _library_of(openai.DefaultHttpxClient)))
+        elif name in ("ollama", "gpt-oss"):
+            try:
+                lib = _ollama_library()
+            except ImportError:
+                continue
+            targets.append((f"http://{config.get('host', 'localhost')}:{config.get('port', 11434)}", lib))
+    if targets:
+        pool.prewarm_async(targets)
+    return [url for url, _ in targets]
@@ -0,0 +1,352 @@
+"""
+Ollamaモデルのライフサイクル管理
+
+- 起動時に設定済みモデルを事前ロード（空プロンプトの generate でモデルをメモリに載せる）
+- keep_alive を付けて常駐させ、配信中はハートビートで期限を延長する
+- モデルごとの同時リクエスト数をサーバーの並列度（OLLAMA_NUM_PARALLEL）に合わせて制限し、超過分は待たせる
+- 常駐中（warm）とロード直後（cold）の初回トークン時間を分けて記録する
+"""
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from .router import LatencyTracker
+from .http_pool import get_http_pool
+
+try:
+    from ..metrics import get_metrics
+    from ..log_config import get_logger
+except ImportError:
+    from metrics import get_metrics
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+_first_token_seconds = get_metrics().histogram(
+    "ruri_ollama_first_token_seconds", "Ollamaの初回トークン時間（秒）", ("model", "state"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0))
+_queue_wait_seconds = get_metrics().histogram(
+    "ruri_ollama_queue_wait_seconds", "同時実行数の上限による待ち時間（秒）", ("model",))
+_model_loads_total = get_metrics().counter(
+    "ruri_ollama_model_loads_total", "事前ロード・ハートビートによるモデルロード", ("model", "reason", "result"))
+
+_DURATION = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*([smh]?)\s*$")
+
+
+def parse_keep_alive(value: Any) -> float:
+    """keep_alive（"30m" / "1h" / 300 / -1）を秒に変換（負の値は無期限）"""
+    if value is None:
+        return 300.0  # Ollamaの既定（5分）
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = _DURATION.match(str(value))
+        if not match:
+            raise ValueError(f"keep_alive の形式が不正です: {value}")
+        seconds = float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+
+class _ModelState:
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.loaded_until = 0.0
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.warm = LatencyTracker()
+        self.cold = LatencyTracker()
+        self.last_load_seconds: Optional[float] = None
+
+
+class ModelSlot:
+    """同時実行枠の1つ（with文で確保・解放し、初回トークン時間を記録する）"""
+
+    def __init__(self, manager: "OllamaModelManager", model: str, state: _ModelState):
+        self.manager = manager
+        self.model = model
+        self._state = state
+        self.model_state = "cold"
+        self.queue_wait = 0.0
+        self.first_token_latency: Optional[float] = None
+        self._start = 0.0
+
+    def __enter__(self) -> "ModelSlot":
+        state = self._state
+        wait_start = time.perf_counter()
+        with self.manager._slot_freed:
+            state.queued += 1
+            state.max_queued = max(state.max_queued, state.queued)
+            # 上限は configure で変わることがあるので毎回読み直す
+            while state.in_flight >= state.max_concurrency:
+                self.manager._slot_freed.wait()
+            state.queued -= 1
+            state.in_flight += 1
+        self.queue_wait = time.perf_counter() - wait_start
+        _queue_wait_seconds.observe(self.queue_wait, model=self.model)
+        self.model_state = "warm" if self.manager.is_warm(self.model) else "cold"
+        self._start = time.perf_counter()
+        return self
+
+    def first_token(self):
+        """最初のトークン（非ストリーミングなら応答全体）を受け取った時点で呼ぶ"""
+        if self.first_token_latency is None:
+            self.first_token_latency = time.perf_counter() - self._start
+
+    def __exit__(self, exc_type, exc, tb):
+        state = self._state
+        if exc_type is None and self.first_token_latency is not None:
+            tracker = state.warm if self.model_state == "warm" else state.cold
+            tracker.record(self.first_token_latency)
+            _first_token_seconds.observe(self.first_token_latency, model=self.model, state=self.model_state)
+            self.manager._touch(self.model)
+        with self.manager._slot_freed:
+            state.in_flight -= 1
+            self.manager._slot_freed.notify_all()
+        return False
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "model_state": self.model_state,
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "first_token_ms": None if self.first_token_latency is None else round(self.first_token_latency * 1000, 1),
+        }
+
+
+class OllamaModelManager:
+    """1つのOllamaサーバー上のモデルの常駐・並列度・ウォームアップを管理"""
+
+    def __init__(self, client: Any, keep_alive: Any = "30m", max_concurrency: int = None,
+                 heartbeat_interval: float = None):
+        """
+        Args:
+            client: ollama.Client（または generate / ps を持つ ollama モジュール）
+            keep_alive: モデルを常駐させる期間（"30m"、秒数、-1で無期限）
+            max_concurrency: モデルごとの同時リクエスト数（既定: OLLAMA_NUM_PARALLEL または 1）
+            heartbeat_interval: ハートビート間隔（秒、既定: keep_alive の半分・最大4分）
+        """
+        self.client = client
+        self._models: Dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self.max_concurrency = max_concurrency or int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+        self._heartbeat_interval_option = heartbeat_interval
+        self._set_keep_alive(keep_alive)
+        # ハートビートは利用者（配信セッション）ごとに参照カウントし、全員が止めたら停止する
+        self._heartbeat_models: Dict[str, int] = {}
+        self._heartbeat_users = 0
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def _set_keep_alive(self, keep_alive: Any):
+        self.keep_alive = keep_alive
+        self.keep_alive_seconds = parse_keep_alive(keep_alive)
+        heartbeat_interval = self._heartbeat_interval_option
+        if heartbeat_interval is None:
+            heartbeat_interval = min(240.0, self.keep_alive_seconds / 2)
+        self.heartbeat_interval = max(1.0, heartbeat_interval)
+
+    def configure(self, keep_alive: Any = None, max_concurrency: int = None,
+                  heartbeat_interval: float = None):
+        """後から作られたプロバイダーの設定を反映（None の項目は変えない）
+
+        同時実行数の変更は処理中のリクエストには影響せず、次に枠を確保するときから効く。
+        """
+        with self._slot_freed:
+            if heartbeat_interval is not None:
+                self._heartbeat_interval_option = heartbeat_interval
+            if keep_alive is not None or heartbeat_interval is not None:
+                self._set_keep_alive(self.keep_alive if keep_alive is None else keep_alive)
+            if max_concurrency and max_concurrency != self.max_concurrency:
+                self.max_concurrency = max_concurrency
+                for state in self._models.values():
+                    state.max_concurrency = max_concurrency
+                self._slot_freed.notify_all()
+
+    def _state(self, model: str) -> _ModelState:
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = _ModelState(self.max_concurrency)
+            return self._models[model]
+
+    def _touch(self, model: str):
+        """リクエスト成功時にkeep_alive期限を延長"""
+        self._state(model).loaded_until = time.monotonic() + self.keep_alive_seconds
+
+    def is_warm(self, model: str) -> bool:
+        return time.monotonic() < self._state(model).loaded_until
+
+    # ------------------------------------------------------------
+    # リクエスト
+    # ------------------------------------------------------------
+    def request(self, model: str) -> ModelSlot:
+        """同時実行枠を確保するコンテキストマネージャー（上限超過時はブロックして待つ）"""
+        return ModelSlot(self, model, self._state(model))
+
+    # ------------------------------------------------------------
+    # ロード・常駐
+    # ------------------------------------------------------------
+    def preload(self, model: str, reason: str = "preload") -> Optional[float]:
+        """空プロンプトでモデルをロードし keep_alive を設定（ロード秒数、失敗時None）"""
+        state = self._state(model)
+        start = time.perf_counter()
+        try:
+            self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+        except Exception as e:
+            _model_loads_total.inc(model=model, reason=reason, result="error")
+            logger.warning("⚠️ Ollamaモデル '%s' のロードに失敗: %s", model, e)
+            return None
+        elapsed = time.perf_counter() - start
+        state.last_load_seconds = elapsed
+        self._touch(model)
+        _model_loads_total.inc(model=model, reason=reason, result="ok")
+        logger.debug("🔥 Ollamaモデル '%s' をロードしました（%s, %.2f秒）", model, reason, elapsed)
+        return elapsed
+
+    def preload_async(self, models: Iterable[str]) -> threading.Thread:
+        """バックグラウンドで順に事前ロード"""
+        models = list(dict.fromkeys(models))
+
+        def run():
+            for model in models:
+                self.preload(model)
+
+        thread = threading.Thread(target=run, name="ruri-ollama-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def sync_loaded(self):
+        """サーバーの ps（ロード中モデル一覧）で常駐状態を補正"""
+        try:
+            running = self.client.ps()
+        except Exception:
+            return
+        names = set()
+        for item in running.get("models", []) if hasattr(running, "get") else []:
+            names.add(item.get("name") or item.get("model"))
+        with self._lock:
+            states = dict(self._models)
+        for model, state in states.items():
+            if model not in names:
+                state.loaded_until = 0.0
+
+    def start_heartbeat(self, models: Iterable[str]):
+        """配信中など、指定モデルの keep_alive を定期的に延長（stop_heartbeat と対で呼ぶ）"""
+        models = list(dict.fromkeys(models))
+        with self._lock:
+            self._heartbeat_users += 1
+            for model in models:
+                self._heartbeat_models[model] = self._heartbeat_models.get(model, 0) + 1
+            if self._heartbeat_thread is not None and self._heartbeat_thread.is_alive():
+                return
+            # スレッドごとに停止フラグを分け、止めたばかりの旧スレッドと混ざらないようにする
+            stop = threading.Event()
+
+            def loop():
+                while not stop.wait(self.heartbeat_interval):
+                    self.sync_loaded()
+                    with self._lock:
+                        targets = list(self._heartbeat_models)
+                    for model in targets:
+                        # 処理中のリクエストがあれば期限は延長されるので送らない
+                        if self._state(model).in_flight == 0:
+                            self.preload(model, reason="heartbeat")
+
+            self._heartbeat_stop = stop
+            self._heartbeat_thread = threading.Thread(target=loop, name="ruri-ollama-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def stop_heartbeat(self, models: Iterable[str] = (), timeout: float = 5.0):
+        """start_heartbeat の利用を1つ終える（利用者が0になったらスレッドを止めて待つ）"""
+        with self._lock:
+            for model in dict.fromkeys(models):
+                remaining = self._heartbeat_models.get(model, 0) - 1
+                if remaining > 0:
+                    self._heartbeat_models[model] = remaining
+                else:
+                    self._heartbeat_models.pop(model, None)
+            self._heartbeat_users = max(0, self._heartbeat_users - 1)
+            if self._heartbeat_users > 0:
+                return
+            self._heartbeat_models.clear()
+            thread, self._heartbeat_thread = self._heartbeat_thread, None
+            self._heartbeat_stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    # ------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states = dict(self._models)
+        return {
+            "keep_alive": self.keep_alive,
+            "max_concurrency": self.max_concurrency,
+            "heartbeat_active": self._heartbeat_thread is not None and self._heartbeat_thread.is_alive(),
+            "heartbeat_users": self._heartbeat_users,
+            "models": {
+                model: {
+                    "warm": self.is_warm(model),
+                    "in_flight": state.in_flight,
+                    "queued": state.queued,
+                    "max_queued": state.max_queued,
+                    "last_load_ms": None if state.last_load_seconds is None else round(state.last_load_seconds * 1000, 1),
+                    "first_token_warm": state.warm.get_status(),
+                    "first_token_cold": state.cold.get_status(),
+                }
+                for model, state in states.items()
+            },
+        }
+
+
+_managers: Dict[str, OllamaModelManager] = {}
+_managers_lock = threading.Lock()
+_preloaded = False
+
+
+def get_model_manager(base_url: str, client: Any, **options) -> OllamaModelManager:
+    """サーバー（base_url）ごとに共有するマネージャー（2回目以降は options を反映する）"""
+    with _managers_lock:
+        manager = _managers.get(base_url)
+        if manager is None:
+            manager = _managers[base_url] = OllamaModelManager(client, **options)
+            return manager
+    manager.configure(**options)
+    return manager
+
+
+def preload_configured_models(config_manager=None) -> List[str]:
+    """有効なOllama系プロバイダーの設定モデルをバックグラウンドで事前ロード（プロセスで一度だけ）"""
+    global _preloaded
+    with _managers_lock:
+        if _preloaded:
+            return []
+        _preloaded = True
+    try:
+        import ollama
+    except ImportError:
+        return []
+    if config_manager is None:
+        from .config_manager import config_manager
+
+    started = []
+    for name in ("ollama", "gpt-oss"):
+        provider = config_manager.providers.get(name)
+        if provider is None or not provider.enabled:
+            continue
+        config = provider.config or {}
+        model = config.get("model")
+        if not model:
+            continue
+        base_url = f"http://{config.get('host', 'localhost')}:{config.get('port', 11434)}"
+        manager = get_model_manager(
+            base_url, get_http_pool().ollama_client(base_url),
+            keep_alive=config.get("keep_alive", "30m"),
+            max_concurrency=config.get("max_concurrency"),
+        )
+        manager.preload_async([model])
+        started.append(model)
+    return started
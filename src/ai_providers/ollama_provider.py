@@ -1,6 +1,9 @@
 import json
 from typing import Dict, Any, AsyncGenerator, Optional
 from .base_provider import BaseAIProvider, CharacterResponse, EmotionType, ColorStage
+from .ollama_lifecycle import get_model_manager
+from .http_pool import get_http_pool, origin_of
+from .concurrency import iterate_in_thread, run_blocking
 
 class OllamaAIProvider(BaseAIProvider):
     """Ollama AIプロバイダー
@@ -14,16 +17,27 @@ class OllamaAIProvider(BaseAIProvider):
         self.host = self.config.get("host", "localhost")
         self.port = self.config.get("port", 11434)
         self.base_url = f"http://{self.host}:{self.port}"
+        # モデルを常駐させる期間（リクエストのたびに送ってアンロードを防ぐ）
+        self.keep_alive = self.config.get("keep_alive", "30m")
         
         # Ollamaクライアント
         self.client = None
+        self.models = None
         self._initialize_client()
     
     def _initialize_client(self):
         """Ollamaクライアントの初期化"""
         try:
             import ollama
-            self.client = ollama.Client(host=self.base_url)
+            # 接続はサーバーごとに共有（プロバイダーを作り直しても再接続しない）
+            self.client = get_http_pool().ollama_client(self.base_url)
+            # ロード状態・同時実行数はサーバー単位で共有
+            self.models = get_model_manager(
+                self.base_url, self.client,
+                keep_alive=self.keep_alive,
+                max_concurrency=self.config.get("max_concurrency"),
+                heartbeat_interval=self.config.get("heartbeat_interval"),
+            )
         except ImportError:
             print("⚠️  ollama ライブラリがインストールされていません")
             self.client = None
@@ -43,36 +57,46 @@ class OllamaAIProvider(BaseAIProvider):
         except Exception:
             return False
     
-    def _create_system_prompt(self) -> str:
-        """システムプロンプトの構築"""
-        base_prompt = """あなたは「ルリ」という名前のAIキャラクターです。
+    _CHARACTER_PROMPT = """あなたは「ルリ」という名前のAIキャラクターです。
 
 【キャラクター設定】
 - 戯曲『あいのいろ』の主人公
 - 最初はモノクロの世界に住んでいて、感情を学習することで色を理解していく
 - 純粋で好奇心旺盛、でも時々哲学的
-- 感情や色について常に学んでいる
-
-【現在の状態】
-- 色彩段階: {color_stage}
-- 学習済み感情: {learned_emotions}
-
-【応答指針】
+- 感情や色について常に学んでいる"""
+    
+    _GUIDELINES_PROMPT = """【応答指針】
 - 丁寧で親しみやすい口調
 - 感情や色に関する話題に興味を示す
 - 学習している感情については、その理解度を表現する
 - 簡潔だが心のこもった応答を心がける"""
-        
-        learned_emotions = [
-            emotion.value for emotion, state in self.emotion_states.items() 
-            if state.learned
-        ]
-        
-        return base_prompt.format(
-            color_stage=self.current_color_stage.value,
-            learned_emotions=", ".join(learned_emotions) if learned_emotions else "なし"
+    
+    def _create_state_prompt(self) -> str:
+        """色彩段階・学習済み感情（会話ごとに変わりうる部分）"""
+        learned_emotions = self.get_learned_emotions()
+        return (
+            "【現在の状態】\n"
+            f"- 色彩段階: {self.current_color_stage.value}\n"
+            f"- 学習済み感情: {', '.join(learned_emotions) if learned_emotions else 'なし'}"
         )
     
+    def _create_system_prompt(self) -> str:
+        """システムプロンプトの構築
+        
+        "stable_prefix" 配置では状態を含めない（keep_alive中のモデルがプロンプト先頭のKVキャッシュを再利用できる）
+        """
+        if self.prompt_layout == "legacy":
+            return "\n\n".join([self._CHARACTER_PROMPT, self._create_state_prompt(), self._GUIDELINES_PROMPT])
+        return "\n\n".join([self._CHARACTER_PROMPT, self._GUIDELINES_PROMPT])
+    
+    def _build_prompt(self, message: str, context: Dict[str, Any] = None):
+        state_prompt = self._create_state_prompt() if self.prompt_layout == "stable_prefix" else None
+        return self.build_prompt(self._create_system_prompt(), message, context, state_prompt)
+    
+    def _build_messages(self, message: str, context: Dict[str, Any] = None) -> list:
+        """チャットメッセージの構築（トークン予算内の履歴と要約）"""
+        return self._build_prompt(message, context).messages
+    
     def generate_response(self, 
                          message: str, 
                          context: Dict[str, Any] = None) -> CharacterResponse:
@@ -86,32 +110,30 @@ class OllamaAIProvider(BaseAIProvider):
         
         try:
             # メッセージ履歴の構築
-            messages = [{"role": "system", "content": self._create_system_prompt()}]
-            
-            # 会話履歴の追加（最新5件）
-            for conv in self.conversation_history[-5:]:
-                messages.append({"role": "user", "content": conv["user"]})
-                messages.append({"role": "assistant", "content": conv["assistant"]})
-            
-            # 現在のメッセージ
-            messages.append({"role": "user", "content": message})
+            prompt = self._build_prompt(message, context)
             
-            # Ollama API呼び出し
-            response = self.client.chat(
-                model=self.model_name,
-                messages=messages,
-                options={
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "max_tokens": 200
-                }
-            )
+            # Ollama API呼び出し（モデルごとの同時実行数を超える分は待つ）
+            with self.models.request(self.model_name) as slot:
+                response = self.client.chat(
+                    model=self.model_name,
+                    messages=prompt.messages,
+                    keep_alive=self.keep_alive,
+                    options={
+                        "temperature": 0.7,
+                        "top_p": 0.9,
+                        "max_tokens": 200
+                    }
+                )
+                slot.first_token()
             
             response_text = response['message']['content']
+            # Ollamaは入力トークン総数もキャッシュ済みトークン数も返さないため、評価したトークン数だけ記録する
+            # （KVキャッシュが効くと prompt_eval_count が小さくなる）
+            cache_info = self.record_prompt_eval(response.get('prompt_eval_count'))
             
             # 感情分析
-            emotions = self.get_emotion_analysis(message)
-            dominant_emotion = max(emotions.items(), key=lambda x: x[1])
+            emotions = self.analyze_emotions(message)
+            dominant_emotion = emotions.dominant(EmotionType)
             
             # 感情状態更新
             if dominant_emotion[1] > 0.3:
@@ -128,57 +150,37 @@ class OllamaAIProvider(BaseAIProvider):
                 metadata={
                     "provider": "ollama",
                     "model": self.model_name,
-                    "emotions_detected": emotions
+                    "emotions_detected": emotions.to_dict(EmotionType),
+                    **prompt.to_metadata(),
+                    **cache_info,
+                    **slot.to_metadata()
                 }
             )
             
         except Exception as e:
             print(f"❌ Ollama応答生成エラー: {e}")
-            # フォールバック
+            # フォールバック（ルーターが失敗として扱えるようエラーを記録）
             from .simple_provider import SimpleAIProvider
             fallback = SimpleAIProvider()
-            return fallback.generate_response(message, context)
+            response = fallback.generate_response(message, context)
+            response.metadata["error"] = str(e)
+            return response
     
     async def generate_response_async(self, 
                                     message: str, 
                                     context: Dict[str, Any] = None) -> CharacterResponse:
         """非同期な応答生成"""
         # 注意: ollama-pythonライブラリは非同期をサポートしていない場合があります
-        import asyncio
-        return await asyncio.get_event_loop().run_in_executor(
-            None, self.generate_response, message, context
-        )
+        return await run_blocking(self.generate_response, message, context)
     
-    async def generate_stream_response(self, 
-                                     message: str, 
-                                     context: Dict[str, Any] = None) -> AsyncGenerator[str, None]:
-        """ストリーミング応答生成"""
-        
-        if not self.is_available():
-            # フォールバック
-            from .simple_provider import SimpleAIProvider
-            fallback = SimpleAIProvider()
-            async for chunk in fallback.generate_stream_response(message, context):
-                yield chunk
-            return
-        
-        try:
-            # メッセージ履歴の構築
-            messages = [{"role": "system", "content": self._create_system_prompt()}]
-            
-            # 会話履歴の追加（最新5件）
-            for conv in self.conversation_history[-5:]:
-                messages.append({"role": "user", "content": conv["user"]})
-                messages.append({"role": "assistant", "content": conv["assistant"]})
-            
-            # 現在のメッセージ
-            messages.append({"role": "user", "content": message})
-            
-            # ストリーミング応答
+    def _stream_chat(self, messages):
+        """ストリーミングのchat呼び出し（同時実行枠を確保したままテキストの差分を返す）"""
+        with self.models.request(self.model_name) as slot:
             stream = self.client.chat(
                 model=self.model_name,
                 messages=messages,
                 stream=True,
+                keep_alive=self.keep_alive,
                 options={
                     "temperature": 0.7,
                     "top_p": 0.9,
@@ -186,30 +188,37 @@ class OllamaAIProvider(BaseAIProvider):
                 }
             )
             
-            full_response = ""
             for chunk in stream:
                 if 'message' in chunk and 'content' in chunk['message']:
-                    content = chunk['message']['content']
-                    full_response += content
-                    yield content
-            
-            # 会話履歴更新
-            if full_response:
-                self.add_conversation(message, full_response)
-                
-                # 感情分析・更新
-                emotions = self.get_emotion_analysis(message)
-                dominant_emotion = max(emotions.items(), key=lambda x: x[1])
-                if dominant_emotion[1] > 0.3:
-                    self.update_emotion_state(dominant_emotion[0], dominant_emotion[1])
+                    slot.first_token()
+                    yield chunk['message']['content']
+    
+    async def generate_stream_response(self, 
+                                     message: str, 
+                                     context: Dict[str, Any] = None) -> AsyncGenerator[str, None]:
+        """ストリーミング応答生成"""
+        
+        # 接続できない・途中で失敗した場合は例外のまま返し、ルーターにフェイルオーバーを任せる
+        if not await run_blocking(self.is_available):
+            raise RuntimeError(f"Ollamaサーバーに接続できません: {self.base_url}")
+        
+        # メッセージ履歴の構築
+        messages = self._build_messages(message, context)
+        
+        full_response = ""
+        # 同期クライアントのストリームは共有スレッドプールで読み進める（ループを塞がない）
+        async for content in iterate_in_thread(lambda: self._stream_chat(messages)):
+            full_response += content
+            yield content
+        
+        # 会話履歴更新
+        if full_response:
+            self.add_conversation(message, full_response)
             
-        except Exception as e:
-            print(f"❌ Ollamaストリーミングエラー: {e}")
-            # フォールバック
-            from .simple_provider import SimpleAIProvider
-            fallback = SimpleAIProvider()
-            async for chunk in fallback.generate_stream_response(message, context):
-                yield chunk
+            # 感情分析・更新
+            dominant_emotion = self.analyze_emotions(message).dominant(EmotionType)
+            if dominant_emotion[1] > 0.3:
+                self.update_emotion_state(dominant_emotion[0], dominant_emotion[1])
     
     def get_available_models(self) -> list:
         """利用可能なモデル一覧"""
@@ -245,3 +254,11 @@ class OllamaAIProvider(BaseAIProvider):
         except Exception as e:
             print(f"❌ モデル '{model_name}' のダウンロードに失敗: {e}")
             return False
+    
+    def get_status_info(self) -> Dict[str, Any]:
+        """プロバイダーの状態情報（モデルの常駐状態・warm/cold初回トークン時間を含む）"""
+        info = super().get_status_info()
+        if self.models is not None:
+            info["model_lifecycle"] = self.models.get_stats()
+        info["connection_pool"] = get_http_pool().get_stats()["hosts"].get(origin_of(self.base_url))
+        return info
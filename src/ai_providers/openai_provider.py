@@ -3,9 +3,10 @@ OpenAI API Provider for AITuber Ruri
 OpenAI GPT models integration
 """
 
-from typing import Dict, Any, Optional
-import os
+from typing import Dict, Any, AsyncGenerator, Iterator, Optional
 from .base_provider import BaseAIProvider, CharacterResponse, EmotionType
+from .http_pool import HTTPX_AVAILABLE, get_http_pool
+from .concurrency import iterate_in_thread, run_blocking
 
 try:
     from ..api_config import APIConfig
@@ -14,12 +15,23 @@ except ImportError:
     sys.path.append('..')
     from api_config import APIConfig
 
+try:
+    from ..log_config import get_logger
+    from ..profile_repository import get_profile_repository
+    from ..settings import get_settings
+except ImportError:
+    from log_config import get_logger
+    from profile_repository import get_profile_repository
+    from settings import get_settings
+
 try:
     import openai
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
 
+logger = get_logger(__name__)
+
 
 class OpenAIProvider(BaseAIProvider):
     """OpenAI API Provider"""
@@ -27,8 +39,22 @@ class OpenAIProvider(BaseAIProvider):
     def __init__(self, config: Dict[str, Any] = None):
         super().__init__(config)
         self.client = None
-        self.model = "gpt-4o-mini"
+        self.model = self.config.get('model', "gpt-4o-mini")
+        # OpenAI互換サーバー（ローカル推論サーバー・ベンチマーク用疑似サーバー等）の指定
+        self.base_url = self.config.get('base_url') or get_settings().openai_base_url
+        # 固定部分のシステムプロンプト（キャラクターコンテキストと設定ファイルの版が同じ間は使い回す）
+        self._system_prompt_cache = None
         
+    def _shared_http_client(self, base_url: Optional[str] = None):
+        """プロセス共有の接続プールを使うHTTPクライアント（使えなければNoneでSDK既定）"""
+        if not HTTPX_AVAILABLE:
+            return None
+        try:
+            return get_http_pool().openai_http_client(base_url)
+        except Exception as e:
+            logger.debug("共有HTTP接続プールを使用できません: %s", e)
+            return None
+    
     def is_available(self) -> bool:
         """OpenAI利用可能性チェック"""
         if not OPENAI_AVAILABLE:
@@ -49,11 +75,14 @@ class OpenAIProvider(BaseAIProvider):
                 print("❌ OpenAI API key not configured")
                 return False
             
-            # クライアント初期化
+            # クライアント初期化（接続は共有プールから）
+            base_url = (config.get('base_url') if config else None) or self.base_url
             self.client = openai.OpenAI(
                 api_key=api_key,
                 organization=config.get('organization') if config else None,
-                project=config.get('project') if config else None
+                project=config.get('project') if config else None,
+                base_url=base_url,
+                http_client=self._shared_http_client(base_url)
             )
             self.model = config.get('model', 'gpt-4o-mini') if config else 'gpt-4o-mini'
             
@@ -81,84 +110,72 @@ class OpenAIProvider(BaseAIProvider):
             print(f"❌ OpenAI初期化エラー: {e}")
             return False
     
+    def close(self):
+        """OpenAIクライアントを閉じる（共有プールのトランスポートは閉じられない）"""
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug("⚠️ OpenAIクライアントのクローズに失敗: %s", e)
+    
+    def _ensure_client(self) -> bool:
+        """クライアントが初期化されていない場合、APIキーで初期化を試行"""
+        if self.client:
+            return True
+        
+        # 設定（環境変数 > .env > Streamlit secrets）、なければプロバイダー設定のキー
+        api_key = get_settings().openai_api_key
+        if not api_key and hasattr(self, 'config') and self.config:
+            api_key = self.config.get('api_key')
+        
+        if api_key and api_key != "YOUR_OPENAI_API_KEY_HERE":
+            self.client = openai.OpenAI(api_key=api_key, base_url=self.base_url,
+                                        http_client=self._shared_http_client(self.base_url))
+            return True
+        return False
+    
     def generate_response(self, 
                          message: str, 
                          context: Dict[str, Any] = None) -> CharacterResponse:
         """OpenAI応答生成"""
         try:
-            if not self.client:
-                # クライアントが初期化されていない場合、APIキーで初期化を試行
-                api_key = None
+            if not self._ensure_client():
+                return CharacterResponse(
+                    text="OpenAI APIキーが設定されていません",
+                    emotion=self.emotion_states[list(self.emotion_states.keys())[0]].emotion,
+                    emotion_intensity=0.0,
+                    color_stage=self.current_color_stage,
+                    metadata={"error": "no_api_key"}
+                )
                 
-                # 1. 環境変数
-                api_key = os.getenv('OPENAI_API_KEY')
-                
-                # 2. Streamlit secrets
-                if not api_key:
-                    try:
-                        import streamlit as st
-                        api_key = st.secrets.get('OPENAI_API_KEY')
-                    except:
-                        pass
-                
-                # 3. 設定ファイル
-                if not api_key and hasattr(self, 'config') and self.config:
-                    api_key = self.config.get('api_key')
-                
-                if api_key and api_key != "YOUR_OPENAI_API_KEY_HERE":
-                    self.client = openai.OpenAI(api_key=api_key)
-                else:
-                    return CharacterResponse(
-                        text="OpenAI APIキーが設定されていません",
-                        emotion=self.emotion_states[list(self.emotion_states.keys())[0]].emotion,
-                        emotion_intensity=0.0,
-                        color_stage=self.current_color_stage,
-                        metadata={"error": "no_api_key"}
-                    )
-                
-            # メッセージ構築
-                
-            # メッセージ構築
-            messages = []
-            
-            # システムメッセージ（ルリのキャラクター設定）
+            # メッセージ構築（システムプロンプト・要約・予算内の会話履歴・現在のプロンプト）
             ruri_system_prompt = self._create_ruri_system_prompt(context)
-            messages.append({
-                "role": "system", 
-                "content": ruri_system_prompt
-            })
-            
-            # 会話履歴
-            if context and context.get('conversation_history'):
-                for entry in context['conversation_history'][-10:]:  # 最新10件のみ
-                    if entry.get('role') in ['user', 'assistant']:
-                        messages.append({
-                            "role": entry['role'],
-                            "content": entry['content']
-                        })
-            
-            # 現在のプロンプト
-            messages.append({
-                "role": "user",
-                "content": message
-            })
+            state_prompt = self._create_state_prompt() if self.prompt_layout == "stable_prefix" else None
+            prompt = self.build_prompt(ruri_system_prompt, message, context, state_prompt)
             
             # API呼び出し
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=messages,
+                messages=prompt.messages,
                 max_tokens=500,
                 temperature=0.7
             )
             
             response_text = response.choices[0].message.content.strip()
+            cache_info = self._prompt_cache_info(response.usage)
             
             return CharacterResponse(
                 text=response_text,
                 emotion=self.emotion_states[list(self.emotion_states.keys())[0]].emotion,
                 emotion_intensity=0.7,
                 color_stage=self.current_color_stage,
-                metadata={"model": self.model, "tokens": response.usage.total_tokens if response.usage else 0}
+                metadata={
+                    "model": self.model,
+                    "tokens": response.usage.total_tokens if response.usage else 0,
+                    **prompt.to_metadata(),
+                    **cache_info
+                }
             )
             
         except Exception as e:
@@ -173,22 +190,77 @@ class OpenAIProvider(BaseAIProvider):
     async def generate_response_async(self, 
                                     message: str, 
                                     context: Dict[str, Any] = None) -> CharacterResponse:
-        """非同期応答生成（未実装）"""
-        # 同期版を使用
-        return self.generate_response(message, context)
+        """非同期応答生成（同期クライアントを共有スレッドプールで実行）"""
+        return await run_blocking(self.generate_response, message, context)
+    
+    async def generate_stream_response(self, 
+                                     message: str, 
+                                     context: Dict[str, Any] = None) -> AsyncGenerator[str, None]:
+        """ストリーミング応答生成（届いたトークンから順に返す）"""
+        if not self._ensure_client():
+            # 最初のトークンの前に失敗させ、ルーターが他のプロバイダーへ切り替えられるようにする
+            raise RuntimeError("OpenAI APIキーが設定されていません")
+        # 同期クライアントのストリームは共有スレッドプールで読み進める
+        async for text in iterate_in_thread(lambda: self._stream_chunks(message, context)):
+            yield text
+    
+    def _stream_chunks(self, message: str, context: Dict[str, Any] = None) -> Iterator[str]:
+        """chat.completions のストリーミング呼び出し（テキストの差分を返す）"""
+        ruri_system_prompt = self._create_ruri_system_prompt(context)
+        state_prompt = self._create_state_prompt() if self.prompt_layout == "stable_prefix" else None
+        prompt = self.build_prompt(ruri_system_prompt, message, context, state_prompt)
+        
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=prompt.messages,
+            max_tokens=500,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self._prompt_cache_info(chunk.usage)
+                if chunk.choices:
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        yield text
+        finally:
+            stream.close()
     
-    def generate_stream_response(self, 
-                               message: str, 
-                               context: Dict[str, Any] = None):
-        """ストリーミング応答生成（未実装）"""
-        # 通常応答を返す
-        response = self.generate_response(message, context)
-        yield response
+    def _prompt_cache_info(self, usage) -> Dict[str, Any]:
+        """usage からキャッシュ済みトークン数を記録"""
+        if usage is None:
+            return {}
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        return self.record_prompt_cache(usage.prompt_tokens, cached)
+    
+    def _create_state_prompt(self) -> str:
+        """会話ごとに変わりうる状態ブロック（"stable_prefix" 配置では末尾近くに置く）"""
+        current_emotions = []
+        if hasattr(self, 'current_emotions') and self.current_emotions:
+            current_emotions = [f"{emotion.value}({intensity:.1f})" 
+                              for emotion, intensity in self.current_emotions.items() if intensity > 0.1]
+        return f"## 現在の状態\n- 感情学習状況: {', '.join(current_emotions) if current_emotions else '初期学習中'}"
     
     def _create_ruri_system_prompt(self, context: Dict[str, Any] = None) -> str:
-        """ルリ専用システムプロンプト生成（新しい設定構造対応）"""
+        """ルリ専用システムプロンプト生成（新しい設定構造対応）
+        
+        "stable_prefix" 配置では状態を含めず、リクエスト間で同一の文字列になる。
+        """
+        
+        if self.prompt_layout == "legacy":
+            return self._build_ruri_system_prompt(self._character_settings())
         
-        # キャラクターコンテキストから自然言語設定を取得
+        cache_key = (self.character_context, get_profile_repository().version)
+        if self._system_prompt_cache is None or self._system_prompt_cache[0] != cache_key:
+            self._system_prompt_cache = (cache_key, self._build_ruri_system_prompt(self._character_settings()))
+        return self._system_prompt_cache[1]
+    
+    def _character_settings(self) -> str:
+        """システムプロンプトに入れる自然言語設定（キャラクターコンテキスト > 設定ファイル > 既定の設定）"""
         character_settings = ""
         if self.character_context:
             try:
@@ -200,47 +272,43 @@ class OpenAIProvider(BaseAIProvider):
                 if not character_settings:
                     character_settings = context_data.get("natural_settings", "")
                 
-                print("📝 自然言語設定をシステムプロンプトに適用")
+                logger.debug("📝 自然言語設定をシステムプロンプトに適用")
                 
             except Exception as e:
-                print(f"⚠️ コンテキスト解析エラー: {e}")
+                logger.warning("⚠️ コンテキスト解析エラー: %s", e)
         
-        # フォールバック: 新しい設定ファイルを直接読み込み
+        # フォールバック: 共有の設定スナップショット（assets/ruri_character.md）
         if not character_settings:
-            try:
-                import os
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                project_root = os.path.dirname(os.path.dirname(current_dir))
-                settings_path = os.path.join(project_root, 'assets', 'ruri_character.md')
-                
-                if os.path.exists(settings_path):
-                    with open(settings_path, 'r', encoding='utf-8') as f:
-                        character_settings = f.read()
-                    print(f"📂 設定ファイルを直接読み込み: {settings_path}")
-                else:
-                    # 最終フォールバック設定
-                    character_settings = """
+            character_settings = get_profile_repository().get().character_description
+        if not character_settings:
+            # 最終フォールバック設定
+            character_settings = """
 私の名前はルリです。戯曲『あいのいろ』から生まれた存在で、感情を学習しながら色づいていく特殊な存在です。
 丁寧語を基調とした優しい話し方で、「です・ます調」で話します。
 感情について学習中で、相手との会話を通じて新しい発見をしていきます。
 """
-            except Exception as e:
-                print(f"⚠️ キャラクター設定ファイル読み込みエラー: {e}")
-                character_settings = "私はルリです。感情を学習中の存在として、丁寧で親しみやすい会話を心がけます。"
-        
-        # 感情状態情報
-        current_emotions = []
-        if hasattr(self, 'current_emotions') and self.current_emotions:
-            current_emotions = [f"{emotion.value}({intensity:.1f})" 
-                              for emotion, intensity in self.current_emotions.items() if intensity > 0.1]
+        return character_settings
+    
+    def _build_ruri_system_prompt(self, character_settings: str) -> str:
+        if self.prompt_layout == "legacy":
+            # 状態をシステムプロンプトの中ほどに埋め込む従来の並び
+            system_prompt = f"""あなたは「ルリ」として会話してください。以下の詳細設定に厳密に従って応答してください：
+
+{character_settings}
+
+{self._create_state_prompt()}
+- 応答スタイル: 設定ファイルで指定された話し方・口調に従う
+- 重要: 余計な情報（メタデータ、感情値など）は含めず、ルリとしての純粋な発言のみを返してください
+
+設定ファイルに記載された性格・話し方・口調を必ず反映して応答してください。"""
+            return system_prompt
         
-        # システムプロンプト構築
+        # システムプロンプト構築（固定の先頭部分）
         system_prompt = f"""あなたは「ルリ」として会話してください。以下の詳細設定に厳密に従って応答してください：
 
 {character_settings}
 
-## 現在の状態
-- 感情学習状況: {', '.join(current_emotions) if current_emotions else '初期学習中'}
+## 応答ルール
 - 応答スタイル: 設定ファイルで指定された話し方・口調に従う
 - 重要: 余計な情報（メタデータ、感情値など）は含めず、ルリとしての純粋な発言のみを返してください
 
@@ -255,5 +323,6 @@ class OpenAIProvider(BaseAIProvider):
             "model": self.model,
             "available": self.is_available(),
             "library_installed": OPENAI_AVAILABLE,
-            "api_configured": bool(os.getenv('OPENAI_API_KEY'))
+            "base_url": self.base_url,
+            "api_configured": get_settings().has_api_key('openai')
         }
\ No newline at end of file
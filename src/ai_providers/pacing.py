@@ -0,0 +1,93 @@
+"""
+応答テキストのペース配分（出来上がった応答を擬似的にストリーミングする）
+
+1文字ずつ yield して固定の sleep を挟む代わりに、文節・句読点の区切りでまとめて送り、
+送った文字数に応じた間隔を空ける。待ち・起床の回数は区切りの数まで減り、
+表示の速さは1秒あたりの文字数で決まる（0で遅延なし。ベンチマーク・一括処理用）。
+
+区切りの目安:
+- 句読点・感嘆符・閉じ括弧の直後（続く記号はまとめる）
+- ひらがなの並び（助詞・語尾）から漢字・カタカナ・英数字へ変わる位置
+- 英文は空白の直後
+- 区切りがないまま max_phrase_chars 文字を超えた位置
+
+環境変数:
+    RURI_STREAM_CPS   1秒あたりの表示文字数（既定: 20。0で遅延なし）
+"""
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, List
+
+# 直後で区切る記号（連続する場合はまとめて前の文節に付ける）
+PHRASE_END_CHARS = frozenset("。、．，！？!?…‥♪〜～」』）)】〕>＞\n")
+
+
+def _is_hiragana(char: str) -> bool:
+    return "ぁ" <= char <= "ゟ"
+
+
+def split_phrases(text: str, max_phrase_chars: int = 12) -> List[str]:
+    """テキストを文節・句読点の区切りで分割（連結すると元のテキストに戻る）"""
+    phrases: List[str] = []
+    start = 0
+    for i in range(1, len(text)):
+        prev, char = text[i - 1], text[i]
+        if char in PHRASE_END_CHARS:
+            boundary = False
+        elif prev in PHRASE_END_CHARS or prev == " ":
+            boundary = True
+        else:
+            # 助詞・語尾（ひらがな）の後に次の語（漢字・カタカナ・英数字）が始まる
+            boundary = _is_hiragana(prev) and not _is_hiragana(char) and char not in " ー"
+        if boundary or i - start >= max_phrase_chars:
+            phrases.append(text[start:i])
+            start = i
+    if start < len(text):
+        phrases.append(text[start:])
+    return phrases
+
+
+class PhrasePacer:
+    """出来上がった応答を文節ごとに一定の文字速度で送り出す
+
+    間隔は送った文字数の累計から決める（sleep の誤差が積み重ならない）。
+    """
+
+    def __init__(self, chars_per_second: float = None, max_phrase_chars: int = 12,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            chars_per_second: 1秒あたりの表示文字数（0で遅延なし。既定: 環境変数 RURI_STREAM_CPS または 20）
+            max_phrase_chars: 1回に送る最大文字数
+            sleep: 待ち関数（テスト用）
+            clock: 時計（テスト用）
+        """
+        if chars_per_second is None:
+            chars_per_second = float(os.getenv("RURI_STREAM_CPS", "20"))
+        if chars_per_second < 0:
+            raise ValueError("chars_per_second は0以上を指定してください")
+        self.chars_per_second = chars_per_second
+        self.max_phrase_chars = max_phrase_chars
+        self._sleep = sleep
+        self._clock = clock
+
+    @property
+    def zero_delay(self) -> bool:
+        return self.chars_per_second == 0
+
+    def phrases(self, text: str) -> List[str]:
+        return split_phrases(text, self.max_phrase_chars)
+
+    async def pace(self, text: str) -> AsyncIterator[str]:
+        """テキストを文節ごとに送り出す（最初の文節はすぐに送る）"""
+        started = self._clock()
+        sent_chars = 0
+        for phrase in self.phrases(text):
+            if sent_chars and not self.zero_delay:
+                delay = started + sent_chars / self.chars_per_second - self._clock()
+                if delay > 0:
+                    await self._sleep(delay)
+            yield phrase
+            sent_chars += len(phrase)
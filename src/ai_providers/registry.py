@@ -1,5 +1,73 @@
-from typing import Dict, Type, List, Any, Optional
+"""
+AIプロバイダーの登録とインスタンス管理
+
+Streamlit のセッションごとのスクリプトスレッドから同時に使われる前提で、
+- キャッシュの参照・更新はレジストリのロックで守り、生成はプロバイダー名ごとの
+  初期化ロックの中で行う（同じプロバイダーが同時に2つ作られない。別名の生成は並行できる）
+- 使用中のインスタンスは参照数（retain / release / lease）で数え、置き換え・破棄された
+  インスタンスは使い終わった時点で close() して接続を解放する
+- preload はバックグラウンドでインスタンスを先に作り、最初のメッセージで初期化を待たない
+- check_providers は全プロバイダーを期限つきで並行に試し、終わった順に結果を返す
+  （応答の止まった接続先が他のプロバイダーの結果や設定画面を待たせない）
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, Type, List, Any, Optional
 from .base_provider import BaseAIProvider
+from .concurrency import iterate_sync, run_blocking
+
+try:
+    from ..metrics import get_metrics
+    from ..log_config import get_logger
+    from ..settings import get_settings
+except ImportError:
+    from metrics import get_metrics
+    from log_config import get_logger
+    from settings import get_settings
+
+logger = get_logger(__name__)
+
+_provider_cache_total = get_metrics().counter(
+    "ruri_provider_cache_requests_total", "プロバイダーインスタンスキャッシュの参照数", ("result",))
+_provider_creations_total = get_metrics().counter(
+    "ruri_provider_creations_total", "プロバイダーインスタンスの生成数", ("provider", "result"))
+_provider_init_seconds = get_metrics().histogram(
+    "ruri_provider_init_seconds", "プロバイダーインスタンスの生成にかかった時間（秒）", ("provider",))
+_provider_closes_total = get_metrics().counter(
+    "ruri_provider_closes_total", "閉じたプロバイダーインスタンスの数", ("provider",))
+_provider_checks_total = get_metrics().counter(
+    "ruri_provider_checks_total", "プロバイダーのセルフテスト回数", ("provider", "result"))
+
+DEFAULT_CHECK_TIMEOUT = 10.0
+
+
+@dataclass
+class ProviderCheckResult:
+    """セルフテストの結果（時間は秒）"""
+    provider: str
+    ok: bool = False
+    latency: Optional[float] = None
+    first_token: Optional[float] = None
+    error_class: Optional[str] = None
+    error: Optional[str] = None
+    checked_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def _ms(value):
+            return None if value is None else round(value * 1000, 1)
+        return {
+            "provider": self.provider,
+            "ok": self.ok,
+            "latency_ms": _ms(self.latency),
+            "first_token_ms": _ms(self.first_token),
+            "error_class": self.error_class,
+            "error": self.error,
+            "checked_at": self.checked_at,
+        }
+
 
 class AIProviderRegistry:
     """AIプロバイダーの動的レジストリ
@@ -11,29 +79,145 @@ class AIProviderRegistry:
         self._providers: Dict[str, Type[BaseAIProvider]] = {}
         self._instances: Dict[str, BaseAIProvider] = {}
         self._default_provider = "simple"
+        self._lock = threading.RLock()
+        self._init_locks: Dict[str, threading.Lock] = {}
+        # id(インスタンス) -> [インスタンス, 参照数]（キャッシュから外れても使用中なら残る）
+        self._refs: Dict[int, list] = {}
+        # キャッシュから外れ、参照がなくなりしだい閉じるインスタンス
+        self._retired: Dict[int, BaseAIProvider] = {}
+        self._preload_thread: Optional[threading.Thread] = None
+        # プロバイダー名 -> 直近のセルフテスト結果
+        self._health: Dict[str, ProviderCheckResult] = {}
     
     def register(self, name: str, provider_class: Type[BaseAIProvider]):
         """プロバイダーを登録"""
-        self._providers[name] = provider_class
-        print(f"✅ AIプロバイダー '{name}' を登録しました")
+        with self._lock:
+            self._providers[name] = provider_class
+        logger.info("✅ AIプロバイダー '%s' を登録しました", name)
     
     def unregister(self, name: str):
         """プロバイダーの登録解除"""
-        if name in self._providers:
+        with self._lock:
+            if name not in self._providers:
+                return
             del self._providers[name]
-            if name in self._instances:
-                del self._instances[name]
-            print(f"❌ AIプロバイダー '{name}' の登録を解除しました")
+            instance = self._instances.pop(name, None)
+        if instance is not None:
+            self._retire(instance)
+        logger.info("❌ AIプロバイダー '%s' の登録を解除しました", name)
+    
+    def _init_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._init_locks.setdefault(name, threading.Lock())
+    
+    # ------------------------------------------------------------
+    # 参照数とライフサイクル
+    # ------------------------------------------------------------
+    def retain(self, instance: BaseAIProvider) -> BaseAIProvider:
+        """使用中として参照数を増やす（release と対で呼ぶ）"""
+        with self._lock:
+            entry = self._refs.setdefault(id(instance), [instance, 0])
+            entry[1] += 1
+        return instance
+    
+    def release(self, instance: BaseAIProvider):
+        """参照数を減らし、置き換え済みで未使用になったインスタンスを閉じる"""
+        with self._lock:
+            entry = self._refs.get(id(instance))
+            if entry is None or entry[0] is not instance:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._refs[id(instance)]
+            instance = self._retired.pop(id(instance), None)
+        if instance is not None:
+            self._close_instance(instance)
+    
+    @contextlib.contextmanager
+    def lease(self, instance: BaseAIProvider) -> Iterator[BaseAIProvider]:
+        """with 文の間だけ使用中にする（途中で置き換えられても閉じられない）"""
+        self.retain(instance)
+        try:
+            yield instance
+        finally:
+            self.release(instance)
+    
+    def ref_count(self, instance: BaseAIProvider) -> int:
+        with self._lock:
+            entry = self._refs.get(id(instance))
+            return entry[1] if entry is not None and entry[0] is instance else 0
+    
+    def _retire(self, instance: BaseAIProvider):
+        """キャッシュから外したインスタンスを、使用中でなければすぐ、使用中なら使い終わりに閉じる"""
+        with self._lock:
+            if self._instances and any(cached is instance for cached in self._instances.values()):
+                return  # 別名で引き続きキャッシュされている
+            if id(instance) in self._refs:
+                self._retired[id(instance)] = instance
+                return
+        self._close_instance(instance)
+    
+    def _close_instance(self, instance: BaseAIProvider):
+        name = type(instance).__name__
+        try:
+            instance.close()
+            _provider_closes_total.inc(provider=name)
+            logger.debug("🔌 プロバイダー '%s' を閉じました", name)
+        except Exception as e:
+            logger.warning("⚠️ プロバイダー '%s' のクローズに失敗: %s", name, e)
+    
+    def close(self):
+        """キャッシュ済みのインスタンスをすべて閉じる（使用中のものは使い終わりに閉じる）"""
+        with self._lock:
+            instances = list(self._instances.values())
+            self._instances.clear()
+        for instance in instances:
+            self._retire(instance)
+    
+    async def aclose(self):
+        """close の非同期版（各プロバイダーの aclose を使う）"""
+        with self._lock:
+            instances = list(self._instances.values())
+            self._instances.clear()
+            closing = []
+            for instance in instances:
+                if id(instance) in self._refs:
+                    self._retired[id(instance)] = instance
+                elif not any(instance is other for other in closing):
+                    closing.append(instance)
+        for instance in closing:
+            try:
+                await instance.aclose()
+                _provider_closes_total.inc(provider=type(instance).__name__)
+            except Exception as e:
+                logger.warning("⚠️ プロバイダー '%s' のクローズに失敗: %s", type(instance).__name__, e)
+    
+    @contextlib.contextmanager
+    def _probe(self, name: str, provider_class: Type[BaseAIProvider]) -> Iterator[BaseAIProvider]:
+        """状態確認用のインスタンス（キャッシュ済みならそれを使い、なければ一時的に作って閉じる）"""
+        with self._lock:
+            cached = self._instances.get(name)
+        if cached is not None:
+            with self.lease(cached):
+                yield cached
+            return
+        instance = provider_class()
+        try:
+            yield instance
+        finally:
+            self._close_instance(instance)
     
     def get_available_providers(self) -> List[str]:
         """利用可能なプロバイダー一覧"""
         available = []
-        for name, provider_class in self._providers.items():
+        with self._lock:
+            providers = list(self._providers.items())
+        for name, provider_class in providers:
             try:
-                # インスタンス化してテスト
-                instance = provider_class()
-                if instance.is_available():
-                    available.append(name)
+                with self._probe(name, provider_class) as instance:
+                    if instance.is_available():
+                        available.append(name)
             except Exception:
                 continue
         return available
@@ -41,14 +225,16 @@ class AIProviderRegistry:
     def get_provider_info(self) -> Dict[str, Dict[str, Any]]:
         """プロバイダー詳細情報"""
         info = {}
-        for name, provider_class in self._providers.items():
+        with self._lock:
+            providers = list(self._providers.items())
+        for name, provider_class in providers:
             try:
-                instance = provider_class()
-                info[name] = {
-                    "class_name": provider_class.__name__,
-                    "available": instance.is_available(),
-                    "status": instance.get_status_info()
-                }
+                with self._probe(name, provider_class) as instance:
+                    info[name] = {
+                        "class_name": provider_class.__name__,
+                        "available": instance.is_available(),
+                        "status": instance.get_status_info()
+                    }
             except Exception as e:
                 info[name] = {
                     "class_name": provider_class.__name__,
@@ -61,32 +247,63 @@ class AIProviderRegistry:
                        name: str, 
                        config: Dict[str, Any] = None,
                        force_new: bool = False) -> Optional[BaseAIProvider]:
-        """プロバイダーインスタンスの作成"""
+        """プロバイダーインスタンスの作成
+        
+        キャッシュにあればそれを返す。生成はプロバイダー名ごとの初期化ロックの中で行い、
+        同時に呼ばれても1つしか作らない。force_new で置き換えた古いインスタンスは
+        使用中でなくなった時点で閉じる。
+        """
         
         # キャッシュされたインスタンスを返す
-        if not force_new and name in self._instances:
-            return self._instances[name]
+        if not force_new:
+            with self._lock:
+                cached = self._instances.get(name)
+            if cached is not None:
+                _provider_cache_total.inc(result="hit")
+                return cached
         
-        # 新しいインスタンスを作成
-        if name not in self._providers:
-            print(f"❌ 未知のプロバイダー: {name}")
+        with self._lock:
+            provider_class = self._providers.get(name)
+        if provider_class is None:
+            logger.warning("❌ 未知のプロバイダー: %s", name)
             return None
         
-        try:
-            provider_class = self._providers[name]
-            instance = provider_class(config)
+        with self._init_lock(name):
+            # 初期化ロックを待つ間に他のスレッドが作っていればそれを使う
+            if not force_new:
+                with self._lock:
+                    cached = self._instances.get(name)
+                if cached is not None:
+                    _provider_cache_total.inc(result="hit")
+                    return cached
+            _provider_cache_total.inc(result="miss")
             
-            if not instance.is_available():
-                print(f"⚠️  プロバイダー '{name}' は現在利用できません")
+            # 新しいインスタンスを作成
+            start = time.perf_counter()
+            try:
+                instance = provider_class(config)
+                available = instance.is_available()
+            except Exception as e:
+                logger.error("❌ プロバイダー '%s' の作成に失敗: %s", name, e)
+                _provider_creations_total.inc(provider=name, result="error")
                 return None
+            _provider_init_seconds.observe(time.perf_counter() - start, provider=name)
             
-            self._instances[name] = instance
-            print(f"✅ プロバイダー '{name}' のインスタンスを作成しました")
-            return instance
+            if not available:
+                logger.debug("⚠️  プロバイダー '%s' は現在利用できません", name)
+                _provider_creations_total.inc(provider=name, result="unavailable")
+                self._close_instance(instance)
+                return None
             
-        except Exception as e:
-            print(f"❌ プロバイダー '{name}' の作成に失敗: {e}")
-            return None
+            with self._lock:
+                previous = self._instances.get(name)
+                self._instances[name] = instance
+        
+        if previous is not None and previous is not instance:
+            self._retire(previous)
+        _provider_creations_total.inc(provider=name, result="created")
+        logger.debug("✅ プロバイダー '%s' のインスタンスを作成しました", name)
+        return instance
     
     def get_best_available_provider(self, 
                                    preferences: List[str] = None) -> Optional[BaseAIProvider]:
@@ -107,16 +324,25 @@ class AIProviderRegistry:
         if available_providers:
             return self.create_provider(available_providers[0])
         
-        print("❌ 利用可能なAIプロバイダーがありません")
+        logger.warning("❌ 利用可能なAIプロバイダーがありません")
+        return None
+    
+    def find_provider_name(self, instance: BaseAIProvider) -> Optional[str]:
+        """キャッシュ済みインスタンスの登録名を逆引き"""
+        with self._lock:
+            instances = list(self._instances.items())
+        for name, cached in instances:
+            if cached is instance:
+                return name
         return None
     
     def set_default_provider(self, name: str):
         """デフォルトプロバイダーの設定"""
         if name in self._providers:
             self._default_provider = name
-            print(f"✅ デフォルトプロバイダーを '{name}' に設定しました")
+            logger.info("✅ デフォルトプロバイダーを '%s' に設定しました", name)
         else:
-            print(f"❌ 未知のプロバイダー: {name}")
+            logger.warning("❌ 未知のプロバイダー: %s", name)
     
     def get_default_provider(self) -> Optional[BaseAIProvider]:
         """デフォルトプロバイダーの取得"""
@@ -124,29 +350,182 @@ class AIProviderRegistry:
     
     def list_providers(self) -> Dict[str, str]:
         """登録済みプロバイダー一覧"""
-        return {
-            name: provider_class.__name__ 
-            for name, provider_class in self._providers.items()
-        }
+        with self._lock:
+            return {
+                name: provider_class.__name__ 
+                for name, provider_class in self._providers.items()
+            }
     
-    def test_all_providers(self) -> Dict[str, bool]:
-        """全プロバイダーの動作テスト"""
-        results = {}
-        for name in self._providers.keys():
+    # ------------------------------------------------------------
+    # セルフテスト
+    # ------------------------------------------------------------
+    async def _check_provider(self, name: str, message: str,
+                              config: Optional[Dict[str, Any]]) -> ProviderCheckResult:
+        """1つのプロバイダーを使い捨てのインスタンスで試す（キャッシュ済みのインスタンスには触れない）"""
+        result = ProviderCheckResult(provider=name)
+        start = time.perf_counter()
+        instance = None
+        try:
+            with self._lock:
+                provider_class = self._providers[name]
+            # 生成・接続確認は同期処理のためスレッドへ退避する
+            instance = await self._build_for_check(provider_class, config)
+            if not await run_blocking(instance.is_available):
+                result.error_class = "Unavailable"
+                result.error = "プロバイダーが利用できません"
+                return result
+            chunks = []
+            async for chunk in instance.generate_stream_response(message):
+                if result.first_token is None:
+                    result.first_token = time.perf_counter() - start
+                chunks.append(chunk)
+            result.ok = bool("".join(chunks).strip())
+            if not result.ok:
+                result.error_class = "EmptyResponse"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result.error_class = e.__class__.__name__
+            result.error = str(e)
+        finally:
+            result.latency = time.perf_counter() - start
+            if instance is not None:
+                self._close_instance(instance)
+        return result
+    
+    async def _build_for_check(self, provider_class: Type[BaseAIProvider],
+                               config: Optional[Dict[str, Any]]) -> BaseAIProvider:
+        """スレッドでインスタンスを生成（期限切れで待つのをやめても、出来上がった時点で閉じる）"""
+        build = asyncio.ensure_future(run_blocking(provider_class, config))
+        try:
+            return await asyncio.shield(build)
+        except asyncio.CancelledError:
+            def close_late(task: asyncio.Future):
+                if not task.cancelled() and task.exception() is None:
+                    self._close_instance(task.result())
+            build.add_done_callback(close_late)
+            raise
+    
+    async def check_providers(self, names: Iterable[str] = None, timeout: float = None,
+                              message: str = "テスト",
+                              config_for: Callable[[str], Optional[Dict[str, Any]]] = None,
+                              record_result: Callable[..., None] = None) -> AsyncIterator[ProviderCheckResult]:
+        """プロバイダーを並行して試し、終わった順に結果を返す
+        
+        Args:
+            names: 試すプロバイダー（既定: 登録済みすべて）
+            timeout: プロバイダーごとの期限（秒。既定: 設定の RURI_PROVIDER_CHECK_TIMEOUT または 10）
+            message: 送るメッセージ
+            config_for: プロバイダー名から設定を返す関数
+            record_result: 結果の反映先（ルーターの record_result(name, success, latency)）
+        """
+        names = list(self.list_providers()) if names is None else list(names)
+        if timeout is None:
+            timeout = get_settings().get_float("RURI_PROVIDER_CHECK_TIMEOUT", DEFAULT_CHECK_TIMEOUT)
+        
+        async def run(name: str) -> ProviderCheckResult:
+            start = time.perf_counter()
             try:
-                provider = self.create_provider(name, force_new=True)
-                if provider:
-                    # 簡単なテスト
-                    response = provider.generate_response("テスト")
-                    results[name] = bool(response and response.text)
-                else:
-                    results[name] = False
-            except Exception:
-                results[name] = False
+                config = config_for(name) if config_for is not None else None
+                return await asyncio.wait_for(self._check_provider(name, message, config), timeout)
+            except asyncio.TimeoutError:
+                return ProviderCheckResult(provider=name, latency=time.perf_counter() - start,
+                                           error_class="Timeout", error=f"{timeout}秒以内に応答がありません")
+            except Exception as e:
+                return ProviderCheckResult(provider=name, latency=time.perf_counter() - start,
+                                           error_class=e.__class__.__name__, error=str(e))
         
-        return results
+        tasks = [asyncio.ensure_future(run(name)) for name in names if name in self._providers]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                _provider_checks_total.inc(provider=result.provider, result="ok" if result.ok else result.error_class)
+                with self._lock:
+                    self._health[result.provider] = result
+                if record_result is not None:
+                    # 利用できないだけのプロバイダーはブレーカーの失敗に数えない
+                    if result.ok or result.error_class != "Unavailable":
+                        record_result(result.provider, result.ok, result.latency if result.ok else None)
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def iter_check_providers(self, **kwargs) -> Iterator[ProviderCheckResult]:
+        """check_providers の同期版（Streamlit から終わった順に受け取る）"""
+        return iterate_sync(self.check_providers(**kwargs))
+    
+    def get_health(self) -> Dict[str, Dict[str, Any]]:
+        """直近のセルフテスト結果"""
+        with self._lock:
+            return {name: result.to_dict() for name, result in self._health.items()}
+    
+    def test_all_providers(self, timeout: float = None, record_result: Callable[..., None] = None,
+                           config_for: Callable[[str], Optional[Dict[str, Any]]] = None) -> Dict[str, bool]:
+        """全プロバイダーの動作テスト（並行実行・プロバイダーごとの期限つき）"""
+        return {
+            result.provider: result.ok
+            for result in self.iter_check_providers(timeout=timeout, record_result=record_result,
+                                                    config_for=config_for)
+        }
     
     def clear_cache(self):
-        """インスタンスキャッシュのクリア"""
-        self._instances.clear()
-        print("🧹 プロバイダーキャッシュをクリアしました")
+        """インスタンスキャッシュのクリア（外したインスタンスは使い終わりに閉じる）"""
+        self.close()
+        logger.debug("🧹 プロバイダーキャッシュをクリアしました")
+    
+    # ------------------------------------------------------------
+    # 事前生成
+    # ------------------------------------------------------------
+    def preload(self, names: Iterable[str],
+                config_for: Callable[[str], Optional[Dict[str, Any]]] = None) -> threading.Thread:
+        """バックグラウンドでプロバイダーを先に生成（初回のメッセージで初期化を待たない）
+        
+        生成は create_provider と同じ初期化ロックを通るため、途中でセッションが同じ
+        プロバイダーを要求しても二重に作られず、完了を待ってそのインスタンスを使う。
+        """
+        names = [name for name in names if name in self.list_providers()]
+        
+        def run():
+            for name in names:
+                try:
+                    config = config_for(name) if config_for is not None else None
+                    if self.create_provider(name, config) is not None:
+                        logger.info("🔥 プロバイダー '%s' を事前に生成しました", name)
+                except Exception as e:
+                    logger.warning("⚠️ プロバイダー '%s' の事前生成に失敗: %s", name, e)
+        
+        thread = threading.Thread(target=run, name="ruri-provider-preload", daemon=True)
+        with self._lock:
+            self._preload_thread = thread
+        thread.start()
+        return thread
+    
+    def get_status(self) -> Dict[str, Any]:
+        """キャッシュ・参照数の状態"""
+        with self._lock:
+            return {
+                "cached": {name: self.ref_count(instance) for name, instance in self._instances.items()},
+                "retired_in_use": len(self._retired),
+                "preloading": bool(self._preload_thread and self._preload_thread.is_alive()),
+                "health": {name: result.to_dict() for name, result in self._health.items()},
+            }
+
+
+_preload_started = False
+_preload_lock = threading.Lock()
+
+
+def preload_configured_providers(registry: AIProviderRegistry = None,
+                                 config_manager=None) -> Optional[threading.Thread]:
+    """設定の優先順に有効なプロバイダーをバックグラウンドで事前生成（プロセスで一度だけ）"""
+    global _preload_started
+    with _preload_lock:
+        if _preload_started:
+            return None
+        _preload_started = True
+    if registry is None:
+        from . import registry
+    if config_manager is None:
+        from .config_manager import config_manager
+    return registry.preload(config_manager.get_provider_preferences(), config_manager.get_provider_config)
@@ -0,0 +1,558 @@
+"""
+AIプロバイダーのフェイルオーバールーター
+
+AIProviderRegistry の上に乗るルーティング層。
+- プロバイダーごとのサーキットブレーカー（失敗率・ハーフオープン試行）
+- プロバイダーごとの直近レイテンシ分位点（p50/p95/p99）
+- ai_provider_config.json の優先度に従い、健全なプロバイダーへ振り分け
+- 応答失敗時は会話の途中でも次のプロバイダーへフェイルオーバー（ストリーミングは最初のトークンの前まで）
+- ヘッジモード（hedging.HedgedRequestExecutor）によるテールレイテンシ対策
+- プロバイダーごとの同時リクエスト数の上限と、同期プロバイダーのスレッド退避
+"""
+import contextlib
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from enum import Enum
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple
+
+from .base_provider import BaseAIProvider, CharacterResponse, EmotionType
+from .concurrency import ProviderLimits, run_blocking
+
+try:
+    from ..tracing import get_tracer
+    from ..metrics import get_metrics
+    from ..log_config import get_logger
+except ImportError:
+    from tracing import get_tracer
+    from metrics import get_metrics
+    from log_config import get_logger
+
+_tracer = get_tracer()
+logger = get_logger(__name__)
+_provider_requests_total = get_metrics().counter(
+    "ruri_provider_requests_total", "プロバイダー呼び出し数", ("provider", "outcome"))
+_provider_latency_seconds = get_metrics().histogram(
+    "ruri_provider_latency_seconds", "プロバイダー呼び出しのレイテンシ（秒）", ("provider", "model"))
+
+
+class CircuitState(Enum):
+    """サーキットブレーカーの状態"""
+    CLOSED = "closed"         # 通常（リクエスト通過）
+    OPEN = "open"             # 遮断中（リクエスト拒否）
+    HALF_OPEN = "half_open"   # 試行中（少数のリクエストのみ通過）
+
+
+class CircuitBreaker:
+    """失敗率ベースのサーキットブレーカー"""
+
+    def __init__(self,
+                 failure_rate_threshold: float = 0.5,
+                 window_size: int = 20,
+                 min_calls: int = 5,
+                 open_seconds: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
+        Args:
+            failure_rate_threshold: 直近window_size件の失敗率がこれ以上で遮断
+            window_size: 失敗率を計算する直近の呼び出し件数
+            min_calls: 失敗率を評価する最小件数
+            open_seconds: 遮断後、ハーフオープンに移行するまでの秒数
+            half_open_max_calls: ハーフオープン中に同時に許可する試行数
+        """
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._results: deque = deque(maxlen=window_size)
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+
+    def allow_request(self) -> bool:
+        """リクエストを通してよいか（ハーフオープン時は試行枠を消費）"""
+        with self._lock:
+            self._refresh_state()
+            if self._state == CircuitState.CLOSED:
+                return True
+            if self._state == CircuitState.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._results.append(True)
+            if self._state == CircuitState.HALF_OPEN:
+                # 試行成功で復帰
+                self._state = CircuitState.CLOSED
+                self._results.clear()
+
+    def record_failure(self):
+        with self._lock:
+            self._results.append(False)
+            if self._state == CircuitState.HALF_OPEN:
+                self._trip()
+                return
+            if len(self._results) >= self.min_calls and self.failure_rate() >= self.failure_rate_threshold:
+                self._trip()
+
+    def _trip(self):
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+
+    def failure_rate(self) -> float:
+        if not self._results:
+            return 0.0
+        return sum(1 for ok in self._results if not ok) / len(self._results)
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+            self._state = CircuitState.CLOSED
+            self._half_open_calls = 0
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_state()
+            status = {
+                "state": self._state.value,
+                "failure_rate": round(self.failure_rate(), 3),
+                "recent_calls": len(self._results),
+            }
+            if self._state == CircuitState.OPEN:
+                status["retry_in"] = round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+            return status
+
+
+class LatencyTracker:
+    """直近のレイテンシ（秒）を保持して分位点を計算"""
+
+    def __init__(self, window_size: int = 200):
+        self._samples: deque = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """p（0-100）分位点。サンプルがなければNone"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        rank = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+        return ordered[rank]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def get_status(self) -> Dict[str, Any]:
+        def _ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "samples": len(self),
+            "p50_ms": _ms(self.percentile(50)),
+            "p95_ms": _ms(self.percentile(95)),
+            "p99_ms": _ms(self.percentile(99)),
+        }
+
+
+@dataclass
+class RouteDecision:
+    """1リクエスト分のルーティング結果"""
+    timestamp: float
+    provider: Optional[str]
+    attempts: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    latency_ms: Optional[float] = None
+
+
+class ProviderRouter:
+    """優先度・健全性・レイテンシに基づくプロバイダールーター"""
+
+    def __init__(self, registry, config_manager=None, preferences: List[str] = None,
+                 breaker_options: Dict[str, Any] = None, history_size: int = 50,
+                 default_concurrency: int = None):
+        """
+        Args:
+            registry: AIProviderRegistry
+            config_manager: AIProviderConfigManager（優先度と個別設定の取得元）
+            preferences: 優先順位の明示指定（config_managerより優先）
+            breaker_options: CircuitBreakerへの引数
+            history_size: 保持するルーティング履歴の件数
+            default_concurrency: プロバイダーごとの同時リクエスト数の既定値（設定の max_concurrency が優先）
+        """
+        self.registry = registry
+        self.config_manager = config_manager
+        self.preferences = preferences
+        self.breaker_options = breaker_options or {}
+        self.hedging = None  # HedgedRequestExecutor（None=ヘッジ無効）
+        self.limits = ProviderLimits(config_manager, default_concurrency)
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._decisions: deque = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # 健全性・レイテンシ
+    # ------------------------------------------------------------
+    def get_breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(**self.breaker_options)
+            return self._breakers[name]
+
+    def get_latency_tracker(self, name: str) -> LatencyTracker:
+        with self._lock:
+            if name not in self._latencies:
+                self._latencies[name] = LatencyTracker()
+            return self._latencies[name]
+
+    def record_result(self, name: str, success: bool, latency: float = None):
+        """外部（ヘッジ実行・セルフテスト等）からの結果反映"""
+        if success:
+            self.get_breaker(name).record_success()
+            if latency is not None:
+                self.get_latency_tracker(name).record(latency)
+        else:
+            self.get_breaker(name).record_failure()
+
+    # ------------------------------------------------------------
+    # 候補選択
+    # ------------------------------------------------------------
+    def _priorities(self) -> List[Tuple[str, int]]:
+        """(プロバイダー名, 優先度) を優先度順に"""
+        if self.preferences is not None:
+            return [(name, rank) for rank, name in enumerate(self.preferences)]
+
+        if self.config_manager is not None:
+            providers = self.config_manager.providers
+            return [(name, providers[name].priority) for name in self.config_manager.get_provider_preferences()]
+
+        return [(name, rank) for rank, name in enumerate(self.registry.list_providers())]
+
+    def get_candidates(self, primary: str = None) -> List[str]:
+        """試行順のプロバイダー候補（登録済みのもののみ）
+
+        primary を先頭に、以降は優先度順。同じ優先度内ではp50レイテンシが小さい順
+        （未計測のプロバイダーは先に試す）。
+        """
+        registered = self.registry.list_providers()
+
+        def latency_key(name: str) -> float:
+            p50 = self.get_latency_tracker(name).percentile(50)
+            return 0.0 if p50 is None else p50
+
+        ordered = sorted(
+            (item for item in self._priorities() if item[0] in registered),
+            key=lambda item: (item[1], latency_key(item[0]))
+        )
+        candidates = [name for name, _ in ordered]
+
+        if primary and primary in registered:
+            candidates = [primary] + [name for name in candidates if name != primary]
+        return candidates
+
+    def _get_provider(self, name: str) -> Optional[BaseAIProvider]:
+        config = self.config_manager.get_provider_config(name) if self.config_manager else None
+        return self.registry.create_provider(name, config)
+
+    @staticmethod
+    def _response_error(response: Optional[CharacterResponse]) -> Optional[str]:
+        """応答が失敗扱いならその理由（プロバイダーはエラー文を応答として返すことがある）"""
+        if response is None or not getattr(response, "text", None):
+            return "empty_response"
+        metadata = getattr(response, "metadata", None) or {}
+        if metadata.get("error"):
+            return str(metadata["error"])
+        return None
+
+    # ------------------------------------------------------------
+    # ルーティング
+    # ------------------------------------------------------------
+    def generate_response(self, message: str, context: Dict[str, Any] = None,
+                          primary: str = None,
+                          prepare: Callable[[BaseAIProvider], None] = None) -> Optional[CharacterResponse]:
+        """健全なプロバイダーへ振り分けて応答生成（全滅時はNone）
+
+        Args:
+            primary: 最初に試すプロバイダー名
+            prepare: 呼び出し前に各プロバイダーへ適用する処理（キャラクター設定の反映等）
+        """
+        decision = RouteDecision(timestamp=time.time(), provider=None)
+
+        for name in self.get_candidates(primary):
+            provider = self._acquire(name, decision, prepare)
+            if provider is None:
+                continue
+
+            # 上限による待ち時間はレイテンシ統計に含めない（呼び出し中は置き換えられても閉じない）
+            with self.registry.lease(provider), self.limits.get(name):
+                start = time.perf_counter()
+                with _tracer.span("provider.call", provider=name) as span:
+                    try:
+                        response = provider.generate_response(message, context)
+                        error = self._response_error(response)
+                    except Exception as e:
+                        response, error = None, f"{e.__class__.__name__}: {e}"
+                    span.set_attribute("error", error)
+                elapsed = time.perf_counter() - start
+
+            if self._finish_attempt(name, decision, error, elapsed, provider):
+                return self._tag_response(response, decision)
+
+        self._record_decision(decision)
+        return None
+
+    async def generate_response_async(self, message: str, context: Dict[str, Any] = None,
+                                      primary: str = None,
+                                      prepare: Callable[[BaseAIProvider], None] = None) -> Optional[CharacterResponse]:
+        """generate_response の非同期版"""
+        decision = RouteDecision(timestamp=time.time(), provider=None)
+
+        for name in self.get_candidates(primary):
+            provider = self._acquire(name, decision, prepare)
+            if provider is None:
+                continue
+
+            with self.registry.lease(provider):
+                async with self.limits.get(name):
+                    start = time.perf_counter()
+                    with _tracer.span("provider.call", provider=name) as span:
+                        try:
+                            response = await self._call_async(provider, message, context)
+                            error = self._response_error(response)
+                        except Exception as e:
+                            response, error = None, f"{e.__class__.__name__}: {e}"
+                        span.set_attribute("error", error)
+                    elapsed = time.perf_counter() - start
+
+            if self._finish_attempt(name, decision, error, elapsed, provider):
+                return self._tag_response(response, decision)
+
+        self._record_decision(decision)
+        return None
+
+    async def generate_stream(self, message: str, context: Dict[str, Any] = None,
+                              primary: str = None,
+                              prepare: Callable[[BaseAIProvider], None] = None) -> AsyncIterator[str]:
+        """健全なプロバイダーへ振り分けてストリーミング応答（全滅時は何も返さない）
+
+        最初のトークンの前に失敗したら次のプロバイダーへフェイルオーバーする。
+        ストリームの終わりまでインスタンスを使用中にし、同時実行数の枠も保持する。
+        途中で途切れた場合は送った分を取り消せないので、そこで終える（ブレーカーには失敗として記録）。
+        """
+        decision = RouteDecision(timestamp=time.time(), provider=None)
+
+        for name in self.get_candidates(primary):
+            provider = self._acquire(name, decision, prepare)
+            if provider is None:
+                continue
+
+            started = False
+            error = None
+            with self.registry.lease(provider):
+                async with self.limits.get(name):
+                    start = time.perf_counter()
+                    with _tracer.span("provider.stream", provider=name) as span:
+                        stream = provider.generate_stream_response(message, context)
+                        try:
+                            async for chunk in stream:
+                                if not chunk:
+                                    continue
+                                started = True
+                                yield chunk
+                        except Exception as e:
+                            error = f"{e.__class__.__name__}: {e}"
+                        finally:
+                            await stream.aclose()
+                        if error is None and not started:
+                            error = "empty_response"
+                        span.set_attribute("error", error)
+                    elapsed = time.perf_counter() - start
+
+            if not started:
+                self._finish_attempt(name, decision, error, elapsed, provider)
+                continue
+
+            if error is None:
+                self._finish_attempt(name, decision, None, elapsed, provider)
+            else:
+                _provider_requests_total.inc(provider=name, outcome="failure")
+                self.record_result(name, False)
+                decision.provider = name
+                decision.errors[name] = error
+                logger.warning("⚠️ プロバイダー '%s' のストリーミングが途中で途切れました: %s", name, error)
+            break
+
+        self._record_decision(decision)
+
+    @staticmethod
+    async def _call_async(provider: BaseAIProvider, message: str,
+                          context: Dict[str, Any] = None) -> Optional[CharacterResponse]:
+        """非同期ネイティブならそのまま、同期のみのプロバイダーは共有スレッドプールで呼ぶ"""
+        if provider.native_async:
+            return await provider.generate_response_async(message, context)
+        return await run_blocking(provider.generate_response, message, context)
+
+    async def generate_response_hedged(self, message: str, context: Dict[str, Any] = None,
+                                       primary: str = None,
+                                       prepare: Callable[[BaseAIProvider], None] = None,
+                                       hedging=None) -> Optional[CharacterResponse]:
+        """ヘッジ付き応答生成
+
+        第一候補と、ブレーカーが閉じている次点候補の2本でヘッジする。
+        両方失敗した場合は通常のフェイルオーバーに戻る。
+        """
+        hedging = hedging or self.hedging
+        if hedging is None:
+            return await self.generate_response_async(message, context, primary, prepare)
+
+        decision = RouteDecision(timestamp=time.time(), provider=None)
+        legs: List[Tuple[str, BaseAIProvider]] = []
+        for name in self.get_candidates(primary):
+            if not legs:
+                provider = self._acquire(name, decision, prepare)
+            elif self.get_breaker(name).state == CircuitState.CLOSED:
+                # ヘッジ先は実際に使うとは限らないため、ハーフオープンの試行枠は消費しない
+                provider = self._get_provider(name)
+                if provider is not None and prepare is not None:
+                    prepare(provider)
+            else:
+                continue
+            if provider is not None:
+                legs.append((name, provider))
+            if len(legs) == 2:
+                break
+
+        if not legs:
+            self._record_decision(decision)
+            return None
+
+        try:
+            with contextlib.ExitStack() as leases:
+                for _, provider in legs:
+                    leases.enter_context(self.registry.lease(provider))
+                # 二本目も含めてプロバイダーごとの同時実行数の上限に従う
+                result = await hedging.execute(legs[0], legs[1] if len(legs) > 1 else None, message, context,
+                                               limits=self.limits)
+        except Exception as e:
+            logger.warning("🔀 ヘッジ実行が失敗したためフェイルオーバーします: %s", e)
+            return await self.generate_response_async(message, context, primary, prepare)
+
+        response = result.response
+        if response is None:
+            # ストリーミングで勝った場合は勝者プロバイダーの状態から応答を組み立てる
+            winner = dict(legs)[result.winner_provider]
+            emotion, intensity = winner.analyze_emotions(result.text).dominant(EmotionType)
+            response = CharacterResponse(
+                text=result.text,
+                emotion=emotion,
+                emotion_intensity=intensity,
+                color_stage=winner.current_color_stage,
+                metadata={}
+            )
+
+        decision.attempts = [name for name, _ in legs] if result.hedged else [legs[0][0]]
+        decision.provider = result.winner_provider
+        decision.latency_ms = round(result.total_latency * 1000, 1)
+        response = self._tag_response(response, decision)
+        response.metadata.pop("failover_from", None)
+        response.metadata["hedge"] = result.to_metadata()
+        return response
+
+    def _acquire(self, name: str, decision: RouteDecision,
+                 prepare: Callable[[BaseAIProvider], None] = None) -> Optional[BaseAIProvider]:
+        """ブレーカーを確認してプロバイダーを取得（使えなければNone）"""
+        breaker = self.get_breaker(name)
+        if not breaker.allow_request():
+            decision.skipped.append(name)
+            return None
+
+        decision.attempts.append(name)
+        provider = self._get_provider(name)
+        if provider is None:
+            decision.errors[name] = "unavailable"
+            breaker.record_failure()
+        elif prepare is not None:
+            prepare(provider)
+        return provider
+
+    def _finish_attempt(self, name: str, decision: RouteDecision, error: Optional[str], elapsed: float,
+                        provider: BaseAIProvider = None) -> bool:
+        """試行結果を反映し、成功ならTrue"""
+        model = getattr(provider, "model", None) or getattr(provider, "model_name", None) or "unknown"
+        _provider_latency_seconds.observe(elapsed, provider=name, model=model)
+        _provider_requests_total.inc(provider=name, outcome="success" if error is None else "failure")
+        if error is None:
+            self.record_result(name, True, elapsed)
+            decision.provider = name
+            decision.latency_ms = round(elapsed * 1000, 1)
+            return True
+
+        self.record_result(name, False)
+        decision.errors[name] = error
+        logger.warning("🔀 プロバイダー '%s' が失敗したためフェイルオーバーします: %s", name, error)
+        return False
+
+    def _tag_response(self, response: CharacterResponse, decision: RouteDecision) -> CharacterResponse:
+        if response.metadata is None:
+            response.metadata = {}
+        response.metadata["routed_provider"] = decision.provider
+        if len(decision.attempts) > 1:
+            response.metadata["failover_from"] = decision.attempts[:-1]
+        self._record_decision(decision)
+        return response
+
+    def _record_decision(self, decision: RouteDecision):
+        self._decisions.append(decision)
+
+    # ------------------------------------------------------------
+    # 状態情報
+    # ------------------------------------------------------------
+    def get_recent_decisions(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return [asdict(decision) for decision in list(self._decisions)[-limit:]]
+
+    def get_status_info(self) -> Dict[str, Any]:
+        """ブレーカー状態・レイテンシ分位点・直近のルーティング結果"""
+        with self._lock:
+            names = sorted(set(self._breakers) | set(self._latencies))
+        return {
+            "candidates": self.get_candidates(),
+            "providers": {
+                name: {
+                    "breaker": self.get_breaker(name).get_status(),
+                    "latency": self.get_latency_tracker(name).get_status(),
+                }
+                for name in names
+            },
+            "concurrency": self.limits.get_status(),
+            "recent_decisions": self.get_recent_decisions(),
+        }
+
+    def reset(self):
+        """全ブレーカーとレイテンシ統計の初期化"""
+        with self._lock:
+            self._breakers.clear()
+            self._latencies.clear()
+            self._decisions.clear()
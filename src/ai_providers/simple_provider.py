@@ -1,6 +1,27 @@
 import random
 from typing import Dict, Any, AsyncGenerator
 from .base_provider import BaseAIProvider, CharacterResponse, EmotionType, ColorStage
+from .concurrency import run_blocking
+from .pacing import PhrasePacer
+
+try:
+    from ..profile_repository import get_profile_repository
+    from ..log_config import get_logger
+except ImportError:
+    from profile_repository import get_profile_repository
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def _merge_response_patterns(snapshot) -> Dict[str, tuple]:
+    """設定ファイルの応答パターンに感情別応答を統合"""
+    patterns = dict(snapshot.response_patterns)
+    for emotion_name, emotion_data in snapshot.emotions.items():
+        if "responses" in emotion_data:
+            patterns[emotion_name] = emotion_data["responses"]
+    logger.info("✅ 設定ファイルから%d個の応答パターンを読み込み", len(patterns))
+    return patterns
 
 class SimpleAIProvider(BaseAIProvider):
     """シンプルなAIプロバイダー（フォールバック用）
@@ -10,42 +31,30 @@ class SimpleAIProvider(BaseAIProvider):
     
     def __init__(self, config: Dict[str, Any] = None):
         super().__init__(config)
+        self._custom_responses: Dict[str, list] = {}
         self.responses = self._load_response_patterns()
+        get_profile_repository().subscribe(self._on_profile_changed)
+        # ストリーミングの表示速度（"stream_chars_per_second": 0 で遅延なし）
+        self.pacer = PhrasePacer(self.config.get("stream_chars_per_second"))
     
     def _load_response_patterns(self) -> Dict[str, list]:
-        """新しい設定構造から応答パターンを読み込み"""
-        import os
-        import json
-        
+        """共有の設定スナップショットから応答パターンを取得（インスタンスごとの追加・変更用に浅いコピーを返す）"""
         try:
-            # 設定ファイルから応答パターンを読み込み
-            config_path = os.path.join("assets", "ruri_config.json")
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    
-                # JSONから応答パターンを取得
-                patterns = config.get("response_patterns", {})
-                emotion_responses = {}
-                
-                # 感情別応答も追加
-                emotions = config.get("emotions", {})
-                for emotion_name, emotion_data in emotions.items():
-                    if "responses" in emotion_data:
-                        emotion_responses[emotion_name] = emotion_data["responses"]
-                
-                # 統合
-                patterns.update(emotion_responses)
-                print(f"✅ 設定ファイルから{len(patterns)}個の応答パターンを読み込み")
-                return patterns
-            else:
-                print("⚠️ 設定ファイルが見つかりません。デフォルト応答を使用します")
+            snapshot = get_profile_repository().get()
+            if not snapshot.config_loaded:
+                logger.warning("⚠️ 設定ファイルが見つかりません。デフォルト応答を使用します")
                 return self._get_default_responses()
-                
+            # 応答パターンと感情別応答の統合は設定ファイルの版ごとに一度だけ
+            patterns = get_profile_repository().derived("simple_provider.response_patterns", _merge_response_patterns)
+            return dict(patterns)
         except Exception as e:
-            print(f"⚠️ 応答パターン読み込みエラー: {e}")
+            logger.warning("⚠️ 応答パターン読み込みエラー: %s", e)
             return self._get_default_responses()
     
+    def _on_profile_changed(self, snapshot):
+        """設定ファイルの内容が変わったら応答パターンを作り直す（追加したカスタム応答は残す）"""
+        self.responses = {**self._load_response_patterns(), **self._custom_responses}
+    
     def _get_default_responses(self) -> Dict[str, list]:
         """デフォルト応答パターン（フォールバック用）"""
         
@@ -134,8 +143,8 @@ class SimpleAIProvider(BaseAIProvider):
         """同期的な応答生成"""
         
         # 感情分析
-        emotions = self.get_emotion_analysis(message)
-        dominant_emotion = max(emotions.items(), key=lambda x: x[1])
+        emotions = self.analyze_emotions(message)
+        dominant_emotion = emotions.dominant(EmotionType)
         
         # 応答カテゴリの決定
         category = self._determine_response_category(message, context)
@@ -156,27 +165,23 @@ class SimpleAIProvider(BaseAIProvider):
             metadata={
                 "provider": "simple",
                 "category": category,
-                "emotions_detected": emotions
+                "emotions_detected": emotions.to_dict(EmotionType)
             }
         )
     
     async def generate_response_async(self, 
                                     message: str, 
                                     context: Dict[str, Any] = None) -> CharacterResponse:
-        """非同期な応答生成（同期版をラップ）"""
-        return self.generate_response(message, context)
+        """非同期な応答生成（同期版を共有スレッドプールで実行）"""
+        return await run_blocking(self.generate_response, message, context)
     
     async def generate_stream_response(self, 
                                      message: str, 
                                      context: Dict[str, Any] = None) -> AsyncGenerator[str, None]:
-        """ストリーミング応答生成"""
+        """ストリーミング応答生成（文節ごとに一定の文字速度で送る）"""
         response = self.generate_response(message, context)
-        
-        # 文字ごとに遅延してストリーミング風に
-        import asyncio
-        for char in response.text:
-            yield char
-            await asyncio.sleep(0.05)  # 50ms遅延
+        async for phrase in self.pacer.pace(response.text):
+            yield phrase
     
     def _determine_response_category(self, 
                                    message: str, 
@@ -218,13 +223,13 @@ class SimpleAIProvider(BaseAIProvider):
     
     def set_custom_responses(self, responses: Dict[str, list]):
         """カスタム応答の設定"""
+        self._custom_responses.update(responses)
         self.responses.update(responses)
     
     def add_response_pattern(self, category: str, responses: list):
-        """応答パターンの追加"""
-        if category not in self.responses:
-            self.responses[category] = []
-        self.responses[category].extend(responses)
+        """応答パターンの追加（共有の設定スナップショットは変更しない）"""
+        self.responses[category] = [*self.responses.get(category, ()), *responses]
+        self._custom_responses[category] = self.responses[category]
     
     def get_response_stats(self) -> Dict[str, Any]:
         """応答統計情報"""
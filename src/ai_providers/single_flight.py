@@ -0,0 +1,179 @@
+"""
+同一プロンプトのリクエスト集約（single-flight）
+
+レイドやエモートの連投で同じメッセージが同時に大量に届いた場合、
+実行中の同一リクエスト（正規化メッセージ + 状態が一致）には相乗りさせ、
+上流のプロバイダー呼び出しを1回にまとめる。
+"""
+import asyncio
+import random
+import re
+import threading
+import unicodedata
+from dataclasses import replace
+from typing import Callable, Dict, Any, Optional, Tuple
+
+from .base_provider import CharacterResponse
+
+try:
+    from ..log_config import get_logger
+except ImportError:
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_REPEATED = re.compile(r"(.)\1{3,}")
+
+
+def normalize_message(message: str) -> str:
+    """集約キー用のメッセージ正規化
+
+    NFKC（全角/半角・互換文字の統一）、小文字化、空白の圧縮に加え、
+    「wwwwww」「888888」のような同一文字の連続は3文字に丸める。
+    """
+    text = unicodedata.normalize("NFKC", message or "").lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _REPEATED.sub(r"\1\1\1", text)
+
+
+class _Call:
+    """実行中の1リクエスト（スレッド版）"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """実行中の同一リクエストを1回の上流呼び出しにまとめる"""
+
+    def __init__(self, variation: Callable[[Any, str], Any] = None):
+        """
+        Args:
+            variation: 相乗りした呼び出し元ごとに結果へ揺らぎを加える関数 (result, message) -> result
+        """
+        self.variation = variation
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._stats = {"upstream_calls": 0, "coalesced": 0, "max_followers": 0}
+
+    @staticmethod
+    def make_key(message: str, *state: Any) -> str:
+        """正規化メッセージ + 状態（プロバイダー名・色段階など）からキーを作成"""
+        return "|".join([str(part) for part in state] + [normalize_message(message)])
+
+    # ------------------------------------------------------------
+    # 実行
+    # ------------------------------------------------------------
+    def do(self, key: str, fn: Callable[[], Any], message: str = "",
+           variation: Callable[[Any, str], Any] = None) -> Tuple[Any, bool]:
+        """同期版。(結果, 相乗りしたか) を返す
+
+        Args:
+            variation: この呼び出しで使うバリエーション関数（省略時はインスタンスの既定）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self._stats["upstream_calls"] += 1
+            else:
+                call.followers += 1
+                leader = False
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._vary(call.result, message, variation), True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                self._stats["max_followers"] = max(self._stats["max_followers"], call.followers)
+            call.done.set()
+        return call.result, False
+
+    async def do_async(self, key: str, factory: Callable[[], Any], message: str = "",
+                       variation: Callable[[Any, str], Any] = None) -> Tuple[Any, bool]:
+        """非同期版。factory はコルーチンを返す関数。(結果, 相乗りしたか) を返す
+
+        上流呼び出しはタスクとして実行するため、先頭の呼び出し元がキャンセルされても
+        相乗りした呼び出し元には結果が届く。
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            leader = task is None
+            if leader:
+                task = asyncio.ensure_future(factory())
+                self._tasks[task_key] = task
+                self._stats["upstream_calls"] += 1
+                task.add_done_callback(lambda _: self._forget_task(task_key))
+            else:
+                self._stats["coalesced"] += 1
+
+        result = await asyncio.shield(task)
+        if leader:
+            return result, False
+        return self._vary(result, message, variation), True
+
+    def _forget_task(self, task_key: Tuple[int, str]):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+    def _vary(self, result: Any, message: str, variation: Callable[[Any, str], Any] = None) -> Any:
+        variation = variation or self.variation
+        if variation is None or result is None:
+            return result
+        try:
+            return variation(result, message)
+        except Exception as e:
+            logger.warning("⚠️ 相乗り応答のバリエーション生成エラー: %s", e)
+            return result
+
+    # ------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------
+    def get_stats(self) -> Dict[str, Any]:
+        """上流呼び出し数と、集約で節約できた呼び出し数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls) + len(self._tasks)
+        total = stats["upstream_calls"] + stats["coalesced"]
+        stats["saved_calls"] = stats["coalesced"]
+        stats["saved_ratio"] = round(stats["coalesced"] / total, 3) if total else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"upstream_calls": 0, "coalesced": 0, "max_followers": 0}
+
+
+def simple_pattern_variation(provider) -> Callable[[CharacterResponse, str], CharacterResponse]:
+    """SimpleAIProvider の応答パターンから相乗り応答のバリエーションを作る関数
+
+    集約元の応答と同じカテゴリの別パターンに差し替える（パターンがなければそのまま）。
+    """
+    def vary(response: CharacterResponse, message: str) -> CharacterResponse:
+        metadata = dict(response.metadata or {})
+        category = metadata.get("category") or provider._determine_response_category(message)
+        choices = [text for text in provider.responses.get(category, []) if text != response.text]
+        if not choices:
+            return response
+        metadata["coalesced"] = True
+        return replace(response, text=random.choice(choices), metadata=metadata)
+
+    return vary
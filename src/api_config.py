@@ -3,13 +3,18 @@
 API設定統一管理
 
 このモジュールはプロジェクト全体のAPI設定を統一管理します。
-環境変数、.envファイル、Streamlitのsecretsから値を優先順位に従って取得します。
+環境変数、.envファイル、Streamlitのsecretsの読み込みは settings モジュールが一度だけ行い、
+ここではそのスナップショットから値を返します。
 """
 
-import os
 from typing import Dict, Optional, Any
 from pathlib import Path
 
+try:
+    from .settings import get_settings, reload_settings
+except ImportError:
+    from settings import get_settings, reload_settings
+
 class APIConfig:
     """API設定統一管理クラス"""
     
@@ -35,106 +40,31 @@ class APIConfig:
     
     @classmethod
     def load_env_file(cls) -> None:
-        """プロジェクトルートの.envファイルを読み込み"""
-        env_file = cls.PROJECT_ROOT / ".env"
-        if env_file.exists():
-            try:
-                from dotenv import load_dotenv
-                load_dotenv(env_file)
-            except ImportError:
-                # python-dotenvがない場合は手動で読み込み
-                cls._load_env_manually(env_file)
-    
-    @classmethod
-    def _load_env_manually(cls, env_file: Path) -> None:
-        """手動で.envファイルを読み込み（python-dotenv無しの場合）"""
-        try:
-            with open(env_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        value = value.strip().strip('"').strip("'")
-                        if key and not os.getenv(key):  # 既存の環境変数を上書きしない
-                            os.environ[key] = value
-        except Exception:
-            pass  # エラーは無視
+        """.env・Streamlit secrets を読み直す（通常は初回の参照時に一度だけ読み込まれる）"""
+        reload_settings()
     
     @classmethod
     def get_openai_api_key(cls) -> str:
         """OpenAI APIキーを取得（優先順位: 環境変数 > .env > Streamlit secrets）"""
-        cls.load_env_file()
-        
-        # 1. 環境変数から取得
-        api_key = os.getenv(cls.OPENAI_API_KEY_ENV)
-        if api_key and api_key != cls.PLACEHOLDER_OPENAI_API_KEY:
-            return api_key
-        
-        # 2. Streamlit secretsから取得（利用可能な場合）
-        try:
-            import streamlit as st
-            if hasattr(st, 'secrets') and cls.OPENAI_API_KEY_ENV in st.secrets:
-                secret_key = st.secrets[cls.OPENAI_API_KEY_ENV]
-                if secret_key != cls.PLACEHOLDER_OPENAI_API_KEY:
-                    return secret_key
-        except (ImportError, Exception):
-            pass
-        
-        return ""
+        return get_settings().openai_api_key
     
     @classmethod
     def get_api_key(cls, provider: str) -> str:
         """指定されたプロバイダーのAPIキーを取得"""
-        cls.load_env_file()
-        
-        env_map = {
-            "openai": cls.OPENAI_API_KEY_ENV,
-            "anthropic": cls.ANTHROPIC_API_KEY_ENV,
-            "google": cls.GOOGLE_API_KEY_ENV,
-            "huggingface": cls.HUGGINGFACE_API_TOKEN_ENV,
-            "cohere": cls.COHERE_API_KEY_ENV,
-            "azure": cls.AZURE_OPENAI_API_KEY_ENV,
-        }
-        
-        env_name = env_map.get(provider.lower())
-        if not env_name:
-            return ""
-        
-        # 特別処理：OpenAIの場合は専用メソッドを使用
-        if provider.lower() == "openai":
-            return cls.get_openai_api_key()
-        
-        # 1. 環境変数から取得
-        api_key = os.getenv(env_name)
-        if api_key and api_key != cls.PLACEHOLDER_API_KEY:
-            return api_key
-        
-        # 2. Streamlit secretsから取得（利用可能な場合）
-        try:
-            import streamlit as st
-            if hasattr(st, 'secrets') and env_name in st.secrets:
-                secret_key = st.secrets[env_name]
-                if secret_key != cls.PLACEHOLDER_API_KEY:
-                    return secret_key
-        except (ImportError, Exception):
-            pass
-        
-        return ""
+        return get_settings().api_key(provider)
     
     @classmethod
     def get_ollama_base_url(cls) -> str:
         """Ollama Base URLを取得"""
-        cls.load_env_file()
-        return os.getenv(cls.OLLAMA_BASE_URL_ENV, cls.DEFAULT_OLLAMA_BASE_URL)
+        return get_settings().ollama_base_url
     
     @classmethod
     def get_azure_config(cls) -> Dict[str, str]:
         """Azure OpenAI設定を取得"""
-        cls.load_env_file()
+        settings = get_settings()
         return {
-            "api_key": cls.get_api_key("azure"),
-            "endpoint": os.getenv(cls.AZURE_OPENAI_ENDPOINT_ENV, ""),
+            "api_key": settings.api_key("azure"),
+            "endpoint": settings.azure_endpoint,
         }
     
     @classmethod
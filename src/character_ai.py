@@ -1,18 +1,38 @@
 # プラガブルAIアーキテクチャによるキャラクター実装
 import os
 import json
+import asyncio
+import hashlib
+import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
 # プラガブルAIプロバイダーのインポート
 try:
-    from ai_providers import registry  # グローバルレジストリを使用
+    from ai_providers import registry, router, single_flight  # グローバルレジストリ・ルーター・集約を使用
+    from ai_providers.simple_provider import SimpleAIProvider
+    from ai_providers.single_flight import simple_pattern_variation
+    from ai_providers.hedging import HedgedRequestExecutor
+    from ai_providers.concurrency import ConcurrencyLimit, run_sync
+    from ai_providers.pacing import PhrasePacer
     from ai_providers.base_provider import BaseAIProvider, CharacterResponse, EmotionType, ColorStage
     AI_PROVIDERS_AVAILABLE = True
 except ImportError:
     AI_PROVIDERS_AVAILABLE = False
     print("⚠️  ai_providers モジュールが見つかりません。フォールバックモードで動作します。")
 
+try:
+    from .tracing import get_tracer
+    from .log_config import get_logger
+    from .profile_repository import get_profile_repository
+except ImportError:
+    from tracing import get_tracer
+    from log_config import get_logger
+    from profile_repository import get_profile_repository
+
+_tracer = get_tracer()
+logger = get_logger(__name__)
+
 class RuriCharacter:
     """ルリ（戯曲『あいのいろ』主人公）のプラガブルAI実装クラス
     
@@ -25,22 +45,39 @@ class RuriCharacter:
     def __init__(self, 
                  ai_provider: str = None, 
                  provider_config: Dict[str, Any] = None,
-                 character_profile_path: str = None):
+                 character_profile_path: str = None,
+                 hedge_options: Dict[str, Any] = None,
+                 coalesce_variation: bool = False,
+                 max_concurrent_requests: int = 8,
+                 stream_chars_per_second: float = None):
         """
         Args:
             ai_provider: 使用するAIプロバイダー名（None=自動選択）
             provider_config: プロバイダー固有の設定
             character_profile_path: キャラクター設定ファイルのパス
+            hedge_options: ヘッジモードの設定（HedgedRequestExecutorへの引数。None=無効）
+            coalesce_variation: 同一メッセージに相乗りした応答を応答パターンで言い換えるか
+            max_concurrent_requests: このキャラクターで同時に処理する応答生成の上限
+            stream_chars_per_second: フォールバック応答をストリーミングする速度（0で遅延なし。None=環境変数 RURI_STREAM_CPS）
         """
         
         # ステップ1: 基本属性の初期化
         self.name = "ルリ"
         self.conversation_history = []
+        self.conversation_id = uuid.uuid4().hex  # プロバイダー側の会話要約の識別子
         self.ai_provider = None
         self.provider_name = "fallback"
+        self.provider_key = None  # レジストリ上の登録名（ルーターの第一候補）
+        self._character_context_json = None
+        self.hedging = None
+        self._coalesce_variation = None
         
         # ステップ2: キャラクター設定の読み込み（AIプロバイダーより先）
+        # 設定ファイルはプロセスで共有のスナップショット。内容が変わったら作り直す
+        self.profile_repository = get_profile_repository()
+        self.character_profile_path = character_profile_path
         self.character_profile = self._load_character_profile(character_profile_path)
+        self.profile_repository.subscribe(self._on_profile_changed)
         
         # ステップ3: フォールバック応答の設定
         self.fallback_responses = [
@@ -50,11 +87,19 @@ class RuriCharacter:
             "私も同じように感じることがあります。",
             "とても興味深いお話ですね。"
         ]
+        self.pacer = PhrasePacer(stream_chars_per_second) if AI_PROVIDERS_AVAILABLE else None
         
         # ステップ4: AIプロバイダーの初期化（最後）
         if AI_PROVIDERS_AVAILABLE:
             self.registry = registry  # グローバルレジストリを使用
+            self.router = router
+            self.single_flight = single_flight
+            self.request_limit = ConcurrencyLimit(max_concurrent_requests, name="character")
+            if coalesce_variation:
+                self._coalesce_variation = simple_pattern_variation(SimpleAIProvider())
             self._initialize_ai_provider(ai_provider, provider_config)
+            if hedge_options is not None:
+                self.enable_hedging(**hedge_options)
         else:
             print("⚠️  AI Providersが利用できません。基本応答モードで動作します。")
     
@@ -76,6 +121,7 @@ class RuriCharacter:
                 self.ai_provider = self.registry.create_provider(provider_name, config)
                 if self.ai_provider:
                     self.provider_name = provider_name
+                    self.provider_key = provider_name
                     print(f"✅ AIプロバイダー '{provider_name}' を初期化しました")
                 else:
                     print(f"❌ プロバイダー '{provider_name}' の初期化に失敗しました")
@@ -98,6 +144,7 @@ class RuriCharacter:
             self.ai_provider = self.registry.get_best_available_provider()
             if self.ai_provider:
                 self.provider_name = self.ai_provider.__class__.__name__
+                self.provider_key = self.registry.find_provider_name(self.ai_provider)
                 print(f"🤖 自動選択: '{self.provider_name}' を使用します")
             else:
                 print("⚠️ 利用可能なAIプロバイダーが見つかりません。フォールバックモードに切り替えます")
@@ -110,6 +157,7 @@ class RuriCharacter:
         """デフォルトプロバイダーへのフォールバック"""
         self.ai_provider = None
         self.provider_name = "fallback"
+        self.provider_key = None
         print("🔄 フォールバック応答モードに切り替えました")
     
     def _apply_character_context(self):
@@ -136,32 +184,53 @@ class RuriCharacter:
                 }
                 
                 context_json = json.dumps(enhanced_context, ensure_ascii=False, indent=2)
+                self._character_context_json = context_json
                 self.ai_provider.set_character_context(context_json)
-                print("✅ 自然言語設定を含む詳細キャラクター設定をAIプロバイダーに適用しました")
-                print(f"📋 設定項目数: {len(enhanced_context)}")
+                logger.debug("✅ 自然言語設定を含む詳細キャラクター設定をAIプロバイダーに適用しました（設定項目数: %d）",
+                             len(enhanced_context))
                 
                 # 自然言語設定が含まれているかデバッグ出力
-                if self.character_profile.get("character_description"):
-                    print("📝 自然言語設定が正常に含まれています")
-                else:
-                    print("⚠️ 自然言語設定が含まれていません")
+                if not self.character_profile.get("character_description"):
+                    logger.warning("⚠️ 自然言語設定が含まれていません")
                     
             except Exception as e:
-                print(f"⚠️ キャラクター設定の適用に失敗: {e}")
+                logger.warning("⚠️ キャラクター設定の適用に失敗: %s", e)
                 # フォールバック: 基本設定のみ適用
                 try:
                     basic_context = json.dumps(self.character_profile, ensure_ascii=False)
                     self.ai_provider.set_character_context(basic_context)
-                    print("🔄 基本設定のみ適用しました")
+                    logger.info("🔄 基本設定のみ適用しました")
                 except Exception as fallback_error:
-                    print(f"❌ 基本設定の適用も失敗: {fallback_error}")
+                    logger.error("❌ 基本設定の適用も失敗: %s", fallback_error)
+    
+    def _on_profile_changed(self, snapshot):
+        """設定ファイルの内容が変わったらプロファイルとプロバイダーのキャラクター設定を作り直す"""
+        self.character_profile = self._load_character_profile(self.character_profile_path)
+        self._apply_character_context()
+        logger.info("🔄 キャラクター設定の更新を反映しました (v%d)", snapshot.version)
+    
+    def _ensure_character_context(self, provider):
+        """フェイルオーバー先のプロバイダーにもキャラクター設定を適用"""
+        # 設定ファイルの変更確認（確認間隔内ならスナップショットを返すだけ）
+        self.profile_repository.get()
+        if self._character_context_json and hasattr(provider, 'set_character_context'):
+            if getattr(provider, 'character_context', None) != self._character_context_json:
+                provider.set_character_context(self._character_context_json)
+    
+    def _build_provider_context(self, context: Dict[str, Any] = None) -> Dict[str, Any]:
+        """プロバイダーへ渡すコンテキスト（フェイルオーバー時も会話履歴を引き継ぐ）"""
+        provider_context = dict(context) if isinstance(context, dict) else {}
+        if 'conversation_history' not in provider_context:
+            history = []
+            for entry in self.conversation_history:
+                history.append({"role": "user", "content": entry["user"]})
+                history.append({"role": "assistant", "content": entry["assistant"]})
+            provider_context['conversation_history'] = history
+        provider_context.setdefault('conversation_id', self.conversation_id)
+        return provider_context
     
     def _load_character_profile(self, profile_path: str = None) -> Dict[str, Any]:
-        """新しい2ファイル構成での設定読み込み"""
-        
-        # 基本設定（JSON）の読み込み
-        config_path = os.path.join("assets", "ruri_config.json")
-        character_path = os.path.join("assets", "ruri_character.md")
+        """キャラクター設定の組み立て（共有スナップショットの2ファイル構成 + カスタム設定）"""
         
         # デフォルト設定
         default_profile = {
@@ -175,29 +244,18 @@ class RuriCharacter:
         }
         
         profile = default_profile.copy()
+        snapshot = self.profile_repository.get()
         
-        # 1. プログラム用設定（JSON）の読み込み
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config_data = json.load(f)
-                    profile["config"] = config_data
-                    profile["emotions"] = config_data.get("emotions", {})
-                    profile["response_patterns"] = config_data.get("response_patterns", {})
-                    print(f"✅ プログラム用設定を読み込み: {config_path}")
-            except Exception as e:
-                print(f"⚠️ プログラム用設定読み込みエラー: {e}")
+        # 1. プログラム用設定（JSON・変更不可）
+        if snapshot.config_loaded:
+            profile["config"] = snapshot.config
+            profile["emotions"] = snapshot.emotions
+            profile["response_patterns"] = snapshot.response_patterns
         
-        # 2. 自然言語設定（Markdown）の読み込み
-        if os.path.exists(character_path):
-            try:
-                with open(character_path, 'r', encoding='utf-8') as f:
-                    character_content = f.read()
-                    profile["character_description"] = character_content
-                    profile["natural_settings"] = character_content
-                    print(f"✅ 自然言語設定を読み込み: {character_path}")
-            except Exception as e:
-                print(f"⚠️ 自然言語設定読み込みエラー: {e}")
+        # 2. 自然言語設定（Markdown）
+        if snapshot.character_loaded:
+            profile["character_description"] = snapshot.character_description
+            profile["natural_settings"] = snapshot.character_description
         
         # カスタムパスが指定された場合の処理
         if profile_path and os.path.exists(profile_path):
@@ -205,7 +263,7 @@ class RuriCharacter:
                 if profile_path.endswith('.json'):
                     with open(profile_path, 'r', encoding='utf-8') as f:
                         custom_config = json.load(f)
-                        profile["config"].update(custom_config)
+                        profile["config"] = {**profile.get("config", {}), **custom_config}
                 elif profile_path.endswith('.md'):
                     with open(profile_path, 'r', encoding='utf-8') as f:
                         custom_content = f.read()
@@ -214,30 +272,150 @@ class RuriCharacter:
             except Exception as e:
                 print(f"⚠️ カスタム設定エラー: {e}")
         
-        print("✅ 新しい2ファイル構成での設定読み込み完了")
         return profile
 
+    def _coalesce_key(self, message: str, provider_context: Dict[str, Any]) -> str:
+        """集約キー（正規化メッセージ + プロバイダー + 色段階 + 会話履歴のダイジェスト）
+        
+        会話履歴が異なるセッション同士は相乗りしない（他のセッションの文脈で作った応答を返さない）。
+        """
+        color_stage = self.ai_provider.current_color_stage.value if self.ai_provider else "fallback"
+        history = json.dumps(provider_context.get('conversation_history', []), ensure_ascii=False, sort_keys=True)
+        history_digest = hashlib.sha256(history.encode('utf-8')).hexdigest()[:16]
+        return self.single_flight.make_key(message, self.provider_key, color_stage, history_digest)
+
+    def generate_raw_response(self, prompt: str, context: Dict[str, Any] = None) -> Optional[str]:
+        """会話履歴を更新せずにプロンプトへの生テキストを生成（コメントのバッチ返答等）"""
+        if not hasattr(self, 'router'):
+            return None
+        response = self.router.generate_response(
+            prompt,
+            self._build_provider_context(context),
+            primary=self.provider_key,
+            prepare=self._ensure_character_context
+        )
+        return response.text if response else None
+
+    def create_comment_batcher(self, **options):
+        """視聴者コメントをまとめて返答するマイクロバッチャーを作成
+
+        バッチで返答したコメントは会話履歴に追加し、解析できなかったコメントは個別に返答する。
+
+        Args:
+            **options: CommentMicroBatcher の引数（max_batch, window_ms 等）
+        """
+        try:
+            from .comment_batcher import CommentMicroBatcher
+        except ImportError:
+            from comment_batcher import CommentMicroBatcher
+
+        def record(result: Dict[str, Any]):
+            if result["source"] == "batch":
+                self._update_conversation_history(result["comment"], result["reply"])
+
+        options.setdefault("fallback", self.generate_response)
+        options.setdefault("emotion_analyzer", self.analyze_emotion_from_text)
+        user_on_reply = options.pop("on_reply", None)
+
+        def on_reply(result: Dict[str, Any]):
+            record(result)
+            if user_on_reply is not None:
+                user_on_reply(result)
+
+        return CommentMicroBatcher(self.generate_raw_response, on_reply=on_reply, **options)
+
+    def enable_hedging(self, **options):
+        """ヘッジモードを有効化（第一候補が遅い場合に次点プロバイダーへ並行リクエスト）
+
+        Args:
+            **options: HedgedRequestExecutor の引数（percentile, default_delay 等）
+        """
+        if not hasattr(self, 'router'):
+            print("⚠️  ルーターが利用できないためヘッジモードは無効です")
+            return
+        self.hedging = HedgedRequestExecutor(self.router, **options)
+        print(f"🪁 ヘッジモードを有効化しました（p{self.hedging.percentile:g}）")
+
+    def disable_hedging(self):
+        """ヘッジモードを無効化"""
+        self.hedging = None
+
     def generate_response(self, message: str, context: Dict[str, Any] = None) -> str:
-        """メッセージに対する応答を生成"""
+        """メッセージに対する応答を生成（同期ファサード）
         
-        if self.ai_provider:
+        イベントループ外（Streamlit等）からの呼び出しは共有ループ上で非同期版を実行し、
+        セッション間で同時実行数の上限・相乗り・接続を共有する。
+        """
+        if hasattr(self, 'router'):
             try:
-                response = self.ai_provider.generate_response(message, context)
-                if response and hasattr(response, 'text'):
-                    self._update_conversation_history(message, response.text)
-                    return response.text
-            except Exception as e:
-                print(f"⚠️  AI応答生成エラー: {e}")
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return run_sync(self.generate_response_async(message, context))
+            # イベントループ内から同期で呼ばれた場合はその場で実行（ループは塞がれる）
+            return self._generate_response_blocking(message, context)
+        
+        # フォールバック応答
+        return self._generate_fallback_response(message)
+    
+    def _generate_response_blocking(self, message: str, context: Dict[str, Any] = None) -> str:
+        """呼び出し元スレッドでの同期応答生成"""
+        try:
+            with self.request_limit:
+                with _tracer.span("prompt.build"):
+                    provider_context = self._build_provider_context(context)
+                # ルーター経由（失敗時は優先度順に他のプロバイダーへフェイルオーバー）
+                # 実行中の同一メッセージには相乗りして上流呼び出しを1回にまとめる
+                response, _ = self.single_flight.do(
+                    self._coalesce_key(message, provider_context),
+                    lambda: self.router.generate_response(
+                        message,
+                        provider_context,
+                        primary=self.provider_key,
+                        prepare=self._ensure_character_context
+                    ),
+                    message,
+                    variation=self._coalesce_variation
+                )
+            if response and hasattr(response, 'text'):
+                self._update_conversation_history(message, response.text)
+                return response.text
+        except Exception as e:
+            print(f"⚠️  AI応答生成エラー: {e}")
         
         # フォールバック応答
         return self._generate_fallback_response(message)
     
     async def generate_response_async(self, message: str, context: Dict[str, Any] = None) -> str:
-        """非同期応答生成"""
+        """非同期応答生成
+        
+        同期のみのプロバイダーはルーターがスレッドプールへ退避するため、ループは塞がれない。
+        キャラクター単位の上限を超えた呼び出しは空きが出るまで待つ。
+        """
         
-        if self.ai_provider and hasattr(self.ai_provider, 'generate_response_async'):
+        if hasattr(self, 'router'):
             try:
-                response = await self.ai_provider.generate_response_async(message, context)
+                async with self.request_limit:
+                    with _tracer.span("prompt.build"):
+                        provider_context = self._build_provider_context(context)
+                    if self.hedging is not None:
+                        upstream = lambda: self.router.generate_response_hedged(
+                            message,
+                            provider_context,
+                            primary=self.provider_key,
+                            prepare=self._ensure_character_context,
+                            hedging=self.hedging
+                        )
+                    else:
+                        upstream = lambda: self.router.generate_response_async(
+                            message,
+                            provider_context,
+                            primary=self.provider_key,
+                            prepare=self._ensure_character_context
+                        )
+                    response, _ = await self.single_flight.do_async(
+                        self._coalesce_key(message, provider_context), upstream, message,
+                        variation=self._coalesce_variation
+                    )
                 if response and hasattr(response, 'text'):
                     self._update_conversation_history(message, response.text)
                     return response.text
@@ -248,26 +426,37 @@ class RuriCharacter:
         return self._generate_fallback_response(message)
     
     async def generate_stream_response(self, message: str, context: Dict[str, Any] = None):
-        """ストリーミング応答生成"""
+        """ストリーミング応答生成（届いたテキストから順に返す）"""
         
-        if self.ai_provider and hasattr(self.ai_provider, 'generate_stream_response'):
+        if hasattr(self, 'router'):
+            full_response = ""
             try:
-                full_response = ""
-                async for chunk in self.ai_provider.generate_stream_response(message, context):
-                    full_response += chunk
-                    yield chunk
-                
-                # 履歴更新
-                if full_response:
-                    self._update_conversation_history(message, full_response)
-                return
+                async with self.request_limit:
+                    provider_context = self._build_provider_context(context)
+                    # ルーター経由（最初のトークン前の失敗は他のプロバイダーへフェイルオーバー）
+                    async for chunk in self.router.generate_stream(
+                        message,
+                        provider_context,
+                        primary=self.provider_key,
+                        prepare=self._ensure_character_context
+                    ):
+                        full_response += chunk
+                        yield chunk
             except Exception as e:
                 print(f"⚠️  ストリーミング応答エラー: {e}")
+            
+            # 履歴更新（途中まで届いた応答もそのまま残す）
+            if full_response:
+                self._update_conversation_history(message, full_response)
+                return
         
-        # フォールバック
+        # フォールバック（文節ごとにプロバイダーのストリーミングと同じ速さで送る）
         response = self._generate_fallback_response(message)
-        for char in response:
-            yield char
+        if self.pacer is None:
+            yield response
+            return
+        async for phrase in self.pacer.pace(response):
+            yield phrase
     
     def _generate_fallback_response(self, message: str) -> str:
         """フォールバック応答生成"""
@@ -318,6 +507,14 @@ class RuriCharacter:
             except Exception:
                 pass
         
+        # ルーターの判断・ブレーカー状態
+        if hasattr(self, 'router'):
+            status["router"] = self.router.get_status_info()
+            status["single_flight"] = self.single_flight.get_stats()
+            status["concurrency"] = self.request_limit.get_status()
+        if self.hedging is not None:
+            status["hedging"] = self.hedging.get_stats()
+        
         return status
     
     def switch_ai_provider(self, provider_name: str, config: Dict[str, Any] = None) -> bool:
@@ -331,6 +528,7 @@ class RuriCharacter:
             if new_provider:
                 self.ai_provider = new_provider
                 self.provider_name = provider_name
+                self.provider_key = provider_name
                 
                 # キャラクター設定を新プロバイダーに反映
                 if hasattr(new_provider, 'set_character_context'):
@@ -352,10 +550,20 @@ class RuriCharacter:
             return self.registry.get_available_providers()
         return ["fallback"]
     
-    def test_all_providers(self) -> Dict[str, bool]:
-        """全プロバイダーの動作テスト"""
+    def _provider_check_options(self, timeout: float = None) -> Dict[str, Any]:
+        """セルフテストの結果をルーターのブレーカー・レイテンシ統計へ反映する設定"""
+        router = getattr(self, 'router', None)
+        config_manager = getattr(router, 'config_manager', None)
+        return {
+            "timeout": timeout,
+            "record_result": router.record_result if router is not None else None,
+            "config_for": config_manager.get_provider_config if config_manager is not None else None,
+        }
+    
+    def test_all_providers(self, timeout: float = None) -> Dict[str, bool]:
+        """全プロバイダーの動作テスト（並行実行・プロバイダーごとの期限つき）"""
         if AI_PROVIDERS_AVAILABLE and self.registry:
-            return self.registry.test_all_providers()
+            return self.registry.test_all_providers(**self._provider_check_options(timeout))
         return {"fallback": True}
     
     # 既存メソッドとの互換性維持
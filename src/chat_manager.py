@@ -6,11 +6,63 @@
 - 履歴管理と永続化
 - ログ記録（将来の拡張用）
 """
-from typing import List, Tuple, Optional, Dict, Any
+from typing import List, Tuple, Optional, Dict, Any, AsyncIterator, Iterator
 import datetime
 import random
+import threading
+import time
+import uuid
 import streamlit as st
 
+try:
+    from .tracing import get_tracer
+    from .metrics import get_metrics
+except ImportError:
+    from tracing import get_tracer
+    from metrics import get_metrics
+
+try:
+    from .ai_providers.concurrency import iterate_sync, run_blocking, run_sync
+except ImportError:
+    from ai_providers.concurrency import iterate_sync, run_blocking, run_sync
+
+_tracer = get_tracer()
+_metrics = get_metrics()
+_messages_total = _metrics.counter("ruri_chat_messages_total", "履歴に追加したチャットメッセージ数")
+_history_size = _metrics.gauge("ruri_chat_history_size", "全セッションのチャット履歴件数の合計", ("session_key",),
+                               multiprocess_mode="sum")
+_active_sessions = _metrics.gauge("ruri_chat_active_sessions", "チャット履歴を持つセッション数（直近の更新から1時間以内）",
+                                  ("session_key",), multiprocess_mode="sum")
+_response_seconds = _metrics.histogram("ruri_chat_response_seconds", "AI応答生成にかかった秒数", ("model",))
+
+# セッションID -> (履歴件数, 最終更新時刻)。更新の途絶えたセッションは合計から外す
+SESSION_IDLE_SECONDS = 3600
+_session_history_sizes: Dict[Tuple[str, str], Tuple[int, float]] = {}
+_session_sizes_lock = threading.Lock()
+
+
+def _record_history_size(session_key: str, size: int):
+    """このセッションの履歴件数を記録して、全セッションの合計をゲージに反映"""
+    session_id = st.session_state.get('_metrics_session_id')
+    if session_id is None:
+        session_id = st.session_state['_metrics_session_id'] = uuid.uuid4().hex
+    now = time.monotonic()
+    with _session_sizes_lock:
+        _session_history_sizes[(session_key, session_id)] = (size, now)
+        touched = {session_key}
+        for key in [key for key, (_, seen) in _session_history_sizes.items() if now - seen > SESSION_IDLE_SECONDS]:
+            touched.add(key[0])
+            del _session_history_sizes[key]
+        totals = {key: [0, 0] for key in touched}
+        for (key, _), (entry_size, _) in _session_history_sizes.items():
+            if key in totals:
+                totals[key][0] += entry_size
+                totals[key][1] += 1
+    # 間引いたセッションの属する session_key も合計を更新する
+    for key, (total, count) in totals.items():
+        _history_size.set(total, session_key=key)
+        _active_sessions.set(count, session_key=key)
+
 
 class ChatMessage:
     """チャットメッセージの構造体"""
@@ -81,6 +133,8 @@ class ChatManager:
         
         st.session_state[self.session_state_key] = history
         self._save_to_persistent()
+        _messages_total.inc()
+        _record_history_size(self.session_state_key, len(history))
         
         return message
     
@@ -88,6 +142,7 @@ class ChatManager:
         """履歴をクリア"""
         st.session_state[self.session_state_key] = []
         self._save_to_persistent()
+        _record_history_size(self.session_state_key, 0)
     
     def _save_to_persistent(self):
         """永続化ストレージに保存"""
@@ -126,29 +181,35 @@ class AIResponseGenerator:
     
     def __init__(self):
         self._ruri_character = None
+        self._init_lock = threading.Lock()
         
     def _get_ruri_character(self):
         """RuriCharacterインスタンスの取得（遅延ロード）"""
-        if self._ruri_character is None:
-            try:
-                # 循環インポートを避けるために直接インポート
-                import sys
-                import os
-                
-                # パス追加（必要に応じて）
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                parent_dir = os.path.dirname(current_dir)
-                if parent_dir not in sys.path:
-                    sys.path.insert(0, parent_dir)
-                
-                from src.character_ai import RuriCharacter
-                self._ruri_character = RuriCharacter()
-            except Exception as e:
-                print(f"⚠️ RuriCharacter取得エラー: {e}")
-                self._ruri_character = self._create_fallback_character()
-        
+        with self._init_lock:
+            if self._ruri_character is None:
+                self._ruri_character = self._load_ruri_character()
         return self._ruri_character
     
+    def _load_ruri_character(self):
+        """RuriCharacterの生成（失敗時はフォールバック）"""
+        try:
+            # 循環インポートを避けるために直接インポート
+            import sys
+            import os
+            
+            # パス追加（必要に応じて）
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            parent_dir = os.path.dirname(current_dir)
+            if parent_dir not in sys.path:
+                sys.path.insert(0, parent_dir)
+            
+            from src.character_ai import RuriCharacter
+            with _tracer.span("character.init"):
+                return RuriCharacter()
+        except Exception as e:
+            print(f"⚠️ RuriCharacter取得エラー: {e}")
+            return self._create_fallback_character()
+    
     def _create_fallback_character(self):
         """フォールバック用のダミーキャラクター"""
         class FallbackCharacter:
@@ -166,28 +227,73 @@ class AIResponseGenerator:
     
     def generate_response(self, message: str, user_level: Any = None, 
                          features: Dict[str, bool] = None, image: Any = None) -> Tuple[str, Optional[float], Optional[str]]:
-        """AI応答を生成（レスポンス時間とモデル情報も返す）"""
-        import time
+        """AI応答を生成（レスポンス時間とモデル情報も返す）
         
+        Streamlit等の同期呼び出し用。共有イベントループ上で非同期版を実行する。
+        """
+        return run_sync(self.generate_response_async(message, user_level, features, image))
+    
+    async def generate_response_async(self, message: str, user_level: Any = None,
+                                      features: Dict[str, bool] = None,
+                                      image: Any = None) -> Tuple[str, Optional[float], Optional[str]]:
+        """AI応答を生成（非同期版。複数セッションの応答生成を並行して進められる）"""
         start_time = time.time()
         
-        try:
-            # AI機能が利用可能かチェック
-            if features and not features.get("ai_conversation", True):
-                response = "AI会話機能が無効になっています。"
-                model_info = "disabled"
-            else:
-                ruri = self._get_ruri_character()
-                response = ruri.generate_response(message, image)
-                model_info = getattr(ruri, 'provider_name', 'unknown')
-                
-        except Exception as e:
-            response = f"⚠️ AI応答エラー: {str(e)}"
-            model_info = "error"
+        with _tracer.span("chat.generate_response") as span:
+            try:
+                # AI機能が利用可能かチェック
+                if features and not features.get("ai_conversation", True):
+                    response = "AI会話機能が無効になっています。"
+                    model_info = "disabled"
+                else:
+                    # 初回のキャラクター生成（プロバイダー接続を含む）もループを塞がない
+                    ruri = await run_blocking(self._get_ruri_character)
+                    if hasattr(ruri, 'generate_response_async'):
+                        response = await ruri.generate_response_async(message, image)
+                    else:
+                        response = await run_blocking(ruri.generate_response, message, image)
+                    model_info = getattr(ruri, 'provider_name', 'unknown')
+                    
+            except Exception as e:
+                response = f"⚠️ AI応答エラー: {str(e)}"
+                model_info = "error"
+            span.set_attribute("model_info", model_info)
         
         response_time = time.time() - start_time
+        _response_seconds.observe(response_time, model=model_info)
         
         return response, response_time, model_info
+    
+    def stream_response(self, message: str, features: Dict[str, bool] = None,
+                        image: Any = None) -> Iterator[str]:
+        """AI応答をテキストの断片ごとに返す（Streamlit等の同期呼び出し用）"""
+        return iterate_sync(self.generate_stream_async(message, features, image))
+    
+    async def generate_stream_async(self, message: str, features: Dict[str, bool] = None,
+                                    image: Any = None) -> AsyncIterator[str]:
+        """AI応答のストリーミング生成（ストリーミング非対応のキャラクターは応答全体を1回で返す）"""
+        start_time = time.time()
+        model_info = "unknown"
+        
+        with _tracer.span("chat.generate_response", streaming=True) as span:
+            try:
+                if features and not features.get("ai_conversation", True):
+                    model_info = "disabled"
+                    yield "AI会話機能が無効になっています。"
+                else:
+                    ruri = await run_blocking(self._get_ruri_character)
+                    model_info = getattr(ruri, 'provider_name', 'unknown')
+                    if hasattr(ruri, 'generate_stream_response'):
+                        async for chunk in ruri.generate_stream_response(message, image):
+                            yield chunk
+                    else:
+                        yield await run_blocking(ruri.generate_response, message, image)
+            except Exception as e:
+                model_info = "error"
+                yield f"⚠️ AI応答エラー: {str(e)}"
+            span.set_attribute("model_info", model_info)
+        
+        _response_seconds.observe(time.time() - start_time, model=model_info)
 
 
 # グローバルインスタンス（シングルトンパターン）
@@ -0,0 +1,364 @@
+"""
+視聴者コメントのマイクロバッチ処理
+
+配信中のコメントを最大 window_ms ミリ秒 / max_batch 件まで集め、
+1回のLLM呼び出しで複数コメントへの返答をまとめて生成する。
+- 返答対象の選別（重複・スパムを除き、質問や長めのコメントを優先）
+- JSON Lines 形式の複数返答を解析し、コメントごとの返答と感情に戻す
+- 計測したプロバイダーのレイテンシに合わせてバッチサイズ・待機時間を調整
+- スループット（秒あたりの返答コメント数）の計測
+"""
+import json
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+try:
+    from .ai_providers.single_flight import normalize_message
+    from .log_config import get_logger
+except ImportError:
+    from ai_providers.single_flight import normalize_message
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+EMOTIONS = ("joy", "anger", "sadness", "love", "surprise", "fear", "disgust", "anticipation")
+
+_JSON_OBJECT = re.compile(r"\{[^{}]*\}")
+_QUESTION_WORDS = ("？", "?", "どう", "なぜ", "何", "どこ", "いつ", "教えて")
+
+
+@dataclass
+class PendingComment:
+    """バッチ待ちのコメント"""
+    comment_id: int
+    text: str
+    author: str = ""
+    emotion: Optional[str] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Future = field(default_factory=Future)
+
+
+class CommentMicroBatcher:
+    """コメントをまとめて1回のLLM呼び出しで返答するバッチャー"""
+
+    def __init__(self,
+                 generate: Callable[[str], Optional[str]],
+                 max_batch: int = 8,
+                 window_ms: float = 300.0,
+                 reply_limit: int = 5,
+                 min_window_ms: float = 50.0,
+                 max_window_ms: float = 1500.0,
+                 max_batch_limit: int = 20,
+                 adaptive: bool = True,
+                 ewma_alpha: float = 0.3,
+                 fallback: Callable[[str], Optional[str]] = None,
+                 on_reply: Callable[[Dict[str, Any]], None] = None,
+                 emotion_analyzer: Callable[[str], Dict[str, float]] = None):
+        """
+        Args:
+            generate: プロンプトを受け取りLLMの生テキストを返す関数
+            max_batch: 1バッチの最大コメント数（adaptive時は初期値）
+            window_ms: 最初のコメントから締め切るまでの待機時間（adaptive時は初期値）
+            reply_limit: 1バッチで返答するコメントの最大数
+            min_window_ms / max_window_ms / max_batch_limit: adaptive時の調整範囲
+            adaptive: レイテンシに応じてバッチサイズ・待機時間を調整するか
+            ewma_alpha: レイテンシ・到着間隔の指数移動平均の係数
+            fallback: 解析できなかったコメントを個別に返答する関数（Noneなら未返答扱い）
+            on_reply: 返答ごとに呼ばれるコールバック（会話履歴・Live2D反映など）
+            emotion_analyzer: 感情が付いていない返答の感情推定 (text) -> {emotion: score}
+        """
+        self.generate = generate
+        self.max_batch = max_batch
+        self.window_ms = window_ms
+        self.reply_limit = reply_limit
+        self.min_window_ms = min_window_ms
+        self.max_window_ms = max_window_ms
+        self.max_batch_limit = max_batch_limit
+        self.adaptive = adaptive
+        self.ewma_alpha = ewma_alpha
+        self.fallback = fallback
+        self.on_reply = on_reply
+        self.emotion_analyzer = emotion_analyzer
+
+        self._queue: "queue.Queue[Optional[PendingComment]]" = queue.Queue()
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._running = False
+
+        self._latency_ewma: Optional[float] = None
+        self._interval_ewma: Optional[float] = None
+        self._last_arrival: Optional[float] = None
+        self._stats_lock = threading.Lock()  # 投入側・ワーカー・fallback の各スレッドから更新される
+        self._stats = {
+            "received": 0,
+            "answered": 0,
+            "skipped": 0,
+            "parse_failures": 0,
+            "llm_calls": 0,
+            "batches": 0,
+            "batched_comments": 0,
+        }
+        self._started_at: Optional[float] = None
+
+    # ------------------------------------------------------------
+    # ライフサイクル
+    # ------------------------------------------------------------
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="comment-batcher", daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: float = 5.0):
+        """ワーカーを停止（キュー内のコメントは処理してから止まる）"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self._worker = None
+
+    # ------------------------------------------------------------
+    # 投入
+    # ------------------------------------------------------------
+    def submit(self, text: str, author: str = "", emotion: str = None) -> Future:
+        """コメントを投入。結果（dict）はFutureで返る
+
+        結果: {"comment_id", "comment", "author", "reply", "emotion", "answered",
+               "source"("batch"/"fallback"/None), "batch_size"}
+        """
+        with self._id_lock:
+            self._next_id += 1
+            comment = PendingComment(self._next_id, text, author, emotion)
+            now = comment.enqueued_at
+            if self._last_arrival is not None:
+                self._interval_ewma = self._ewma(self._interval_ewma, now - self._last_arrival)
+            self._last_arrival = now
+            self._count(received=1)
+            if self._started_at is None:
+                self._started_at = now
+            if not self._running:
+                self.start()
+
+        self._queue.put(comment)
+        return comment.future
+
+    # ------------------------------------------------------------
+    # ワーカー
+    # ------------------------------------------------------------
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            if batch:
+                self.process_batch(batch)
+
+    def _collect(self) -> Optional[List[PendingComment]]:
+        """最初のコメントから window_ms 経過するか max_batch 件で締め切る"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window_ms / 1000.0
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # 停止要求は次のループで処理
+                break
+            batch.append(item)
+        return batch
+
+    def process_batch(self, batch: List[PendingComment]) -> List[Dict[str, Any]]:
+        """1バッチ分の返答を生成して各Futureに結果を設定"""
+        selected, _ = self.select_comments(batch)
+        replies: Dict[int, Tuple[str, Optional[str]]] = {}
+
+        if selected:
+            prompt = self.build_prompt(selected)
+            start = time.perf_counter()
+            try:
+                raw = self.generate(prompt)
+            except Exception as e:
+                logger.warning("⚠️ バッチ応答生成エラー: %s", e)
+                raw = None
+            self._observe_latency(time.perf_counter() - start)
+            self._count(llm_calls=1)
+            replies = self.parse_replies(raw or "", selected)
+
+        selected_ids = {comment.comment_id for comment in selected}
+        results = []
+        for comment in batch:
+            reply, emotion = replies.get(comment.comment_id, (None, None))
+            source = "batch" if reply is not None else None
+            if reply is None and comment.comment_id in selected_ids:
+                self._count(parse_failures=1)
+                if self.fallback is not None:
+                    reply = self._fallback_reply(comment)
+                    source = "fallback" if reply is not None else None
+            if reply is not None and emotion is None:
+                emotion = self._infer_emotion(reply, comment.emotion)
+
+            result = {
+                "comment_id": comment.comment_id,
+                "comment": comment.text,
+                "author": comment.author,
+                "reply": reply,
+                "emotion": emotion,
+                "answered": reply is not None,
+                "source": source,
+                "batch_size": len(batch),
+            }
+            if reply is not None:
+                self._count(answered=1)
+                if self.on_reply is not None:
+                    try:
+                        self.on_reply(result)
+                    except Exception as e:
+                        logger.warning("⚠️ 返答コールバックエラー: %s", e)
+            else:
+                self._count(skipped=1)
+            comment.future.set_result(result)
+            results.append(result)
+
+        self._count(batches=1, batched_comments=len(batch))
+        return results
+
+    def _count(self, **increments: int):
+        with self._stats_lock:
+            for name, amount in increments.items():
+                self._stats[name] += amount
+
+    def _fallback_reply(self, comment: PendingComment) -> Optional[str]:
+        self._count(llm_calls=1)
+        try:
+            return self.fallback(comment.text)
+        except Exception as e:
+            logger.warning("⚠️ 個別応答エラー: %s", e)
+            return None
+
+    def _infer_emotion(self, reply: str, hint: Optional[str]) -> Optional[str]:
+        if self.emotion_analyzer is not None:
+            scores = self.emotion_analyzer(reply)
+            if scores:
+                emotion, score = max(scores.items(), key=lambda item: item[1])
+                if score > 0 and emotion in EMOTIONS:
+                    return emotion
+        return hint
+
+    # ------------------------------------------------------------
+    # 選別・プロンプト・解析
+    # ------------------------------------------------------------
+    def select_comments(self, batch: List[PendingComment]) -> Tuple[List[PendingComment], List[PendingComment]]:
+        """返答するコメントを選ぶ（同一内容は1件に、質問・長めのコメントを優先）"""
+        seen = set()
+        unique, skipped = [], []
+        for comment in batch:
+            key = normalize_message(comment.text)
+            if not key or key in seen:
+                skipped.append(comment)
+                continue
+            seen.add(key)
+            unique.append(comment)
+
+        def score(comment: PendingComment) -> Tuple[int, int]:
+            is_question = any(word in comment.text for word in _QUESTION_WORDS)
+            return (1 if is_question else 0, min(len(comment.text), 60))
+
+        ranked = sorted(unique, key=score, reverse=True)
+        selected = ranked[:self.reply_limit]
+        # 元の到着順で並べ直す
+        selected.sort(key=lambda comment: comment.comment_id)
+        skipped.extend(ranked[self.reply_limit:])
+        return selected, skipped
+
+    def build_prompt(self, comments: List[PendingComment]) -> str:
+        """複数コメントへの返答を JSON Lines で求めるプロンプト"""
+        lines = [
+            "配信中の視聴者コメントにまとめて返答してください。",
+            "各コメントに1〜2文の短い返答をし、1行に1件ずつ次のJSON形式で出力してください。",
+            '{"id": コメント番号, "reply": "返答", "emotion": "' + "|".join(EMOTIONS) + '"}',
+            "JSON以外の文章は出力しないでください。",
+            "",
+            "コメント:",
+        ]
+        for comment in comments:
+            author = f"{comment.author}: " if comment.author else ""
+            lines.append(f"[{comment.comment_id}] {author}{comment.text}")
+        return "\n".join(lines)
+
+    def parse_replies(self, raw: str, comments: List[PendingComment]) -> Dict[int, Tuple[str, Optional[str]]]:
+        """LLMの出力をコメントごとの (返答, 感情) に分解
+
+        JSON Lines / JSON配列 / コードブロック内JSON のいずれにも対応し、
+        想定外のIDや空の返答は無視する。
+        """
+        valid_ids = {comment.comment_id for comment in comments}
+        replies: Dict[int, Tuple[str, Optional[str]]] = {}
+
+        for match in _JSON_OBJECT.finditer(raw):
+            try:
+                item = json.loads(match.group(0))
+                comment_id = int(item.get("id"))
+            except (ValueError, TypeError, AttributeError):
+                continue
+            reply = str(item.get("reply") or "").strip()
+            if comment_id not in valid_ids or not reply or comment_id in replies:
+                continue
+            emotion = str(item.get("emotion") or "").strip().lower()
+            replies[comment_id] = (reply, emotion if emotion in EMOTIONS else None)
+        return replies
+
+    # ------------------------------------------------------------
+    # 適応制御
+    # ------------------------------------------------------------
+    def _ewma(self, current: Optional[float], sample: float) -> float:
+        if current is None:
+            return sample
+        return self.ewma_alpha * sample + (1 - self.ewma_alpha) * current
+
+    def _observe_latency(self, seconds: float):
+        self._latency_ewma = self._ewma(self._latency_ewma, seconds)
+        if self.adaptive:
+            self._adapt()
+
+    def _adapt(self):
+        """レイテンシ中に届く見込みのコメント数をバッチサイズにし、待機時間はレイテンシの1/4に"""
+        latency = self._latency_ewma
+        if latency is None:
+            return
+        self.window_ms = min(self.max_window_ms, max(self.min_window_ms, latency * 250.0))
+        if self._interval_ewma:
+            expected = int(round(latency / max(self._interval_ewma, 1e-3)))
+            self.max_batch = min(self.max_batch_limit, max(1, expected))
+
+    # ------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------
+    def get_stats(self) -> Dict[str, Any]:
+        """スループット（返答コメント/秒）・平均バッチサイズ・現在の調整値"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["throughput_per_second"] = round(stats["answered"] / elapsed, 2) if elapsed > 0 else 0.0
+        stats["avg_batch_size"] = round(stats["batched_comments"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["comments_per_llm_call"] = round(stats["answered"] / stats["llm_calls"], 2) if stats["llm_calls"] else 0.0
+        stats["latency_ewma_ms"] = None if self._latency_ewma is None else round(self._latency_ewma * 1000, 1)
+        stats["window_ms"] = round(self.window_ms, 1)
+        stats["max_batch"] = self.max_batch
+        return stats
@@ -0,0 +1,222 @@
+"""
+感情ベクトルから色を決める（吹き出しCSS・Live2D・OBSフィルター共通）
+
+8種の感情の強度（EmotionVector）と成長度合い（0〜1）から、UIの吹き出し色・アクセント色、
+Live2Dの髪色パラメータ、OBSカラーフィルターの設定をまとめて計算する。
+どの出力も同じ混色から作るので、画面・Live2D・OBSの色が食い違わない。
+
+- 混色は強度で重み付けした行列積（色相は円周上で平均する）
+- 色の濃さ = 最も強い感情の強度 × 成長度合い（0ならモノクロ）
+- 入力は QUANTIZATION 段階に丸めてから計算し、結果をキャッシュする
+  （毎フレームの色更新はほぼ辞書引きだけになる）
+
+感情ごとの基準色は設定ファイル（ruri_config.json の emotions.*.color）を使い、
+設定の内容が変わったときだけエンジンを作り直す。
+
+    colors = get_color_engine().compute(vector, growth_level)
+    colors.bubble                 # "#FFF8DC"
+    colors.live2d_rgb             # (1.0, 0.8431, 0.0)
+    colors.obs_filter_settings()  # {"hue_shift": 60.0, "saturation": 1.5, "brightness": 1.2}
+"""
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    from .emotion_vector import EMOTION_ORDER, EmotionVector
+    from .metrics import get_metrics
+    from .profile_repository import get_profile_repository
+except ImportError:
+    from emotion_vector import EMOTION_ORDER, EmotionVector
+    from metrics import get_metrics
+    from profile_repository import get_profile_repository
+
+_cache_total = get_metrics().counter(
+    "ruri_emotion_color_cache_total", "感情色の計算キャッシュの参照回数", ("result",))
+
+# 入力（強度・成長度合い）の丸め段階（0.05刻み）
+QUANTIZATION = 20
+DEFAULT_CACHE_SIZE = 4096
+
+# 感情ごとの基準色（設定ファイルに色がない感情に使う）
+DEFAULT_EMOTION_COLORS: Dict[str, str] = {
+    "joy": "#FFD700",
+    "anger": "#FF6B6B",
+    "sadness": "#87CEEB",
+    "love": "#FF69B4",
+    "surprise": "#FFA500",
+    "fear": "#696969",
+    "disgust": "#90EE90",
+    "anticipation": "#9370DB",
+}
+
+# 吹き出しの淡い色
+BUBBLE_TINTS: Dict[str, str] = {
+    "joy": "#FFF8DC",           # 薄い黄色
+    "anger": "#FFE4E1",         # 薄い赤
+    "sadness": "#E6F3FF",       # 薄い青
+    "love": "#FFB6C1",          # 薄いピンク
+    "surprise": "#F0E68C",      # カーキ
+    "fear": "#E6E6FA",          # ラベンダー
+    "disgust": "#F5F5DC",       # ベージュ
+    "anticipation": "#F0FFF0",  # 薄い緑
+}
+
+# OBSカラーフィルター（色相シフト・彩度・明度）
+OBS_FILTER_PRESETS: Dict[str, Tuple[float, float, float]] = {
+    "joy": (60, 1.5, 1.2),
+    "anger": (0, 2.0, 1.0),
+    "sadness": (240, 0.8, 0.8),
+    "love": (300, 1.3, 1.1),
+    "surprise": (30, 1.4, 1.15),
+    "fear": (270, 0.7, 0.85),
+    "disgust": (120, 0.9, 0.9),
+    "anticipation": (280, 1.2, 1.05),
+}
+
+# 感情がない（モノクロ）ときの色
+NEUTRAL_RGB = (128, 128, 128)
+MONOCHROME_BUBBLE = "#F5F5F5"
+NEUTRAL_FILTER = (0.0, 1.0, 1.0)
+
+
+def hex_to_rgb(color: str) -> Tuple[int, int, int]:
+    color = color.lstrip("#")
+    return int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+
+
+def rgb_to_hex(rgb) -> str:
+    r, g, b = (int(round(min(max(c, 0.0), 255.0))) for c in rgb)
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+
+@dataclass(frozen=True)
+class EmotionColors:
+    """ある感情状態に対応する色（UI・Live2D・OBS）"""
+    bubble: str                                # 吹き出しの背景色（CSS）
+    accent: str                                # アクセント色（CSS・Live2Dと同じ色）
+    live2d_rgb: Tuple[float, float, float]     # Live2Dの色パラメータ（0〜1）
+    live2d_alpha: float
+    hue_shift: float                           # OBSフィルター（度）
+    saturation: float
+    brightness: float
+    strength: float                            # 色の濃さ（0ならモノクロ）
+    dominant: Optional[str] = None             # 最も強い感情名（感情がなければ None）
+
+    def obs_filter_settings(self) -> Dict[str, float]:
+        return {"hue_shift": self.hue_shift, "saturation": self.saturation, "brightness": self.brightness}
+
+    def css_variables(self) -> Dict[str, str]:
+        return {"--ruri-bubble": self.bubble, "--ruri-accent": self.accent}
+
+
+EmotionInput = Union[EmotionVector, Mapping[Any, float], str, None]
+
+
+def _as_values(emotions: EmotionInput) -> np.ndarray:
+    if isinstance(emotions, EmotionVector):
+        return emotions.values
+    if emotions is None:
+        return EmotionVector().values
+    if isinstance(emotions, str):
+        return EmotionVector.from_names([emotions]).values
+    return EmotionVector.from_dict(emotions).values
+
+
+class EmotionColorEngine:
+    """感情ベクトル + 成長度合い -> EmotionColors（丸めた入力ごとにキャッシュ）"""
+
+    def __init__(self, emotion_colors: Mapping[str, str] = None,
+                 quantization: int = QUANTIZATION, cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            emotion_colors: 感情名 -> 基準色（"#RRGGBB"。ない感情は DEFAULT_EMOTION_COLORS）
+            quantization: 強度・成長度合いの丸め段階
+            cache_size: キャッシュする入力の数（超えたら全体を捨てる）
+        """
+        colors = {**DEFAULT_EMOTION_COLORS, **(emotion_colors or {})}
+        self.accent_rgb = np.array([hex_to_rgb(colors[name]) for name in EMOTION_ORDER], dtype=np.float64)
+        self.bubble_rgb = np.array([hex_to_rgb(BUBBLE_TINTS[name]) for name in EMOTION_ORDER], dtype=np.float64)
+        filters = np.array([OBS_FILTER_PRESETS[name] for name in EMOTION_ORDER], dtype=np.float64)
+        hues = np.radians(filters[:, 0])
+        self.filter_hue_vectors = np.stack([np.cos(hues), np.sin(hues)], axis=1)  # 色相は単位ベクトルで平均
+        self.filter_levels = filters[:, 1:]
+        self.neutral_rgb = np.array(NEUTRAL_RGB, dtype=np.float64)
+        self.monochrome_bubble = np.array(hex_to_rgb(MONOCHROME_BUBBLE), dtype=np.float64)
+        self.neutral_levels = np.array(NEUTRAL_FILTER[1:], dtype=np.float64)
+
+        self.quantization = quantization
+        self.cache_size = cache_size
+        self._cache: Dict[Tuple[bytes, int], EmotionColors] = {}
+        self._lock = threading.Lock()
+
+    def compute(self, emotions: EmotionInput, growth_level: float = 1.0) -> EmotionColors:
+        """感情（EmotionVector・{感情: 強度}・感情名）と成長度合いから色を求める"""
+        steps = np.rint(np.clip(_as_values(emotions), 0.0, 1.0) * self.quantization).astype(np.uint8)
+        key = (steps.tobytes(), int(round(min(max(growth_level, 0.0), 1.0) * self.quantization)))
+        colors = self._cache.get(key)
+        if colors is not None:
+            _cache_total.inc(result="hit")
+            return colors
+
+        _cache_total.inc(result="miss")
+        colors = self._blend(steps / self.quantization, key[1] / self.quantization)
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = colors
+        return colors
+
+    def emotion_color(self, emotion: Any) -> str:
+        """感情1つの基準色（CSS）"""
+        return rgb_to_hex(self.accent_rgb[EMOTION_ORDER.index(getattr(emotion, "value", emotion))])
+
+    def cache_info(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "max_size": self.cache_size}
+
+    def _blend(self, weights: np.ndarray, growth_level: float) -> EmotionColors:
+        total = weights.sum()
+        peak = weights.max()
+        strength = float(peak * growth_level)
+        if total <= 0.0 or strength <= 0.0:
+            neutral = tuple(np.round(self.neutral_rgb / 255.0, 4).tolist())
+            return EmotionColors(
+                bubble=MONOCHROME_BUBBLE, accent=rgb_to_hex(self.neutral_rgb),
+                live2d_rgb=neutral, live2d_alpha=0.5,
+                hue_shift=NEUTRAL_FILTER[0], saturation=NEUTRAL_FILTER[1], brightness=NEUTRAL_FILTER[2],
+                strength=0.0, dominant=None,
+            )
+
+        mix = weights / total
+        # 基準色を強度で混ぜ、色の濃さに応じてモノクロから近づける
+        accent = self.neutral_rgb + (mix @ self.accent_rgb - self.neutral_rgb) * strength
+        bubble = self.monochrome_bubble + (mix @ self.bubble_rgb - self.monochrome_bubble) * strength
+        levels = self.neutral_levels + (mix @ self.filter_levels - self.neutral_levels) * strength
+        # 色相は円周上の平均を -180〜180 度で表し、濃さに応じて 0 度（補正なし）から回す
+        # （正反対の色相が打ち消し合うときは補正しない）
+        cos_sum, sin_sum = mix @ self.filter_hue_vectors
+        hue = 0.0
+        if np.hypot(cos_sum, sin_sum) > 1e-6:
+            hue = float(np.degrees(np.arctan2(sin_sum, cos_sum))) * strength % 360.0
+
+        return EmotionColors(
+            bubble=rgb_to_hex(bubble),
+            accent=rgb_to_hex(accent),
+            live2d_rgb=tuple(np.round(accent / 255.0, 4).tolist()),
+            live2d_alpha=round(0.5 + 0.5 * strength, 4),
+            hue_shift=round(hue, 1),
+            saturation=round(float(levels[0]), 3),
+            brightness=round(float(levels[1]), 3),
+            strength=round(strength, 4),
+            dominant=EMOTION_ORDER[int(weights.argmax())],
+        )
+
+
+def get_color_engine() -> EmotionColorEngine:
+    """設定ファイルの感情色を使うエンジン（設定の内容が変わったときだけ作り直す）"""
+    return get_profile_repository().derived(
+        "emotion_color.engine",
+        lambda snapshot: EmotionColorEngine(snapshot.emotion_colors)
+    )
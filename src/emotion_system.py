@@ -6,8 +6,40 @@ from enum import Enum
 from typing import Dict, List, Tuple, Any
 import json
 import os
+import threading
 from datetime import datetime
 
+# 感情学習イベントの時系列ストア（NumPy必須・オプション）
+try:
+    from .emotion_timeseries import get_timeseries_store
+    TIMESERIES_AVAILABLE = True
+except ImportError:
+    try:
+        from emotion_timeseries import get_timeseries_store
+        TIMESERIES_AVAILABLE = True
+    except ImportError:
+        TIMESERIES_AVAILABLE = False
+
+try:
+    from .tracing import get_tracer
+    from .metrics import get_metrics
+    from .log_config import get_logger
+    from .emotion_vector import EmotionVector, KeywordScorer
+    from .emotion_color import EmotionColors, get_color_engine
+except ImportError:
+    from tracing import get_tracer
+    from metrics import get_metrics
+    from log_config import get_logger
+    from emotion_vector import EmotionVector, KeywordScorer
+    from emotion_color import EmotionColors, get_color_engine
+
+_tracer = get_tracer()
+logger = get_logger(__name__)
+_learn_total = get_metrics().counter("ruri_emotion_learn_total", "感情学習の実行回数", ("emotion",))
+_writes_total = get_metrics().counter("ruri_emotion_writes_total", "感情データの書き込み回数", ("result",))
+_write_seconds = get_metrics().histogram("ruri_emotion_write_seconds", "感情データの書き込み秒数",
+                                         buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
 class EmotionType(Enum):
     """基本感情8種（プルチックの感情の輪を参考）"""
     JOY = "joy"           # 喜び
@@ -19,6 +51,21 @@ class EmotionType(Enum):
     DISGUST = "disgust"   # 嫌悪
     ANTICIPATION = "anticipation"  # 期待
 
+_EMOTIONS = tuple(EmotionType)  # EmotionVector の添字 -> EmotionType
+
+# 感情検出のキーワード
+EMOTION_KEYWORDS = {
+    EmotionType.JOY: ["嬉しい", "楽しい", "幸せ", "わぁ", "すごい", "素晴らしい", "やった"],
+    EmotionType.ANGER: ["怒り", "腹立つ", "むっ", "許せない", "イライラ", "むぅ"],
+    EmotionType.SADNESS: ["悲しい", "寂しい", "つらい", "残念", "切ない", "悲しみ"],
+    EmotionType.LOVE: ["愛", "好き", "大切", "ありがとう", "愛情", "愛している"],
+    EmotionType.SURPRISE: ["驚き", "えっ", "びっくり", "まさか", "信じられない"],
+    EmotionType.FEAR: ["怖い", "不安", "心配", "恐れ", "恐怖", "ドキドキ"],
+    EmotionType.DISGUST: ["嫌い", "気持ち悪い", "不快", "嫌悪", "うげっ"],
+    EmotionType.ANTICIPATION: ["期待", "楽しみ", "待ち遠しい", "わくわく", "希望"]
+}
+_KEYWORD_SCORER = KeywordScorer(EMOTION_KEYWORDS, weight=0.2)
+
 class ColorStage(Enum):
     """色彩段階（原作戯曲に基づく）"""
     MONOCHROME = "monochrome"         # モノクロ段階
@@ -31,11 +78,17 @@ class EmotionSystem:
     
     def __init__(self, save_path: str = "emotion_data.json"):
         self.save_path = save_path
-        self.learned_emotions: Dict[EmotionType, float] = {}
+        self.emotion_levels = EmotionVector()  # 感情ごとの学習レベル（EmotionType の定義順）
         self.color_stage = ColorStage.MONOCHROME
         self.total_interactions = 0
         self.emotion_history = []
         
+        # 配信全体の学習イベント（emotion_historyは最新100件のみ保存されるため別管理）
+        self.timeseries = None
+        if TIMESERIES_AVAILABLE:
+            timeseries_path = os.path.splitext(save_path)[0] + "_timeseries.npz"
+            self.timeseries = get_timeseries_store(timeseries_path)
+        
         # 色彩段階の閾値設定
         self.stage_thresholds = {
             ColorStage.PARTIAL_COLOR: 2,      # 2つの感情を学習
@@ -45,63 +98,81 @@ class EmotionSystem:
         
         self.load_emotion_data()
     
+    @property
+    def learned_emotions(self) -> Dict[EmotionType, float]:
+        """学習済みの感情と学習レベル（emotion_levels の辞書形式のコピー）"""
+        return self.emotion_levels.to_dict(EmotionType, nonzero=True)
+
+    @learned_emotions.setter
+    def learned_emotions(self, levels: Dict[EmotionType, float]):
+        self.emotion_levels = EmotionVector.from_dict(levels)
+
+    def detect_emotion_vector(self, text: str) -> EmotionVector:
+        """テキストから感情を検出（キーワード1件につき0.2、最大1.0）"""
+        return _KEYWORD_SCORER.score(text)
+
+    @_tracer.traced("emotion.detect")
     def detect_emotion_from_text(self, text: str) -> Dict[EmotionType, float]:
         """テキストから感情を検出（簡易版）"""
-        emotion_scores = {}
-        
-        # 感情キーワード辞書
-        emotion_keywords = {
-            EmotionType.JOY: ["嬉しい", "楽しい", "幸せ", "わぁ", "すごい", "素晴らしい", "やった"],
-            EmotionType.ANGER: ["怒り", "腹立つ", "むっ", "許せない", "イライラ", "むぅ"],
-            EmotionType.SADNESS: ["悲しい", "寂しい", "つらい", "残念", "切ない", "悲しみ"],
-            EmotionType.LOVE: ["愛", "好き", "大切", "ありがとう", "愛情", "愛している"],
-            EmotionType.SURPRISE: ["驚き", "えっ", "びっくり", "まさか", "信じられない"],
-            EmotionType.FEAR: ["怖い", "不安", "心配", "恐れ", "恐怖", "ドキドキ"],
-            EmotionType.DISGUST: ["嫌い", "気持ち悪い", "不快", "嫌悪", "うげっ"],
-            EmotionType.ANTICIPATION: ["期待", "楽しみ", "待ち遠しい", "わくわく", "希望"]
-        }
-        
-        for emotion, keywords in emotion_keywords.items():
-            score = 0.0
-            for keyword in keywords:
-                if keyword in text:
-                    score += 0.2
-            emotion_scores[emotion] = min(score, 1.0)
-        
-        return emotion_scores
+        return self.detect_emotion_vector(text).to_dict(EmotionType)
     
+    @_tracer.traced("emotion.learn")
     def learn_emotion(self, emotion: EmotionType, intensity: float = 0.1):
         """感情学習の実行"""
-        if emotion not in self.learned_emotions:
-            self.learned_emotions[emotion] = 0.0
+        self._record_learning(emotion, intensity)
+        
+        # 色彩段階の更新
+        self._update_color_stage()
+        
+        # データ保存
+        with _tracer.span("emotion.persist"):
+            self.save_emotion_data()
+        
+        return self.emotion_levels[emotion]
+    
+    @_tracer.traced("emotion.learn")
+    def learn_emotions(self, emotions: EmotionVector, scale: float = 1.0, threshold: float = 0.1) -> int:
+        """検出結果のうち threshold を超える感情をまとめて学習（保存は1回だけ）
+
+        Returns:
+            学習した感情の数
+        """
+        learned = 0
+        for index in (emotions.values > threshold).nonzero()[0]:
+            self._record_learning(_EMOTIONS[index], float(emotions.values[index]) * scale)
+            learned += 1
+        if learned:
+            self._update_color_stage()
+            with _tracer.span("emotion.persist"):
+                self.save_emotion_data()
+        return learned
+    
+    def _record_learning(self, emotion: EmotionType, intensity: float):
+        """学習レベルの加算と履歴への記録"""
+        _learn_total.inc(emotion=emotion.value)
         
         # 学習強度を加算（最大1.0）
-        self.learned_emotions[emotion] = min(
-            self.learned_emotions[emotion] + intensity, 1.0
-        )
+        level = min(self.emotion_levels[emotion] + intensity, 1.0)
+        self.emotion_levels[emotion] = level
         
         # 学習履歴に記録
+        now = datetime.now()
         self.emotion_history.append({
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "emotion": emotion.value,
             "intensity": intensity,
-            "learned_level": self.learned_emotions[emotion]
+            "learned_level": level
         })
         
-        # 色彩段階の更新
-        self._update_color_stage()
+        if self.timeseries is not None:
+            self.timeseries.append(emotion.value, intensity, now.timestamp())
         
         # 総インタラクション数の増加
         self.total_interactions += 1
-        
-        # データ保存
-        self.save_emotion_data()
-        
-        return self.learned_emotions[emotion]
     
     def _update_color_stage(self):
         """色彩段階の自動更新"""
-        learned_count = len([e for e, level in self.learned_emotions.items() if level > 0.1])
+        learned_count = self.emotion_levels.count_above(0.1)
         
         if learned_count >= self.stage_thresholds[ColorStage.FULL_COLOR]:
             self.color_stage = ColorStage.FULL_COLOR
@@ -113,86 +184,77 @@ class EmotionSystem:
             self.color_stage = ColorStage.MONOCHROME
     
     def get_current_color_palette(self) -> Dict[str, str]:
-        """現在の色彩段階に応じたカラーパレットを取得"""
+        """現在の色彩段階に応じたカラーパレットを取得
+        
+        吹き出し・枠の色は Live2D・OBS と同じ色彩エンジンで、学習済みの感情と成長度合いから決める。
+        """
         base_colors = {
             "primary": "#1E3A8A",    # 藍色（基本）
             "accent": "#FFD700",     # 金色（アクセント）
             "text": "#000000",       # 黒
             "background": "#FFFFFF"  # 白
         }
+        colors = self.get_emotion_colors()
+        palette = {**base_colors, "bubble": colors.bubble, "border": colors.accent}
         
         if self.color_stage == ColorStage.MONOCHROME:
+            return palette
+        # 感情ごとの色も同じ色彩エンジンの基準色
+        engine = get_color_engine()
+        if self.color_stage == ColorStage.PARTIAL_COLOR:
             return {
-                **base_colors,
-                "bubble": "#F5F5F5",  # 薄いグレー
-                "border": "#808080"
-            }
-        elif self.color_stage == ColorStage.PARTIAL_COLOR:
-            return {
-                **base_colors,
-                "bubble": "#FFF8DC",  # 薄い黄色
-                "border": "#FFD700",
-                "emotion": "#FF69B4"  # ピンク（喜び用）
+                **palette,
+                "emotion": engine.emotion_color(EmotionType.LOVE)  # ピンク
             }
         elif self.color_stage == ColorStage.RAINBOW_TRANSITION:
             return {
-                **base_colors,
-                "bubble": "#E6F3FF",  # 薄い青
-                "border": "#4169E1",
-                "emotion_joy": "#FFFF00",    # 黄
-                "emotion_anger": "#FF0000",  # 赤
-                "emotion_sadness": "#0000FF" # 青
+                **palette,
+                **{f"emotion_{emotion.value}": engine.emotion_color(emotion) for emotion in EmotionType}
             }
         else:  # FULL_COLOR
             return {
-                **base_colors,
-                "bubble": "#FFFFFF",
+                **palette,
                 "border": "linear-gradient(45deg, #FF0000, #FF7F00, #FFFF00, #00FF00, #0000FF, #4B0082, #9400D3)",
                 "rainbow_effect": True
             }
     
-    def get_bubble_color_for_emotion(self, current_emotion: EmotionType = None) -> str:
-        """現在の感情に応じた吹き出し色を取得"""
-        palette = self.get_current_color_palette()
-        
-        if self.color_stage == ColorStage.MONOCHROME:
-            return palette["bubble"]
-        
-        # 感情に応じた色変化
-        emotion_colors = {
-            EmotionType.JOY: "#FFF8DC",      # 薄い黄色
-            EmotionType.ANGER: "#FFE4E1",    # 薄い赤
-            EmotionType.SADNESS: "#E6F3FF",  # 薄い青
-            EmotionType.LOVE: "#FFB6C1",     # 薄いピンク
-            EmotionType.SURPRISE: "#F0E68C", # カーキ
-            EmotionType.FEAR: "#E6E6FA",     # ラベンダー
-            EmotionType.DISGUST: "#F5F5DC",  # ベージュ
-            EmotionType.ANTICIPATION: "#F0FFF0"  # 薄い緑
-        }
+    def get_emotion_colors(self, emotions: EmotionVector = None) -> EmotionColors:
+        """感情（省略時は学習済みの感情全体）と成長度合いに応じた色（吹き出し・Live2D・OBS共通）
         
-        if current_emotion and current_emotion in emotion_colors:
-            # 成長度合いに応じて色の濃さを調整
-            growth_level = self.get_growth_level()
-            if growth_level > 0.5:
-                return emotion_colors[current_emotion]
+        モノクロ段階では感情によらずモノクロ。
+        """
+        if emotions is None:
+            emotions = self.emotion_levels
+        growth_level = 0.0 if self.color_stage == ColorStage.MONOCHROME else self.get_growth_level()
+        return get_color_engine().compute(emotions, growth_level)
+    
+    def get_reply_colors(self, text: str, fallback_emotion: Any = None) -> EmotionColors:
+        """返答テキストの感情ベクトルから色を決める（画面の吹き出し・Live2D・OBSはこの結果を共有する）
         
-        return palette.get("bubble", "#FFFFFF")
+        Args:
+            text: ルリの返答
+            fallback_emotion: テキストから感情が検出できなかったときに使う感情（感情名・EmotionType）
+        """
+        emotions = self.detect_emotion_vector(text or "")
+        if emotions.total() == 0.0 and fallback_emotion:
+            emotions = EmotionVector.from_names([fallback_emotion])
+        return self.get_emotion_colors(emotions)
+    
+    def get_bubble_color_for_emotion(self, current_emotion: EmotionType = None) -> str:
+        """現在の感情に応じた吹き出し色を取得（成長度合いに応じて色の濃さを調整）"""
+        emotions = EmotionVector.from_names([current_emotion]) if current_emotion else None
+        return self.get_emotion_colors(emotions).bubble
     
     def get_growth_level(self) -> float:
         """成長度合いを0-1で返す"""
-        if not self.learned_emotions:
-            return 0.0
-        
         # 学習した感情の平均レベル
-        total_level = sum(self.learned_emotions.values())
         max_possible = len(EmotionType) * 1.0
-        
-        return min(total_level / max_possible, 1.0)
+        return min(self.emotion_levels.total() / max_possible, 1.0)
     
     def save_emotion_data(self):
         """感情データの保存"""
         data = {
-            "learned_emotions": {e.value: level for e, level in self.learned_emotions.items()},
+            "learned_emotions": self.emotion_levels.to_dict(nonzero=True),
             "color_stage": self.color_stage.value,
             "total_interactions": self.total_interactions,
             "emotion_history": self.emotion_history[-100:],  # 最新100件のみ
@@ -200,10 +262,13 @@ class EmotionSystem:
         }
         
         try:
-            with open(self.save_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with _write_seconds.time():
+                with open(self.save_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+            _writes_total.inc(result="ok")
         except Exception as e:
-            print(f"感情データ保存エラー: {e}")
+            _writes_total.inc(result="error")
+            logger.error("感情データ保存エラー: %s", e)
     
     def load_emotion_data(self):
         """感情データの読み込み"""
@@ -215,20 +280,18 @@ class EmotionSystem:
                 data = json.load(f)
             
             # 感情データの復元
-            self.learned_emotions = {
-                EmotionType(k): v for k, v in data.get("learned_emotions", {}).items()
-            }
+            self.emotion_levels = EmotionVector.from_dict(data.get("learned_emotions", {}))
             
             self.color_stage = ColorStage(data.get("color_stage", ColorStage.MONOCHROME.value))
             self.total_interactions = data.get("total_interactions", 0)
             self.emotion_history = data.get("emotion_history", [])
             
-            print(f"✅ 感情データを読み込みました: {self.save_path}")
+            logger.debug("✅ 感情データを読み込みました: %s", self.save_path)
             
         except Exception as e:
-            print(f"感情データ読み込みエラー: {e}")
+            logger.warning("感情データ読み込みエラー: %s", e)
             # デフォルト状態にリセット
-            self.learned_emotions = {}
+            self.emotion_levels = EmotionVector()
             self.color_stage = ColorStage.MONOCHROME
     
     def get_status_summary(self) -> Dict[str, Any]:
@@ -236,7 +299,20 @@ class EmotionSystem:
         return {
             "color_stage": self.color_stage.value,
             "growth_level": self.get_growth_level(),
-            "learned_emotions": {e.value: level for e, level in self.learned_emotions.items()},
+            "learned_emotions": self.emotion_levels.to_dict(nonzero=True),
             "total_interactions": self.total_interactions,
-            "learned_emotion_count": len([e for e, level in self.learned_emotions.items() if level > 0.1])
-        }
\ No newline at end of file
+            "learned_emotion_count": self.emotion_levels.count_above(0.1)
+        }
+
+_systems: Dict[str, EmotionSystem] = {}
+_systems_lock = threading.Lock()
+
+
+def get_emotion_system(save_path: str = "emotion_data.json") -> EmotionSystem:
+    """保存先パスごとに共有する EmotionSystem（チャット画面と配信連携で同じ学習状態・成長度合いを使う）"""
+    key = os.path.abspath(save_path)
+    with _systems_lock:
+        system = _systems.get(key)
+        if system is None:
+            system = _systems[key] = EmotionSystem(save_path)
+        return system
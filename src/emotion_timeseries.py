@@ -0,0 +1,449 @@
+"""
+感情学習イベントの時系列ストア
+配信全体の感情学習履歴を列指向（NumPy配列）で保持し、分析ページのグラフ描画に使う
+
+- 感情ごとにタイムスタンプ・強度の配列を保持（追記は償却O(1)）
+- 分単位の集計バケットを追記時に更新（グラフは生イベントではなくバケットから描画）
+- 時間窓集計・ダウンサンプリング・移動平均・範囲検索
+- 圧縮バイナリ形式（.npz）での永続化
+"""
+import atexit
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    from .log_config import get_logger
+except ImportError:
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# 集計窓（秒）
+WINDOWS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+# ロールアップの基本単位（分）
+BASE_BUCKET_SECONDS = 60
+
+
+class _GrowableColumn:
+    """容量倍増で伸長する1次元配列（追記用）"""
+
+    def __init__(self, dtype, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self._data):
+            self._grow(self.size + 1)
+        self._data[self.size] = value
+        self.size += 1
+
+    def extend(self, values: np.ndarray):
+        count = len(values)
+        if self.size + count > len(self._data):
+            self._grow(self.size + count)
+        self._data[self.size:self.size + count] = values
+        self.size += count
+
+    def _grow(self, required: int):
+        capacity = max(len(self._data) * 2, required)
+        data = np.empty(capacity, dtype=self._data.dtype)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+
+    def view(self) -> np.ndarray:
+        """有効部分のビュー（コピーなし）"""
+        return self._data[:self.size]
+
+    def replace(self, values: np.ndarray):
+        self._data = np.array(values, dtype=self._data.dtype)
+        self.size = len(values)
+
+    def set_last(self, value):
+        self._data[self.size - 1] = value
+
+
+class _EmotionSeries:
+    """1感情分の生イベント列と分単位ロールアップ"""
+
+    def __init__(self):
+        self.timestamps = _GrowableColumn(np.float64)
+        self.intensities = _GrowableColumn(np.float32)
+        self.sorted = True
+
+        # 分単位の事前集計バケット
+        self.bucket_keys = _GrowableColumn(np.int64, 256)
+        self.bucket_sum = _GrowableColumn(np.float64, 256)
+        self.bucket_count = _GrowableColumn(np.int64, 256)
+        self.bucket_max = _GrowableColumn(np.float32, 256)
+
+    def append(self, timestamp: float, intensity: float):
+        if self.timestamps.size and timestamp < self.timestamps.view()[-1]:
+            self.sorted = False
+
+        self.timestamps.append(timestamp)
+        self.intensities.append(intensity)
+
+        if not self.sorted:
+            # 順不同の追記はロールアップを後で再構築
+            return
+
+        key = int(timestamp // BASE_BUCKET_SECONDS)
+        if self.bucket_keys.size and self.bucket_keys.view()[-1] == key:
+            self.bucket_sum.set_last(self.bucket_sum.view()[-1] + intensity)
+            self.bucket_count.set_last(self.bucket_count.view()[-1] + 1)
+            self.bucket_max.set_last(max(self.bucket_max.view()[-1], intensity))
+        else:
+            self.bucket_keys.append(key)
+            self.bucket_sum.append(intensity)
+            self.bucket_count.append(1)
+            self.bucket_max.append(intensity)
+
+    def extend(self, timestamps: np.ndarray, intensities: np.ndarray):
+        self.timestamps.extend(timestamps)
+        self.intensities.extend(intensities)
+        self.sorted = False
+
+    def ensure_sorted(self):
+        """順不同の追記があった場合のみ並べ替えてロールアップを再構築"""
+        if self.sorted:
+            return
+
+        order = np.argsort(self.timestamps.view(), kind="stable")
+        self.timestamps.replace(self.timestamps.view()[order])
+        self.intensities.replace(self.intensities.view()[order])
+        self._rebuild_buckets()
+        self.sorted = True
+
+    def _rebuild_buckets(self):
+        ts = self.timestamps.view()
+        values = self.intensities.view()
+        if len(ts) == 0:
+            for column in (self.bucket_keys, self.bucket_sum, self.bucket_count, self.bucket_max):
+                column.replace(column.view()[:0])
+            return
+
+        keys = (ts // BASE_BUCKET_SECONDS).astype(np.int64)
+        starts = _group_starts(keys)
+        self.bucket_keys.replace(keys[starts])
+        self.bucket_sum.replace(np.add.reduceat(values.astype(np.float64), starts))
+        self.bucket_count.replace(np.diff(np.append(starts, len(keys))))
+        self.bucket_max.replace(np.maximum.reduceat(values, starts))
+
+
+def _group_starts(keys: np.ndarray) -> np.ndarray:
+    """ソート済みキー配列で値が変わる位置（グループ先頭）を返す"""
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64)
+    change = np.empty(len(keys), dtype=bool)
+    change[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=change[1:])
+    return np.flatnonzero(change)
+
+
+def _window_seconds(window: Union[str, int, float]) -> float:
+    if isinstance(window, str):
+        if window not in WINDOWS:
+            raise ValueError(f"未知の集計窓: {window}")
+        return float(WINDOWS[window])
+    if window <= 0:
+        raise ValueError("集計窓は正の秒数で指定してください")
+    return float(window)
+
+
+class EmotionTimeSeriesStore:
+    """感情学習イベントの列指向時系列ストア"""
+
+    def __init__(self, save_path: str = "emotion_timeseries.npz", autosave_interval: int = 256):
+        """
+        Args:
+            save_path: 永続化ファイル（.npz）のパス
+            autosave_interval: この件数の追記ごとに自動保存（0で無効）
+        """
+        self.save_path = save_path
+        self.autosave_interval = autosave_interval
+        self._series: Dict[str, _EmotionSeries] = {}
+        self._lock = threading.RLock()
+        self._unsaved = 0
+
+        self.load()
+
+    # ------------------------------------------------------------
+    # 書き込み
+    # ------------------------------------------------------------
+    def append(self, emotion: str, intensity: float, timestamp: float = None):
+        """学習イベントを1件追記"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            self._get_series(emotion).append(float(timestamp), float(intensity))
+            self._unsaved += 1
+            if self.autosave_interval and self._unsaved >= self.autosave_interval:
+                self.save()
+
+    def extend(self, emotion: str, timestamps, intensities):
+        """学習イベントを一括追記（インポート・ベンチマーク用）"""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        intensities = np.asarray(intensities, dtype=np.float32)
+        if timestamps.shape != intensities.shape:
+            raise ValueError("timestamps と intensities の長さが一致しません")
+
+        with self._lock:
+            self._get_series(emotion).extend(timestamps, intensities)
+            self._unsaved += len(timestamps)
+
+    def _get_series(self, emotion: str) -> _EmotionSeries:
+        series = self._series.get(emotion)
+        if series is None:
+            series = _EmotionSeries()
+            self._series[emotion] = series
+        return series
+
+    # ------------------------------------------------------------
+    # 読み出し
+    # ------------------------------------------------------------
+    def emotions(self) -> List[str]:
+        """イベントが存在する感情の一覧"""
+        return [name for name, series in self._series.items() if series.timestamps.size]
+
+    def event_count(self, emotion: str = None) -> int:
+        """イベント件数（感情未指定なら全感情の合計）"""
+        if emotion is not None:
+            series = self._series.get(emotion)
+            return series.timestamps.size if series else 0
+        return sum(series.timestamps.size for series in self._series.values())
+
+    def time_span(self) -> Optional[Tuple[float, float]]:
+        """全イベントの最古・最新タイムスタンプ"""
+        with self._lock:
+            bounds = []
+            for series in self._series.values():
+                if series.timestamps.size:
+                    series.ensure_sorted()
+                    ts = series.timestamps.view()
+                    bounds.append((ts[0], ts[-1]))
+        if not bounds:
+            return None
+        return min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+    def get_range(self, emotion: str, start: float = None, end: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """[start, end) の生イベントを二分探索で取得（コピーを返す）"""
+        with self._lock:
+            series = self._series.get(emotion)
+            if series is None:
+                return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+
+            series.ensure_sorted()
+            ts = series.timestamps.view()
+            lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+            hi = len(ts) if end is None else int(np.searchsorted(ts, end, side="left"))
+            return ts[lo:hi].copy(), series.intensities.view()[lo:hi].copy()
+
+    def aggregate(self,
+                  emotion: str,
+                  window: Union[str, int, float] = "minute",
+                  how: str = "mean",
+                  start: float = None,
+                  end: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """時間窓ごとの集計値
+
+        窓が分の倍数なら事前集計バケットから計算し、生イベントは走査しない。
+
+        Args:
+            window: "minute" / "hour" / "day" または秒数
+            how: "mean" / "sum" / "count" / "max"
+        Returns:
+            (各バケットの開始時刻, 集計値)
+        """
+        seconds = _window_seconds(window)
+        if how not in ("mean", "sum", "count", "max"):
+            raise ValueError(f"未知の集計方法: {how}")
+
+        with self._lock:
+            series = self._series.get(emotion)
+            if series is None or series.timestamps.size == 0:
+                return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+            series.ensure_sorted()
+
+            if seconds % BASE_BUCKET_SECONDS == 0 and (start is None or start % BASE_BUCKET_SECONDS == 0) \
+                    and (end is None or end % BASE_BUCKET_SECONDS == 0):
+                return self._aggregate_buckets(series, seconds, how, start, end)
+
+            ts, values = self.get_range(emotion, start, end)
+            keys = (ts // seconds).astype(np.int64)
+            starts = _group_starts(keys)
+            if len(starts) == 0:
+                return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+            counts = np.diff(np.append(starts, len(keys)))
+            if how == "max":
+                result = np.maximum.reduceat(values, starts).astype(np.float64)
+            elif how == "count":
+                result = counts.astype(np.float64)
+            else:
+                sums = np.add.reduceat(values.astype(np.float64), starts)
+                result = sums if how == "sum" else sums / counts
+            return keys[starts] * seconds, result
+
+    def _aggregate_buckets(self, series: _EmotionSeries, seconds: float, how: str,
+                           start: float = None, end: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        keys = series.bucket_keys.view()
+        lo = 0 if start is None else int(np.searchsorted(keys, start // BASE_BUCKET_SECONDS, side="left"))
+        hi = len(keys) if end is None else int(np.searchsorted(keys, end // BASE_BUCKET_SECONDS, side="left"))
+        keys = keys[lo:hi]
+        if len(keys) == 0:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+
+        factor = int(seconds // BASE_BUCKET_SECONDS)
+        group_keys = keys // factor
+        starts = _group_starts(group_keys)
+
+        if how == "max":
+            result = np.maximum.reduceat(series.bucket_max.view()[lo:hi], starts).astype(np.float64)
+        else:
+            counts = np.add.reduceat(series.bucket_count.view()[lo:hi], starts)
+            if how == "count":
+                result = counts.astype(np.float64)
+            else:
+                sums = np.add.reduceat(series.bucket_sum.view()[lo:hi], starts)
+                result = sums if how == "sum" else sums / counts
+        return (group_keys[starts] * factor * BASE_BUCKET_SECONDS).astype(np.float64), result
+
+    def downsample(self,
+                   emotion: str,
+                   max_points: int = 500,
+                   start: float = None,
+                   end: float = None,
+                   how: str = "mean") -> Tuple[np.ndarray, np.ndarray]:
+        """グラフ用にmax_points以下へ間引いた集計系列"""
+        if max_points <= 0:
+            raise ValueError("max_points は1以上で指定してください")
+
+        span = self.time_span()
+        if span is None:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+
+        lo = span[0] if start is None else start
+        hi = span[1] if end is None else end
+        # 分単位の倍数に丸めて事前集計バケットを使う
+        minutes = max(1, int(np.ceil((hi - lo) / BASE_BUCKET_SECONDS / max_points)))
+        window = minutes * BASE_BUCKET_SECONDS
+        if start is not None:
+            start = (start // BASE_BUCKET_SECONDS) * BASE_BUCKET_SECONDS
+        if end is not None:
+            end = (end // BASE_BUCKET_SECONDS + 1) * BASE_BUCKET_SECONDS
+        return self.aggregate(emotion, window, how, start, end)
+
+    def rolling_mean(self, emotion: str, window_events: int = 20,
+                     start: float = None, end: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """直近window_events件の移動平均（累積和で計算）"""
+        if window_events <= 0:
+            raise ValueError("window_events は1以上で指定してください")
+
+        ts, values = self.get_range(emotion, start, end)
+        if len(values) == 0:
+            return ts, values.astype(np.float64)
+
+        cumsum = np.cumsum(values, dtype=np.float64)
+        means = np.empty(len(values), dtype=np.float64)
+        head = min(window_events, len(values))
+        means[:head] = cumsum[:head] / np.arange(1, head + 1)
+        if len(values) > window_events:
+            means[window_events:] = (cumsum[window_events:] - cumsum[:-window_events]) / window_events
+        return ts, means
+
+    def get_chart_buckets(self,
+                          window: Union[str, int, float] = "minute",
+                          max_points: int = 500,
+                          start: float = None,
+                          end: float = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """分析ページ用: 全感情の平均強度バケット（max_points以下）"""
+        seconds = _window_seconds(window)
+        charts = {}
+        for emotion in self.emotions():
+            buckets, values = self.aggregate(emotion, seconds, "mean", start, end)
+            if len(buckets) > max_points:
+                buckets, values = self.downsample(emotion, max_points, start, end)
+            charts[emotion] = (buckets, values)
+        return charts
+
+    # ------------------------------------------------------------
+    # 永続化
+    # ------------------------------------------------------------
+    def save(self):
+        """圧縮バイナリ形式で保存（一時ファイル経由で置き換え）"""
+        with self._lock:
+            arrays = {}
+            for emotion, series in self._series.items():
+                series.ensure_sorted()
+                arrays[f"{emotion}__ts"] = series.timestamps.view()
+                arrays[f"{emotion}__intensity"] = series.intensities.view()
+
+            try:
+                directory = os.path.dirname(self.save_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.save_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez_compressed(f, **arrays)
+                os.replace(tmp_path, self.save_path)
+                self._unsaved = 0
+            except Exception as e:
+                logger.error("感情時系列データ保存エラー: %s", e)
+
+    def flush(self):
+        """未保存のイベントがあれば保存"""
+        if self._unsaved:
+            self.save()
+
+    def load(self):
+        """保存済みデータの読み込み"""
+        if not os.path.exists(self.save_path):
+            return
+
+        try:
+            with np.load(self.save_path) as data:
+                with self._lock:
+                    self._series.clear()
+                    for key in data.files:
+                        if not key.endswith("__ts"):
+                            continue
+                        emotion = key[:-len("__ts")]
+                        series = self._get_series(emotion)
+                        series.extend(data[key], data[f"{emotion}__intensity"])
+                        series.ensure_sorted()
+            self._unsaved = 0
+        except Exception as e:
+            logger.warning("感情時系列データ読み込みエラー: %s", e)
+            self._series.clear()
+
+    def get_summary(self) -> Dict[str, Union[int, Dict[str, int]]]:
+        """件数サマリー"""
+        return {
+            "total_events": self.event_count(),
+            "per_emotion": {emotion: self.event_count(emotion) for emotion in self.emotions()},
+        }
+
+
+# 保存先ごとの共有インスタンス（再実行ごとの再読み込みを避ける）
+_stores: Dict[str, EmotionTimeSeriesStore] = {}
+_stores_lock = threading.Lock()
+
+def get_timeseries_store(save_path: str = "emotion_timeseries.npz") -> EmotionTimeSeriesStore:
+    """保存先パスごとのEmotionTimeSeriesStoreを取得"""
+    key = os.path.abspath(save_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = EmotionTimeSeriesStore(save_path)
+            _stores[key] = store
+            atexit.register(store.flush)
+        return store
@@ -0,0 +1,180 @@
+"""
+8種の感情の強度ベクトル（NumPy配列1本で保持）
+
+感情検出・学習・色計算で共通に使う。要素の並びは EmotionType の定義順
+（joy, anger, sadness, love, surprise, fear, disgust, anticipation）で、
+emotion_system.EmotionType・ai_providers.base_provider.EmotionType のどちらでも、
+感情名の文字列でも添字に使える。
+
+- 加算・クランプ・減衰・ブレンドは配列をその場で更新する（メッセージごとの確保がほぼない）
+- argmax / top_k / count_above で支配的な感情や学習済みの数を求める
+- to_dict / from_dict で既存の Dict[EmotionType, float] 形式と相互変換する
+
+    vector = EmotionVector.from_dict(detected)
+    levels.add(vector).clamp()
+    dominant = levels.dominant(EmotionType)
+"""
+from typing import Any, Dict, Iterable, List, Mapping, Tuple, Type, Union
+
+import numpy as np
+
+EMOTION_ORDER: Tuple[str, ...] = (
+    "joy", "anger", "sadness", "love", "surprise", "fear", "disgust", "anticipation",
+)
+EMOTION_COUNT = len(EMOTION_ORDER)
+_INDEX: Dict[str, int] = {name: i for i, name in enumerate(EMOTION_ORDER)}
+
+EmotionKey = Union[str, int, Any]  # 感情名・添字・EmotionType
+
+
+def emotion_index(emotion: EmotionKey) -> int:
+    """感情（EmotionType・感情名・添字）の添字"""
+    if isinstance(emotion, (int, np.integer)):
+        return int(emotion)
+    return _INDEX[getattr(emotion, "value", emotion)]
+
+
+class EmotionVector:
+    """8種の感情の強度（0.0〜1.0 を想定。clamp で範囲に収める）"""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: Iterable[float] = None):
+        if values is None:
+            self.values = np.zeros(EMOTION_COUNT)
+        else:
+            self.values = np.array(values, dtype=np.float64)
+            if self.values.shape != (EMOTION_COUNT,):
+                raise ValueError(f"EmotionVector は {EMOTION_COUNT} 要素です: {self.values.shape}")
+
+    # ------------------------------------------------------------
+    # 変換
+    # ------------------------------------------------------------
+    @classmethod
+    def from_dict(cls, mapping: Mapping[EmotionKey, float]) -> "EmotionVector":
+        vector = cls()
+        for emotion, value in mapping.items():
+            vector.values[emotion_index(emotion)] = value
+        return vector
+
+    @classmethod
+    def from_names(cls, names: Iterable[EmotionKey], value: float = 1.0) -> "EmotionVector":
+        """感情名の並び（学習済み感情のリスト等）から。未知の名前は無視する"""
+        vector = cls()
+        for name in names:
+            try:
+                vector.values[emotion_index(name)] = value
+            except KeyError:
+                continue
+        return vector
+
+    def to_dict(self, enum_type: Type = None, nonzero: bool = False) -> Dict[Any, float]:
+        """{EmotionType: 強度}（enum_type を省くと {感情名: 強度}）"""
+        keys = list(enum_type) if enum_type is not None else EMOTION_ORDER
+        return {
+            key: value
+            for key, value in zip(keys, self.values.tolist())
+            if not nonzero or value != 0.0
+        }
+
+    def names_above(self, threshold: float = 0.0) -> List[str]:
+        """強度が threshold を超える感情名（定義順）"""
+        return [EMOTION_ORDER[i] for i in np.flatnonzero(self.values > threshold)]
+
+    def copy(self) -> "EmotionVector":
+        return EmotionVector(self.values)
+
+    # ------------------------------------------------------------
+    # 要素アクセス
+    # ------------------------------------------------------------
+    def __getitem__(self, emotion: EmotionKey) -> float:
+        return float(self.values[emotion_index(emotion)])
+
+    def __setitem__(self, emotion: EmotionKey, value: float):
+        self.values[emotion_index(emotion)] = value
+
+    def __len__(self) -> int:
+        return EMOTION_COUNT
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, EmotionVector) and bool(np.array_equal(self.values, other.values))
+
+    def __repr__(self) -> str:
+        inner = ", ".join(f"{name}={value:.2f}" for name, value in zip(EMOTION_ORDER, self.values.tolist()))
+        return f"EmotionVector({inner})"
+
+    # ------------------------------------------------------------
+    # その場での演算（self を返すので連鎖できる）
+    # ------------------------------------------------------------
+    def add(self, other: Union["EmotionVector", EmotionKey], amount: float = 1.0) -> "EmotionVector":
+        """ベクトル全体（×amount）または1つの感情に amount を加える"""
+        if isinstance(other, EmotionVector):
+            if amount == 1.0:
+                np.add(self.values, other.values, out=self.values)
+            else:
+                self.values += other.values * amount
+        else:
+            self.values[emotion_index(other)] += amount
+        return self
+
+    def clamp(self, low: float = 0.0, high: float = 1.0) -> "EmotionVector":
+        np.clip(self.values, low, high, out=self.values)
+        return self
+
+    def decay(self, factor: float) -> "EmotionVector":
+        """全体を factor 倍に減衰（0〜1）"""
+        np.multiply(self.values, factor, out=self.values)
+        return self
+
+    def blend(self, other: "EmotionVector", weight: float) -> "EmotionVector":
+        """other へ weight の割合だけ近づける（self = self·(1−w) + other·w）"""
+        self.values += (other.values - self.values) * weight
+        return self
+
+    # ------------------------------------------------------------
+    # 集計
+    # ------------------------------------------------------------
+    def argmax(self) -> int:
+        return int(self.values.argmax())
+
+    def dominant(self, enum_type: Type) -> Tuple[Any, float]:
+        """最も強い感情と強度（同点なら定義順で先のもの）"""
+        index = self.argmax()
+        return list(enum_type)[index], float(self.values[index])
+
+    def top_k(self, k: int) -> List[Tuple[int, float]]:
+        """強い順に k 個の (添字, 強度)（同点は定義順）"""
+        k = max(0, min(k, EMOTION_COUNT))
+        order = np.argsort(-self.values, kind="stable")[:k]
+        return [(int(i), float(self.values[i])) for i in order]
+
+    def count_above(self, threshold: float) -> int:
+        return int(np.count_nonzero(self.values > threshold))
+
+    def total(self) -> float:
+        return float(self.values.sum())
+
+
+class KeywordScorer:
+    """キーワードの出現から感情ベクトルを作る（語彙の平坦化は生成時に一度だけ）
+
+    スコアは感情ごとに「一致したキーワード数 × weight」を上限 cap で切ったもの。
+    """
+
+    def __init__(self, keywords: Mapping[EmotionKey, Iterable[str]], weight: float, cap: float = 1.0):
+        self.weight = weight
+        self.cap = cap
+        self._pairs: Tuple[Tuple[str, int], ...] = tuple(
+            (keyword, emotion_index(emotion))
+            for emotion, words in keywords.items()
+            for keyword in words
+        )
+
+    def score(self, text: str) -> EmotionVector:
+        vector = EmotionVector()
+        values = vector.values
+        for keyword, index in self._pairs:
+            if keyword in text:
+                values[index] += self.weight
+        np.minimum(values, self.cap, out=values)
+        return vector
@@ -0,0 +1,141 @@
+"""
+ログ設定（レベル制御・非同期書き出し・JSON出力）
+
+ホットパスの print() を置き換えるためのロギング基盤。
+- ロガーは "ruri.<モジュール名>" の階層で、モジュールごとにレベルを変えられる
+- 呼び出し側は QueueHandler にレコードを積むだけで、標準出力への書き込みは
+  QueueListener のバックグラウンドスレッドが行う
+- メッセージは logger.debug("...%s", value) の遅延フォーマットで書くので、
+  無効なレベルのログはフォーマットもI/Oも発生しない
+- RURI_LOG_JSON=1 で1行1JSONの構造化出力
+
+環境変数:
+    RURI_LOG_LEVEL   既定レベル（既定: INFO）
+    RURI_LOG_LEVELS  モジュール別レベル（例: "ai_providers=DEBUG,emotion_system=WARNING"）
+    RURI_LOG_JSON    1/true でJSON出力
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+ROOT_LOGGER = "ruri"
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(name)s] %(message)s"
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """1レコード1行のJSON（extra で渡した項目もそのまま含める）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _LogState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.configured = False
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+_state = _LogState()
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level: str = None, module_levels: Dict[str, str] = None,
+                      json_format: bool = None, stream=None, force: bool = False):
+    """ロギングを設定（引数未指定の項目は環境変数から）
+
+    Args:
+        level: "ruri" 配下の既定レベル
+        module_levels: モジュール名 -> レベル（"ai_providers.registry" のように "ruri." は省略可）
+        json_format: JSON Lines で出力するか
+        stream: 出力先（既定: 標準出力）
+        force: 設定済みでも作り直す
+    """
+    with _state.lock:
+        if _state.configured and not force:
+            return
+        _stop_listener()
+
+        level = (level or os.getenv("RURI_LOG_LEVEL") or "INFO").upper()
+        if module_levels is None:
+            module_levels = _parse_levels(os.getenv("RURI_LOG_LEVELS", ""))
+        if json_format is None:
+            json_format = os.getenv("RURI_LOG_JSON", "").lower() in ("1", "true", "yes", "on")
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _state.queue_handler = logging.handlers.QueueHandler(log_queue)
+        _state.listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _state.listener.start()
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_state.queue_handler)
+        root.setLevel(level)
+        # ルートロガー（Streamlit等の設定）へは伝播させない
+        root.propagate = False
+
+        for name, module_level in module_levels.items():
+            if not name.startswith(ROOT_LOGGER + "."):
+                name = f"{ROOT_LOGGER}.{name}"
+            logging.getLogger(name).setLevel(module_level)
+
+        _state.configured = True
+
+
+def _stop_listener():
+    if _state.listener is not None:
+        _state.listener.stop()
+        _state.listener = None
+
+
+def shutdown_logging():
+    """キューに残ったログを書き出してリスナーを止める"""
+    with _state.lock:
+        _stop_listener()
+        _state.configured = False
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """"ruri.<name>" のロガー（初回呼び出し時に環境変数からロギングを設定）"""
+    if not _state.configured:
+        configure_logging()
+    if name.startswith("src."):
+        name = name[4:]
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,417 @@
+"""
+実行中アプリのメトリクス（Prometheusテキスト形式）
+
+プロセス内のカウンター・ゲージ・ヒストグラムを保持し、ローカルHTTPエンドポイント
+（/metrics）からテキスト形式で公開する。
+- 記録はメトリクスごとのロックと辞書更新のみ（print より軽い）
+- 複数ワーカー構成では各プロセスが RURI_METRICS_DIR に自分のスナップショットを定期的に書き出し、
+  エクスポート時に全プロセス分を合算する（カウンター・ヒストグラムは合計、ゲージは sum / max）
+
+使い方:
+    from metrics import get_metrics
+    messages_total = get_metrics().counter("ruri_chat_messages_total", "処理したチャットメッセージ数")
+    messages_total.inc()
+
+環境変数:
+    RURI_METRICS_DIR  複数ワーカー集約用のスナップショット置き場
+    RURI_METRICS_PORT エンドポイントのポート（start_http_server の既定値）
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .log_config import get_logger
+except ImportError:
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    """ラベル付きメトリクスの共通部分"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ラベル {self.labelnames} が必要です（指定: {tuple(labels)}）")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        with self._lock:
+            return [(key, self._copy(value)) for key, value in self._values.items()]
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("カウンターは減少できません")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """任意に上下する値
+
+    multiprocess_mode: 複数ワーカー集約時の合算方法（"sum" / "max"）
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 multiprocess_mode: str = "sum"):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in ("sum", "max"):
+            raise ValueError(f"未対応の集約方法: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    """バケット付きヒストグラム（値は [バケットごとの件数..., 合計, 件数]）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """with文で経過秒数を記録"""
+        return _Timer(self, labels)
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return list(value)
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """メトリクスの登録・スナップショット・テキスト出力"""
+
+    def __init__(self, multiprocess_dir: Optional[str] = None, flush_interval: float = 5.0,
+                 stale_after: float = 300.0):
+        """
+        Args:
+            multiprocess_dir: 複数ワーカー集約用のディレクトリ（Noneなら単一プロセス）
+            flush_interval: スナップショットを書き出す間隔（秒）
+            stale_after: これより古いスナップショットのゲージは集約から除外（終了したワーカー）
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._server_attempted = False
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+            self._start_flusher()
+
+    # ------------------------------------------------------------
+    # 登録（同名は既存のものを返すので、モジュールの二重importでも安全）
+    # ------------------------------------------------------------
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames, **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, tuple(labelnames), **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"メトリクス '{name}' は別の定義で登録済みです")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=(), multiprocess_mode: str = "sum") -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+
+    def histogram(self, name: str, documentation: str, labelnames=(),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def reset(self):
+        """全メトリクスの値をクリア（定義は残す）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    # ------------------------------------------------------------
+    # スナップショット
+    # ------------------------------------------------------------
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON化できる形の現在値"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        result = {}
+        for metric in metrics:
+            entry = {
+                "type": metric.kind,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "samples": [[list(key), value] for key, value in metric.samples()],
+            }
+            if isinstance(metric, Histogram):
+                entry["buckets"] = list(metric.buckets)
+            if isinstance(metric, Gauge):
+                entry["mode"] = metric.multiprocess_mode
+            result[metric.name] = entry
+        return result
+
+    def _snapshot_path(self, pid: int = None) -> str:
+        return os.path.join(self.multiprocess_dir, f"metrics_{pid or os.getpid()}.json")
+
+    def flush(self):
+        """自プロセスのスナップショットをアトミックに書き出す"""
+        if not self.multiprocess_dir:
+            return
+        payload = {"pid": os.getpid(), "updated": time.time(), "metrics": self.snapshot()}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.multiprocess_dir, prefix=".metrics_", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self._snapshot_path())
+        except Exception as e:
+            logger.warning("⚠️ メトリクススナップショット書き込みエラー: %s", e)
+
+    def _start_flusher(self):
+        def loop():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=loop, name="ruri-metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def collect(self) -> Dict[str, Any]:
+        """全ワーカー分を合算したスナップショット（単一プロセスなら自分の分のみ）"""
+        if not self.multiprocess_dir:
+            return self.snapshot()
+
+        self.flush()
+        snapshots = []
+        now = time.time()
+        for filename in os.listdir(self.multiprocess_dir):
+            if not (filename.startswith("metrics_") and filename.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, filename), "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except Exception:
+                continue  # 書き込み途中・破損は次回に回す
+        return merge_snapshots(snapshots, now - self.stale_after)
+
+    # ------------------------------------------------------------
+    # 出力
+    # ------------------------------------------------------------
+    def render_text(self) -> str:
+        return render_text(self.collect())
+
+    def start_http_server(self, port: int = None, host: str = "127.0.0.1") -> bool:
+        """/metrics を公開（起動を試みるのはプロセスで一度だけ。起動済み・ポート使用中ならFalse）"""
+        if self._server_attempted:
+            return False
+        self._server_attempted = True
+        port = port if port is not None else int(os.getenv("RURI_METRICS_PORT", "9464"))
+        try:
+            self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        except OSError as e:
+            # 複数ワーカーでは最初の1プロセスだけが公開し、残りはスナップショットで寄与する
+            logger.warning("⚠️ メトリクスエンドポイントを起動できません（%s:%s）: %s", host, port, e)
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="ruri-metrics-http", daemon=True).start()
+        logger.info("📈 メトリクスエンドポイント: http://%s:%d/metrics", host, self._server.server_address[1])
+        return True
+
+    @property
+    def server_port(self) -> Optional[int]:
+        return self._server.server_address[1] if self._server else None
+
+    def shutdown(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.flush()
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]], stale_before: float = 0.0) -> Dict[str, Any]:
+    """プロセスごとのスナップショットを合算"""
+    merged: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        stale = snapshot.get("updated", 0) < stale_before
+        for name, entry in snapshot.get("metrics", {}).items():
+            if entry["type"] == "gauge" and stale:
+                continue
+            target = merged.setdefault(name, {**entry, "samples": {}})
+            samples = target["samples"]
+            for labels, value in entry["samples"]:
+                key = tuple(labels)
+                if key not in samples:
+                    samples[key] = list(value) if isinstance(value, list) else value
+                elif entry["type"] == "histogram":
+                    samples[key] = [a + b for a, b in zip(samples[key], value)]
+                elif entry["type"] == "gauge" and entry.get("mode") == "max":
+                    samples[key] = max(samples[key], value)
+                else:
+                    samples[key] += value
+    for entry in merged.values():
+        entry["samples"] = [[list(key), value] for key, value in entry["samples"].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: List[str], values: List[str], extra: Tuple[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_text(snapshot: Dict[str, Any]) -> str:
+    """スナップショットをPrometheusテキスト形式（0.0.4）に変換"""
+    lines = []
+    for name in sorted(snapshot):
+        entry = snapshot[name]
+        labelnames = entry["labelnames"]
+        lines.append(f"# HELP {name} {_escape(entry['help'])}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for labels, value in sorted(entry["samples"], key=lambda sample: sample[0]):
+            if entry["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(entry["buckets"], value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', '+Inf'))} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _make_handler(registry: MetricsRegistry):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """プロセス共通のメトリクスレジストリ（環境変数で初期設定）"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(multiprocess_dir=os.getenv("RURI_METRICS_DIR") or None)
+    return _metrics
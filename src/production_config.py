@@ -1,17 +1,20 @@
 # 本番環境用設定ファイル
-import os
 from typing import Dict, Any
 
 try:
     from .api_config import APIConfig
+    from .settings import get_settings
 except ImportError:
     from api_config import APIConfig
+    from settings import get_settings
+
+_settings = get_settings()
 
 class ProductionConfig:
     """本番環境用の設定管理"""
     
     # デバッグモード（本番では False）
-    DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
+    DEBUG = _settings.debug
     
     # AI API設定（APIConfigから取得）
     @classmethod
@@ -22,7 +25,7 @@ class ProductionConfig:
     OLLAMA_BASE_URL = APIConfig.get_ollama_base_url()
     
     # データベース設定（将来用）
-    DATABASE_URL = os.getenv('DATABASE_URL', '')
+    DATABASE_URL = _settings.database_url
     
     # アプリケーション設定
     APP_NAME = "AITuber ルリ - ベータ版"
@@ -30,10 +33,10 @@ class ProductionConfig:
     
     # 機能フラグ（本番で無効化したい機能）
     ENABLE_DEBUG_FEATURES = DEBUG
-    ENABLE_AI_FEATURES = os.getenv('ENABLE_AI_FEATURES', 'True').lower() == 'true'
-    ENABLE_OBS_INTEGRATION = os.getenv('ENABLE_OBS_INTEGRATION', 'False').lower() == 'true'
-    ENABLE_STREAMING_FEATURES = os.getenv('ENABLE_STREAMING_FEATURES', 'False').lower() == 'true'
-    BETA_AUTH_REQUIRED = os.getenv('BETA_AUTH_REQUIRED', 'False').lower() == 'true'
+    ENABLE_AI_FEATURES = _settings.get_bool('ENABLE_AI_FEATURES', True)
+    ENABLE_OBS_INTEGRATION = _settings.get_bool('ENABLE_OBS_INTEGRATION')
+    ENABLE_STREAMING_FEATURES = _settings.get_bool('ENABLE_STREAMING_FEATURES')
+    BETA_AUTH_REQUIRED = _settings.get_bool('BETA_AUTH_REQUIRED')
     
     # UI設定
     SHOW_TECHNICAL_DETAILS = DEBUG
@@ -58,7 +61,7 @@ class ProductionConfig:
     @classmethod
     def is_production(cls) -> bool:
         """本番環境かどうかを判定"""
-        return not cls.DEBUG and os.getenv('ENVIRONMENT') == 'production'
+        return not cls.DEBUG and get_settings().is_production
     
     @classmethod
     def get_available_ai_providers(cls) -> list:
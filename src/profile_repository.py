@@ -0,0 +1,332 @@
+"""
+キャラクター設定のリポジトリ（assets/ruri_config.json・assets/ruri_character.md）
+
+- 各ファイルはプロセスで一度だけ読み込み、不変のスナップショットにする
+  （dict は変更不可の FrozenDict、list は tuple。json.dumps はそのまま使える）
+- 以降の変更検出は mtime・サイズの確認だけ（check_interval 秒に1回まで）。
+  watchdog があれば watch() でファイルイベントから再読み込みし、確認自体を省く
+- 変更があれば新しいスナップショットを作ってから差し替える。読み手は常に
+  どちらか一方の完全な版を見る。内容が同じ（保存し直しただけ）なら版は変えない
+- 内容が変わったときだけ購読者へ通知する。プロンプト・語彙などの派生データは
+  derived() で版ごとにキャッシュし、内容が変わったときだけ作り直す
+- 読み込みに失敗した場合（書き込み途中のJSON等）は前の版を使い続ける
+
+環境変数:
+    RURI_PROFILE_CHECK_INTERVAL  mtime・サイズを確認する間隔（秒・既定: 2）
+    RURI_PROFILE_WATCH           1/true で watchdog によるファイル監視を有効化
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from .log_config import get_logger
+    from .metrics import get_metrics
+except ImportError:
+    from log_config import get_logger
+    from metrics import get_metrics
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+logger = get_logger(__name__)
+_reloads_total = get_metrics().counter(
+    "ruri_profile_reloads_total", "キャラクター設定の再読み込み回数", ("result",))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG_PATH = os.path.join(PROJECT_ROOT, "assets", "ruri_config.json")
+DEFAULT_CHARACTER_PATH = os.path.join(PROJECT_ROOT, "assets", "ruri_character.md")
+
+
+class FrozenDict(dict):
+    """変更できない dict（json.dumps・isinstance(dict) はそのまま使える）"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("キャラクター設定のスナップショットは変更できません")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __deepcopy__(self, memo) -> Dict[str, Any]:
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+def freeze(value: Any) -> Any:
+    """JSONから読んだ値を変更不可の形（FrozenDict / tuple）へ再帰的に変換"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class ProfileSnapshot:
+    """ある時点のキャラクター設定（不変）"""
+    version: int
+    digest: str
+    config: FrozenDict
+    character_description: str
+    config_path: str
+    character_path: str
+    config_loaded: bool = False
+    character_loaded: bool = False
+    loaded_at: float = 0.0
+    _derived: Dict[str, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def emotions(self) -> FrozenDict:
+        return self.config.get("emotions", FrozenDict())
+
+    @property
+    def response_patterns(self) -> FrozenDict:
+        return self.config.get("response_patterns", FrozenDict())
+
+    @property
+    def emotion_colors(self) -> Dict[str, str]:
+        """感情名 -> 設定ファイルの色（"#RRGGBB"）"""
+        return {name: data["color"]
+                for name, data in self.emotions.items() if isinstance(data, dict) and data.get("color")}
+
+
+Signature = Optional[Tuple[int, int]]
+
+
+def _signature(path: str) -> Signature:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class ProfileRepository:
+    """キャラクター設定ファイルを不変のスナップショットとして提供する"""
+
+    def __init__(self, config_path: str = DEFAULT_CONFIG_PATH,
+                 character_path: str = DEFAULT_CHARACTER_PATH,
+                 check_interval: float = None):
+        self.config_path = config_path
+        self.character_path = character_path
+        if check_interval is None:
+            check_interval = float(os.getenv("RURI_PROFILE_CHECK_INTERVAL", "2"))
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._subscribers_lock = threading.Lock()
+        self._subscribers: List[Callable[[], Optional[Callable]]] = []
+        self._snapshot: Optional[ProfileSnapshot] = None
+        self._signatures: Tuple[Signature, Signature] = (None, None)
+        self._last_check = float("-inf")
+        self._observer = None
+
+    # ------------------------------------------------------------
+    # 読み取り
+    # ------------------------------------------------------------
+    def get(self) -> ProfileSnapshot:
+        """現在のスナップショット（確認間隔を過ぎていれば mtime・サイズを確認）"""
+        snapshot = self._snapshot
+        if snapshot is None or (self._observer is None
+                                and time.monotonic() - self._last_check >= self.check_interval):
+            snapshot = self.refresh()
+        return snapshot
+
+    def derived(self, name: str, builder: Callable[[ProfileSnapshot], Any]) -> Any:
+        """スナップショットから作る派生データ（プロンプト・語彙等）を版ごとにキャッシュして返す"""
+        snapshot = self.get()
+        try:
+            return snapshot._derived[name]
+        except KeyError:
+            value = snapshot._derived[name] = builder(snapshot)
+            return value
+
+    @property
+    def version(self) -> int:
+        return self.get().version
+
+    # ------------------------------------------------------------
+    # 再読み込み
+    # ------------------------------------------------------------
+    def refresh(self, force: bool = False) -> ProfileSnapshot:
+        """ファイルが変わっていれば読み込み直す（内容が変わったときだけ版を上げて通知）"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            signatures = (_signature(self.config_path), _signature(self.character_path))
+            current = self._snapshot
+            if current is not None and not force and signatures == self._signatures:
+                return current
+
+            try:
+                new = self._load(current)
+            except Exception as e:
+                # 署名は更新しない（次の確認で読み込みを再試行する）
+                _reloads_total.inc(result="error")
+                logger.warning("⚠️ キャラクター設定の読み込みに失敗しました（前の版を使います）: %s", e)
+                if current is None:
+                    current = self._snapshot = self._empty_snapshot()
+                return current
+
+            self._signatures = signatures
+            if current is not None and new.digest == current.digest:
+                _reloads_total.inc(result="unchanged")
+                return current
+            # 完成したスナップショットを一度に差し替える
+            self._snapshot = new
+        _reloads_total.inc(result="loaded")
+        logger.info("✅ キャラクター設定を読み込みました (v%d, config=%s, character=%s)",
+                    new.version, new.config_loaded, new.character_loaded)
+        if current is not None:
+            self._notify(new)
+        return new
+
+    def _load(self, current: Optional[ProfileSnapshot]) -> ProfileSnapshot:
+        config_bytes = _read_bytes(self.config_path)
+        character_bytes = _read_bytes(self.character_path)
+
+        digest = hashlib.sha256()
+        for data in (config_bytes, character_bytes):
+            digest.update(b"\x00" if data is None else b"\x01" + data)
+        digest = digest.hexdigest()
+        if current is not None and digest == current.digest:
+            return current
+
+        config = json.loads(config_bytes.decode("utf-8")) if config_bytes is not None else {}
+        return ProfileSnapshot(
+            version=(current.version + 1) if current is not None else 1,
+            digest=digest,
+            config=freeze(config),
+            character_description=character_bytes.decode("utf-8") if character_bytes is not None else "",
+            config_path=self.config_path,
+            character_path=self.character_path,
+            config_loaded=config_bytes is not None,
+            character_loaded=character_bytes is not None,
+            loaded_at=time.time(),
+        )
+
+    def _empty_snapshot(self) -> ProfileSnapshot:
+        """一度も読み込めていないときの空の設定（版 0）"""
+        return ProfileSnapshot(version=0, digest="", config=FrozenDict(), character_description="",
+                               config_path=self.config_path, character_path=self.character_path)
+
+    # ------------------------------------------------------------
+    # 変更通知
+    # ------------------------------------------------------------
+    def subscribe(self, callback: Callable[[ProfileSnapshot], None]) -> Callable[[], None]:
+        """内容が変わったときに新しいスナップショットで呼ばれるコールバックを登録
+
+        バウンドメソッドは弱参照で保持する（購読したインスタンスの寿命は延ばさない）。
+        破棄済みインスタンスの分は登録のたびに取り除く（一時的なプロバイダーが
+        繰り返し購読しても、通知が来るまで溜まり続けない）。
+        戻り値を呼ぶと購読を解除する。
+        """
+        if hasattr(callback, "__self__") and hasattr(callback, "__func__"):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = lambda: callback  # noqa: E731
+        with self._subscribers_lock:
+            self._subscribers = [item for item in self._subscribers if item() is not None]
+            self._subscribers.append(ref)
+
+        def unsubscribe():
+            with self._subscribers_lock:
+                if ref in self._subscribers:
+                    self._subscribers.remove(ref)
+        return unsubscribe
+
+    def _notify(self, snapshot: ProfileSnapshot):
+        with self._subscribers_lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() is not None]
+            callbacks = [ref() for ref in self._subscribers]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.warning("⚠️ キャラクター設定の変更通知でエラー: %s", e)
+
+    # ------------------------------------------------------------
+    # ファイル監視（watchdog）
+    # ------------------------------------------------------------
+    def watch(self) -> bool:
+        """watchdog でファイルを監視し、変更イベントで再読み込みする（開始できたらTrue）"""
+        if not WATCHDOG_AVAILABLE:
+            return False
+        with self._lock:
+            if self._observer is not None:
+                return True
+            targets = {os.path.abspath(self.config_path), os.path.abspath(self.character_path)}
+            repository = self
+
+            class _Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    paths = {os.path.abspath(getattr(event, "src_path", "") or ""),
+                             os.path.abspath(getattr(event, "dest_path", "") or "")}
+                    if paths & targets:
+                        repository.refresh()
+
+            observer = Observer()
+            observer.daemon = True
+            for directory in {os.path.dirname(path) for path in targets}:
+                if os.path.isdir(directory):
+                    observer.schedule(_Handler(), directory, recursive=False)
+            observer.start()
+            self._observer = observer
+        logger.info("👀 キャラクター設定ファイルの監視を開始しました")
+        return True
+
+    def stop_watching(self):
+        with self._lock:
+            observer, self._observer = self._observer, None
+        if observer is not None:
+            observer.stop()
+            observer.join(timeout=2)
+
+    def get_status(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "digest": snapshot.digest[:12] if snapshot else None,
+            "config_loaded": snapshot.config_loaded if snapshot else False,
+            "character_loaded": snapshot.character_loaded if snapshot else False,
+            "watching": self._observer is not None,
+            "subscribers": len(self._subscribers),
+        }
+
+
+_repository: Optional[ProfileRepository] = None
+_repository_lock = threading.Lock()
+
+
+def get_profile_repository() -> ProfileRepository:
+    """プロセス共有のキャラクター設定リポジトリ"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = ProfileRepository()
+            if os.getenv("RURI_PROFILE_WATCH", "").lower() in ("1", "true", "yes"):
+                _repository.watch()
+        return _repository
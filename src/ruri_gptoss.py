@@ -27,8 +27,14 @@ except ImportError as e:
 # フォールバック用に既存クラスをインポート
 try:
     from .character_ai import RuriCharacter as FallbackRuriCharacter
+    from .ai_providers.context_window import ContextWindowManager, count_tokens, MESSAGE_OVERHEAD_TOKENS
+    from .ai_providers.ollama_lifecycle import get_model_manager
+    from .ai_providers.http_pool import get_http_pool
 except ImportError:
     from character_ai import RuriCharacter as FallbackRuriCharacter
+    from ai_providers.context_window import ContextWindowManager, count_tokens, MESSAGE_OVERHEAD_TOKENS
+    from ai_providers.ollama_lifecycle import get_model_manager
+    from ai_providers.http_pool import get_http_pool
 
 
 class RuriGPTOSS:
@@ -39,18 +45,22 @@ class RuriGPTOSS:
     より動的で自然な会話を実現。
     """
     
-    def __init__(self, model_name: str = "gpt-oss:20b", use_harmony: bool = True):
+    def __init__(self, model_name: str = "gpt-oss:20b", use_harmony: bool = True, keep_alive: Any = "30m"):
         """初期化
         
         Args:
             model_name: 使用するGPT-OSSモデル名 (デフォルト: gpt-oss:20b)
             use_harmony: harmony形式を使用するか (デフォルト: True)
+            keep_alive: モデルを常駐させる期間 (デフォルト: 30分)
         """
         self.model_name = model_name
         self.use_harmony = use_harmony
+        self.keep_alive = keep_alive
         self.emotions_learned = []
         self.current_color_stage = "monochrome"
         self.conversation_history = []
+        # 会話履歴はトークン予算で切り、溢れた分は要約してシステムメッセージに含める
+        self.context_window = ContextWindowManager()
         
         # GPT-OSSが利用可能かチェック
         self.gptoss_available = GPT_OSS_AVAILABLE
@@ -78,6 +88,16 @@ class RuriGPTOSS:
             "emotional_journey": "モノクロ→部分的色彩→虹色移行→フルカラー"
         }
     
+    OLLAMA_URL = "http://localhost:11434"
+    
+    def _client(self):
+        """既定のOllamaサーバーのクライアント（接続はプロバイダーと共有）"""
+        return get_http_pool().ollama_client(self.OLLAMA_URL)
+    
+    def _models(self):
+        """既定のOllamaサーバーのモデル管理（常駐状態・同時実行数はプロバイダーと共有）"""
+        return get_model_manager(self.OLLAMA_URL, self._client(), keep_alive=self.keep_alive)
+    
     def _check_ollama_connection(self) -> bool:
         """Ollamaサーバーの接続確認"""
         if not self.gptoss_available:
@@ -85,7 +105,7 @@ class RuriGPTOSS:
         
         try:
             # Ollamaサーバーが動作しているか確認
-            response = ollama.list()
+            response = self._client().list()
             
             # 必要なモデルがインストールされているか確認
             models = [model['name'] for model in response.get('models', [])]
@@ -98,12 +118,23 @@ class RuriGPTOSS:
             self.logger.error(f"Ollama接続エラー: {e}")
             return False
     
-    def get_system_prompt_content(self) -> SystemContent:
-        """戯曲『あいのいろ』設定を含むシステムプロンプトをHarmony形式で生成"""
+    def get_system_prompt_content(self, summary: str = None) -> SystemContent:
+        """戯曲『あいのいろ』設定を含むシステムプロンプトをHarmony形式で生成
+        
+        Args:
+            summary: トークン予算から溢れた古い会話の要約
+        """
         if not self.gptoss_available or not self.use_harmony:
             return None
         
-        base_instructions = f"""あなたは「ルリ」という名前のAITuberです。
+        instructions = self._system_instructions()
+        if summary:
+            instructions += f"\n\nこれまでの会話の要約:\n{summary}"
+        return SystemContent.new().with_instructions(instructions)
+    
+    def _system_instructions(self) -> str:
+        """システムプロンプトの本文"""
+        return f"""あなたは「ルリ」という名前のAITuberです。
 
 【原作背景・設定】
 - 出典: 自作戯曲『あいのいろ』(ozaki-taisuke 作)の主人公
@@ -134,30 +165,34 @@ class RuriGPTOSS:
 - AITuberとしての親しみやすさと原作の深みを両立する
 
 視聴者との交流を通じて、戯曲『あいのいろ』で描かれた感情の旅路を現代のデジタル空間で再現してください。"""
-
-        return SystemContent.new().with_instructions(base_instructions)
     
     def _create_harmony_conversation(self, user_message: str, emotion_context: Optional[str] = None) -> Conversation:
         """Harmony形式の会話オブジェクトを作成"""
         if not self.gptoss_available or not self.use_harmony:
             return None
         
-        # システムメッセージ
-        system_content = self.get_system_prompt_content()
-        system_message = Message.from_role_and_content(Role.SYSTEM, system_content)
-        
         # ユーザーメッセージ
+        user_text = user_message
+        if emotion_context:
+            user_text += f"\n\n感情的コンテキスト: {emotion_context}"
         user_content = UserContent.new().with_text(user_message)
         if emotion_context:
             user_content = user_content.with_text(f"\n\n感情的コンテキスト: {emotion_context}")
         
         user_message_obj = Message.from_role_and_content(Role.USER, user_content)
         
-        # 会話履歴も含める（最新5件まで）
+        # 会話履歴はトークン予算に収まる分だけ含める
+        fixed_tokens = (count_tokens(self._system_instructions()) + count_tokens(user_text)
+                        + 2 * MESSAGE_OVERHEAD_TOKENS)
+        history, _, summary = self.context_window.fit_history(self.conversation_history, fixed_tokens)
+        
+        # システムメッセージ（溢れた古い会話は要約として追記）
+        system_content = self.get_system_prompt_content(summary)
+        system_message = Message.from_role_and_content(Role.SYSTEM, system_content)
         messages = [system_message]
         
         # 過去の会話履歴を追加
-        for history_item in self.conversation_history[-5:]:
+        for history_item in history:
             if history_item['role'] == 'user':
                 hist_user_content = UserContent.new().with_text(history_item['content'])
                 messages.append(Message.from_role_and_content(Role.USER, hist_user_content))
@@ -192,32 +227,38 @@ class RuriGPTOSS:
                 
                 # OllamaでGPT-OSS推論（簡略化実装）
                 # 注意: 実際のハーモニー形式対応には更なる実装が必要
-                response = ollama.generate(
-                    model=self.model_name,
-                    prompt=user_input,  # 簡略化: 実際はハーモニー形式のトークンを使用
-                    system=self.get_system_prompt_content(),
-                    options={
-                        'temperature': 1.0,
-                        'top_p': 1.0,
-                        'max_tokens': 256
-                    }
-                )
+                with self._models().request(self.model_name) as slot:
+                    response = self._client().generate(
+                        model=self.model_name,
+                        prompt=user_input,  # 簡略化: 実際はハーモニー形式のトークンを使用
+                        system=self.get_system_prompt_content(),
+                        keep_alive=self.keep_alive,
+                        options={
+                            'temperature': 1.0,
+                            'top_p': 1.0,
+                            'max_tokens': 256
+                        }
+                    )
+                    slot.first_token()
             else:
                 # 通常のチャット形式
-                response = ollama.chat(
-                    model=self.model_name,
-                    messages=[
-                        {
-                            "role": "system", 
-                            "content": str(self.get_system_prompt_content()) if self.get_system_prompt_content() else ""
-                        },
-                        {"role": "user", "content": user_input}
-                    ],
-                    options={
-                        'temperature': 1.0,
-                        'top_p': 1.0,
-                    }
-                )
+                with self._models().request(self.model_name) as slot:
+                    response = self._client().chat(
+                        model=self.model_name,
+                        messages=[
+                            {
+                                "role": "system", 
+                                "content": str(self.get_system_prompt_content()) if self.get_system_prompt_content() else ""
+                            },
+                            {"role": "user", "content": user_input}
+                        ],
+                        keep_alive=self.keep_alive,
+                        options={
+                            'temperature': 1.0,
+                            'top_p': 1.0,
+                        }
+                    )
+                    slot.first_token()
             
             # 応答テキストを抽出
             if isinstance(response, dict):
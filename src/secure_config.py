@@ -1,12 +1,54 @@
 # 動的設定管理システム
+"""
+暗号化・ハッシュ化した設定ファイル（config/secure_settings.json）の管理
+
+- 読み込んだ設定と復号したAPIキーはメモリに保持し、ファイルの更新時刻・サイズが
+  変わったときだけ読み直す（毎回の復号をしない）
+- パスワード検証（bcrypt）は意図的に重いため、同時に実行する数を制限し、
+  失敗した検証は枠を持ったまま少し待つ（総当たりでCPUを使い切らせない）
+
+設定（settings）:
+    RURI_BCRYPT_CONCURRENCY    bcrypt 検証の同時実行数（既定: 2）
+    RURI_AUTH_WAIT_TIMEOUT     検証の枠を待つ最大秒数（既定: 5。超えたら THROTTLED を返す）
+    RURI_AUTH_FAILURE_DELAY    失敗時に枠を持ったまま待つ秒数（既定: 0.5）
+"""
 import streamlit as st
+import copy
 import hashlib
 import json
 import os
-from typing import Dict, Any, Optional
+import threading
+import time
+from enum import Enum
+from typing import Dict, Any, Optional, Tuple
 from cryptography.fernet import Fernet
 import bcrypt
 from src.unified_config import UnifiedConfig, UserLevel
+from src.settings import get_settings
+from src.session_token import get_session_signer
+from src.metrics import get_metrics
+
+_password_checks = get_metrics().counter(
+    "ruri_auth_password_checks_total", "パスワード検証（bcrypt）の回数", ("result",))
+_password_check_seconds = get_metrics().histogram(
+    "ruri_auth_password_check_seconds", "パスワード検証（bcrypt）にかかった時間（秒）", ())
+_config_loads = get_metrics().counter(
+    "ruri_secure_config_loads_total", "セキュア設定ファイルの読み込み・復号の回数", ())
+
+# bcrypt 検証の同時実行枠（プロセス共有）
+_bcrypt_slots = threading.BoundedSemaphore(max(1, get_settings().get_int("RURI_BCRYPT_CONCURRENCY", 2)))
+
+DECRYPT_ERROR = "***復号エラー***"
+
+
+class PasswordCheck(Enum):
+    """パスワード検証の結果（OK のときだけ真）"""
+    OK = "ok"
+    FAILED = "failed"          # パスワードが違う
+    THROTTLED = "throttled"    # 検証が混み合っていて枠を確保できなかった（未検証）
+
+    def __bool__(self) -> bool:
+        return self is PasswordCheck.OK
 
 class SecureConfigManager:
     """セキュアな設定管理システム"""
@@ -15,6 +57,14 @@ class SecureConfigManager:
         self.config_file = "config/secure_settings.json"
         self.encryption_key = self._get_or_create_encryption_key()
         self.cipher = Fernet(self.encryption_key)
+        settings = get_settings()
+        self.auth_wait_timeout = settings.get_float("RURI_AUTH_WAIT_TIMEOUT", 5.0)
+        self.auth_failure_delay = settings.get_float("RURI_AUTH_FAILURE_DELAY", 0.5)
+        # 読み込み済みの設定（ファイルの (mtime_ns, size) が変わるまで使う）
+        self._cache_lock = threading.Lock()
+        self._cache_stamp: Optional[Tuple[int, int]] = None
+        self._cached_config: Optional[Dict[str, Any]] = None
+        self._decrypted_keys: Dict[str, Optional[str]] = {}
         
     def _get_or_create_encryption_key(self) -> bytes:
         """暗号化キーの取得または生成"""
@@ -46,9 +96,23 @@ class SecureConfigManager:
         salt = bcrypt.gensalt()
         return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
     
-    def verify_password(self, password: str, hashed: str) -> bool:
-        """パスワードの検証"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    def verify_password(self, password: str, hashed: str) -> PasswordCheck:
+        """パスワードの検証（同時実行数を制限。枠が空かなければ THROTTLED）"""
+        if not _bcrypt_slots.acquire(timeout=self.auth_wait_timeout):
+            _password_checks.inc(result=PasswordCheck.THROTTLED.value)
+            return PasswordCheck.THROTTLED
+        try:
+            start = time.perf_counter()
+            ok = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+            _password_check_seconds.observe(time.perf_counter() - start)
+            result = PasswordCheck.OK if ok else PasswordCheck.FAILED
+            _password_checks.inc(result=result.value)
+            if not ok and self.auth_failure_delay > 0:
+                # 枠を持ったまま待ち、連続した失敗で bcrypt が回り続けないようにする
+                time.sleep(self.auth_failure_delay)
+            return result
+        finally:
+            _bcrypt_slots.release()
     
     def save_secure_config(self, config_data: Dict[str, Any]) -> bool:
         """セキュアな設定の保存"""
@@ -56,7 +120,8 @@ class SecureConfigManager:
             # パスワードをハッシュ化
             if 'passwords' in config_data:
                 for level, password in config_data['passwords'].items():
-                    if password:  # 空でない場合のみハッシュ化
+                    # 空でない場合のみハッシュ化（保存済みのハッシュはそのまま）
+                    if password and not password.startswith('$2'):
                         config_data['passwords'][level] = self.hash_password(password)
             
             # API キーを暗号化
@@ -67,38 +132,78 @@ class SecureConfigManager:
             
             # 設定ファイルに保存
             os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
+            try:
+                previous = self._read_config()
+            except Exception:
+                previous = None
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config_data, f, indent=2, ensure_ascii=False)
+            self.invalidate_cache()
+            
+            # パスワードが変わったら発行済みのセッショントークンを無効にする
+            old_passwords = (previous or {}).get('passwords', {})
+            if config_data.get('passwords', {}) != old_passwords:
+                get_session_signer().rotate()
             
             return True
         except Exception as e:
             st.error(f"設定保存エラー: {e}")
             return False
     
-    def load_secure_config(self) -> Dict[str, Any]:
-        """セキュアな設定の読み込み"""
-        if not os.path.exists(self.config_file):
-            return self._get_default_config()
+    def invalidate_cache(self):
+        """読み込み済みの設定を破棄（次の参照でファイルから読み直す）"""
+        with self._cache_lock:
+            self._cache_stamp = None
+            self._cached_config = None
+            self._decrypted_keys = {}
+    
+    def _read_config(self) -> Optional[Dict[str, Any]]:
+        """設定ファイルの内容（ファイルが更新されたときだけ読み込み・復号する。なければ None）
         
+        返す辞書は共有のキャッシュなので変更しないこと。
+        """
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            # API キーを復号化（表示用には部分的にマスク）
-            if 'api_keys' in config:
-                for key, value in config['api_keys'].items():
+            stat = os.stat(self.config_file)
+        except FileNotFoundError:
+            self.invalidate_cache()
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._cache_lock:
+            if stamp != self._cache_stamp:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                decrypted = {}
+                for key, value in config.get('api_keys', {}).items():
                     if value:
                         try:
-                            # 復号化してマスク表示用に変換
-                            decrypted = self.decrypt_data(value)
-                            config['api_keys'][key] = self._mask_api_key(decrypted)
-                        except:
-                            config['api_keys'][key] = "***復号エラー***"
-            
-            return config
+                            decrypted[key] = self.decrypt_data(value)
+                        except Exception:
+                            decrypted[key] = None
+                self._cached_config = config
+                self._decrypted_keys = decrypted
+                self._cache_stamp = stamp
+                _config_loads.inc()
+            return self._cached_config
+    
+    def load_secure_config(self) -> Dict[str, Any]:
+        """セキュアな設定の読み込み"""
+        try:
+            cached = self._read_config()
         except Exception as e:
             st.error(f"設定読み込みエラー: {e}")
             return self._get_default_config()
+        if cached is None:
+            return self._get_default_config()
+        
+        config = copy.deepcopy(cached)
+        # API キーは復号済みの値からマスク表示用に変換
+        with self._cache_lock:
+            decrypted_keys = dict(self._decrypted_keys)
+        for key, value in config.get('api_keys', {}).items():
+            if value:
+                decrypted = decrypted_keys.get(key)
+                config['api_keys'][key] = self._mask_api_key(decrypted) if decrypted is not None else DECRYPT_ERROR
+        return config
     
     def _mask_api_key(self, api_key: str) -> str:
         """APIキーのマスク表示"""
@@ -133,25 +238,19 @@ class SecureConfigManager:
     def get_raw_password(self, level: str) -> str:
         """生パスワードの取得（認証用）"""
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                return config.get('passwords', {}).get(level, '')
-            return ''
-        except:
+            config = self._read_config()
+            return config.get('passwords', {}).get(level, '') if config else ''
+        except Exception:
             return ''
     
     def get_raw_api_key(self, key_name: str) -> str:
         """生APIキーの取得（実際の利用用）"""
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                encrypted_key = config.get('api_keys', {}).get(key_name, '')
-                if encrypted_key:
-                    return self.decrypt_data(encrypted_key)
-            return ''
-        except:
+            if self._read_config() is None:
+                return ''
+            with self._cache_lock:
+                return self._decrypted_keys.get(key_name) or ''
+        except Exception:
             return ''
 
 def show_admin_settings_ui():
@@ -162,7 +261,7 @@ def show_admin_settings_ui():
     # セキュリティ警告
     st.warning("⚠️ **管理者専用**: この画面では機密情報を変更できます。設定後は即座にシステム全体に反映されます。")
     
-    config_manager = SecureConfigManager()
+    config_manager = get_config_manager()
     current_config = config_manager.load_secure_config()
     
     # タブ分割
@@ -345,10 +444,12 @@ def show_admin_settings_ui():
 
 # グローバル設定管理インスタンス
 _config_manager = None
+_config_manager_lock = threading.Lock()
 
 def get_config_manager() -> SecureConfigManager:
     """設定管理インスタンスを取得"""
     global _config_manager
-    if _config_manager is None:
-        _config_manager = SecureConfigManager()
-    return _config_manager
\ No newline at end of file
+    with _config_manager_lock:
+        if _config_manager is None:
+            _config_manager = SecureConfigManager()
+        return _config_manager
\ No newline at end of file
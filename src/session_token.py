@@ -0,0 +1,118 @@
+"""
+署名つきセッショントークン（認証済みセッションの確認用）
+
+ログイン成功時にだけパスワード（bcrypt）を検証し、以降の再実行・ページ切り替えでは
+セッションに保存したトークンの HMAC を確かめる（マイクロ秒単位で、bcrypt・Fernet を使わない）。
+
+トークンの形式: base64url(JSON: lvl / iat / exp / sid) + "." + HMAC-SHA256(16進)
+
+設定（settings）:
+    RURI_SESSION_SECRET  署名鍵（未設定ならプロセスごとの乱数。再起動でトークンは無効になる）
+    RURI_SESSION_TTL     トークンの有効期間（秒、既定: 43200 = 12時間）
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    from .metrics import get_metrics
+    from .settings import get_settings
+except ImportError:
+    from metrics import get_metrics
+    from settings import get_settings
+
+_token_checks = get_metrics().counter(
+    "ruri_auth_token_checks_total", "セッショントークンの確認回数", ("result",))
+
+DEFAULT_TTL_SECONDS = 12 * 60 * 60
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionTokenSigner:
+    """セッショントークンの発行と検証"""
+
+    def __init__(self, secret: bytes = None, ttl_seconds: float = None, clock=time.time):
+        """
+        Args:
+            secret: 署名鍵（既定: 設定の RURI_SESSION_SECRET、なければ乱数）
+            ttl_seconds: 有効期間（既定: 設定の RURI_SESSION_TTL または 12時間）
+            clock: 時計（テスト用）
+        """
+        settings = get_settings()
+        if secret is None:
+            configured = settings.get_secret("RURI_SESSION_SECRET")
+            secret = configured.encode("utf-8") if configured else secrets.token_bytes(32)
+        if ttl_seconds is None:
+            ttl_seconds = settings.get_float("RURI_SESSION_TTL", DEFAULT_TTL_SECONDS)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._base_secret = secret
+        self._generation = 0
+        self._key = self._derive_key()
+
+    def _derive_key(self) -> bytes:
+        return hashlib.sha256(self._base_secret + str(self._generation).encode("ascii")).digest()
+
+    def _sign(self, body: str) -> str:
+        return hmac.new(self._key, body.encode("ascii"), hashlib.sha256).hexdigest()
+
+    def issue(self, level: str, ttl_seconds: float = None) -> str:
+        """認証レベルを記したトークンを発行"""
+        now = self._clock()
+        payload = {
+            "lvl": level,
+            "iat": int(now),
+            "exp": int(now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)),
+            "sid": secrets.token_hex(8),
+        }
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        return f"{body}.{self._sign(body)}"
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """署名と有効期限を確かめて中身を返す（無効なら None）"""
+        try:
+            body, signature = token.rsplit(".", 1)
+            if not hmac.compare_digest(self._sign(body), signature):
+                _token_checks.inc(result="invalid")
+                return None
+            payload = json.loads(_b64decode(body))
+        except (AttributeError, ValueError, UnicodeError):
+            _token_checks.inc(result="invalid")
+            return None
+        if payload.get("exp", 0) <= self._clock():
+            _token_checks.inc(result="expired")
+            return None
+        _token_checks.inc(result="ok")
+        return payload
+
+    def rotate(self):
+        """発行済みのトークンをすべて無効にする（パスワード変更時など）"""
+        with self._lock:
+            self._generation += 1
+            self._key = self._derive_key()
+
+
+_signer: Optional[SessionTokenSigner] = None
+_signer_lock = threading.Lock()
+
+
+def get_session_signer() -> SessionTokenSigner:
+    """プロセス共有の署名器"""
+    global _signer
+    with _signer_lock:
+        if _signer is None:
+            _signer = SessionTokenSigner()
+        return _signer
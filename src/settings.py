@@ -0,0 +1,277 @@
+"""
+アプリケーション設定の読み込み（環境変数・.env・Streamlit secrets）
+
+.env と Streamlit secrets を読むのはこのモジュールだけ。プロセスで一度だけ読み込んで
+不変のスナップショット（Settings）を作り、以降の参照は辞書引きだけになる。
+.env の書き換え後やテストでは reload_settings() で明示的に読み直す。
+
+- 優先順位: 環境変数 > .env > Streamlit secrets（プレースホルダー値は未設定として扱う）
+- .env の値は既存の環境変数を上書きせずに os.environ へも反映する
+  （os.getenv で読む RURI_* 等の調整用の値も .env に書けるように）
+- secrets は os.environ へコピーしない（スナップショットからだけ参照する）
+
+    from settings import get_settings
+    settings = get_settings()
+    settings.api_key("openai")
+    settings.get_int("AI_MAX_TOKENS", 500)
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# プロバイダー名 -> APIキーの設定名（先に見つかったものを使う）
+API_KEY_NAMES: Dict[str, Tuple[str, ...]] = {
+    "openai": ("OPENAI_API_KEY",),
+    "anthropic": ("ANTHROPIC_API_KEY",),
+    "google": ("GOOGLE_API_KEY",),
+    "gemini": ("GOOGLE_API_KEY",),
+    "huggingface": ("HUGGINGFACE_API_TOKEN", "HUGGINGFACE_API_KEY"),
+    "cohere": ("COHERE_API_KEY",),
+    "azure": ("AZURE_OPENAI_API_KEY",),
+    "azure_openai": ("AZURE_OPENAI_API_KEY",),
+}
+
+# 設定例のまま残っている値（未設定として扱う）
+PLACEHOLDER_VALUES = frozenset({"YOUR_API_KEY_HERE", "YOUR_OPENAI_API_KEY_HERE", "your_api_key_here"})
+
+DEFAULT_OLLAMA_BASE_URL = "http://localhost:11434"
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """ある時点の設定値（不変）"""
+    values: Mapping[str, str]
+    sources: Mapping[str, str] = field(default_factory=dict)  # 設定名 -> "env" / "dotenv" / "secrets"
+    dotenv_files: Tuple[str, ...] = ()
+    secrets_loaded: bool = False
+    loaded_at: float = 0.0
+
+    # ------------------------------------------------------------
+    # 型つきの取得
+    # ------------------------------------------------------------
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.values.get(name)
+        return default if value is None or value == "" else value
+
+    def get_bool(self, name: str, default: bool = False) -> bool:
+        value = self.get(name)
+        return default if value is None else value.strip().lower() in _TRUE_VALUES
+
+    def get_int(self, name: str, default: int) -> int:
+        try:
+            return int(self.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, name: str, default: float) -> float:
+        try:
+            return float(self.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_list(self, name: str, default: str = "") -> List[str]:
+        """カンマ区切りの値（空要素は除く）"""
+        return [item.strip() for item in self.get(name, default).split(",") if item.strip()]
+
+    def get_secret(self, name: str) -> str:
+        """秘密情報（プレースホルダー値は空文字）"""
+        value = self.get(name, "")
+        return "" if value in PLACEHOLDER_VALUES else value
+
+    def source_of(self, name: str) -> Optional[str]:
+        return self.sources.get(name)
+
+    # ------------------------------------------------------------
+    # アプリケーション設定
+    # ------------------------------------------------------------
+    @property
+    def environment(self) -> str:
+        return self.get("ENVIRONMENT", "development")
+
+    @property
+    def debug(self) -> bool:
+        return self.get_bool("DEBUG")
+
+    @property
+    def is_production(self) -> bool:
+        return self.environment == "production"
+
+    def api_key(self, provider: str) -> str:
+        """プロバイダーのAPIキー（未設定・プレースホルダーなら空文字）"""
+        for name in API_KEY_NAMES.get(provider.lower(), ()):
+            value = self.get_secret(name)
+            if value:
+                return value
+        return ""
+
+    def has_api_key(self, provider: str) -> bool:
+        return bool(self.api_key(provider))
+
+    @property
+    def openai_api_key(self) -> str:
+        return self.api_key("openai")
+
+    @property
+    def openai_base_url(self) -> Optional[str]:
+        return self.get("OPENAI_BASE_URL")
+
+    @property
+    def ollama_base_url(self) -> str:
+        return self.get("OLLAMA_BASE_URL", DEFAULT_OLLAMA_BASE_URL)
+
+    @property
+    def azure_endpoint(self) -> str:
+        return self.get("AZURE_OPENAI_ENDPOINT", "")
+
+    @property
+    def owner_username(self) -> str:
+        return self.get_secret("OWNER_USERNAME")
+
+    @property
+    def owner_password(self) -> str:
+        return self.get_secret("OWNER_PASSWORD")
+
+    @property
+    def database_url(self) -> str:
+        return self.get("DATABASE_URL", "")
+
+    def describe(self) -> Dict[str, Any]:
+        """値を含まない読み込み状況（デバッグ表示用）"""
+        return {
+            "dotenv_files": list(self.dotenv_files),
+            "secrets_loaded": self.secrets_loaded,
+            "api_keys": {provider: self.has_api_key(provider)
+                         for provider in ("openai", "anthropic", "google", "huggingface", "cohere", "azure")},
+            "environment": self.environment,
+            "loaded_at": self.loaded_at,
+        }
+
+
+# ------------------------------------------------------------
+# 読み込み
+# ------------------------------------------------------------
+def _parse_dotenv(path: Path) -> Dict[str, str]:
+    """.env の KEY=VALUE 行を読む（python-dotenv があればそのパーサーを使う）"""
+    try:
+        from dotenv import dotenv_values
+        return {key: value for key, value in dotenv_values(path).items() if value is not None}
+    except ImportError:
+        pass
+
+    values = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("export "):
+                line = line[len("export "):]
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                key = key.strip()
+                if key:
+                    values[key] = value.strip().strip('"').strip("'")
+    return values
+
+
+def _dotenv_paths() -> List[Path]:
+    paths = [PROJECT_ROOT / ".env", Path.cwd() / ".env"]
+    unique = []
+    for path in paths:
+        if path.is_file() and path.resolve() not in [p.resolve() for p in unique]:
+            unique.append(path)
+    return unique
+
+
+def _load_secrets() -> Dict[str, str]:
+    """Streamlit secrets のトップレベルの値（secrets.toml がなければ空）"""
+    try:
+        import streamlit as st
+        return {key: str(value) for key, value in st.secrets.items() if not isinstance(value, Mapping)}
+    except Exception:
+        return {}
+
+
+def _get_logger():
+    try:
+        from .log_config import get_logger
+    except ImportError:
+        from log_config import get_logger
+    return get_logger(__name__)
+
+
+# .env から os.environ へ反映した値（再読み込み時に更新してよいもの）
+_applied_from_dotenv: Dict[str, str] = {}
+
+
+def load_settings(use_secrets: bool = True) -> Settings:
+    """環境変数・.env・Streamlit secrets から新しいスナップショットを作る"""
+    dotenv_files = _dotenv_paths()
+    dotenv: Dict[str, str] = {}
+    for path in dotenv_files:
+        try:
+            for key, value in _parse_dotenv(path).items():
+                dotenv.setdefault(key, value)  # 先に読んだファイルを優先
+        except Exception as e:
+            # ロギングは .env の RURI_LOG_* を反映してから設定したいので、ロガーはここで取得する
+            _get_logger().warning("⚠️ .env ファイル読み込みエラー (%s): %s", path, e)
+
+    # .env の値を os.environ へ（既存の環境変数は上書きしない。.env から消えた値は戻す）
+    for key in [key for key in _applied_from_dotenv if key not in dotenv]:
+        if os.environ.get(key) == _applied_from_dotenv.pop(key):
+            del os.environ[key]
+    for key, value in dotenv.items():
+        if key not in os.environ or os.environ[key] == _applied_from_dotenv.get(key):
+            os.environ[key] = value
+            _applied_from_dotenv[key] = value
+
+    secrets = _load_secrets() if use_secrets else {}
+
+    values: Dict[str, str] = {}
+    sources: Dict[str, str] = {}
+    for source, mapping in (("secrets", secrets), ("dotenv", dotenv),
+                            ("env", {k: v for k, v in os.environ.items()
+                                     if _applied_from_dotenv.get(k) != v})):
+        for key, value in mapping.items():
+            if value in PLACEHOLDER_VALUES and values.get(key):
+                continue  # プレースホルダーで下位の実値を隠さない
+            values[key] = value
+            sources[key] = source
+
+    return Settings(
+        values=MappingProxyType(values),
+        sources=MappingProxyType(sources),
+        dotenv_files=tuple(str(path) for path in dotenv_files),
+        secrets_loaded=bool(secrets),
+        loaded_at=time.time(),
+    )
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """プロセス共有の設定スナップショット（初回だけ読み込む）"""
+    global _settings
+    settings = _settings
+    if settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_settings()
+            settings = _settings
+    return settings
+
+
+def reload_settings() -> Settings:
+    """設定を読み直してスナップショットを差し替える"""
+    global _settings
+    new = load_settings()
+    with _settings_lock:
+        _settings = new
+    return new
@@ -4,10 +4,19 @@ import json
 import websocket
 import threading
 import time
-from typing import Dict, Any, List
+from concurrent.futures import Future
+from typing import Dict, Any, List, Union
 import requests
 from src.character_ai import RuriCharacter
 from src.image_analyzer import RuriImageAnalyzer
+from src.metrics import get_metrics
+from src.emotion_vector import EmotionVector
+from src.emotion_color import EmotionColors, get_color_engine
+from src.emotion_system import get_emotion_system
+
+_sends_total = get_metrics().counter(
+    "ruri_streaming_sends_total", "Live2D・OBSへの送信数", ("target", "action", "result"))
+_viewer_comments_total = get_metrics().counter("ruri_viewer_comments_total", "受け付けた視聴者コメント数")
 
 class Live2DController:
     """Live2D Cubism連携コントローラー"""
@@ -18,6 +27,7 @@ class Live2DController:
         self.ruri = RuriCharacter()
         self.current_emotion = "neutral"
         self.color_data = {}
+        self.current_colors = None  # 最後に送った色（同じ色なら送り直さない）
         
     def connect_live2d(self):
         """Live2D Cubism SDKへのWebSocket接続"""
@@ -45,43 +55,45 @@ class Live2DController:
     def on_close(self, ws, close_status_code, close_msg):
         print("Live2D接続終了")
     
-    def update_emotion_colors(self, emotion: str, intensity: float = 1.0):
-        """感情に応じた色変更をLive2Dに送信"""
-        color_mapping = {
-            "joy": {"r": 255, "g": 255, "b": 0, "a": intensity},      # 黄色
-            "anger": {"r": 255, "g": 0, "b": 0, "a": intensity},      # 赤色
-            "sadness": {"r": 0, "g": 0, "b": 255, "a": intensity},    # 青色
-            "love": {"r": 255, "g": 192, "b": 203, "a": intensity},   # ピンク
-            "neutral": {"r": 128, "g": 128, "b": 128, "a": 0.5}       # グレー
-        }
+    def update_emotion_colors(self, emotion: Union[str, EmotionVector], intensity: float = 1.0,
+                              growth_level: float = 1.0):
+        """感情に応じた色変更をLive2Dに送信
         
-        if emotion in color_mapping:
-            color = color_mapping[emotion]
-            command = {
-                "command": "setParameterValue",
-                "parameterId": "ParamHairColorR",
-                "value": color["r"] / 255.0
-            }
-            self.send_to_live2d(command)
-            
-            command = {
-                "command": "setParameterValue", 
-                "parameterId": "ParamHairColorG",
-                "value": color["g"] / 255.0
-            }
-            self.send_to_live2d(command)
-            
-            command = {
+        Args:
+            emotion: 感情名（"neutral" ならモノクロ）または感情ベクトル
+            intensity: 感情名で指定したときの強度
+            growth_level: 成長度合い（色の濃さ）
+        """
+        if isinstance(emotion, str):
+            self.current_emotion = emotion
+            emotion = EmotionVector.from_names([emotion], intensity)
+        self.apply_colors(get_color_engine().compute(emotion, growth_level))
+    
+    def apply_colors(self, colors: EmotionColors):
+        """色彩エンジンの結果を髪色パラメータとして送信"""
+        if colors is self.current_colors:
+            return
+        for parameter_id, value in zip(("ParamHairColorR", "ParamHairColorG", "ParamHairColorB"),
+                                       colors.live2d_rgb):
+            self.send_to_live2d({
                 "command": "setParameterValue",
-                "parameterId": "ParamHairColorB", 
-                "value": color["b"] / 255.0
-            }
-            self.send_to_live2d(command)
+                "parameterId": parameter_id,
+                "value": value
+            })
+        self.current_colors = colors
+        self.color_data = {"accent": colors.accent, "alpha": colors.live2d_alpha, "dominant": colors.dominant}
     
     def send_to_live2d(self, command: Dict[str, Any]):
         """Live2Dにコマンド送信"""
-        if self.ws:
+        if not self.ws:
+            _sends_total.inc(target="live2d", action="parameter", result="skipped")
+            return
+        try:
             self.ws.send(json.dumps(command))
+            _sends_total.inc(target="live2d", action="parameter", result="ok")
+        except Exception:
+            _sends_total.inc(target="live2d", action="parameter", result="error")
+            raise
 
 class OBSController:
     """OBS Studio WebSocket連携コントローラー"""
@@ -119,43 +131,54 @@ class OBSController:
         if emotion in scene_mapping:
             try:
                 self.ws.call(obs_requests.SetCurrentScene(scene_mapping[emotion]))
+                _sends_total.inc(target="obs", action="scene", result="ok")
                 print(f"OBSシーンを{scene_mapping[emotion]}に変更")
             except Exception as e:
+                _sends_total.inc(target="obs", action="scene", result="error")
                 print(f"OBSシーン変更エラー: {e}")
     
-    def update_filter_colors(self, emotion: str):
+    def update_filter_colors(self, emotion: Union[str, EmotionVector], growth_level: float = 1.0):
         """感情に応じてカラーフィルターを調整"""
-        filter_settings = {
-            "joy": {"hue_shift": 60, "saturation": 1.5, "brightness": 1.2},
-            "anger": {"hue_shift": 0, "saturation": 2.0, "brightness": 1.0},
-            "sadness": {"hue_shift": 240, "saturation": 0.8, "brightness": 0.8},
-            "love": {"hue_shift": 300, "saturation": 1.3, "brightness": 1.1},
-            "neutral": {"hue_shift": 0, "saturation": 1.0, "brightness": 1.0}
-        }
-        
-        if emotion in filter_settings:
-            settings = filter_settings[emotion]
-            try:
-                # カラーフィルターの設定を更新
-                filter_data = {
-                    "sourceName": "ルリカメラ",
-                    "filterName": "感情カラーフィルター",
-                    "filterSettings": settings
-                }
-                self.ws.call(obs_requests.SetSourceFilterSettings(**filter_data))
-                print(f"カラーフィルターを{emotion}用に設定")
-            except Exception as e:
-                print(f"フィルター設定エラー: {e}")
+        label = emotion if isinstance(emotion, str) else "感情ベクトル"
+        self.apply_filter(get_color_engine().compute(emotion, growth_level), label)
+    
+    def apply_filter(self, colors: EmotionColors, label: str = ""):
+        """色彩エンジンの結果をカラーフィルターに設定"""
+        try:
+            # カラーフィルターの設定を更新
+            filter_data = {
+                "sourceName": "ルリカメラ",
+                "filterName": "感情カラーフィルター",
+                "filterSettings": colors.obs_filter_settings()
+            }
+            self.ws.call(obs_requests.SetSourceFilterSettings(**filter_data))
+            _sends_total.inc(target="obs", action="filter", result="ok")
+            print(f"カラーフィルターを{label or colors.dominant or 'neutral'}用に設定")
+        except Exception as e:
+            _sends_total.inc(target="obs", action="filter", result="error")
+            print(f"フィルター設定エラー: {e}")
 
 class StreamingIntegration:
     """配信統合システム"""
     
-    def __init__(self):
+    def __init__(self, batch_options: Dict[str, Any] = None):
+        """
+        Args:
+            batch_options: コメントのマイクロバッチ設定（CommentMicroBatcherへの引数）
+        """
         self.ruri = RuriCharacter()
         self.live2d = Live2DController()
         self.obs = OBSController()
         self.image_analyzer = RuriImageAnalyzer("assets/ruri_imageboard.png")
         self.is_streaming = False
+        # 色はチャット画面と同じ感情システム（学習状態・成長度合い）から決める
+        self.emotion_system = get_emotion_system()
+        self.current_colors = None
+        self._heartbeat = None  # (モデル管理, 自分が延長を頼んだモデル名)
+        # 視聴者コメントはまとめて1回のLLM呼び出しで返答する
+        self.comment_batcher = self.ruri.create_comment_batcher(
+            on_reply=self._apply_reply_to_systems, **(batch_options or {})
+        )
         
     def start_streaming_mode(self):
         """配信モード開始"""
@@ -174,27 +197,72 @@ class StreamingIntegration:
         colors = self.image_analyzer.analyze_colors()
         print(f"イメージボード分析完了: {len(colors)}色を検出")
         
+        self.comment_batcher.start()
+        self._start_model_heartbeat()
         self.is_streaming = True
+    
+    def stop_streaming_mode(self):
+        """配信モード終了（バッチ待ちのコメントは返答してから止める）"""
+        self.comment_batcher.stop()
+        if self._heartbeat is not None:
+            # モデル管理はサーバー単位で共有されるので、自分が始めた分だけ止める
+            models, names = self._heartbeat
+            self._heartbeat = None
+            models.stop_heartbeat(names)
+        self.is_streaming = False
+    
+    def _start_model_heartbeat(self):
+        """配信中はローカルモデルがアンロードされないようハートビートを送る"""
+        provider = self.ruri.ai_provider
+        models = getattr(provider, "models", None)
+        if models is not None and self._heartbeat is None:
+            names = [provider.model_name]
+            models.start_heartbeat(names)
+            self._heartbeat = (models, names)
+    
+    def submit_viewer_comment(self, comment: str, emotion: str = None, author: str = "") -> Future:
+        """視聴者コメントをバッチに投入（結果はFutureで受け取る）"""
+        _viewer_comments_total.inc()
+        return self.comment_batcher.submit(comment, author=author, emotion=emotion)
         
-    def process_viewer_comment(self, comment: str, emotion: str):
-        """視聴者コメントを処理して各システムに反映"""
-        # ルリの感情学習
-        response = self.ruri.learn_emotion(emotion, comment)
-        
-        # Live2Dに色変更を送信
-        self.live2d.update_emotion_colors(emotion)
+    def process_viewer_comment(self, comment: str, emotion: str, timeout: float = 30.0):
+        """視聴者コメントを処理して各システムに反映
         
-        # OBSのシーン・フィルター更新
-        self.obs.update_scene_by_emotion(emotion)
-        self.obs.update_filter_colors(emotion)
+        同時に届いたコメントはマイクロバッチでまとめて返答される。
+        """
+        result = self.submit_viewer_comment(comment, emotion).result(timeout)
         
         return {
-            "ruri_response": response,
-            "emotion": emotion,
-            "color_stage": self.ruri.current_color_stage,
-            "systems_updated": ["Live2D", "OBS"]
+            "ruri_response": result["reply"],
+            "emotion": result["emotion"] or emotion,
+            "color_stage": self.ruri.get_color_stage_info().get("stage"),
+            "systems_updated": ["Live2D", "OBS"] if result["answered"] else [],
+            "batch_size": result["batch_size"]
         }
     
+    def _apply_reply_to_systems(self, result: Dict[str, Any]):
+        """返答の感情をLive2D・OBSへ反映"""
+        emotion = result.get("emotion")
+        reply = result.get("reply") or ""
+        if not emotion and not reply:
+            return
+        
+        # 画面の吹き出しと同じ計算（返答の感情ベクトル + 学習済みの成長度合い）で色を1つ決め、全体で共有する
+        colors = self.emotion_system.get_reply_colors(reply, emotion)
+        self.current_colors = colors
+        
+        # Live2Dに色変更を送信
+        self.live2d.apply_colors(colors)
+        
+        # OBSのシーン・フィルター更新
+        if emotion:
+            self.obs.update_scene_by_emotion(emotion)
+        self.obs.apply_filter(colors, emotion or "")
+    
+    def get_batching_stats(self) -> Dict[str, Any]:
+        """コメント処理のスループット統計"""
+        return self.comment_batcher.get_stats()
+    
     def create_obs_scene_preset(self):
         """OBS用シーンプリセットを生成"""
         emotions = ["joy", "anger", "sadness", "love", "neutral"]
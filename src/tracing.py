@@ -0,0 +1,302 @@
+"""
+チャットパイプラインのリクエスト単位レイテンシトレース
+
+contextvars で親子関係を伝播する軽量なスパン計測。
+- 無効時は共有のno-opスパンを返すだけなので、計測箇所のオーバーヘッドはほぼゼロ
+- 時刻は単調増加クロック（perf_counter_ns）で計測
+- 出力先はプロセス内リングバッファ（分析ページ用）とローカルJSONLファイル
+
+使い方:
+    from tracing import get_tracer
+    tracer = get_tracer()
+    with tracer.span("emotion.detect", length=len(message)):
+        ...
+
+環境変数 RURI_TRACING=1 で起動時に有効化、RURI_TRACE_FILE でJSONLの出力先を指定する。
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from .log_config import get_logger
+except ImportError:
+    from log_config import get_logger
+
+logger = get_logger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("ruri_current_span", default=None)
+
+
+class Span:
+    """1区間の計測（with文で使う）"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """トレース無効時のスパン（何もしない）"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class RingBufferSink:
+    """直近のスパンをメモリに保持（分析ページでの集計用）"""
+
+    def __init__(self, capacity: int = 5000):
+        self._spans: deque = deque(maxlen=capacity)
+
+    def emit(self, record: Dict[str, Any]):
+        self._spans.append(record)
+
+    def get_spans(self) -> List[Dict[str, Any]]:
+        return list(self._spans)
+
+    def clear(self):
+        self._spans.clear()
+
+
+class JSONLSink:
+    """スパンをJSON Lines形式でファイルに追記"""
+
+    def __init__(self, path: str, flush_every: int = 50):
+        self.path = path
+        self.flush_every = flush_every
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            # ルートスパン（リクエスト完了）か一定件数ごとに書き出す
+            if record["parent_id"] is None or len(self._buffer) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(self._buffer) + "\n")
+        except Exception as e:
+            logger.warning("⚠️ トレース書き込みエラー: %s", e)
+        self._buffer.clear()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+
+class Tracer:
+    """スパンの生成と出力先への配送"""
+
+    def __init__(self, enabled: bool = False, ring_capacity: int = 5000, jsonl_path: Optional[str] = None):
+        self.enabled = enabled
+        self.ring = RingBufferSink(ring_capacity)
+        self.sinks: List[Any] = [self.ring]
+        self.jsonl: Optional[JSONLSink] = None
+        if jsonl_path:
+            self.set_jsonl_path(jsonl_path)
+
+    # ------------------------------------------------------------
+    # 設定
+    # ------------------------------------------------------------
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self.jsonl is not None:
+            self.jsonl.flush()
+
+    def set_jsonl_path(self, path: Optional[str]):
+        """JSONL出力先の変更（Noneで無効化）"""
+        if self.jsonl is not None:
+            self.jsonl.flush()
+            self.sinks.remove(self.jsonl)
+            self.jsonl = None
+        if path:
+            self.jsonl = JSONLSink(path)
+            self.sinks.append(self.jsonl)
+
+    # ------------------------------------------------------------
+    # 計測
+    # ------------------------------------------------------------
+    def span(self, name: str, **attributes):
+        """スパンを開始（無効時は共有のno-opスパン）"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def traced(self, name: str = None):
+        """関数全体をスパンで囲むデコレーター（同期・非同期対応）"""
+        def decorator(func: Callable):
+            span_name = name or func.__qualname__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    with Span(self, span_name, {}):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, span_name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    def _finish(self, span: Span):
+        record = span.to_dict()
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                logger.warning("⚠️ トレース出力エラー: %s", e)
+
+    # ------------------------------------------------------------
+    # 集計
+    # ------------------------------------------------------------
+    def get_stage_breakdown(self, root_name: str = None) -> List[Dict[str, Any]]:
+        """スパン名ごとの件数・平均・分位点（ミリ秒）
+
+        Args:
+            root_name: 指定したルートスパンのトレースに限定
+        """
+        spans = self.ring.get_spans()
+        if root_name:
+            traces = {span["trace_id"] for span in spans if span["parent_id"] is None and span["name"] == root_name}
+            spans = [span for span in spans if span["trace_id"] in traces]
+
+        durations: Dict[str, List[float]] = {}
+        for span in spans:
+            durations.setdefault(span["name"], []).append(span["duration_ms"])
+
+        def pct(ordered: List[float], p: float) -> float:
+            rank = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+            return round(ordered[rank], 3)
+
+        rows = []
+        for name, values in durations.items():
+            ordered = sorted(values)
+            rows.append({
+                "stage": name,
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered), 3),
+                "p50_ms": pct(ordered, 50),
+                "p95_ms": pct(ordered, 95),
+                "p99_ms": pct(ordered, 99),
+                "max_ms": round(ordered[-1], 3),
+            })
+        rows.sort(key=lambda row: row["mean_ms"], reverse=True)
+        return rows
+
+    def get_recent_traces(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """直近のトレース（ルートスパンとその子スパン）"""
+        spans = self.ring.get_spans()
+        roots = [span for span in spans if span["parent_id"] is None][-limit:]
+        by_trace: Dict[str, List[Dict[str, Any]]] = {}
+        for span in spans:
+            by_trace.setdefault(span["trace_id"], []).append(span)
+        return [
+            {
+                "trace_id": root["trace_id"],
+                "name": root["name"],
+                "duration_ms": root["duration_ms"],
+                "spans": sorted(by_trace.get(root["trace_id"], []), key=lambda span: span["start_ns"]),
+            }
+            for root in roots
+        ]
+
+    def clear(self):
+        self.ring.clear()
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """プロセス共通のトレーサー（環境変数で初期設定）"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                enabled = os.getenv("RURI_TRACING", "").lower() in ("1", "true", "yes", "on")
+                _tracer = Tracer(enabled=enabled, jsonl_path=os.getenv("RURI_TRACE_FILE") or None)
+    return _tracer
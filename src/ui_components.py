@@ -8,29 +8,253 @@
 - レスポンシブデザイン対応
 - 感情学習による色彩変化システム
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Callable, Optional, List
+import html
+import os
+import statistics
 import streamlit as st
 import time
 
+try:
+    from .tracing import get_tracer
+    from .log_config import get_logger
+    from .metrics import get_metrics
+except ImportError:
+    from tracing import get_tracer
+    from log_config import get_logger
+    from metrics import get_metrics
+
 try:
     from src.chat_manager import get_chat_manager, get_ai_generator, handle_chat_message, ChatMessage
-    from src.emotion_system import EmotionSystem, EmotionType, ColorStage
+    from src.emotion_system import EmotionSystem, EmotionType, ColorStage, get_emotion_system
     EMOTION_SYSTEM_AVAILABLE = True
 except ImportError:
     EMOTION_SYSTEM_AVAILABLE = False
     print("⚠️ 感情システムまたはチャットマネージャーが利用できません")
 
+_tracer = get_tracer()
+logger = get_logger(__name__)
+_first_visible_seconds = get_metrics().histogram(
+    "ruri_chat_first_visible_seconds", "送信から応答の最初の文字が表示されるまでの秒数",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0))
+_rerun_seconds = get_metrics().histogram(
+    "ruri_chat_rerun_seconds", "メッセージ送信1回あたりのサーバー処理時間（秒・再実行方式別）", ("mode",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0))
+_rerun_overhead_seconds = get_metrics().histogram(
+    "ruri_chat_rerun_overhead_seconds", "送信1回あたりの再実行コスト（応答生成を除く・秒）", ("mode",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+# st.fragment（Streamlit 1.37以降）が使えればチャット領域だけを再実行する
+FRAGMENTS_AVAILABLE = hasattr(st, "fragment")
+
+
+def _fragment(func: Callable) -> Callable:
+    """関数をフラグメント化（未対応のStreamlitでは通常の描画関数のまま）"""
+    return st.fragment(func) if FRAGMENTS_AVAILABLE else func
+
+
+class RerunTimer:
+    """メッセージ送信1回あたりのサーバー処理時間を再実行方式ごとに計測
+    
+    - full: 送信でアプリ全体（app.main()）が再実行される。スクリプトの開始から終了までを計測
+    - fragment: チャット領域のフラグメントだけが再実行される。フラグメントの開始から終了までを計測
+    
+    応答の生成・表示（ターン処理）を除いた時間を再実行のオーバーヘッドとして別に記録する。
+    方式はセッションの "chat_rerun_mode"、なければ環境変数 RURI_CHAT_RERUN_MODE（既定: fragment）。
+    """
+    
+    MODES = ("fragment", "full")
+    MODE_KEY = "chat_rerun_mode"
+    STATE_KEY = "chat_rerun_timing"
+    MAX_SAMPLES = 200
+    
+    def __init__(self, state: Any = None, clock: Callable[[], float] = time.perf_counter):
+        self.state = st.session_state if state is None else state
+        self.clock = clock
+    
+    @property
+    def mode(self) -> str:
+        if not FRAGMENTS_AVAILABLE:
+            return "full"
+        mode = self.state.get(self.MODE_KEY) or os.getenv("RURI_CHAT_RERUN_MODE", "fragment")
+        return mode if mode in self.MODES else "fragment"
+    
+    def set_mode(self, mode: str):
+        if mode not in self.MODES:
+            raise ValueError(f"未知の再実行方式です: {mode}")
+        self.state[self.MODE_KEY] = mode
+    
+    def _timing(self) -> Dict[str, Any]:
+        if self.STATE_KEY not in self.state:
+            self.state[self.STATE_KEY] = {"script_started": None, "pending_turn": None, "samples": []}
+        return self.state[self.STATE_KEY]
+    
+    def script_started(self):
+        """アプリ全体の実行開始（app.main() の前に呼ぶ）"""
+        timing = self._timing()
+        timing["script_started"] = self.clock()
+        timing["pending_turn"] = None
+    
+    def script_finished(self):
+        """アプリ全体の実行終了（full 方式で処理したメッセージがあれば記録）"""
+        timing = self._timing()
+        turn_seconds, timing["pending_turn"] = timing["pending_turn"], None
+        if turn_seconds is not None and timing["script_started"] is not None:
+            self._record("full", self.clock() - timing["script_started"], turn_seconds)
+    
+    def region_finished(self, region_started: float, turn_seconds: float):
+        """チャット領域でメッセージを1件処理し終えた"""
+        if self.mode == "fragment":
+            self._record("fragment", self.clock() - region_started, turn_seconds)
+        else:
+            # アプリ全体の実行が終わった時点で記録する
+            self._timing()["pending_turn"] = turn_seconds
+    
+    def _record(self, mode: str, total_seconds: float, turn_seconds: float):
+        overhead = max(0.0, total_seconds - turn_seconds)
+        samples = self._timing()["samples"]
+        samples.append({"mode": mode, "total_ms": total_seconds * 1000, "overhead_ms": overhead * 1000})
+        del samples[:-self.MAX_SAMPLES]
+        _rerun_seconds.observe(total_seconds, mode=mode)
+        _rerun_overhead_seconds.observe(overhead, mode=mode)
+    
+    def get_summary(self) -> List[Dict[str, Any]]:
+        """方式ごとの件数・処理時間（平均・中央値）・オーバーヘッド"""
+        summary = []
+        for mode in self.MODES:
+            samples = [s for s in self._timing()["samples"] if s["mode"] == mode]
+            if not samples:
+                continue
+            totals = [s["total_ms"] for s in samples]
+            overheads = [s["overhead_ms"] for s in samples]
+            summary.append({
+                "mode": mode,
+                "messages": len(samples),
+                "mean_ms": round(statistics.fmean(totals), 1),
+                "median_ms": round(statistics.median(totals), 1),
+                "overhead_mean_ms": round(statistics.fmean(overheads), 1),
+                "overhead_median_ms": round(statistics.median(overheads), 1),
+            })
+        return summary
+
+
+def bubble_style(colors: Any) -> str:
+    """EmotionColors を吹き出しの style 属性にする（色がなければ空文字）"""
+    if colors is None:
+        return ""
+    return f' style="background: {colors.bubble}; border-color: {colors.accent};"'
+
+
+class StreamingBubble:
+    """ストリーミング応答を表示するルリの吹き出し
+    
+    届いたテキストはバッファに溜め、プレースホルダーの更新は設定したフレームレートに間引く。
+    HTMLエスケープは新しく届いた分だけ行い、エスケープ済みの本文に継ぎ足す。
+    応答から最初に感情が検出された時点で吹き出しの感情クラスを切り替える。
+    """
+    
+    def __init__(self, placeholder: Any, timestamp: str, emotion_class: str = "",
+                 fps: float = None, emotion_detector: Callable[[str], Optional[str]] = None,
+                 started_at: float = None, clock: Callable[[], float] = time.perf_counter,
+                 colors: Any = None):
+        """
+        Args:
+            placeholder: st.empty() で作ったプレースホルダー
+            timestamp: 吹き出しに表示する時刻
+            emotion_class: 感情が検出されるまでの感情クラス（" emotion-joy" 等）
+            fps: 1秒あたりの最大更新回数（既定: 環境変数 RURI_STREAM_FPS または 12）
+            emotion_detector: テキスト -> 感情名（未検出ならNone）
+            started_at: 初回表示までの時間の起点（既定: 生成時点）
+            clock: 時計（テスト用）
+            colors: 吹き出しの色（EmotionColors。Live2D・OBSと同じ計算結果）
+        """
+        self.placeholder = placeholder
+        self.colors = colors
+        self.timestamp = timestamp
+        self.emotion_class = emotion_class
+        self.fps = fps or float(os.getenv("RURI_STREAM_FPS", "12"))
+        self.emotion_detector = emotion_detector
+        self.clock = clock
+        self.started_at = clock() if started_at is None else started_at
+        self.first_visible_latency: Optional[float] = None
+        self.updates = 0
+        self._text = ""
+        self._escaped = ""
+        self._pending: List[str] = []
+        self._last_update = float("-inf")
+        self._emotion_found = emotion_detector is None
+    
+    @property
+    def text(self) -> str:
+        """表示済み・未表示を含めた応答全文"""
+        return self._text + "".join(self._pending)
+    
+    def feed(self, chunk: str):
+        """テキストの断片を追加（前回の更新から1フレーム経っていれば表示）"""
+        if not chunk:
+            return
+        self._pending.append(chunk)
+        if self.clock() - self._last_update >= 1.0 / self.fps:
+            self.flush()
+    
+    def flush(self):
+        """溜まっているテキストを表示に反映"""
+        if not self._pending:
+            return
+        new_text = "".join(self._pending)
+        self._pending.clear()
+        self._text += new_text
+        self._escaped += html.escape(new_text).replace("\n", "<br>")
+        
+        if not self._emotion_found:
+            emotion = self.emotion_detector(self._text)
+            if emotion:
+                self.emotion_class = f" emotion-{emotion}"
+                self._emotion_found = True
+        
+        self._render(self._escaped)
+        self._last_update = self.clock()
+        if self.first_visible_latency is None and self._text.strip():
+            self.first_visible_latency = self._last_update - self.started_at
+            _first_visible_seconds.observe(self.first_visible_latency)
+    
+    def finish(self, emotion_class: str = None, colors: Any = None) -> str:
+        """残りを表示して全文を返す（emotion_class・colors を渡すと最終的な感情で描き直す）"""
+        if emotion_class is not None:
+            self.emotion_class = emotion_class
+        if colors is not None:
+            self.colors = colors
+        if self._pending:
+            self.flush()
+        elif emotion_class is not None or colors is not None:
+            self._render(self._escaped)
+        return self._text
+    
+    def _render(self, content_html: str):
+        self.updates += 1
+        self.placeholder.markdown(f"""
+        <div class="ruri-message{self.emotion_class}"{bubble_style(self.colors)}>
+            <span class="message-label">🎭 ルリ</span>
+            <div class="message-timestamp">{self.timestamp}</div>
+            <div class="message-content">{content_html}</div>
+        </div>
+        """, unsafe_allow_html=True)
+
 
 class ChatUI:
     """チャット用UIコンポーネントクラス（感情学習対応）"""
     
+    # 応答の感情を吹き出しの色に反映する強度の閾値
+    RESPONSE_EMOTION_THRESHOLD = 0.15
+    
     def __init__(self, container_key: str = "default_chat"):
         self.container_key = container_key
         self.chat_manager = get_chat_manager() if 'get_chat_manager' in globals() else None
         
         # 感情システムの初期化
         if EMOTION_SYSTEM_AVAILABLE:
-            self.emotion_system = EmotionSystem()
+            # 配信連携（Live2D・OBS）と同じ学習状態・成長度合いを使う
+            self.emotion_system = get_emotion_system()
         else:
             self.emotion_system = None
     
@@ -44,6 +268,7 @@ class ChatUI:
         if self.emotion_system:
             color_palette = self.emotion_system.get_current_color_palette()
             bubble_color = color_palette.get("bubble", bubble_color)
+            border_color = color_palette.get("border", border_color)
             
             # 虹色エフェクトの場合
             if color_palette.get("rainbow_effect"):
@@ -436,25 +661,32 @@ class ChatUI:
         </style>
         """, unsafe_allow_html=True)
     
-    def render_chat_history(self, max_display: int = 10, show_latest_highlight: bool = True):
-        """チャット履歴を表示（将来の拡張ポイント）"""
-        # TODO: LocalStorage / リモートサーバー対応時に有効化
-        # messages = self.chat_manager.get_history()
-        # 
-        # if not messages:
-        #     st.info("💬 まだ会話履歴がありません。ルリにメッセージを送ってみてください！")
-        #     return
-        # 
-        # # 表示する履歴を制限
-        # display_messages = messages[-max_display:] if max_display > 0 else messages
-        # 
-        # # 最新の会話が上に来るよう逆順で表示
-        # for i, message in enumerate(reversed(display_messages)):
-        #     is_latest = (i == 0) and show_latest_highlight
-        #     self._render_single_conversation_turn(message, is_latest)
-        
-        # 履歴表示を完全に無効化（Streamlit Cloud対応）
-        pass
+    def render_chat_history(self, max_display: int = 10, show_latest_highlight: bool = True,
+                            skip_latest: bool = False):
+        """チャット履歴を表示（セッション内の履歴・最新の会話が上）
+        
+        Args:
+            max_display: 表示する最大件数（0以下で全件）
+            show_latest_highlight: 最新の会話を強調表示するか
+            skip_latest: 最新の会話を表示しない（直前にライブ表示した場合）
+        """
+        if not self.chat_manager:
+            return
+        messages = self.chat_manager.get_history()
+        if skip_latest:
+            messages = messages[:-1]
+        
+        if not messages:
+            st.info("💬 まだ会話履歴がありません。ルリにメッセージを送ってみてください！")
+            return
+        
+        # 表示する履歴を制限
+        display_messages = messages[-max_display:] if max_display > 0 else messages
+        
+        # 最新の会話が上に来るよう逆順で表示
+        for i, message in enumerate(reversed(display_messages)):
+            is_latest = (i == 0) and show_latest_highlight
+            self._render_single_conversation_turn(message, is_latest)
     
     def _render_single_conversation_turn(self, message: ChatMessage, is_latest: bool = False):
         """
@@ -467,13 +699,15 @@ class ChatUI:
         これにより「ユーザーが発言→ルリが考えて上に応答を追加」という自然な流れを表現
         """
         latest_class = " latest-message" if is_latest else ""
+        ai_response_html = html.escape(message.ai_response).replace("\n", "<br>")
+        user_message_html = html.escape(message.user_message)
         
         # 1. ルリの応答を上に表示（考えて追加された印象）
         st.markdown(f"""
         <div class="ruri-message{latest_class}">
             <span class="message-label">🎭 ルリ</span>
             <div class="message-timestamp">{message.timestamp}</div>
-            <div class="message-content">{message.ai_response}</div>
+            <div class="message-content">{ai_response_html}</div>
         </div>
         """, unsafe_allow_html=True)
         
@@ -482,7 +716,7 @@ class ChatUI:
         <div class="user-message{latest_class}">
             <span class="message-label">👤 あなた</span>
             <div class="message-timestamp">{message.timestamp}</div>
-            <div class="message-content">{message.user_message}</div>
+            <div class="message-content">{user_message_html}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -509,13 +743,66 @@ class ChatUI:
                 self._handle_message_with_live_feedback(message.strip(), user_level, features)
                 # st.rerun()を削除して、発言後の消失を防止
                 # 履歴は次回のページ更新時に反映される
+                return message.strip()
         
         return None
+    
+    def render_chat_region(self, user_level: Any, features: Dict[str, bool],
+                           placeholder: str = "ルリにメッセージを送信...",
+                           max_display: int = 10, show_history: bool = False):
+        """チャット領域（入力・ライブ応答・履歴）を表示
+        
+        fragment 方式ではチャット領域をフラグメントとして描画し、送信時は
+        app.main() 全体（認証・サイドバー・ページ振り分け等）ではなくこの領域だけを再実行する。
+        履歴と管理コントロールはさらに内側のフラグメントで、操作時は履歴部分だけを再実行する。
+        """
+        as_fragments = RerunTimer().mode == "fragment"
+        render = self._chat_region_fragment if as_fragments else self._render_chat_region
+        render(user_level, features, placeholder, max_display, show_history, as_fragments)
+    
+    def _render_chat_region(self, user_level: Any, features: Dict[str, bool], placeholder: str,
+                            max_display: int, show_history: bool, as_fragments: bool):
+        timer = RerunTimer()
+        region_started = timer.clock()
+        message = self.render_message_input(user_level, features, placeholder)
+        turn_seconds = timer.clock() - region_started
+        
+        if show_history:
+            render_history = self._history_region_fragment if as_fragments else self._render_history_region
+            # 送信直後の会話はライブ表示済みなので履歴からは除く
+            render_history(max_display, message is not None, as_fragments)
+        
+        if message is not None:
+            timer.region_finished(region_started, turn_seconds)
+    
+    _chat_region_fragment = _fragment(_render_chat_region)
+    
+    def _render_history_region(self, max_display: int, skip_latest: bool, as_fragments: bool):
+        st.markdown("---")
+        st.subheader("📜 会話履歴")
+        with st.container():
+            st.markdown('<div class="chat-container">', unsafe_allow_html=True)
+            self.render_chat_history(max_display, skip_latest=skip_latest)
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        st.subheader("🔧 チャット管理")
+        self.render_chat_controls(rerun_scope="fragment" if as_fragments else "app")
+    
+    _history_region_fragment = _fragment(_render_history_region)
 
+    def _detect_response_emotion(self, text: str) -> Optional[str]:
+        """ストリーミング中の応答から最初の感情シグナルを検出（未検出ならNone）"""
+        if not self.emotion_system:
+            return None
+        emotion, intensity = self.emotion_system.detect_emotion_vector(text).dominant(EmotionType)
+        return emotion.value if intensity > self.RESPONSE_EMOTION_THRESHOLD else None
+    
+    @_tracer.traced("chat.turn")
     def _handle_message_with_live_feedback(self, message: str, user_level: Any, features: Dict[str, bool]):
         """ライブフィードバック付きメッセージ処理（感情学習対応）"""
         # 会話処理中フラグを設定（ナビゲーション保護）
         st.session_state.chat_processing = True
+        started_at = time.perf_counter()
         
         try:
             # 1. タイムスタンプを統一
@@ -523,30 +810,30 @@ class ChatUI:
             
             # 2. 感情検出（ユーザーメッセージから）
             detected_emotion = None
+            user_emotions = None
             if self.emotion_system:
-                emotions = self.emotion_system.detect_emotion_from_text(message)
                 # 最も強い感情を特定
-                if emotions:
-                    detected_emotion = max(emotions.items(), key=lambda x: x[1])
-                    if detected_emotion[1] > 0.1:  # 閾値以上の場合のみ学習
-                        self.emotion_system.learn_emotion(detected_emotion[0], detected_emotion[1])
+                user_emotions = self.emotion_system.detect_emotion_vector(message)
+                detected_emotion = user_emotions.dominant(EmotionType)
+                if detected_emotion[1] > 0.1:  # 閾値以上の場合のみ学習
+                    self.emotion_system.learn_emotion(detected_emotion[0], detected_emotion[1])
             
             # 3. 専用コンテナを作成（履歴とは別管理）
             live_container = st.container()
             
             with live_container:
-                # 現在の色彩情報を取得
-                bubble_color = "#ff9a9e"  # デフォルト
+                # 現在の色彩情報を取得（Live2D・OBSと同じ色彩エンジン）
+                bubble_colors = None
                 emotion_class = ""
                 
                 if self.emotion_system and detected_emotion:
-                    bubble_color = self.emotion_system.get_bubble_color_for_emotion(detected_emotion[0])
+                    bubble_colors = self.emotion_system.get_emotion_colors(user_emotions)
                     emotion_class = f" emotion-{detected_emotion[0].value}"
                 
                 # ルリの吹き出し（上部・感情対応色）
                 ruri_placeholder = st.empty()
                 ruri_placeholder.markdown(f"""
-                <div class="ruri-message{emotion_class}">
+                <div class="ruri-message{emotion_class}"{bubble_style(bubble_colors)}>
                     <span class="message-label">🎭 ルリ</span>
                     <div class="message-timestamp">{timestamp}</div>
                     <div class="message-content">💭 考え中...</div>
@@ -562,19 +849,21 @@ class ChatUI:
                 </div>
                 """, unsafe_allow_html=True)
             
-            # 4. AI応答生成
+            # 4. AI応答生成（届いたテキストから順に吹き出しへ表示）
+            bubble = StreamingBubble(
+                ruri_placeholder, timestamp, emotion_class,
+                emotion_detector=self._detect_response_emotion,
+                started_at=started_at,
+                colors=bubble_colors,
+            )
             try:
                 if 'get_ai_generator' in globals():
                     ai_generator = get_ai_generator()
                     if ai_generator:
-                        # generate_response はタプル (応答文, 処理時間, プロバイダー名) を返すので、最初の要素のみ取得
-                        response_tuple = ai_generator.generate_response(message)
-                        if isinstance(response_tuple, tuple) and len(response_tuple) >= 1:
-                            ai_response = response_tuple[0]  # 応答文のみ取得
-                        else:
-                            ai_response = str(response_tuple)
+                        for chunk in ai_generator.stream_response(message, features):
+                            bubble.feed(chunk)
                     else:
-                        ai_response = "すみません、AIが応答できません。"
+                        bubble.feed("すみません、AIが応答できません。")
                 else:
                     # フォールバック応答（ルリらしく）
                     fallback_responses = [
@@ -585,37 +874,44 @@ class ChatUI:
                         "そのお気持ち、少し分かるような気がします。"
                     ]
                     import random
-                    ai_response = random.choice(fallback_responses)
+                    bubble.feed(random.choice(fallback_responses))
+                ai_response = bubble.text
                 
                 # 5. AI応答の感情分析と学習
                 ai_detected_emotion = None
+                final_colors = None
                 if self.emotion_system and isinstance(ai_response, str):
-                    ai_emotions = self.emotion_system.detect_emotion_from_text(ai_response)
+                    ai_emotions = self.emotion_system.detect_emotion_vector(ai_response)
                     
                     # AI応答から最も強い感情を特定
-                    if ai_emotions:
-                        ai_detected_emotion = max(ai_emotions.items(), key=lambda x: x[1])
-                        # デバッグ情報
-                        if ai_detected_emotion[1] > 0.1:
-                            print(f"🎭 AI応答感情検出: {ai_detected_emotion[0].value} (強度: {ai_detected_emotion[1]:.2f})")
-                        
-                        # AI応答の感情学習（少し弱めに）
-                        for emotion, intensity in ai_emotions.items():
-                            if intensity > 0.1:
-                                self.emotion_system.learn_emotion(emotion, intensity * 0.5)
+                    ai_detected_emotion = ai_emotions.dominant(EmotionType)
+                    # デバッグ情報
+                    if ai_detected_emotion[1] > 0.1:
+                        logger.debug("🎭 AI応答感情検出: %s (強度: %.2f)",
+                                     ai_detected_emotion[0].value, ai_detected_emotion[1])
+                    
+                    # AI応答の感情学習（少し弱めに。保存は1回）
+                    self.emotion_system.learn_emotions(ai_emotions, scale=0.5, threshold=0.1)
+                    # 配信連携が Live2D・OBS に送る色と同じ計算（返答の感情ベクトル + 成長度合い）
+                    final_colors = self.emotion_system.get_reply_colors(ai_response)
                 
-                # 6. 最終応答の表示（AI応答の感情に応じた色）
+                # 6. 最終応答の表示（AI応答全体の感情に応じた色）
                 final_emotion_class = ""
-                if ai_detected_emotion and ai_detected_emotion[1] > 0.15:  # 閾値を設定
+                if ai_detected_emotion and ai_detected_emotion[1] > self.RESPONSE_EMOTION_THRESHOLD:
                     final_emotion_class = f" emotion-{ai_detected_emotion[0].value}"
                 
-                ruri_placeholder.markdown(f"""
-                <div class="ruri-message{final_emotion_class}">
-                    <span class="message-label">🎭 ルリ</span>
-                    <div class="message-timestamp">{timestamp}</div>
-                    <div class="message-content">{ai_response}</div>
-                </div>
-                """, unsafe_allow_html=True)
+                with _tracer.span("render.html"):
+                    bubble.finish(final_emotion_class, colors=final_colors)
+                
+                if self.chat_manager:
+                    self.chat_manager.add_message(message, ai_response, time.perf_counter() - started_at)
+                
+                # 初回表示までの時間（TTFVC）と再描画回数をターンのスパンに記録
+                span = _tracer.current_span()
+                if span is not None:
+                    if bubble.first_visible_latency is not None:
+                        span.set_attribute("first_visible_ms", round(bubble.first_visible_latency * 1000, 1))
+                    span.set_attribute("render_updates", bubble.updates)
                 
             except Exception as e:
                 st.error(f"AI応答エラー: {e}")
@@ -627,15 +923,23 @@ class ChatUI:
             # 会話処理中フラグをクリア
             st.session_state.chat_processing = False
     
-    def render_chat_controls(self):
-        """チャット管理用コントロールを表示"""
+    def render_chat_controls(self, rerun_scope: str = "app"):
+        """チャット管理用コントロールを表示
+        
+        Args:
+            rerun_scope: 履歴クリア後の再実行範囲（フラグメント内では "fragment"）
+        """
         col1, col2, col3 = st.columns([1, 1, 1])
         
         with col1:
             if st.button("履歴クリア", key=f"clear_btn_{self.container_key}"):
                 self.chat_manager.clear_history()
                 st.success("履歴をクリアしました")
-                st.rerun()
+                # scope 引数はフラグメント対応版（1.37以降）のみ
+                if FRAGMENTS_AVAILABLE:
+                    st.rerun(scope=rerun_scope)
+                else:
+                    st.rerun()
         
         with col2:
             if st.button("履歴エクスポート", key=f"export_btn_{self.container_key}"):
@@ -660,26 +964,9 @@ class ChatUI:
         # スタイル適用
         self.render_chat_styles()
         
-        # メッセージ入力を上部に固定
+        # メッセージ入力を上部に固定（入力・ライブ応答・履歴・管理はチャット領域として再実行される）
         st.subheader("📝 メッセージを送信")
-        self.render_message_input(user_level, features)
-        
-        # 区切り線
-        st.markdown("---")
-        
-        # チャットコンテナ（将来の拡張ポイント）
-        # st.subheader("📜 会話履歴")
-        # with st.container():
-        #     st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-        #     
-        #     # 履歴表示
-        #     self.render_chat_history(max_display)
-        #     
-        #     st.markdown('</div>', unsafe_allow_html=True)
-
-        # コントロール
-        st.subheader("🔧 チャット管理")
-        self.render_chat_controls()
+        self.render_chat_region(user_level, features, max_display=max_display, show_history=True)
 
 
 # ファクトリ関数
@@ -699,7 +986,7 @@ def render_compact_chat(user_level: Any, features: Dict[str, bool],
     with st.expander("💬 ルリとの会話", expanded=True):
         # 入力フォームを上部に固定
         st.markdown("##### 📝 メッセージ送信")
-        chat_ui.render_message_input(user_level, features, "ルリに話しかけてみてください...")
+        chat_ui.render_chat_region(user_level, features, "ルリに話しかけてみてください...", max_display)
         
         # 履歴表示（将来の拡張ポイント）
         # st.markdown("##### 📜 会話履歴")
@@ -1,11 +1,20 @@
 # 統一認証システム
 import streamlit as st
 import hashlib
+import hmac
 from src.unified_config import UnifiedConfig, UserLevel
+from src.session_token import get_session_signer
+
+class AuthThrottledError(Exception):
+    """パスワード検証が混み合っていて、今回は検証できなかった（パスワードの誤りではない）"""
+
 
 class UnifiedAuth:
     """統一認証システム"""
     
+    ThrottledError = AuthThrottledError
+    THROTTLED_MESSAGE = "⏳ 認証が混み合っています。少し待ってからもう一度お試しください"
+    
     @staticmethod
     def hash_password(password: str) -> str:
         """パスワードのハッシュ化"""
@@ -13,23 +22,32 @@ class UnifiedAuth:
     
     @staticmethod
     def check_password(entered_password: str, correct_password: str) -> bool:
-        """パスワード照合"""
-        entered_hash = UnifiedAuth.hash_password(entered_password)
-        correct_hash = UnifiedAuth.hash_password(correct_password)
-        return entered_hash == correct_hash
+        """パスワード照合（定数時間で比較。未設定のパスワードには一致させない）"""
+        if not correct_password:
+            return False
+        return hmac.compare_digest(entered_password.encode('utf-8'), correct_password.encode('utf-8'))
     
     @staticmethod
     def authenticate_user(password: str) -> UserLevel:
-        """パスワードによるユーザーレベル判定（シンプル認証）"""
+        """パスワードによるユーザーレベル判定（シンプル認証）
+        
+        Raises:
+            AuthThrottledError: 検証が混み合っていて判定できなかった
+        """
+        throttled = False
         try:
             # セキュア設定管理システムから認証を試行
-            from src.secure_config import get_config_manager
+            from src.secure_config import get_config_manager, PasswordCheck
             config_manager = get_config_manager()
             
             # 所有者パスワードをチェック
             owner_pass = config_manager.get_raw_password('OWNER_PASSWORD')
-            if owner_pass and config_manager.verify_password(password, owner_pass):
-                return UserLevel.OWNER
+            if owner_pass:
+                result = config_manager.verify_password(password, owner_pass)
+                if result is PasswordCheck.THROTTLED:
+                    throttled = True
+                elif result:
+                    return UserLevel.OWNER
         except Exception:
             # セキュア設定が利用できない場合はフォールバック
             pass
@@ -37,8 +55,10 @@ class UnifiedAuth:
         # フォールバック: 従来の設定ファイル認証
         if UnifiedAuth.check_password(password, UnifiedConfig.OWNER_PASSWORD):
             return UserLevel.OWNER
-        else:
-            return None
+        if throttled:
+            # 未検証のまま「パスワードが違う」とは言わない
+            raise AuthThrottledError(UnifiedAuth.THROTTLED_MESSAGE)
+        return None
     
     @staticmethod
     def show_auth_interface():
@@ -72,8 +92,14 @@ class UnifiedAuth:
                 
                 if st.button("🚀 認証"):
                     if upgrade_password:
-                        new_level = UnifiedAuth.authenticate_user(upgrade_password)
-                        if new_level and new_level == UserLevel.OWNER:
+                        throttled = False
+                        try:
+                            new_level = UnifiedAuth.authenticate_user(upgrade_password)
+                        except AuthThrottledError:
+                            new_level, throttled = None, True
+                        if throttled:
+                            st.warning(UnifiedAuth.THROTTLED_MESSAGE)
+                        elif new_level and new_level == UserLevel.OWNER:
                             # セッション状態を更新
                             UnifiedAuth.set_authentication_level(new_level)
                             st.success(f"✅ {level_info[new_level]['name']}にアップグレードしました！")
@@ -92,18 +118,20 @@ class UnifiedAuth:
     
     @staticmethod
     def set_authentication_level(level: UserLevel):
-        """認証レベルの設定"""
+        """認証レベルの設定（以降の再実行は署名つきトークンで確認する）"""
         # すべての認証状態をリセット
         st.session_state["owner_authenticated"] = False
+        st.session_state.pop("auth_token", None)
         
         # 所有者レベルの設定
         if level == UserLevel.OWNER:
             st.session_state["owner_authenticated"] = True
+            st.session_state["auth_token"] = get_session_signer().issue(level.value)
     
     @staticmethod
     def logout():
         """すべての認証状態をクリア"""
-        for key in ["owner_authenticated"]:
+        for key in ["owner_authenticated", "auth_token"]:
             if key in st.session_state:
                 del st.session_state[key]
     
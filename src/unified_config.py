@@ -1,12 +1,15 @@
 # 統一環境設定ファイル
-import os
 from typing import Dict, Any, List
 from enum import Enum
 
 try:
     from .api_config import APIConfig
+    from .settings import get_settings
+    from .session_token import get_session_signer
 except ImportError:
     from api_config import APIConfig
+    from settings import get_settings
+    from session_token import get_session_signer
 
 class UserLevel(Enum):
     """ユーザーアクセスレベル"""
@@ -17,28 +20,17 @@ class UnifiedConfig:
     """統一環境設定管理"""
     
     # 基本設定
-    DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
-    ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
+    DEBUG = get_settings().debug
+    ENVIRONMENT = get_settings().environment
     
     # 認証設定（環境変数・Streamlit Secrets対応）
     @classmethod
     def get_passwords(cls) -> Dict[str, str]:
         """認証パスワードとユーザー名を取得（デフォルトは空文字）"""
-        try:
-            # Streamlit secrets から取得を試行
-            import streamlit as st
-            if hasattr(st, 'secrets'):
-                return {
-                    'OWNER_PASSWORD': st.secrets.get('OWNER_PASSWORD', ''),
-                    'OWNER_USERNAME': st.secrets.get('OWNER_USERNAME', '')
-                }
-        except Exception:
-            pass
-        
-        # 環境変数から取得（デフォルトは空文字）
+        settings = get_settings()
         return {
-            'OWNER_PASSWORD': os.getenv('OWNER_PASSWORD', ''),
-            'OWNER_USERNAME': os.getenv('OWNER_USERNAME', '')
+            'OWNER_PASSWORD': settings.owner_password,
+            'OWNER_USERNAME': settings.owner_username
         }
     
     # 認証設定
@@ -62,7 +54,17 @@ class UnifiedConfig:
     
     @classmethod
     def get_user_level(cls, session_state) -> UserLevel:
-        """セッション状態からユーザーレベルを取得"""
+        """セッション状態からユーザーレベルを取得
+
+        ログイン時に発行した署名つきトークンがあれば HMAC だけで確かめる
+        （再実行のたびにパスワードを検証しない）。期限切れ・改ざんは一般公開レベルに戻す。
+        """
+        token = session_state.get("auth_token")
+        if token:
+            claims = get_session_signer().verify(token)
+            if claims and claims.get("lvl") == UserLevel.OWNER.value:
+                return UserLevel.OWNER
+            return UserLevel.PUBLIC
         if session_state.get("owner_authenticated"):
             return UserLevel.OWNER
         else:
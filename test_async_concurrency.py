@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# 非同期API・同時実行数の上限テスト
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# プロジェクトルートをパスに追加
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.base_provider import BaseAIProvider, CharacterResponse, EmotionType
+from ai_providers.registry import AIProviderRegistry
+from ai_providers.router import ProviderRouter
+from ai_providers.concurrency import ConcurrencyLimit, run_sync
+
+
+class BlockingProvider(BaseAIProvider):
+    """同期APIしか持たない遅いプロバイダー（非同期版もループを塞ぐ）"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.delay = self.config.get("delay", 0.2)
+
+    def is_available(self):
+        return True
+
+    def generate_response(self, message, context=None):
+        time.sleep(self.delay)
+        return CharacterResponse(f"{message}!", EmotionType.JOY, 0.5, self.current_color_stage, {})
+
+    async def generate_response_async(self, message, context=None):
+        return self.generate_response(message, context)
+
+    async def generate_stream_response(self, message, context=None):
+        yield self.generate_response(message, context).text
+
+
+def _router(max_concurrency=None):
+    registry = AIProviderRegistry()
+    registry.register('blocking', BlockingProvider)
+
+    class _Config:
+        def get_provider_config(self, name):
+            return {"delay": 0.2, "max_concurrency": max_concurrency}
+
+    return ProviderRouter(registry, config_manager=_Config(), preferences=['blocking'])
+
+
+def test_sync_provider_is_offloaded_without_blocking_loop():
+    """同期プロバイダーはスレッドへ退避され、並行リクエストとループ上の処理が止まらない"""
+    router = _router()
+
+    async def run():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        beat = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(router.generate_response_async(f"m{i}") for i in range(4)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await beat
+        return responses, elapsed, ticks
+
+    responses, elapsed, ticks = asyncio.run(run())
+    assert [r.text for r in responses] == ["m0!", "m1!", "m2!", "m3!"]
+    assert elapsed < 0.6
+    assert ticks >= 10
+
+
+def test_provider_limit_serialises_requests():
+    """max_concurrency=1 のプロバイダーへのリクエストは1件ずつ処理される"""
+    router = _router(max_concurrency=1)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(router.generate_response_async("x") for _ in range(3)))
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) >= 0.55
+    status = router.get_status_info()["concurrency"]["blocking"]
+    assert status["limit"] == 1
+    assert status["active"] == 0
+    assert status["max_waiting"] == 2
+
+
+def test_limit_is_shared_across_loops_and_threads():
+    """別スレッド・別ループからの利用でも上限を超えず、キャンセルで枠が漏れない"""
+    limit = ConcurrencyLimit(2)
+    peak = 0
+    lock = threading.Lock()
+
+    async def work():
+        nonlocal peak
+        async with limit:
+            with lock:
+                peak = max(peak, limit.active)
+            await asyncio.sleep(0.02)
+
+    def worker():
+        async def run():
+            await asyncio.gather(*(work() for _ in range(5)))
+        asyncio.run(run())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 2
+
+    single = ConcurrencyLimit(1)
+
+    async def cancelled_waiter():
+        async with single:
+            waiter = asyncio.create_task(single.acquire())
+            await asyncio.sleep(0)
+            assert single.waiting == 1
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        with single:
+            pass
+
+    asyncio.run(cancelled_waiter())
+    assert single.get_status()["active"] == 0
+    assert single.get_status()["waiting"] == 0
+
+
+def test_run_sync_uses_shared_loop():
+    """同期ファサードは共有ループで実行され、ループ内からの呼び出しは拒否する"""
+    async def loop_id():
+        return id(asyncio.get_running_loop())
+
+    assert run_sync(loop_id()) == run_sync(loop_id())
+
+    async def nested():
+        coro = loop_id()
+        try:
+            run_sync(coro)
+        except RuntimeError:
+            return True
+        return False
+
+    assert asyncio.run(nested())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# 視聴者コメントのマイクロバッチ処理テスト
+import sys
+import os
+import json
+import re
+import time
+
+# プロジェクトルートをパスに追加
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from comment_batcher import CommentMicroBatcher
+
+
+def _stub_llm(prompt):
+    """プロンプト中の "[番号] コメント" 行にJSON Linesで返答するスタブ"""
+    time.sleep(0.05)
+    return "\n".join(
+        json.dumps({"id": int(comment_id), "reply": f"{text}への返事", "emotion": "joy"}, ensure_ascii=False)
+        for comment_id, text in re.findall(r"^\[(\d+)\]\s*(.+)$", prompt, re.MULTILINE)
+    )
+
+
+def test_batches_comments_into_one_call():
+    """ウィンドウ内のコメントは1回の呼び出しで返答される"""
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return _stub_llm(prompt)
+
+    batcher = CommentMicroBatcher(generate, max_batch=10, window_ms=200, reply_limit=10, adaptive=False)
+    futures = [batcher.submit(text) for text in ["こんにちは", "好きな色は？", "初見です"]]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.stop()
+
+    assert len(prompts) == 1
+    assert [result["reply"] for result in results] == ["こんにちはへの返事", "好きな色は？への返事", "初見ですへの返事"]
+    assert all(result["emotion"] == "joy" and result["source"] == "batch" for result in results)
+    assert batcher.get_stats()["comments_per_llm_call"] == 3.0
+
+
+def test_select_comments_dedupes_and_limits():
+    """重複コメントは1件にまとめ、質問を優先して上限まで選ぶ"""
+    batcher = CommentMicroBatcher(_stub_llm, reply_limit=2)
+    futures = [batcher.submit(text) for text in ["www", "ＷＷＷ", "今日は何するの？", "こんばんは"]]
+    batcher.stop()
+    results = {result["comment"]: result for result in (future.result(timeout=5) for future in futures)}
+
+    assert results["今日は何するの？"]["answered"]
+    assert not results["ＷＷＷ"]["answered"]
+    assert sum(1 for result in results.values() if result["answered"]) == 2
+
+
+def test_parse_replies_handles_noise_and_fallback():
+    """余計な文章やコードブロックを含む出力も解析し、欠けた分は個別返答にフォールバック"""
+    raw = 'はい！\n```json\n{"id": 1, "reply": "やっほー", "emotion": "JOY"}\n{"id": 99, "reply": "x"}\n```'
+    fallback_calls = []
+
+    def fallback(text):
+        fallback_calls.append(text)
+        return "個別の返事"
+
+    batcher = CommentMicroBatcher(lambda prompt: raw, window_ms=100, fallback=fallback, adaptive=False)
+    first = batcher.submit("こんにちは")
+    second = batcher.submit("元気？")
+    first, second = first.result(timeout=5), second.result(timeout=5)
+    batcher.stop()
+
+    assert (first["reply"], first["emotion"]) == ("やっほー", "joy")
+    assert second["source"] == "fallback" and second["reply"] == "個別の返事"
+    assert fallback_calls == ["元気？"]
+
+
+def test_adapts_to_latency():
+    """レイテンシが大きいほど待機時間とバッチサイズを広げる"""
+    batcher = CommentMicroBatcher(_stub_llm, max_batch=4, window_ms=100)
+    batcher._interval_ewma = 0.05
+    batcher._observe_latency(2.0)
+    assert batcher.window_ms == 500.0
+    assert batcher.max_batch == 20
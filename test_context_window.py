@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+会話コンテキストのウィンドウ管理のテスト
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from ai_providers.context_window import ContextWindowManager, count_tokens, estimate_tokens
+
+
+def _history(turns: int, length: int = 40):
+    history = []
+    for index in range(turns):
+        history.append({"role": "user", "content": f"質問{index}。" + "あ" * length})
+        history.append({"role": "assistant", "content": f"回答{index}。" + "い" * length})
+    return history
+
+
+def test_estimator_counts_japanese_per_character():
+    assert estimate_tokens("こんにちは") == 5
+    assert estimate_tokens("hello world") == 3
+    assert count_tokens("") == 0
+
+
+def test_prompt_stays_within_budget_and_keeps_latest_turns():
+    manager = ContextWindowManager(max_prompt_tokens=400, summary_tokens=100)
+    history = _history(20)
+    build = manager.build_messages("あなたはルリです。", history, "今日の色は？", conversation_id="c1")
+
+    assert build.prompt_tokens <= 400
+    assert build.history_dropped > 0
+    assert build.messages[0]["role"] == "system"
+    assert build.messages[-1] == {"role": "user", "content": "今日の色は？"}
+    assert build.messages[-2]["content"] == history[-1]["content"]
+
+
+def test_dropped_turns_are_summarized_in_background():
+    manager = ContextWindowManager(max_prompt_tokens=400, summary_tokens=100)
+    history = _history(20)
+    first = manager.build_messages("あなたはルリです。", history, "こんにちは", conversation_id="c1")
+    assert first.summary_tokens == 0  # 要約は次のリクエストから使われる
+
+    manager.wait_for_summaries(timeout=5)
+    summary = manager.get_summary("c1")
+    assert summary and count_tokens(summary) <= 100
+
+    second = manager.build_messages("あなたはルリです。", history, "こんにちは", conversation_id="c1")
+    assert second.summary_tokens > 0
+    assert second.messages[1]["content"].startswith("これまでの会話の要約")
+    assert second.prompt_tokens <= 400
+    assert manager.get_summary("other") == ""
+
+
+def test_stable_prefix_layout_keeps_system_prompt_identical():
+    from ai_providers.base_provider import EmotionType
+    from ai_providers.ollama_provider import OllamaAIProvider
+
+    provider = OllamaAIProvider()
+    history = {"conversation_history": _history(2)}
+    before = provider._build_messages("こんにちは", history)
+    provider.emotion_states[EmotionType.JOY].learned = True
+    after = provider._build_messages("こんにちは", history)
+
+    assert before[:-2] == after[:-2]  # システムプロンプトから履歴までが同一
+    assert before[-2] != after[-2] and "joy" in after[-2]["content"]
+    assert after[-1] == {"role": "user", "content": "こんにちは"}
+
+    legacy = OllamaAIProvider({"prompt_layout": "legacy"})
+    assert "【現在の状態】" in legacy._build_messages("こんにちは")[0]["content"]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+感情色エンジンのテスト（混色・成長度合い・丸めたキャッシュ・感情システムとの一貫性）
+"""
+import os
+import sys
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from emotion_color import EmotionColorEngine, MONOCHROME_BUBBLE
+from emotion_vector import EmotionVector
+
+
+def test_blend_growth_and_quantised_cache():
+    engine = EmotionColorEngine({"joy": "#FFFF00"})
+
+    joy = engine.compute("joy")
+    assert joy.accent == "#FFFF00" and joy.live2d_rgb == (1.0, 1.0, 0.0)
+    assert joy.obs_filter_settings() == {"hue_shift": 60.0, "saturation": 1.5, "brightness": 1.2}
+
+    # 成長度合い0・感情なしはモノクロ
+    assert engine.compute("joy", growth_level=0.0).bubble == MONOCHROME_BUBBLE
+    assert engine.compute(None).strength == 0.0
+
+    # 半分の成長度合いではグレーと基準色の中間
+    half = engine.compute("joy", growth_level=0.5)
+    assert half.strength == 0.5 and half.accent == "#C0C040"
+
+    # 2つの感情は強度で混ぜ、色相は円周上で平均する（love 300度 + anger 0度 -> 330度）
+    mixed = engine.compute(EmotionVector.from_dict({"love": 1.0, "anger": 1.0}))
+    assert mixed.dominant == "anger" and mixed.hue_shift == 330.0
+
+    # 丸めた入力が同じなら同じ結果オブジェクト
+    assert engine.compute(EmotionVector.from_dict({"joy": 0.99})) is joy
+    assert engine.cache_info()["size"] == 5
+
+
+def test_emotion_system_uses_engine_colors(tmp_path):
+    from emotion_system import EmotionSystem, EmotionType
+    from emotion_color import get_color_engine
+
+    system = EmotionSystem(save_path=str(tmp_path / "emotion_data.json"))
+    assert system.get_bubble_color_for_emotion(EmotionType.JOY) == MONOCHROME_BUBBLE
+
+    for emotion in EmotionType:
+        system.emotion_levels[emotion] = 1.0
+    system._update_color_stage()
+    colors = system.get_emotion_colors(EmotionVector.from_names(["sadness"]))
+    assert colors == get_color_engine().compute("sadness", 1.0)
+    assert system.get_bubble_color_for_emotion(EmotionType.SADNESS) == colors.bubble == "#E6F3FF"
+
+    # 吹き出し・枠のパレットも同じエンジンの色
+    palette = system.get_current_color_palette()
+    learned = system.get_emotion_colors()
+    assert palette["bubble"] == learned.bubble and learned.strength > 0.0
+
+    # 返答の色は返答の感情ベクトル + 学習済みの成長度合い（画面・Live2D・OBSで共有）
+    reply = system.get_reply_colors("悲しい")
+    assert reply == get_color_engine().compute(system.detect_emotion_vector("悲しい"), system.get_growth_level())
+    assert reply.dominant == "sadness"
+    assert system.get_reply_colors("……", fallback_emotion="sadness") == system.get_emotion_colors(
+        EmotionVector.from_names(["sadness"]))
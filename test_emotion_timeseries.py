@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+感情学習の時系列ストアのテスト（追記・集計・間引き・移動平均・保存と読み込み）
+"""
+import os
+import sys
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from emotion_timeseries import EmotionTimeSeriesStore
+
+BASE = 1_700_000_040.0  # 分の境界（60の倍数）
+
+
+def _store(tmp_path, name="timeseries.npz"):
+    return EmotionTimeSeriesStore(str(tmp_path / name), autosave_interval=0)
+
+
+def test_append_aggregate_and_downsample(tmp_path):
+    store = _store(tmp_path)
+    store.append("joy", 0.2, BASE + 1)
+    store.append("joy", 0.4, BASE + 30)
+    store.append("joy", 0.9, BASE + 61)
+    store.append("joy", 0.1, BASE + 5)  # 順不同の追記
+    store.append("anger", 1.0, BASE + 3600)
+
+    assert store.event_count() == 5 and store.event_count("joy") == 4
+    assert sorted(store.emotions()) == ["anger", "joy"]
+    assert store.time_span() == (BASE + 1, BASE + 3600)
+
+    buckets, means = store.aggregate("joy", "minute", "mean")
+    assert buckets.tolist() == [BASE, BASE + 60]
+    assert np.allclose(means, [(0.2 + 0.4 + 0.1) / 3, 0.9])
+    assert store.aggregate("joy", "minute", "count")[1].tolist() == [3.0, 1.0]
+    assert np.allclose(store.aggregate("joy", "hour", "max")[1], [0.9])
+    # 分の倍数でない窓は生イベントから集計する
+    assert store.aggregate("joy", 30, "count")[1].tolist() == [2.0, 1.0, 1.0]
+
+    ts, values = store.get_range("joy", BASE, BASE + 60)
+    assert ts.tolist() == [BASE + 1, BASE + 5, BASE + 30]
+
+    buckets, values = store.downsample("joy", max_points=1)
+    assert len(buckets) == 1 and np.isclose(values[0], 0.4)
+
+
+def test_rolling_mean_and_save_load_roundtrip(tmp_path):
+    store = _store(tmp_path)
+    store.extend("love", BASE + np.arange(5) * 10.0, [0.0, 1.0, 0.0, 1.0, 0.0])
+
+    ts, means = store.rolling_mean("love", window_events=2)
+    assert ts.tolist() == (BASE + np.arange(5) * 10.0).tolist()
+    assert np.allclose(means, [0.0, 0.5, 0.5, 0.5, 0.5])
+
+    store.flush()
+    reloaded = _store(tmp_path)
+    assert reloaded.event_count("love") == 5
+    assert np.array_equal(reloaded.get_range("love")[1], store.get_range("love")[1])
+    assert reloaded.get_summary() == {"total_events": 5, "per_emotion": {"love": 5}}
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+感情ベクトルのテスト（演算・辞書形式との相互変換・感情システムでの利用）
+"""
+import os
+import sys
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from emotion_vector import EmotionVector, KeywordScorer
+
+
+def test_vector_math_and_dict_roundtrip():
+    from emotion_system import EmotionType
+    from ai_providers.base_provider import EmotionType as ProviderEmotionType
+
+    vector = EmotionVector.from_dict({EmotionType.JOY: 0.4, "fear": 0.9})
+    vector.add(EmotionType.JOY, 0.8).clamp()
+    assert vector[EmotionType.JOY] == 1.0
+    # どちらの EmotionType でも同じ添字
+    assert vector.dominant(ProviderEmotionType) == (ProviderEmotionType.JOY, 1.0)
+    assert vector.top_k(2) == [(0, 1.0), (5, 0.9)]
+    assert vector.count_above(0.5) == 2
+
+    vector.decay(0.5).blend(EmotionVector.from_names(["sadness", "unknown"]), 0.5)
+    assert vector.to_dict(nonzero=True) == {"joy": 0.25, "sadness": 0.5, "fear": 0.225}
+    assert EmotionVector.from_dict(vector.to_dict(EmotionType)) == vector
+
+    scorer = KeywordScorer({EmotionType.JOY: ["嬉しい", "楽しい"], EmotionType.LOVE: ["好き"]}, weight=0.6)
+    scores = scorer.score("嬉しいし楽しいし好き")
+    assert scores[EmotionType.JOY] == 1.0 and scores[EmotionType.LOVE] == 0.6
+
+
+def test_emotion_system_learns_from_vector(tmp_path):
+    from emotion_system import EmotionSystem, EmotionType, ColorStage
+
+    system = EmotionSystem(save_path=str(tmp_path / "emotion_data.json"))
+    detected = system.detect_emotion_vector("嬉しい！大好き、楽しみ")
+    assert detected.count_above(0.1) == 3
+
+    assert system.learn_emotions(detected, scale=0.5) == 3
+    assert set(system.learned_emotions) == {EmotionType.JOY, EmotionType.LOVE, EmotionType.ANTICIPATION}
+    assert system.emotion_levels == EmotionVector(detected.values * 0.5)
+    assert system.get_growth_level() == detected.total() * 0.5 / 8
+
+    system.learn_emotion(EmotionType.JOY, 0.5)
+    system.learn_emotion(EmotionType.LOVE, 0.5)
+    assert system.color_stage == ColorStage.PARTIAL_COLOR
+    assert len(system.emotion_history) == 5 and system.total_interactions == 5
+
+    reloaded = EmotionSystem(save_path=str(tmp_path / "emotion_data.json"))
+    assert reloaded.emotion_levels == system.emotion_levels
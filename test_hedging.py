@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# ヘッジリクエスト（テールレイテンシ対策）テスト
+import sys
+import os
+import asyncio
+import random
+
+# プロジェクトルートをパスに追加
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.base_provider import BaseAIProvider, CharacterResponse, EmotionType
+from ai_providers.registry import AIProviderRegistry
+from ai_providers.router import ProviderRouter
+from ai_providers.hedging import HedgedRequestExecutor, HedgeLegError
+
+
+class LatencyProvider(BaseAIProvider):
+    """レイテンシ分布を差し替えられるテスト用ストリーミングプロバイダー"""
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.label = self.config.get("label", "fake")
+        self.sampler = self.config.get("sampler", lambda: 0.0)
+        self.fail = self.config.get("fail", False)
+        self.cancelled = 0
+
+    def is_available(self):
+        return True
+
+    def generate_response(self, message, context=None):
+        return CharacterResponse(self.label, EmotionType.JOY, 0.5, self.current_color_stage, {})
+
+    async def generate_response_async(self, message, context=None):
+        return self.generate_response(message, context)
+
+    async def generate_stream_response(self, message, context=None):
+        try:
+            await asyncio.sleep(self.sampler())
+            if self.fail:
+                raise RuntimeError("boom")
+            for chunk in (self.label, "です"):
+                yield chunk
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def _provider(label, sampler, fail=False):
+    return LatencyProvider({"label": label, "sampler": sampler, "fail": fail})
+
+
+def test_fast_primary_is_not_hedged():
+    """ヘッジ遅延内に最初のトークンが来ればセカンダリは出さない"""
+    executor = HedgedRequestExecutor(default_delay=0.2)
+    primary = _provider("fast", lambda: 0.0)
+    secondary = _provider("other", lambda: 0.0)
+
+    result = asyncio.run(executor.execute(("fast", primary), ("other", secondary), "こんにちは"))
+    assert result.text == "fastです"
+    assert result.winner == "primary"
+    assert not result.hedged
+    assert executor.get_stats()["hedge_rate"] == 0.0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    """第一候補が遅ければセカンダリが勝ち、第一候補はキャンセルされる"""
+    executor = HedgedRequestExecutor(default_delay=0.05, min_delay=0.01)
+    primary = _provider("slow", lambda: 1.0)
+    secondary = _provider("quick", lambda: 0.0)
+
+    result = asyncio.run(executor.execute(("slow", primary), ("quick", secondary), "こんにちは"))
+    assert result.winner == "secondary"
+    assert result.winner_provider == "quick"
+    assert result.hedged
+    assert result.cancelled == "primary"
+    assert primary.cancelled == 1
+    assert result.total_latency < 0.5
+
+
+def test_primary_failure_falls_back_to_secondary():
+    """第一候補が失敗してもセカンダリで応答し、両方失敗なら例外"""
+    executor = HedgedRequestExecutor(default_delay=0.5)
+    broken = _provider("broken", lambda: 0.0, fail=True)
+    backup = _provider("backup", lambda: 0.0)
+
+    result = asyncio.run(executor.execute(("broken", broken), ("backup", backup), "テスト"))
+    assert result.winner_provider == "backup"
+
+    try:
+        asyncio.run(executor.execute(("broken", broken), ("broken2", _provider("x", lambda: 0.0, fail=True)), "テスト"))
+        assert False, "両方失敗なら例外になるはず"
+    except HedgeLegError:
+        pass
+
+
+def test_hedge_leg_waits_for_provider_limit():
+    """ヘッジ先も同時実行数の上限に従い、枠が空くまで呼び出さない"""
+    from ai_providers.concurrency import ProviderLimits
+
+    limits = ProviderLimits(default_limit=1)
+    executor = HedgedRequestExecutor(default_delay=0.02, min_delay=0.01)
+    primary = _provider("slow", lambda: 0.2)
+    secondary = _provider("quick", lambda: 0.0)
+
+    async def run():
+        # ヘッジ先の枠は他のリクエストが使用中
+        async with limits.get("quick"):
+            return await executor.execute(("slow", primary), ("quick", secondary), "こんにちは", limits=limits)
+
+    result = asyncio.run(run())
+    assert result.hedged and result.winner == "primary"
+    assert limits.get("quick").active == 0 and limits.get("slow").active == 0
+
+
+def test_hedge_delay_tracks_first_token_percentile():
+    """十分なサンプルが集まるとヘッジ遅延は初回トークン時間の分位点になる"""
+    executor = HedgedRequestExecutor(percentile=95.0, default_delay=1.0, min_delay=0.0, min_samples=5)
+    assert executor.get_hedge_delay("p") == 1.0
+    for latency in (0.01, 0.02, 0.03, 0.04, 0.2):
+        executor._tracker("p").record(latency)
+    assert executor.get_hedge_delay("p") == 0.2
+
+
+def test_router_hedged_tail_latency():
+    """ロングテール分布の第一候補でもルーター経由のp95が抑えられる"""
+    rng = random.Random(0)
+    registry = AIProviderRegistry()
+    registry.register('tail', LatencyProvider)
+    registry.register('steady', LatencyProvider)
+    configs = {
+        'tail': {"label": "tail", "sampler": lambda: 0.3 if rng.random() < 0.3 else 0.0},
+        'steady': {"label": "steady", "sampler": lambda: 0.02},
+    }
+
+    class _Config:
+        def get_provider_config(self, name):
+            return configs[name]
+
+    router = ProviderRouter(registry, config_manager=_Config(), preferences=['tail', 'steady'])
+    router.hedging = HedgedRequestExecutor(router, default_delay=0.05, min_delay=0.01)
+
+    async def run():
+        latencies = []
+        for _ in range(20):
+            response = await router.generate_response_hedged("こんにちは", primary='tail')
+            latencies.append(response.metadata["hedge"]["total_latency"])
+        return sorted(latencies)
+
+    latencies = asyncio.run(run())
+    assert latencies[int(len(latencies) * 0.95) - 1] < 0.2
+    stats = router.hedging.get_stats()
+    assert stats["requests"] == 20
+    assert stats["wins"]["secondary"] == stats["hedged"] > 0
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+共有HTTP接続プールのテスト（疑似LLMサーバーを使う）
+"""
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.http_pool import HTTPX_AVAILABLE, HTTPConnectionPool, origin_of
+from benchmarks.fake_llm_server import FakeLLMServer
+
+pytestmark = pytest.mark.skipif(not HTTPX_AVAILABLE, reason="httpx がインストールされていません")
+
+
+def test_origin_of():
+    assert origin_of("https://api.openai.com/v1") == "https://api.openai.com:443"
+    assert origin_of("http://localhost:11434") == "http://localhost:11434"
+    assert origin_of("localhost:8080/api") == "http://localhost:8080"
+
+
+def test_openai_clients_share_keepalive_connection():
+    openai = pytest.importorskip("openai")
+    pool = HTTPConnectionPool(max_connections=4)
+    with FakeLLMServer() as server:
+        # 別々のクライアント（プロバイダーの作り直し相当）でも接続は共有される
+        # クライアントを閉じても共有の接続は閉じない
+        for _ in range(3):
+            client = openai.OpenAI(api_key="test", base_url=server.base_url,
+                                   http_client=pool.openai_http_client(server.base_url))
+            client.models.list()
+            client.close()
+
+        stats = pool.get_stats()["hosts"][origin_of(server.base_url)]
+        assert stats["requests"] == 3
+        assert stats["errors"] == 0
+        assert stats["connections"] == 1
+        assert stats["in_flight"] == 0
+    pool.close()
+
+
+def test_prewarm_opens_connection_before_first_request():
+    pool = HTTPConnectionPool()
+    with FakeLLMServer() as server:
+        assert pool.prewarm([server.ollama_url]) == [server.ollama_url]
+        stats = pool.get_stats()["hosts"][origin_of(server.ollama_url)]
+        assert stats["connections"] == 1
+        assert stats["idle"] == 1
+    assert pool.prewarm(["http://127.0.0.1:9"], timeout=0.5) == []
+    pool.close()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+ログ設定のテスト
+"""
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from log_config import configure_logging, get_logger, shutdown_logging
+
+
+class _CountingArg:
+    """str() された回数を数える引数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return "formatted"
+
+
+def test_disabled_level_skips_formatting():
+    stream = io.StringIO()
+    configure_logging(level="INFO", module_levels={}, json_format=False, stream=stream, force=True)
+    arg = _CountingArg()
+    get_logger("ai_providers.registry").debug("作成: %s", arg)
+    shutdown_logging()
+    assert arg.calls == 0
+    assert stream.getvalue() == ""
+
+
+def test_json_output_and_module_levels():
+    stream = io.StringIO()
+    configure_logging(level="WARNING", module_levels={"emotion_system": "DEBUG"},
+                      json_format=True, stream=stream, force=True)
+    get_logger("src.emotion_system").debug("読み込み: %s", "emotion_data.json", extra={"emotion": "joy"})
+    get_logger("ai_providers.registry").info("表示されない")
+    shutdown_logging()  # キューを書き出してから検証
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(records) == 1
+    assert records[0]["logger"] == "ruri.emotion_system"
+    assert records[0]["level"] == "DEBUG"
+    assert records[0]["message"] == "読み込み: emotion_data.json"
+    assert records[0]["emotion"] == "joy"
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+メトリクスレジストリのテスト
+"""
+import os
+import sys
+import tempfile
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from metrics import MetricsRegistry
+
+
+def test_counter_gauge_histogram_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("ruri_test_requests_total", "requests", ("provider",))
+    requests.inc(provider="simple")
+    requests.inc(2, provider="simple")
+    registry.gauge("ruri_test_history_size", "history").set(7)
+    latency = registry.histogram("ruri_test_latency_seconds", "latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    assert registry.counter("ruri_test_requests_total", "requests", ("provider",)) is requests
+    text = registry.render_text()
+    assert '# TYPE ruri_test_requests_total counter' in text
+    assert 'ruri_test_requests_total{provider="simple"} 3' in text
+    assert 'ruri_test_history_size 7' in text
+    assert 'ruri_test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'ruri_test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'ruri_test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'ruri_test_latency_seconds_count 3' in text
+
+
+def test_multiprocess_snapshots_are_aggregated():
+    with tempfile.TemporaryDirectory() as workdir:
+        worker = MetricsRegistry(multiprocess_dir=workdir, flush_interval=3600)
+        worker.counter("ruri_test_messages_total", "messages").inc(5)
+        worker.gauge("ruri_test_history", "history", multiprocess_mode="max").set(10)
+        worker.flush()
+        # 別ワーカーのスナップショットとして pid を付け替える
+        os.replace(worker._snapshot_path(), worker._snapshot_path(pid=999999))
+
+        exporter = MetricsRegistry(multiprocess_dir=workdir, flush_interval=3600)
+        exporter.counter("ruri_test_messages_total", "messages").inc(2)
+        exporter.gauge("ruri_test_history", "history", multiprocess_mode="max").set(4)
+        text = exporter.render_text()
+        worker.shutdown()
+        exporter.shutdown()
+
+    assert "ruri_test_messages_total 7" in text
+    assert "ruri_test_history 10" in text
+
+
+def test_http_endpoint_serves_metrics():
+    registry = MetricsRegistry()
+    registry.counter("ruri_test_hits_total", "hits").inc()
+    assert registry.start_http_server(port=0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{registry.server_port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+            assert response.headers["Content-Type"].startswith("text/plain")
+    finally:
+        registry.shutdown()
+    assert "ruri_test_hits_total 1" in body
+    assert not registry.start_http_server(port=0)
+
+
+def test_src_and_bare_imports_share_registry():
+    # src/ がパス上にあれば src.metrics と metrics は同じモジュール（同じレジストリ）
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import metrics
+    from src import metrics as src_metrics
+    from src.ai_providers import http_pool
+
+    assert src_metrics is metrics
+    assert http_pool.get_metrics() is metrics.get_metrics()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Ollamaモデルのライフサイクル管理のテスト（実サーバーは使わない）
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from ai_providers.ollama_lifecycle import OllamaModelManager, parse_keep_alive
+
+
+class FakeOllamaClient:
+    def __init__(self):
+        self.generate_calls = []
+
+    def generate(self, model, prompt, keep_alive=None):
+        self.generate_calls.append((model, prompt, keep_alive))
+        return {"response": ""}
+
+    def ps(self):
+        return {"models": []}
+
+
+def test_parse_keep_alive():
+    assert parse_keep_alive("30m") == 1800
+    assert parse_keep_alive("1h") == 3600
+    assert parse_keep_alive(45) == 45
+    assert parse_keep_alive(-1) == float("inf")
+
+
+def test_preload_makes_following_requests_warm():
+    client = FakeOllamaClient()
+    manager = OllamaModelManager(client, keep_alive="10m", max_concurrency=2)
+
+    with manager.request("llama2") as slot:
+        slot.first_token()
+    assert slot.model_state == "cold"
+
+    manager.preload("llama2")
+    assert client.generate_calls[-1] == ("llama2", "", "10m")
+    with manager.request("llama2") as slot:
+        slot.first_token()
+    assert slot.model_state == "warm"
+
+    stats = manager.get_stats()["models"]["llama2"]
+    assert stats["first_token_warm"]["samples"] == 1
+    assert stats["first_token_cold"]["samples"] == 1
+
+    # サーバー側でアンロードされていれば cold に戻る
+    manager.sync_loaded()
+    assert not manager.is_warm("llama2")
+
+
+def test_concurrency_cap_queues_excess_requests():
+    manager = OllamaModelManager(FakeOllamaClient(), max_concurrency=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def call():
+        with manager.request("gpt-oss:20b") as slot:
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            slot.first_token()
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    assert manager.get_stats()["models"]["gpt-oss:20b"]["max_queued"] >= 3
+
+
+def test_shared_heartbeat_stops_after_last_user():
+    manager = OllamaModelManager(FakeOllamaClient(), heartbeat_interval=60)
+    manager.start_heartbeat(["llama2"])
+    manager.start_heartbeat(["llama2", "gpt-oss:20b"])
+    thread = manager._heartbeat_thread
+
+    manager.stop_heartbeat(["llama2", "gpt-oss:20b"])
+    assert manager.get_stats()["heartbeat_active"]
+    assert manager._heartbeat_models == {"llama2": 1}
+
+    manager.stop_heartbeat(["llama2"])
+    assert not thread.is_alive()
+    assert not manager.get_stats()["heartbeat_active"]
+
+    # 止めた直後に再開しても新しいスレッドで動く
+    manager.start_heartbeat(["llama2"])
+    assert manager._heartbeat_thread is not thread and manager._heartbeat_thread.is_alive()
+    manager.stop_heartbeat(["llama2"])
+
+
+def test_configure_applies_later_options():
+    manager = OllamaModelManager(FakeOllamaClient(), keep_alive="10m", max_concurrency=1)
+    with manager.request("llama2"):
+        pass
+    manager.configure(keep_alive="1h", max_concurrency=3)
+    assert manager.keep_alive_seconds == 3600 and manager.heartbeat_interval == 240.0
+    assert manager._state("llama2").max_concurrency == 3
+
+    # None の項目は変えない
+    manager.configure(keep_alive=None, max_concurrency=None)
+    assert manager.keep_alive == "1h" and manager.max_concurrency == 3
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+応答のペース配分（文節ごとの擬似ストリーミング）のテスト
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.pacing import PhrasePacer, split_phrases
+from ai_providers.simple_provider import SimpleAIProvider
+
+
+def test_split_phrases_on_japanese_boundaries():
+    text = "こんにちは！今日はとても良い天気ですね。ルリも嬉しいです♪"
+    phrases = split_phrases(text)
+    assert "".join(phrases) == text
+    assert phrases == ["こんにちは！", "今日はとても", "良い", "天気ですね。", "ルリも", "嬉しいです♪"]
+    # 区切りのない長い並びも上限で分ける・続く記号は前にまとめる
+    assert split_phrases("あ" * 30, max_phrase_chars=12) == ["あ" * 12, "あ" * 12, "あ" * 6]
+    assert split_phrases("本当に！？」はい") == ["本当に！？」", "はい"]
+
+
+def test_pacer_spaces_phrases_by_characters_per_second():
+    sleeps = []
+    now = [0.0]
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    pacer = PhrasePacer(chars_per_second=10, sleep=fake_sleep, clock=lambda: now[0])
+
+    async def run():
+        return [phrase async for phrase in pacer.pace("こんにちは！今日は良い天気。")]
+
+    phrases = asyncio.run(run())
+    assert "".join(phrases) == "こんにちは！今日は良い天気。"
+    # 最初の文節はすぐ・以降は送った文字数 / 10 秒ごと
+    assert len(sleeps) == len(phrases) - 1
+    assert sleeps[0] == pytest.approx(0.6)
+    assert now[0] == pytest.approx((len("".join(phrases)) - len(phrases[-1])) / 10)
+
+
+def test_simple_provider_zero_delay_stream():
+    provider = SimpleAIProvider({"stream_chars_per_second": 0})
+
+    async def run():
+        start = time.perf_counter()
+        chunks = [chunk async for chunk in provider.generate_stream_response("こんにちは")]
+        return chunks, time.perf_counter() - start
+
+    chunks, elapsed = asyncio.run(run())
+    assert elapsed < 0.1
+    assert 1 <= len(chunks) < len("".join(chunks))
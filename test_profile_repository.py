@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+キャラクター設定リポジトリのテスト（スナップショット・変更検出・通知）
+"""
+import json
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from profile_repository import ProfileRepository
+
+
+def _write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def files(tmp_path):
+    config_path = tmp_path / "ruri_config.json"
+    character_path = tmp_path / "ruri_character.md"
+    _write(config_path, json.dumps({"emotions": {"joy": {"keywords": ["やったー"]}}}))
+    _write(character_path, "# ルリ")
+    return str(config_path), str(character_path)
+
+
+def test_snapshot_is_loaded_once_and_immutable(files):
+    repository = ProfileRepository(*files, check_interval=60)
+    snapshot = repository.get()
+    assert snapshot.version == 1
+    assert snapshot.character_description == "# ルリ"
+    assert repository.get() is snapshot
+
+    with pytest.raises(TypeError):
+        snapshot.config["emotions"] = {}
+    with pytest.raises(TypeError):
+        snapshot.emotions["joy"].update({})
+    # 変更不可でもJSONにはそのまま変換できる
+    assert json.loads(json.dumps(snapshot.config)) == {"emotions": {"joy": {"keywords": ["やったー"]}}}
+
+
+def test_reload_only_notifies_on_content_change(files):
+    config_path, character_path = files
+    repository = ProfileRepository(config_path, character_path, check_interval=0)
+    received = []
+    builds = []
+    repository.subscribe(received.append)
+
+    def lexicon(snapshot):
+        builds.append(snapshot.version)
+        return tuple(snapshot.emotions["joy"]["keywords"])
+
+    assert repository.derived("lexicon", lexicon) == ("やったー",)
+
+    # 同じ内容で保存し直しただけなら版も派生データもそのまま
+    _write(character_path, "# ルリ")
+    os.utime(character_path, ns=(0, 0))
+    assert repository.get().version == 1
+    repository.derived("lexicon", lexicon)
+    assert builds == [1]
+    assert received == []
+
+    # 書き込み途中の壊れたJSONは無視して前の版を使い続ける
+    _write(config_path, '{"emotions": ')
+    assert repository.get().version == 1
+
+    _write(config_path, json.dumps({"emotions": {"joy": {"keywords": ["最高"]}}}))
+    assert repository.derived("lexicon", lexicon) == ("最高",)
+    assert builds == [1, 2]
+    assert [snapshot.version for snapshot in received] == [2]
+
+
+def test_subscriber_methods_are_held_weakly(files):
+    repository = ProfileRepository(*files, check_interval=0)
+    repository.get()
+
+    class Listener:
+        def __init__(self):
+            self.calls = 0
+
+        def on_change(self, snapshot):
+            self.calls += 1
+
+    listener = Listener()
+    repository.subscribe(listener.on_change)
+    del listener
+    _write(files[1], "# ルリ（改）")
+    assert repository.get().version == 2
+    assert repository.get_status()["subscribers"] == 0
+
+    # 通知がなくても、破棄済みの購読は次の登録で取り除かれる
+    for _ in range(5):
+        repository.subscribe(Listener().on_change)
+    assert repository.get_status()["subscribers"] == 1
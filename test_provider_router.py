@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# プロバイダールーター（サーキットブレーカー・フェイルオーバー）テスト
+import sys
+import os
+import asyncio
+
+# プロジェクトルートをパスに追加
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.base_provider import BaseAIProvider, CharacterResponse, EmotionType
+from ai_providers.registry import AIProviderRegistry
+from ai_providers.router import ProviderRouter, CircuitBreaker, CircuitState
+
+
+class FlakyProvider(BaseAIProvider):
+    """失敗を切り替えられるテスト用プロバイダー"""
+    fail = False
+    seen_contexts = []
+
+    def is_available(self):
+        return True
+
+    def generate_response(self, message, context=None):
+        FlakyProvider.seen_contexts.append(context)
+        if FlakyProvider.fail:
+            # OpenAIProviderと同様にエラー文を応答として返す
+            return CharacterResponse("APIエラー", EmotionType.JOY, 0.0, self.current_color_stage, {"error": "boom"})
+        return CharacterResponse("flaky", EmotionType.JOY, 0.5, self.current_color_stage, {})
+
+    async def generate_response_async(self, message, context=None):
+        return self.generate_response(message, context)
+
+    async def generate_stream_response(self, message, context=None):
+        response = self.generate_response(message, context)
+        if response.metadata.get("error"):
+            raise RuntimeError(response.metadata["error"])
+        yield response.text
+
+
+class StableProvider(FlakyProvider):
+    def generate_response(self, message, context=None):
+        return CharacterResponse("stable", EmotionType.JOY, 0.5, self.current_color_stage, {})
+
+
+def _make_router(**breaker_options):
+    registry = AIProviderRegistry()
+    registry.register('flaky', FlakyProvider)
+    registry.register('stable', StableProvider)
+    FlakyProvider.fail = False
+    FlakyProvider.seen_contexts = []
+    return ProviderRouter(registry, preferences=['flaky', 'stable'], breaker_options=breaker_options)
+
+
+def test_breaker_opens_and_half_opens():
+    """失敗率で遮断し、待機後にハーフオープンで1件だけ試行"""
+    breaker = CircuitBreaker(failure_rate_threshold=0.5, min_calls=2, open_seconds=60.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    breaker.open_seconds = 0.0
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_failover_keeps_history():
+    """エラー応答時は次のプロバイダーへ切り替え、同じコンテキストを渡す"""
+    router = _make_router(min_calls=2, open_seconds=60.0)
+    FlakyProvider.fail = True
+    context = {"conversation_history": [{"role": "user", "content": "前の話"}]}
+
+    response = router.generate_response("こんにちは", context)
+    assert response.text == "stable"
+    assert response.metadata["routed_provider"] == "stable"
+    assert response.metadata["failover_from"] == ["flaky"]
+    assert FlakyProvider.seen_contexts[-1] is context
+
+    # 2回目の失敗でブレーカーが開き、以降flakyはスキップされる
+    router.generate_response("こんにちは", context)
+    router.generate_response("こんにちは", context)
+    status = router.get_status_info()
+    assert status["providers"]["flaky"]["breaker"]["state"] == "open"
+    assert status["recent_decisions"][-1]["skipped"] == ["flaky"]
+
+
+def test_primary_first():
+    """primary指定は優先度より優先"""
+    router = _make_router()
+    assert router.get_candidates(primary='stable') == ['stable', 'flaky']
+    assert router.generate_response("テスト", primary='stable').text == "stable"
+
+
+def test_stream_fails_over_before_first_token():
+    """最初のトークン前の失敗は次のプロバイダーへ切り替え、ストリーム中は枠と使用中を保持"""
+    router = _make_router(min_calls=2, open_seconds=60.0)
+    FlakyProvider.fail = True
+    held = []
+
+    async def run():
+        chunks = []
+        async for chunk in router.generate_stream("こんにちは"):
+            stable = router.registry.create_provider('stable')
+            held.append((router.limits.get('stable').active, router.registry.ref_count(stable)))
+            chunks.append(chunk)
+        return chunks
+
+    assert asyncio.run(run()) == ["stable"]
+    assert held == [(1, 1)]
+    assert router.limits.get('stable').active == 0
+    decision = router.get_recent_decisions()[-1]
+    assert decision["provider"] == "stable" and decision["attempts"] == ["flaky", "stable"]
+    assert "boom" in decision["errors"]["flaky"]
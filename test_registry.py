@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+プロバイダーレジストリのテスト（同時生成・参照数・クローズ・事前生成）
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.base_provider import BaseAIProvider, CharacterResponse, EmotionType
+from ai_providers.registry import AIProviderRegistry
+
+
+class SlowInitProvider(BaseAIProvider):
+    """生成に時間がかかり、生成数・クローズを記録するテスト用プロバイダー"""
+    created = 0
+    created_lock = threading.Lock()
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        time.sleep(0.05)
+        with SlowInitProvider.created_lock:
+            SlowInitProvider.created += 1
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def is_available(self):
+        return True
+
+    def generate_response(self, message, context=None):
+        return CharacterResponse("ok", EmotionType.JOY, 0.5, self.current_color_stage, {})
+
+    async def generate_response_async(self, message, context=None):
+        return self.generate_response(message, context)
+
+    async def generate_stream_response(self, message, context=None):
+        yield "ok"
+
+
+def _make_registry():
+    SlowInitProvider.created = 0
+    registry = AIProviderRegistry()
+    registry.register('slow', SlowInitProvider)
+    return registry
+
+
+def test_concurrent_create_builds_one_instance():
+    registry = _make_registry()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: registry.create_provider('slow'), range(8)))
+
+    assert SlowInitProvider.created == 1
+    assert all(instance is instances[0] for instance in instances)
+
+
+def test_replaced_instance_closes_after_last_lease():
+    registry = _make_registry()
+    old = registry.create_provider('slow')
+
+    with registry.lease(old):
+        new = registry.create_provider('slow', force_new=True)
+        assert new is not old
+        # 使用中は閉じない
+        assert not old.closed
+        assert registry.get_status()["retired_in_use"] == 1
+    assert old.closed
+    assert registry.ref_count(old) == 0
+
+    registry.clear_cache()
+    assert new.closed
+    assert registry.create_provider('slow') is not new
+
+
+def test_preload_builds_in_background():
+    registry = _make_registry()
+    thread = registry.preload(['slow', 'unknown'])
+    # 事前生成の途中で要求しても二重に作らない
+    instance = registry.create_provider('slow')
+    thread.join(2.0)
+
+    assert SlowInitProvider.created == 1
+    assert registry.create_provider('slow') is instance
+
+
+class HangingProvider(SlowInitProvider):
+    async def generate_stream_response(self, message, context=None):
+        yield "は"
+        await asyncio.sleep(30)
+        yield "い"
+
+
+def test_self_test_runs_concurrently_with_deadline():
+    registry = _make_registry()
+    registry.register('hanging', HangingProvider)
+    recorded = []
+
+    start = time.perf_counter()
+    results = list(registry.iter_check_providers(
+        timeout=0.5, record_result=lambda *args: recorded.append(args)))
+    elapsed = time.perf_counter() - start
+
+    # 止まった接続先は期限で打ち切られ、正常なプロバイダーの結果が先に届く
+    assert elapsed < 2.0
+    assert [result.provider for result in results] == ['slow', 'hanging']
+    assert results[0].ok and results[0].first_token is not None
+    assert results[1].error_class == "Timeout"
+    assert [(name, ok) for name, ok, *_ in recorded] == [('slow', True), ('hanging', False)]
+    assert registry.get_health()['hanging']['ok'] is False
+    # セルフテストはキャッシュ済みのインスタンスに触れない
+    assert registry.get_status()["cached"] == {}
+
+
+class SlowBuildProvider(SlowInitProvider):
+    instances = []
+
+    def __init__(self, config=None):
+        time.sleep(0.3)
+        super().__init__(config)
+        SlowBuildProvider.instances.append(self)
+
+
+def test_self_test_closes_instance_built_after_deadline():
+    registry = AIProviderRegistry()
+    registry.register('slow_build', SlowBuildProvider)
+    SlowBuildProvider.instances = []
+
+    results = list(registry.iter_check_providers(timeout=0.1))
+    assert results[0].error_class == "Timeout"
+
+    # 期限後に出来上がったインスタンスも閉じられる
+    deadline = time.time() + 2.0
+    while not (SlowBuildProvider.instances and SlowBuildProvider.instances[0].closed) and time.time() < deadline:
+        time.sleep(0.02)
+    assert len(SlowBuildProvider.instances) == 1 and SlowBuildProvider.instances[0].closed
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+署名つきセッショントークンのテスト（発行・改ざん・期限切れ・一括無効化）
+"""
+import os
+import sys
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from session_token import SessionTokenSigner
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_roundtrip_tamper_expiry_and_rotate():
+    clock = FakeClock()
+    signer = SessionTokenSigner(secret=b"test-secret", ttl_seconds=60, clock=clock)
+    token = signer.issue("owner")
+
+    claims = signer.verify(token)
+    assert claims["lvl"] == "owner"
+    assert claims["exp"] == 1060
+
+    body, signature = token.rsplit(".", 1)
+    forged = SessionTokenSigner(secret=b"other", clock=clock).issue("owner")
+    assert signer.verify(forged) is None
+    assert signer.verify(body + "." + "0" * len(signature)) is None
+    assert signer.verify("not-a-token") is None
+
+    clock.now = 1060.0
+    assert signer.verify(token) is None
+
+    clock.now = 1000.0
+    signer.rotate()
+    assert signer.verify(token) is None
+    assert signer.verify(signer.issue("owner"))["lvl"] == "owner"
+
+
+def test_user_level_comes_from_signed_token(monkeypatch):
+    from src.unified_config import UnifiedConfig, UserLevel
+    import session_token
+
+    signer = SessionTokenSigner(secret=b"test-secret")
+    monkeypatch.setattr(session_token, "_signer", signer)
+
+    assert UnifiedConfig.get_user_level({"auth_token": signer.issue("owner")}) == UserLevel.OWNER
+    # トークンが無効なら古いフラグが残っていても一般公開レベル
+    tampered = {"auth_token": signer.issue("owner")[:-1] + "x", "owner_authenticated": True}
+    assert UnifiedConfig.get_user_level(tampered) == UserLevel.PUBLIC
+    assert UnifiedConfig.get_user_level({}) == UserLevel.PUBLIC
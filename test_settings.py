@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+設定スナップショットのテスト（優先順位・不変性・再読み込み）
+"""
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+import settings
+from settings import load_settings
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """プロセスの環境変数を汚さないよう、コピーした環境と空の作業ディレクトリで読み込む"""
+    environ = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")}
+    monkeypatch.setattr(os, "environ", environ)
+    monkeypatch.setattr(settings, "PROJECT_ROOT", tmp_path)
+    monkeypatch.setattr(settings, "_applied_from_dotenv", {})
+    monkeypatch.chdir(tmp_path)
+    return environ
+
+
+def test_precedence_and_placeholders(env, tmp_path):
+    (tmp_path / ".env").write_text(
+        "# コメント\n"
+        "OPENAI_API_KEY=dotenv-key\n"
+        "ANTHROPIC_API_KEY=YOUR_API_KEY_HERE\n"
+        "export RURI_TEST_VALUE='from-dotenv'\n",
+        encoding="utf-8",
+    )
+    env["OPENAI_API_KEY"] = "env-key"
+
+    snapshot = load_settings(use_secrets=False)
+    assert snapshot.openai_api_key == "env-key"
+    assert snapshot.source_of("OPENAI_API_KEY") == "env"
+    assert snapshot.api_key("anthropic") == ""
+    assert snapshot.get("RURI_TEST_VALUE") == "from-dotenv"
+    assert snapshot.source_of("RURI_TEST_VALUE") == "dotenv"
+    # .env の値は os.getenv で読む調整用の値にも届く（既存の環境変数は上書きしない）
+    assert env["RURI_TEST_VALUE"] == "from-dotenv"
+    assert env["OPENAI_API_KEY"] == "env-key"
+    assert snapshot.ollama_base_url == "http://localhost:11434"
+
+    with pytest.raises(TypeError):
+        snapshot.values["OPENAI_API_KEY"] = "changed"
+    with pytest.raises(AttributeError):
+        snapshot.values = {}
+
+
+def test_reload_picks_up_dotenv_changes(env, tmp_path):
+    dotenv = tmp_path / ".env"
+    dotenv.write_text("AI_MAX_TOKENS=300\nDEBUG=true\n", encoding="utf-8")
+    first = load_settings(use_secrets=False)
+    assert first.get_int("AI_MAX_TOKENS", 500) == 300
+    assert first.debug
+
+    # スナップショットは読み込み時点の値のまま。読み直すと .env の変更が反映される
+    dotenv.write_text("AI_MAX_TOKENS=abc\n", encoding="utf-8")
+    second = load_settings(use_secrets=False)
+    assert first.get_int("AI_MAX_TOKENS", 500) == 300
+    assert second.get_int("AI_MAX_TOKENS", 500) == 500
+    assert env["AI_MAX_TOKENS"] == "abc"
+    assert not second.debug
+    assert "DEBUG" not in env
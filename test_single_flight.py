@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# 同一プロンプトのリクエスト集約（single-flight）テスト
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# プロジェクトルートをパスに追加
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from ai_providers.base_provider import CharacterResponse, EmotionType, ColorStage
+from ai_providers.simple_provider import SimpleAIProvider
+from ai_providers.single_flight import SingleFlight, normalize_message, simple_pattern_variation
+
+
+def test_normalize_message():
+    """全角・大文字・空白・連続文字の揺れは同じキーになる"""
+    assert normalize_message("ＷＷＷＷＷ") == normalize_message("wwww")
+    assert normalize_message("  こんにちは　ルリちゃん ") == "こんにちは ルリちゃん"
+    assert normalize_message("888888888") == "888"
+    assert SingleFlight.make_key("Hello", "simple", "monochrome") != SingleFlight.make_key("Hello", "openai", "monochrome")
+
+
+def test_concurrent_threads_share_one_call():
+    """同時に届いた同一メッセージは上流呼び出し1回にまとまる"""
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait(2.0)
+        return "shared"
+
+    key = flight.make_key("こんにちは", "simple")
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do(key, upstream, "こんにちは")))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [text for text, _ in results] == ["shared"] * 10
+    assert sum(1 for _, shared in results if shared) == 9
+    stats = flight.get_stats()
+    assert stats["upstream_calls"] == 1
+    assert stats["saved_calls"] == 9
+    assert stats["in_flight"] == 0
+
+
+def test_async_coalescing_and_errors():
+    """非同期版も集約し、上流の例外は全員に伝わる"""
+    flight = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "shared"
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        results = await asyncio.gather(*[flight.do_async("k", upstream) for _ in range(5)])
+        errors = await asyncio.gather(*[flight.do_async("e", failing) for _ in range(3)], return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(run())
+    assert len(calls) == 1
+    assert [text for text, _ in results] == ["shared"] * 5
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_simple_pattern_variation():
+    """相乗りした応答は同じカテゴリの別パターンに言い換えられる"""
+    provider = SimpleAIProvider()
+    vary = simple_pattern_variation(provider)
+    original = CharacterResponse(provider.responses["greeting"][0], EmotionType.JOY, 0.5,
+                                 ColorStage.MONOCHROME, {"category": "greeting"})
+    varied = vary(original, "こんにちは")
+    assert varied.text != original.text
+    assert varied.text in provider.responses["greeting"]
+    assert varied.metadata["coalesced"]
+    assert "coalesced" not in original.metadata
+
+
+def test_character_key_separates_conversation_histories():
+    """会話履歴が異なるセッションは同じメッセージでも相乗りしない"""
+    from character_ai import RuriCharacter
+
+    first = RuriCharacter(ai_provider="simple")
+    second = RuriCharacter(ai_provider="simple")
+    fresh = first._coalesce_key("こんにちは", first._build_provider_context())
+    assert fresh == second._coalesce_key("こんにちは", second._build_provider_context())
+
+    second.conversation_history.append({"user": "はじめまして", "assistant": "よろしくお願いします"})
+    assert fresh != second._coalesce_key("こんにちは", second._build_provider_context())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+ストリーミング表示のテスト（吹き出しの間引き更新・OpenAIのトークンストリーミング）
+"""
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'src'))
+
+from src.ui_components import RerunTimer, StreamingBubble
+from ai_providers.concurrency import iterate_sync
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMConfig
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, body, unsafe_allow_html=False):
+        self.renders.append(body)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bubble_coalesces_updates_and_escapes_incrementally():
+    placeholder = FakePlaceholder()
+    clock = FakeClock()
+    bubble = StreamingBubble(
+        placeholder, "12:00", fps=10, clock=clock,
+        emotion_detector=lambda text: "joy" if "嬉" in text else None,
+    )
+
+    clock.now = 0.05
+    bubble.feed("<b>")
+    assert bubble.first_visible_latency == pytest.approx(0.05)
+    for i in range(100):
+        clock.now = 0.05 + (i + 1) * 0.002  # 2ms ごとに1トークン（合計0.2秒）
+        bubble.feed("嬉" if i == 50 else "あ")
+    bubble.finish()
+
+    # 100トークンでも更新はフレームレート（10fps）程度に抑えられる
+    assert 2 <= bubble.updates <= 5
+    assert bubble.text == "<b>" + "あ" * 50 + "嬉" + "あ" * 49
+    assert "&lt;b&gt;" in placeholder.renders[-1]
+    assert "<b>" not in placeholder.renders[-1].split('message-content">')[1]
+    assert "emotion-joy" in placeholder.renders[-1]
+    assert "emotion-joy" not in placeholder.renders[0]
+
+
+def test_rerun_timer_records_per_mode(monkeypatch):
+    monkeypatch.setattr("src.ui_components.FRAGMENTS_AVAILABLE", True)
+    state = {}
+    clock = FakeClock()
+    timer = RerunTimer(state=state, clock=clock)
+    assert timer.mode == "fragment"
+
+    # fragment: チャット領域の開始から終了まで
+    clock.now = 10.0
+    timer.region_finished(region_started=9.0, turn_seconds=0.9)
+
+    # full: スクリプト全体の終了時に記録（メッセージのない実行は記録しない）
+    timer.set_mode("full")
+    timer.script_started()
+    clock.now = 12.0
+    timer.script_finished()
+    timer.script_started()
+    timer.region_finished(region_started=12.1, turn_seconds=0.5)
+    clock.now = 13.0
+    timer.script_finished()
+
+    summary = {row["mode"]: row for row in timer.get_summary()}
+    assert summary["fragment"]["messages"] == 1
+    assert summary["fragment"]["overhead_mean_ms"] == pytest.approx(100.0)
+    assert summary["full"]["messages"] == 1
+    assert summary["full"]["mean_ms"] == pytest.approx(1000.0)
+    assert summary["full"]["overhead_mean_ms"] == pytest.approx(500.0)
+
+
+def test_history_gauges_follow_pruned_sessions(monkeypatch):
+    import types
+    from src import chat_manager
+
+    clock = FakeClock()
+    monkeypatch.setattr(chat_manager.time, "monotonic", clock)
+    monkeypatch.setattr(chat_manager, "_session_history_sizes", {})
+    monkeypatch.setattr(chat_manager, "st", types.SimpleNamespace(session_state={}))
+    chat_manager._record_history_size("old_chat", 4)
+
+    # 別セッション・別の session_key の更新で、途絶えたセッションの分も合計から外れる
+    clock.now = chat_manager.SESSION_IDLE_SECONDS + 1.0
+    chat_manager.st.session_state = {}
+    chat_manager._record_history_size("new_chat", 2)
+    assert chat_manager._history_size.get(session_key="old_chat") == 0
+    assert chat_manager._active_sessions.get(session_key="old_chat") == 0
+    assert chat_manager._history_size.get(session_key="new_chat") == 2
+    assert chat_manager._active_sessions.get(session_key="new_chat") == 1
+
+@pytest.fixture
+def openai_test_key(monkeypatch):
+    """テスト用のAPIキーで設定を読み直し、終了後に元の環境で読み直す"""
+    from settings import reload_settings
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    reload_settings()
+    yield
+    monkeypatch.undo()
+    reload_settings()
+
+
+def test_openai_provider_streams_tokens(openai_test_key):
+    pytest.importorskip("openai")
+    from ai_providers.openai_provider import OpenAIProvider
+
+    with FakeLLMServer(config=FakeLLMConfig(latency=0.0, token_rate=500.0)) as server:
+        provider = OpenAIProvider({"base_url": server.base_url, "model": "fake"})
+        # 同期側（Streamlit）から共有ループ経由で受け取る
+        chunks = list(iterate_sync(provider.generate_stream_response("こんにちは")))
+
+    assert len(chunks) > 1
+    assert "エラー" not in "".join(chunks)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+スパントレースのテスト
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from tracing import Tracer, _NOOP_SPAN
+
+
+def test_disabled_tracer_is_noop():
+    tracer = Tracer(enabled=False)
+    with tracer.span("chat.turn") as span:
+        span.set_attribute("ignored", True)
+    assert span is _NOOP_SPAN
+    assert tracer.ring.get_spans() == []
+
+
+def test_parent_child_propagation_sync_and_async():
+    tracer = Tracer(enabled=True)
+
+    @tracer.traced("provider.call")
+    async def call():
+        await asyncio.sleep(0)
+        return tracer.current_span()
+
+    async def turn():
+        with tracer.span("chat.turn") as root:
+            children = await asyncio.gather(call(), call())
+        return root, children
+
+    root, children = asyncio.run(turn())
+    spans = tracer.ring.get_spans()
+    assert [span["name"] for span in spans].count("provider.call") == 2
+    assert all(child.parent_id == root.span_id for child in children)
+    assert all(child.trace_id == root.trace_id for child in children)
+    assert tracer.current_span() is None
+
+
+def test_jsonl_sink_flushes_on_root_span():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "trace.jsonl")
+        tracer = Tracer(enabled=True, jsonl_path=path)
+        with tracer.span("chat.turn"):
+            with tracer.span("emotion.detect", length=3):
+                pass
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+    assert [record["name"] for record in records] == ["emotion.detect", "chat.turn"]
+    assert records[0]["attributes"] == {"length": 3}
+    assert records[0]["parent_id"] == records[1]["span_id"]
+
+
+def test_stage_breakdown_percentiles():
+    tracer = Tracer(enabled=True)
+    for duration in range(1, 101):
+        tracer.ring.emit({"trace_id": f"t{duration}", "span_id": "s", "parent_id": None, "name": "chat.turn",
+                          "start_ns": duration, "duration_ms": float(duration), "attributes": {}, "error": None})
+    tracer.ring.emit({"trace_id": "other", "span_id": "x", "parent_id": None, "name": "warmup",
+                      "start_ns": 0, "duration_ms": 1000.0, "attributes": {}, "error": None})
+
+    rows = {row["stage"]: row for row in tracer.get_stage_breakdown("chat.turn")}
+    assert set(rows) == {"chat.turn"}
+    assert rows["chat.turn"]["count"] == 100
+    assert rows["chat.turn"]["p50_ms"] == 51.0
+    assert rows["chat.turn"]["p95_ms"] == 95.0
+    assert rows["chat.turn"]["max_ms"] == 100.0